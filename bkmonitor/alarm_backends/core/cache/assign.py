@@ -12,6 +12,7 @@ from collections import defaultdict
 
 from alarm_backends.core.cache.base import CacheManager
 from alarm_backends.core.cache.cmdb.business import BusinessManager
+from bkmonitor.action.alert_assign import AssignRuleSet
 from bkmonitor.models.fta.assign import AlertAssignGroup, AlertAssignRule
 from bkmonitor.utils import extended_json
 from bkmonitor.utils.local import local
@@ -86,6 +87,19 @@ class AssignCacheManager(CacheManager):
 
         return local.assign_cache[cache_key]
 
+    @classmethod
+    def get_assign_rule_set_by_priority(cls, bk_biz_id, priority) -> AssignRuleSet:
+        """
+        获取指定优先级下所有分派规则的编译结果，与规则缓存同生命周期
+        """
+        cache_key = cls.PRIORITY_CACHE_KEY_TEMPLATE.format(bk_biz_id=bk_biz_id, priority=priority) + ".rule_set"
+        if cache_key not in local.assign_cache:
+            rules = []
+            for group_id in cls.get_assign_groups_by_priority(bk_biz_id, priority):
+                rules.extend(cls.get_assign_rules_by_group(bk_biz_id, group_id))
+            local.assign_cache[cache_key] = AssignRuleSet(rules)
+        return local.assign_cache[cache_key]
+
     @classmethod
     def get_global_config(cls, key_template, **kwargs):
         kwargs.update({"bk_biz_id": GLOBAL_BIZ_ID})
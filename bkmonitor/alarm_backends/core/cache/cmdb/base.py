@@ -13,6 +13,7 @@ specific language governing permissions and limitations under the License.
 import abc
 import json
 import time
+from typing import Iterable, List, Optional, Set, Tuple
 
 import six.moves.cPickle as pickle
 from django.core.cache import caches
@@ -26,6 +27,35 @@ from core.prometheus import metrics
 mem_cache = caches["locmem"]
 
 
+class CompactCodec(object):
+    """
+    CMDB 缓存对象紧凑编码
+    #C1|<分段0>\x1e<分段1>\x1e...
+    每个分段为独立的json，读取时只解析需要的分段。json会转义控制字符，因此分隔符不会出现在分段内容中
+    """
+
+    PREFIX = "#C1|"
+    SEPARATOR = "\x1e"
+
+    @classmethod
+    def is_compact(cls, string: str) -> bool:
+        return string.startswith(cls.PREFIX)
+
+    @classmethod
+    def encode(cls, sections: List) -> str:
+        return cls.PREFIX + cls.SEPARATOR.join(
+            json.dumps(section, ensure_ascii=False, separators=(",", ":")) for section in sections
+        )
+
+    @classmethod
+    def decode(cls, string: str, indexes: Optional[Set[int]] = None) -> List:
+        """
+        :param indexes: 需要解析的分段下标，未解析的分段返回None
+        """
+        parts = string[len(cls.PREFIX) :].split(cls.SEPARATOR)
+        return [json.loads(part) if indexes is None or index in indexes else None for index, part in enumerate(parts)]
+
+
 class CMDBCacheManager(CacheManager):
     """
     CMDB 缓存管理基类
@@ -89,11 +119,10 @@ class CMDBCacheManager(CacheManager):
         return result
 
     @classmethod
-    def get(cls, *args, **kwargs):
+    def get_raw(cls, key):
         """
-        获取单个对象
+        获取单个对象的缓存原文，本地内存中缓存原文而非对象，由调用方按需解析
         """
-        key = cls.key_to_internal_value(*args, **kwargs)
         local_key = f"{cls.CACHE_KEY}_{key}"
         if local_key in mem_cache:
             return mem_cache.get(local_key)
@@ -102,11 +131,19 @@ class CMDBCacheManager(CacheManager):
 
         if not obj:
             cls.logger.warning("unknown {}: {}".format(cls.__name__.replace("Manager", ""), key))
-        else:
-            obj = cls.deserialize(obj)
         mem_cache.set(local_key, obj)
         return obj
 
+    @classmethod
+    def get(cls, *args, **kwargs):
+        """
+        获取单个对象
+        """
+        obj = cls.get_raw(cls.key_to_internal_value(*args, **kwargs))
+        if obj:
+            obj = cls.deserialize(obj)
+        return obj
+
     @classmethod
     def multi_get_with_dict(cls, keys):
         """
@@ -245,6 +282,50 @@ class RefreshByBizMixin(object):
             "removed_biz: {}".format(cls.CACHE_KEY, len(new_keys), len(deleted_keys), len(deleted_biz_ids))
         )
 
+    @classmethod
+    def refresh_by_biz_ids(cls, bk_biz_ids: Iterable[int]) -> Tuple[Set[str], Set[str], Set[int]]:
+        """
+        增量刷新指定业务的缓存，并清理这些业务下已被删除的对象
+        :return: (更新的key集合, 删除的key集合, 刷新失败的业务ID集合)
+        """
+        from alarm_backends.core.i18n import i18n
+
+        bk_biz_ids = sorted({int(bk_biz_id) for bk_biz_id in bk_biz_ids})
+        if not bk_biz_ids:
+            return set(), set(), set()
+
+        old_biz_keys = cls.cache.hmget(cls.get_biz_cache_key(), [str(bk_biz_id) for bk_biz_id in bk_biz_ids])
+        old_keys, new_keys, failed_biz_ids = set(), set(), set()
+        for bk_biz_id, biz_keys in zip(bk_biz_ids, old_biz_keys):
+            biz_start_time = time.time()
+            exc = None
+            try:
+                i18n.set_biz(bk_biz_id)
+                objs = cls.refresh_by_biz(bk_biz_id)
+            except Exception as e:
+                cls.logger.exception("get data by biz fail, bk_biz_id: {}, {}".format(bk_biz_id, e))
+                exc = e
+                failed_biz_ids.add(bk_biz_id)
+            else:
+                cls.cache_by_biz(bk_biz_id, objs, force=True)
+                old_keys.update(json.loads(biz_keys) if biz_keys else [])
+                new_keys.update(objs.keys())
+
+            metrics.ALARM_CACHE_TASK_TIME.labels(str(bk_biz_id), cls.type, str(exc)).observe(
+                time.time() - biz_start_time
+            )
+
+        # 对象可能在本次刷新的业务之间转移，因此只删除所有业务中都不存在的key
+        deleted_keys = old_keys - new_keys
+        if deleted_keys:
+            cls.cache.hdel(cls.CACHE_KEY, *deleted_keys)
+
+        cls.logger.info(
+            "cache_key({}) refresh CMDB data by biz({}) finished, amount: updated: {}, removed: {}, "
+            "failed_biz: {}".format(cls.CACHE_KEY, bk_biz_ids, len(new_keys), len(deleted_keys), failed_biz_ids)
+        )
+        return new_keys, deleted_keys, failed_biz_ids
+
     @classmethod
     def cache_by_biz(cls, bk_biz_id: str, objs_dict: dict, force: bool = False) -> None:
         if not force:
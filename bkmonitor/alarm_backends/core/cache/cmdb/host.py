@@ -11,11 +11,16 @@ specific language governing permissions and limitations under the License.
 
 import json
 from collections import defaultdict
-from typing import Dict, List, Optional, Set
+from typing import Dict, Iterable, List, Optional, Set
 
 from django.conf import settings
+from django.utils.functional import cached_property
 
-from alarm_backends.core.cache.cmdb.base import CMDBCacheManager, RefreshByBizMixin
+from alarm_backends.core.cache.cmdb.base import (
+    CMDBCacheManager,
+    CompactCodec,
+    RefreshByBizMixin,
+)
 from api.cmdb.define import Host, TopoTree
 from bkmonitor.utils.local import local
 from core.drf_resource import api
@@ -139,6 +144,29 @@ class HostIPManager(CMDBCacheManager):
             )
         )
 
+    @classmethod
+    def refresh_by_host_keys(cls, updated_host_keys: Iterable[str], deleted_host_keys: Iterable[str]):
+        """
+        按变更的主机key增量更新IP映射
+        """
+        updated_mapping = cls.to_kv(list(updated_host_keys))
+        deleted_mapping = cls.to_kv(list(deleted_host_keys))
+        ips = list(set(updated_mapping) | set(deleted_mapping))
+        if not ips:
+            return
+
+        pipeline = cls.cache.pipeline()
+        for ip, host_keys in zip(ips, cls.cache.hmget(cls.CACHE_KEY, ips)):
+            host_keys = set(cls.deserialize(host_keys))
+            host_keys.difference_update(deleted_mapping.get(ip, []))
+            host_keys.update(updated_mapping.get(ip, []))
+            if host_keys:
+                pipeline.hset(cls.CACHE_KEY, ip, cls.serialize(sorted(host_keys)))
+            else:
+                pipeline.hdel(cls.CACHE_KEY, ip)
+        pipeline.expire(cls.CACHE_KEY, cls.CACHE_TIMEOUT)
+        pipeline.execute()
+
 
 class HostManager(RefreshByBizMixin, CMDBCacheManager):
     """
@@ -149,27 +177,141 @@ class HostManager(RefreshByBizMixin, CMDBCacheManager):
     CACHE_KEY = "{prefix}.cmdb.host".format(prefix=CMDBCacheManager.CACHE_KEY_PREFIX)
     ObjectClass = Host
 
+    # 紧凑编码分段: 基础属性 / 拓扑链路 / 其他属性
+    BASE_SECTION, TOPO_SECTION, ATTR_SECTION = range(3)
+    BASE_FIELDS = {
+        "bk_host_id",
+        "bk_biz_id",
+        "bk_cloud_id",
+        "bk_host_innerip",
+        "bk_host_innerip_v6",
+        "ip",
+        "bk_agent_id",
+        "bk_host_name",
+        "bk_state",
+        "display_name",
+        "bk_module_ids",
+        "bk_set_ids",
+    }
+    TOPO_NODE_FIELDS = ("bk_obj_id", "bk_inst_id", "bk_obj_name", "bk_inst_name")
+    # 主机对象上的缓存属性由原始属性计算得到，不需要存储
+    CACHED_PROPERTIES = {name for name in dir(Host) if isinstance(getattr(Host, name, None), cached_property)}
+
     @classmethod
     def key_to_internal_value(cls, ip, bk_cloud_id=0):
         return "{}|{}".format(ip, bk_cloud_id)
 
     @classmethod
-    def get(cls, ip, bk_cloud_id=0, using_mem=False, using_api=False):
+    def serialize(cls, obj: Host):
+        if not settings.CMDB_CACHE_COMPACT_SERIALIZE:
+            return super(HostManager, cls).serialize(obj)
+
+        attrs = dict(obj.get_attrs())
+        for key, value in obj.__dict__.items():
+            if key != "_extra_attr" and key not in cls.CACHED_PROPERTIES:
+                attrs[key] = value
+
+        topo_link = attrs.pop("topo_link", None)
+        if topo_link is not None:
+            topo_link = {
+                node_id: [[getattr(node, field) for field in cls.TOPO_NODE_FIELDS] for node in nodes]
+                for node_id, nodes in topo_link.items()
+            }
+        base = {field: attrs.pop(field) for field in cls.BASE_FIELDS if field in attrs}
+        try:
+            return CompactCodec.encode([base, topo_link, attrs])
+        except (TypeError, ValueError):
+            # 存在无法编码的自定义属性时，回退为pickle
+            return super(HostManager, cls).serialize(obj)
+
+    @classmethod
+    def get_sections(cls, fields: Optional[Iterable[str]] = None) -> Optional[Set[int]]:
         """
-        :rtype: Host
+        获取字段所在的编码分段，基础属性分段始终需要解析
         """
-        if not (using_mem or using_api):
-            return super(HostManager, cls).get(ip, bk_cloud_id)
+        if fields is None:
+            return None
+        fields = set(fields)
+        sections = {cls.BASE_SECTION}
+        if "topo_link" in fields:
+            sections.add(cls.TOPO_SECTION)
+        if fields - cls.BASE_FIELDS - {"topo_link"}:
+            sections.add(cls.ATTR_SECTION)
+        return sections
+
+    @classmethod
+    def deserialize(cls, string, fields: Optional[Iterable[str]] = None):
+        """
+        :param fields: 需要的主机字段，仅解析字段所在的编码分段，返回的主机对象只保证这些字段可用
+        """
+        if not CompactCodec.is_compact(string):
+            return super(HostManager, cls).deserialize(string)
+
+        sections = cls.get_sections(fields)
+        attrs, topo_link, extra_attrs = CompactCodec.decode(string, sections)
+        if extra_attrs:
+            attrs.update(extra_attrs)
+        if sections is None or cls.TOPO_SECTION in sections:
+            attrs["topo_link"] = {
+                node_id: [dict(zip(cls.TOPO_NODE_FIELDS, node)) for node in nodes]
+                for node_id, nodes in (topo_link or {}).items()
+            }
+
+        # 展示名称依赖的字段可能不在已解析的分段中，使用写入缓存时的展示名称
+        display_name = attrs.get("display_name")
+        host = Host(attrs)
+        if display_name:
+            host.display_name = display_name
+        return host
+
+    @classmethod
+    def get_mem_key(cls, host_key: str, fields: Optional[Iterable[str]] = None) -> str:
+        """
+        本地内存缓存key，按字段获取的主机对象与完整对象分开缓存
+        """
+        sections = cls.get_sections(fields)
+        if sections is None:
+            return host_key
+        return "{}#{}".format(host_key, ",".join(str(section) for section in sorted(sections)))
+
+    @classmethod
+    def multi_get(cls, keys, fields: Optional[Iterable[str]] = None):
+        if fields is None:
+            return super(HostManager, cls).multi_get(keys)
+        if not keys:
+            return []
+        objs = cls.cache.hmget(cls.CACHE_KEY, list(keys))
+        return [cls.deserialize(obj, fields=fields) if obj else None for obj in objs]
+
+    @classmethod
+    def multi_get_with_dict(cls, keys, fields: Optional[Iterable[str]] = None):
+        if not keys:
+            return {}
+        keys = list(keys)
+        return dict(zip(keys, cls.multi_get(keys, fields=fields)))
 
+    @classmethod
+    def get(cls, ip, bk_cloud_id=0, using_mem=False, using_api=False, fields: Optional[Iterable[str]] = None):
+        """
+        :param fields: 需要的主机字段，为空时获取完整的主机对象
+        :rtype: Host
+        """
         host_key = cls.key_to_internal_value(ip, bk_cloud_id)
 
+        if not (using_mem or using_api):
+            host = cls.get_raw(host_key)
+            if host:
+                host = cls.deserialize(host, fields=fields)
+            return host
+
+        mem_key = cls.get_mem_key(host_key, fields)
         if using_mem:
             # 如果使用本地内存，那么在逻辑结束后，需要调用clear_mem_cache函数清理
-            host = local.host_cache.get(host_key, None)
+            host = local.host_cache.get(mem_key, None)
             if host is not None:
                 return host
 
-        host = cls.get(ip, bk_cloud_id)
+        host = cls.get(ip, bk_cloud_id, fields=fields)
         if host is None and using_api:
             # 打印日志以便查看穿透请求情况
             cls.logger.info("[HostManager] get host(%s) by api start", host_key)
@@ -183,7 +325,7 @@ class HostManager(RefreshByBizMixin, CMDBCacheManager):
                 cls.logger.info("[HostManager] get host(%s) by api failed: err -> %s", host_key, str(e))
 
         if using_mem and host:
-            local.host_cache[host_key] = host
+            local.host_cache[mem_key] = host
         return host
 
     @classmethod
@@ -194,26 +336,28 @@ class HostManager(RefreshByBizMixin, CMDBCacheManager):
         return cls.get_by_id(bk_host_id)
 
     @classmethod
-    def get_by_id(cls, bk_host_id, using_mem=False):
+    def get_by_id(cls, bk_host_id, using_mem=False, fields: Optional[Iterable[str]] = None):
         """
+        :param fields: 需要的主机字段，为空时获取完整的主机对象
         :rtype: Host
         """
         bk_host_id = str(bk_host_id)
+        mem_key = cls.get_mem_key(bk_host_id, fields)
 
         # 尝试从本地缓存中获取
         if using_mem:
-            host = local.host_cache.get(bk_host_id, None)
+            host = local.host_cache.get(mem_key, None)
             if host:
                 return host
 
         # 尝试使用bk_host_id获取主机信息
         host = cls.cache.hget(cls.CACHE_KEY, bk_host_id)
         if host:
-            host = cls.deserialize(host)
+            host = cls.deserialize(host, fields=fields)
 
         # 本地缓存主机信息
         if using_mem:
-            local.host_cache[bk_host_id] = host
+            local.host_cache[mem_key] = host
 
         return host
 
@@ -256,8 +400,13 @@ class HostManager(RefreshByBizMixin, CMDBCacheManager):
 
 
 def main():
+    from alarm_backends.core.cache.cmdb.watch import CMDBResourceWatcher
+
     if "host" in settings.DISABLE_ALARM_CMDB_CACHE_REFRESH:
         return
-    HostManager.refresh()
-    HostIPManager.refresh()
-    HostAgentIDManager.refresh()
+    # 已由变更事件增量维护的缓存不再全量刷新
+    if not CMDBResourceWatcher.is_watching(HostManager):
+        HostManager.refresh()
+        HostIPManager.refresh()
+    if not CMDBResourceWatcher.is_watching(HostAgentIDManager):
+        HostAgentIDManager.refresh()
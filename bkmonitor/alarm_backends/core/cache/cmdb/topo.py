@@ -61,6 +61,11 @@ class TopoManager(RefreshByBizMixin, CMDBCacheManager):
 
 
 def main():
+    from alarm_backends.core.cache.cmdb.watch import CMDBResourceWatcher
+
     if "topo" in settings.DISABLE_ALARM_CMDB_CACHE_REFRESH:
         return
+    # 已由变更事件增量维护的缓存不再全量刷新
+    if CMDBResourceWatcher.is_watching(TopoManager):
+        return
     TopoManager.refresh()
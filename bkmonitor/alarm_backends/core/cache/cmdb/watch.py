@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+Tencent is pleased to support the open source community by making 蓝鲸智云 - 监控平台 (BlueKing - Monitor) available.
+Copyright (C) 2017-2021 THL A29 Limited, a Tencent company. All rights reserved.
+Licensed under the MIT License (the "License"); you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://opensource.org/licenses/MIT
+Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on
+an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the
+specific language governing permissions and limitations under the License.
+
+CMDB 资源变更事件监听
+
+通过 resource_watch 接口获取主机、主机关系、拓扑节点、集群及模块的变更事件，按事件涉及的业务增量刷新缓存。
+每种资源的事件游标保存在 redis 中，每次成功消费后续期；游标丢失(过期或被清理)时，重新获取最新游标并全量刷新相关缓存。
+持有有效游标的缓存由本任务维护，周期性的全量刷新任务将跳过这些缓存。
+"""
+import logging
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from django.conf import settings
+
+from alarm_backends.core.cache.cmdb.base import CMDBCacheManager
+from alarm_backends.core.cache.cmdb.host import (
+    HostAgentIDManager,
+    HostIPManager,
+    HostManager,
+)
+from alarm_backends.core.cache.cmdb.module import ModuleManager
+from alarm_backends.core.cache.cmdb.set import SetManager
+from alarm_backends.core.cache.cmdb.topo import TopoManager
+from api.cmdb import client
+
+logger = logging.getLogger("cache")
+
+
+class CMDBEventSource(object):
+    """
+    CMDB 变更事件源
+    """
+
+    def watch(self, bk_resource: str, bk_cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """
+        获取游标之后的变更事件，未提供游标时仅返回当前最新游标
+        :return: (事件列表, 最新游标)
+        """
+        raise NotImplementedError
+
+
+class ResourceWatchEventSource(CMDBEventSource):
+    """
+    基于 CMDB resource_watch 接口的事件源
+    """
+
+    EVENT_TYPES = ["create", "update", "delete"]
+
+    # 只需要定位事件所属业务的字段
+    RESOURCE_FIELDS = {
+        "host": ["bk_host_id"],
+        "host_relation": ["bk_biz_id", "bk_host_id"],
+        "mainline_instance": ["bk_biz_id", "bk_obj_id", "bk_inst_id"],
+        "set": ["bk_biz_id", "bk_set_id"],
+        "module": ["bk_biz_id", "bk_module_id"],
+    }
+
+    def watch(self, bk_resource: str, bk_cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        params = {
+            "bk_resource": bk_resource,
+            "bk_event_types": self.EVENT_TYPES,
+            "bk_fields": self.RESOURCE_FIELDS.get(bk_resource, []),
+        }
+        if bk_cursor:
+            params["bk_cursor"] = bk_cursor
+        else:
+            params["bk_start_from"] = int(time.time())
+
+        result = client.resource_watch(params)
+        events = result.get("bk_events") or []
+        latest_cursor = events[-1]["bk_cursor"] if events else bk_cursor
+        # 没有命中事件时，接口仅返回一个携带最新游标的空事件
+        if not result.get("bk_watched"):
+            return [], latest_cursor
+        return events, latest_cursor
+
+
+class LocalEventSource(CMDBEventSource):
+    """
+    本地事件源，用于测试及调试
+    """
+
+    def __init__(self):
+        self.events = defaultdict(list)
+
+    def push(self, bk_resource: str, bk_event_type: str, bk_detail: Dict):
+        events = self.events[bk_resource]
+        events.append(
+            {
+                "bk_cursor": str(len(events) + 1),
+                "bk_resource": bk_resource,
+                "bk_event_type": bk_event_type,
+                "bk_detail": bk_detail,
+            }
+        )
+
+    def watch(self, bk_resource: str, bk_cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        events = self.events[bk_resource]
+        if bk_cursor is None:
+            return [], str(len(events))
+        events = events[int(bk_cursor) :]
+        return events, events[-1]["bk_cursor"] if events else bk_cursor
+
+
+class CMDBResourceWatcher(object):
+    """
+    CMDB 资源变更监听，按事件涉及的业务增量刷新缓存
+    """
+
+    CURSOR_KEY_TEMPLATE = "{prefix}.cmdb.watch_cursor.{{bk_resource}}".format(
+        prefix=CMDBCacheManager.CACHE_KEY_PREFIX
+    )
+
+    # 资源变更影响的缓存，主机缓存中包含拓扑链路，因此拓扑节点变更同样需要刷新主机缓存
+    RESOURCE_MANAGERS = {
+        "host": [HostManager, HostAgentIDManager],
+        "host_relation": [HostManager, HostAgentIDManager],
+        "mainline_instance": [TopoManager, HostManager],
+        "set": [SetManager, TopoManager, HostManager],
+        "module": [ModuleManager, TopoManager, HostManager],
+    }
+
+    # 单次任务每种资源最多拉取的事件批次
+    MAX_WATCH_ROUNDS = 10
+
+    cache = CMDBCacheManager.cache
+
+    def __init__(self, event_source: CMDBEventSource = None):
+        self.event_source = event_source or ResourceWatchEventSource()
+
+    @classmethod
+    def get_cursor_key(cls, bk_resource: str) -> str:
+        return cls.CURSOR_KEY_TEMPLATE.format(bk_resource=bk_resource)
+
+    @classmethod
+    def is_watching(cls, manager) -> bool:
+        """
+        判断缓存是否由变更事件维护，即影响该缓存的所有资源都持有有效游标
+        """
+        if not settings.CMDB_RESOURCE_WATCH_ENABLED:
+            return False
+        resources = [bk_resource for bk_resource, managers in cls.RESOURCE_MANAGERS.items() if manager in managers]
+        if not resources:
+            return False
+        cursors = cls.cache.mget([cls.get_cursor_key(bk_resource) for bk_resource in resources])
+        return all(cursors)
+
+    @staticmethod
+    def get_event_biz_id(event: Dict) -> Optional[int]:
+        """
+        获取事件所属业务
+        """
+        detail = event.get("bk_detail") or {}
+        if detail.get("bk_biz_id"):
+            return int(detail["bk_biz_id"])
+
+        # 主机属性变更事件不包含业务信息，从主机缓存中获取
+        if event.get("bk_resource") == "host" and detail.get("bk_host_id"):
+            host = HostManager.get_by_id(detail["bk_host_id"])
+            if host:
+                return int(host.bk_biz_id)
+        return None
+
+    def watch(self, bk_resource: str, bk_cursor: str) -> Tuple[List[Dict], str]:
+        """
+        拉取游标之后的全部事件
+        """
+        events = []
+        for __ in range(self.MAX_WATCH_ROUNDS):
+            batch_events, latest_cursor = self.event_source.watch(bk_resource, bk_cursor)
+            if not batch_events or latest_cursor == bk_cursor:
+                break
+            events.extend(batch_events)
+            bk_cursor = latest_cursor
+        return events, bk_cursor
+
+    def sync(self):
+        """
+        同步资源变更事件到缓存
+        """
+        if not settings.CMDB_RESOURCE_WATCH_ENABLED:
+            return
+
+        start_time = time.time()
+        cursors: Dict[str, str] = {}
+        lost_resources = set()
+        full_refresh_managers = set()
+        refresh_biz_ids: Dict[type, Set[int]] = defaultdict(set)
+        event_count = 0
+
+        resources = list(self.RESOURCE_MANAGERS)
+        old_cursors = self.cache.mget([self.get_cursor_key(bk_resource) for bk_resource in resources])
+        for bk_resource, bk_cursor in zip(resources, old_cursors):
+            managers = self.RESOURCE_MANAGERS[bk_resource]
+            try:
+                if not bk_cursor:
+                    # 游标丢失，期间的事件无法追溯，获取最新游标后全量刷新
+                    __, cursors[bk_resource] = self.event_source.watch(bk_resource)
+                    lost_resources.add(bk_resource)
+                    full_refresh_managers.update(managers)
+                    logger.info("[cmdb watch] cursor of resource(%s) is lost, refresh all", bk_resource)
+                    continue
+
+                events, cursors[bk_resource] = self.watch(bk_resource, bk_cursor)
+            except Exception as e:
+                # 游标不续期，持续失败时游标过期，回退为全量刷新
+                logger.exception("[cmdb watch] watch resource(%s) failed: %s", bk_resource, e)
+                cursors.pop(bk_resource, None)
+                continue
+
+            event_count += len(events)
+            biz_ids = {self.get_event_biz_id(event) for event in events}
+            biz_ids.discard(None)
+            for manager in managers:
+                refresh_biz_ids[manager].update(biz_ids)
+
+        failed = False
+        for manager in full_refresh_managers:
+            manager.refresh()
+        if HostManager in full_refresh_managers:
+            HostIPManager.refresh()
+
+        for manager, biz_ids in refresh_biz_ids.items():
+            if manager in full_refresh_managers or not biz_ids:
+                continue
+            updated_keys, deleted_keys, failed_biz_ids = manager.refresh_by_biz_ids(biz_ids)
+            failed = failed or bool(failed_biz_ids)
+            if manager is HostManager:
+                HostIPManager.refresh_by_host_keys(updated_keys, deleted_keys)
+
+        # 增量刷新失败时不推进游标，下次重新消费这些事件
+        pipeline = self.cache.pipeline()
+        for bk_resource, bk_cursor in cursors.items():
+            if bk_cursor and (not failed or bk_resource in lost_resources):
+                pipeline.set(
+                    self.get_cursor_key(bk_resource), bk_cursor, ex=settings.CMDB_RESOURCE_WATCH_CURSOR_TIMEOUT
+                )
+        pipeline.execute()
+
+        logger.info(
+            "[cmdb watch] sync finished, events: %s, full refresh: %s, refresh biz: %s, failed: %s, cost: %s",
+            event_count,
+            [manager.type for manager in full_refresh_managers],
+            {manager.type: len(biz_ids) for manager, biz_ids in refresh_biz_ids.items()},
+            failed,
+            time.time() - start_time,
+        )
+
+
+def main():
+    if "watch" in settings.DISABLE_ALARM_CMDB_CACHE_REFRESH:
+        return
+    CMDBResourceWatcher().sync()
@@ -735,6 +735,26 @@ ACTION_POLL_KEY_LOCK = register_key_with_config(
     }
 )
 
+ACTION_POLL_DUE_INDEX_KEY = register_key_with_config(
+    {
+        "label": "[action]周期通知待检测索引(type:SortedSet, member为action_id, score为下一次检测时间)",
+        "key_type": "sorted_set",
+        "key_tpl": "fta_action.poll.due_index",
+        "ttl": CONST_ONE_DAY,
+        "backend": "service",
+    }
+)
+
+ACTION_POLL_INDEX_SYNC_KEY = register_key_with_config(
+    {
+        "label": "[action]周期通知索引全量同步标记",
+        "key_type": "string",
+        "key_tpl": "fta_action.poll.due_index.sync",
+        "ttl": CONST_MINUTES * 10,
+        "backend": "service",
+    }
+)
+
 TIMEOUT_ACTION_KEY_LOCK = register_key_with_config(
     {
         "label": "[action]超时设置周期任务",
@@ -10,6 +10,7 @@ specific language governing permissions and limitations under the License.
 """
 
 import copy
+import hashlib
 import json
 import logging
 import time
@@ -80,6 +81,10 @@ class StrategyCacheManager(CacheManager):
     STRATEGY_GROUP_CACHE_KEY = CacheManager.CACHE_KEY_PREFIX + ".strategy_group"
     # 最近增量更新时间
     LAST_UPDATED_CACHE_KEY = CacheManager.CACHE_KEY_PREFIX + ".last_updated"
+    # 策略内容md5，用于差量更新策略缓存
+    STRATEGY_HASH_CACHE_KEY = CacheManager.CACHE_KEY_PREFIX + ".strategy_hash"
+    # 策略缓存版本号，策略或策略分组发生变化时递增
+    VERSION_CACHE_KEY = CacheManager.CACHE_KEY_PREFIX + ".strategy_version"
     # 事件型时序检测周期(默认60s)
     fake_event_agg_interval = 60
     # 实例维度
@@ -555,6 +560,20 @@ class StrategyCacheManager(CacheManager):
         """
         return json.loads(cls.cache.get(cls.IDS_CACHE_KEY) or "[]")
 
+    @classmethod
+    def get_raw_strategy_by_ids(cls, strategy_ids: List[int]) -> Dict[int, str]:
+        """
+        从缓存中获取未解析的策略详情
+        :return: {strategy_id: 策略配置json}
+        """
+        raw_strategies = {}
+        for sub_strategy_ids in chunks(list(strategy_ids), 1000):
+            keys = [cls.CACHE_KEY_TEMPLATE.format(strategy_id=strategy_id) for strategy_id in sub_strategy_ids]
+            for strategy_id, strategy in zip(sub_strategy_ids, cls.cache.mget(keys)):
+                if strategy:
+                    raw_strategies[strategy_id] = strategy
+        return raw_strategies
+
     @classmethod
     def get_strategy_by_ids(cls, strategy_ids: List[int]) -> List[Dict]:
         """
@@ -562,11 +581,8 @@ class StrategyCacheManager(CacheManager):
         """
         if not strategy_ids:
             return []
-        keys = [cls.CACHE_KEY_TEMPLATE.format(strategy_id=strategy_id) for strategy_id in strategy_ids]
-        strategies = []
-        for sub_keys in chunks(keys, 1000):
-            strategies.extend(cls.cache.mget(sub_keys))
-        return [Strategy.convert_v1_to_v2(json.loads(strategy)) for strategy in strategies if strategy]
+        strategies = cls.get_raw_strategy_by_ids(strategy_ids).values()
+        return [Strategy.convert_v1_to_v2(json.loads(strategy)) for strategy in strategies]
 
     @classmethod
     def get_strategy_by_id(cls, strategy_id: int) -> Dict:
@@ -672,6 +688,29 @@ class StrategyCacheManager(CacheManager):
         data = cls.cache.hget(cls.STRATEGY_GROUP_CACHE_KEY, strategy_group_key) or "{}"
         return json.loads(data)
 
+    @classmethod
+    def get_strategy_version(cls) -> int:
+        """
+        获取策略缓存版本号，版本号未变化时进程内的策略配置无需重新加载
+        """
+        return int(cls.cache.get(cls.VERSION_CACHE_KEY) or 0)
+
+    @classmethod
+    def get_strategy_hashes(cls, strategy_ids: List[int]) -> Dict[int, str]:
+        """
+        获取策略内容md5
+        :return: {strategy_id: md5}
+        """
+        strategy_ids = list(strategy_ids)
+        strategy_hashes = {}
+        for sub_strategy_ids in chunks(strategy_ids, 1000):
+            for strategy_id, strategy_hash in zip(
+                sub_strategy_ids, cls.cache.hmget(cls.STRATEGY_HASH_CACHE_KEY, sub_strategy_ids)
+            ):
+                if strategy_hash:
+                    strategy_hashes[strategy_id] = strategy_hash
+        return strategy_hashes
+
     @classmethod
     def refresh_strategy_ids(cls, strategies: List[Dict], to_be_deleted_strategy_ids=None):
         """
@@ -685,10 +724,15 @@ class StrategyCacheManager(CacheManager):
             updated_strategy_ids |= old_strategy_ids - set(to_be_deleted_strategy_ids)
 
         cls.cache.set(cls.IDS_CACHE_KEY, json.dumps(list(updated_strategy_ids)), cls.CACHE_TIMEOUT)
-        for strategy_id in old_strategy_ids:
-            if strategy_id not in updated_strategy_ids:
-                logger.info(f"[smart_strategy_cache]: refresh_strategy_ids delete strategy: {strategy_id}")
-                cls.cache.delete(cls.CACHE_KEY_TEMPLATE.format(strategy_id=strategy_id))
+        deleted_strategy_ids = [
+            strategy_id for strategy_id in old_strategy_ids if strategy_id not in updated_strategy_ids
+        ]
+        for strategy_id in deleted_strategy_ids:
+            logger.info(f"[smart_strategy_cache]: refresh_strategy_ids delete strategy: {strategy_id}")
+            cls.cache.delete(cls.CACHE_KEY_TEMPLATE.format(strategy_id=strategy_id))
+        if deleted_strategy_ids:
+            cls.cache.hdel(cls.STRATEGY_HASH_CACHE_KEY, *deleted_strategy_ids)
+            cls.cache.incr(cls.VERSION_CACHE_KEY)
 
     @classmethod
     def refresh_bk_biz_ids(cls, strategies: List[Dict], partial=None):
@@ -813,14 +857,13 @@ class StrategyCacheManager(CacheManager):
     def refresh_strategy(cls, strategies: List[Dict], old_groups=None):
         """
         刷新策略缓存
+        策略及策略分组按内容差量写入，内容未变化的只续期，续期失败(缓存已丢失)的重新写入，存在变化时递增缓存版本号
         """
         strategy_groups = defaultdict(lambda: defaultdict(list))
+        strategy_contents = {}
 
-        pipeline = cls.cache.pipeline()
         for strategy in strategies:
-            pipeline.set(
-                cls.CACHE_KEY_TEMPLATE.format(strategy_id=strategy["id"]), json.dumps(strategy), cls.CACHE_TIMEOUT
-            )
+            strategy_contents[strategy["id"]] = json.dumps(strategy)
             # 默认周期 50s
             for item in strategy["items"]:
                 if item.get("query_md5"):
@@ -843,21 +886,75 @@ class StrategyCacheManager(CacheManager):
                         except (TypeError, ValueError, AssertionError):
                             continue
 
+        pipeline = cls.cache.pipeline()
+
+        # 策略差量写入
+        old_strategy_hashes = cls.get_strategy_hashes(strategy_contents.keys())
+        changed_strategy_hashes = {}
+        unchanged_strategy_ids = []
+        for strategy_id, content in strategy_contents.items():
+            strategy_hash = hashlib.md5(content.encode("utf-8")).hexdigest()
+            if old_strategy_hashes.get(strategy_id) == strategy_hash:
+                unchanged_strategy_ids.append(strategy_id)
+                continue
+            pipeline.set(cls.CACHE_KEY_TEMPLATE.format(strategy_id=strategy_id), content, cls.CACHE_TIMEOUT)
+            changed_strategy_hashes[strategy_id] = strategy_hash
+
+        # 内容未变化的策略续期，续期失败说明策略缓存已丢失，需要重新写入
+        missing_strategy_ids = []
+        for sub_strategy_ids in chunks(unchanged_strategy_ids, 1000):
+            expire_pipeline = cls.cache.pipeline()
+            for strategy_id in sub_strategy_ids:
+                expire_pipeline.expire(cls.CACHE_KEY_TEMPLATE.format(strategy_id=strategy_id), cls.CACHE_TIMEOUT)
+            for strategy_id, result in zip(sub_strategy_ids, expire_pipeline.execute()):
+                if not result:
+                    missing_strategy_ids.append(strategy_id)
+        for strategy_id in missing_strategy_ids:
+            cache_key = cls.CACHE_KEY_TEMPLATE.format(strategy_id=strategy_id)
+            pipeline.set(cache_key, strategy_contents[strategy_id], cls.CACHE_TIMEOUT)
+        if changed_strategy_hashes:
+            pipeline.hmset(cls.STRATEGY_HASH_CACHE_KEY, changed_strategy_hashes)
+        pipeline.expire(cls.STRATEGY_HASH_CACHE_KEY, cls.CACHE_TIMEOUT)
+
         refresh_all = old_groups is None
         if refresh_all:
             # 全量更新
             old_groups = cls.cache.hkeys(cls.STRATEGY_GROUP_CACHE_KEY)
 
+        deleted_groups = []
         for query_md5 in old_groups:
             if query_md5 not in strategy_groups:
                 if not refresh_all:
                     logger.info(f"[smart_strategy_cache]: refresh_strategy delete old group: {query_md5}")
-                pipeline.hdel(cls.STRATEGY_GROUP_CACHE_KEY, query_md5)
-        for query_md5 in strategy_groups:
-            pipeline.hset(cls.STRATEGY_GROUP_CACHE_KEY, query_md5, json.dumps(strategy_groups[query_md5]))
+                deleted_groups.append(query_md5)
+        if deleted_groups:
+            pipeline.hdel(cls.STRATEGY_GROUP_CACHE_KEY, *deleted_groups)
+
+        # 策略分组差量写入
+        group_contents = {query_md5: json.dumps(group) for query_md5, group in strategy_groups.items()}
+        changed_groups = {}
+        for sub_groups in chunks(list(group_contents.keys()), 1000):
+            for query_md5, old_content in zip(sub_groups, cls.cache.hmget(cls.STRATEGY_GROUP_CACHE_KEY, sub_groups)):
+                if old_content != group_contents[query_md5]:
+                    changed_groups[query_md5] = group_contents[query_md5]
+        if changed_groups:
+            pipeline.hmset(cls.STRATEGY_GROUP_CACHE_KEY, changed_groups)
         pipeline.expire(cls.STRATEGY_GROUP_CACHE_KEY, cls.CACHE_TIMEOUT)
 
+        if changed_strategy_hashes or missing_strategy_ids or changed_groups or deleted_groups:
+            pipeline.incr(cls.VERSION_CACHE_KEY)
+        pipeline.expire(cls.VERSION_CACHE_KEY, cls.CACHE_TIMEOUT)
+
         pipeline.execute()
+        logger.info(
+            "[strategy_cache]: refresh_strategy total(%s), changed strategies(%s), missing strategies(%s), "
+            "changed groups(%s), deleted groups(%s)",
+            len(strategy_contents),
+            len(changed_strategy_hashes),
+            len(missing_strategy_ids),
+            len(changed_groups),
+            len(deleted_groups),
+        )
 
     @classmethod
     def add_enabled_cluster_condition(cls, strategy_configs: List[Dict]):
@@ -9,12 +9,16 @@ an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express o
 specific language governing permissions and limitations under the License.
 """
 
+import hashlib
 import json
 import logging
+import threading
+import time
 from datetime import datetime
-from typing import Dict
+from typing import Dict, List
 
 import arrow
+from django.conf import settings
 from django.utils.functional import cached_property
 from django.utils.translation import ugettext as _
 
@@ -24,21 +28,144 @@ from alarm_backends.core.cache.calendar import CalendarCacheManager
 from alarm_backends.core.cache.strategy import StrategyCacheManager
 from alarm_backends.core.control.item import Item
 from alarm_backends.core.i18n import i18n
+from bkmonitor.strategy.new_strategy import Strategy as StrategyClass
 from bkmonitor.utils import time_tools
 from core.errors.alarm_backends import StrategyItemNotFound
 
 logger = logging.getLogger("core.control")
 
 
+class StrategyLocalCache(object):
+    """
+    进程内策略配置缓存
+    1. 缓存策略配置原文，每次获取时重新解析，避免不同实例之间共享可变对象
+    2. 定期检查策略缓存版本号，版本变化时按内容md5淘汰发生变更的策略
+    3. 记录已写入的策略快照，相同更新时间的快照在有效期内不重复写入
+    """
+
+    # 策略快照重写间隔，保证快照在最后一次使用后仍有足够的有效期
+    SNAPSHOT_REWRITE_INTERVAL = CONST_MINUTES * 10
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # {strategy_id: (策略配置原文, 内容md5, 加载时间)}
+        self.strategies = {}
+        # {snapshot_key: 写入时间}
+        self.snapshots = {}
+        self.version = None
+        self.last_check_time = 0
+
+    def clear(self):
+        with self.lock:
+            self.strategies = {}
+            self.snapshots = {}
+            self.version = None
+            self.last_check_time = 0
+
+    def check_version(self):
+        """
+        检查策略缓存版本号，版本变化时淘汰内容发生变化的策略
+        """
+        now = time.time()
+        if now - self.last_check_time < settings.STRATEGY_LOCAL_CACHE_CHECK_INTERVAL:
+            return
+        self.last_check_time = now
+
+        version = StrategyCacheManager.get_strategy_version()
+        if version == self.version:
+            return
+
+        strategies = self.strategies
+        if strategies:
+            strategy_hashes = StrategyCacheManager.get_strategy_hashes(list(strategies.keys()))
+            expired_strategy_ids = [
+                strategy_id
+                for strategy_id, (_, content_hash, _) in strategies.items()
+                if strategy_hashes.get(strategy_id) != content_hash
+            ]
+            with self.lock:
+                for strategy_id in expired_strategy_ids:
+                    self.strategies.pop(strategy_id, None)
+        self.version = version
+
+    def load(self, strategy_ids: List[int]):
+        """
+        批量从redis加载策略配置
+        """
+        raw_strategies = StrategyCacheManager.get_raw_strategy_by_ids(strategy_ids)
+        now = time.time()
+        with self.lock:
+            if len(self.strategies) + len(raw_strategies) > settings.STRATEGY_LOCAL_CACHE_MAX_SIZE:
+                self.strategies = {}
+            for strategy_id, content in raw_strategies.items():
+                content_hash = hashlib.md5(content.encode("utf-8")).hexdigest()
+                self.strategies[strategy_id] = (content, content_hash, now)
+
+    def get_missing_ids(self, strategy_ids: List[int]) -> List[int]:
+        expired_time = time.time() - settings.STRATEGY_LOCAL_CACHE_TIMEOUT
+        missing_ids = []
+        for strategy_id in strategy_ids:
+            cached = self.strategies.get(strategy_id)
+            if cached is None or cached[2] < expired_time:
+                missing_ids.append(strategy_id)
+        return missing_ids
+
+    def preload(self, strategy_ids: List[int]):
+        """
+        批量预加载策略配置
+        """
+        self.check_version()
+        missing_ids = self.get_missing_ids([int(strategy_id) for strategy_id in strategy_ids])
+        if missing_ids:
+            self.load(missing_ids)
+
+    def get(self, strategy_id) -> dict:
+        strategy_id = int(strategy_id)
+        self.preload([strategy_id])
+        cached = self.strategies.get(strategy_id)
+        if cached is None:
+            return None
+        return StrategyClass.convert_v1_to_v2(json.loads(cached[0]))
+
+    def need_write_snapshot(self, snapshot_key) -> bool:
+        """
+        判断策略快照是否需要写入
+        """
+        if not settings.STRATEGY_LOCAL_CACHE_ENABLED:
+            return True
+        now = time.time()
+        if now - self.snapshots.get(snapshot_key, 0) < self.SNAPSHOT_REWRITE_INTERVAL:
+            return False
+        with self.lock:
+            if len(self.snapshots) >= settings.STRATEGY_LOCAL_CACHE_MAX_SIZE:
+                self.snapshots = {}
+            self.snapshots[snapshot_key] = now
+        return True
+
+
+strategy_local_cache = StrategyLocalCache()
+
+
 class Strategy(object):
     def __init__(self, strategy_id, default_config=None):
         self.id = self.strategy_id = strategy_id
         self._config = default_config
 
+    @classmethod
+    def preload(cls, strategy_ids: List[int]):
+        """
+        批量预加载策略配置到进程内缓存，后续实例化的策略直接从进程内缓存获取
+        """
+        if settings.STRATEGY_LOCAL_CACHE_ENABLED:
+            strategy_local_cache.preload(strategy_ids)
+
     @property
     def config(self) -> dict:
         if self._config is None:
-            self._config = StrategyCacheManager.get_strategy_by_id(self.strategy_id) or {}
+            if settings.STRATEGY_LOCAL_CACHE_ENABLED:
+                self._config = strategy_local_cache.get(self.strategy_id) or {}
+            else:
+                self._config = StrategyCacheManager.get_strategy_by_id(self.strategy_id) or {}
         return self._config
 
     @property
@@ -204,14 +331,14 @@ class Strategy(object):
         client = key.STRATEGY_SNAPSHOT_KEY.client
         update_time = self.config.get("update_time")
         snapshot_key = key.STRATEGY_SNAPSHOT_KEY.get_key(strategy_id=self.id, update_time=update_time)
-        client.set(snapshot_key, json.dumps(self.config), ex=CONST_ONE_HOUR)
+        # 相同更新时间的快照内容一致，近期已经写入的不再重复写入
+        if strategy_local_cache.need_write_snapshot(snapshot_key):
+            client.set(snapshot_key, json.dumps(self.config), ex=CONST_ONE_HOUR)
         setattr(self, "snapshot_key", snapshot_key)
         return snapshot_key
 
     @classmethod
     def get_strategy_snapshot_by_key(cls, snapshot_key, strategy_id=None):
-        from bkmonitor.strategy.new_strategy import Strategy as StrategyClass
-
         client = key.STRATEGY_SNAPSHOT_KEY.client
         if strategy_id:
             snapshot_key = key.SimilarStr(snapshot_key)
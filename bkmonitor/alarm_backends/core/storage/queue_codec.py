@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Tencent is pleased to support the open source community by making 蓝鲸智云 - 监控平台 (BlueKing - Monitor) available.
+Copyright (C) 2017-2021 THL A29 Limited, a Tencent company. All rights reserved.
+Licensed under the MIT License (the "License"); you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://opensource.org/licenses/MIT
+Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on
+an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the
+specific language governing permissions and limitations under the License.
+
+access -> detect 待检测数据队列编解码
+
+- json: 每条记录单独序列化为一个队列元素(历史格式)
+- frame: 多条记录合并为一个列式帧，维度/指标字段名在帧内只保存一份
+
+读取端统一通过 decode_entries 解析，按前缀识别帧格式，其余元素按历史 json 格式解析，保证滚动升级期间新旧格式可以共存。
+队列所在 redis 客户端使用 decode_responses=True，因此帧内容必须为文本。
+"""
+import json
+import logging
+from typing import Dict, Iterable, List, Tuple
+
+from django.conf import settings
+
+logger = logging.getLogger("core.storage")
+
+FRAME_PREFIX = "#F1|"
+
+
+class JsonRecordCodec(object):
+    """
+    历史格式：一条记录一个队列元素
+    """
+
+    name = "json"
+    records_per_entry = 1
+
+    def encode(self, records: List[Dict]) -> List[str]:
+        return [json.dumps(record) for record in records]
+
+
+class ColumnarFrameCodec(object):
+    """
+    列式帧格式：
+    #F1|{
+        "f": ["access_time", "record_id", "time", "value", ...],  # 顶层字段名
+        "c": [[...], [...], ...],                                 # 顶层字段按列存储
+        "dk": [["bk_target_ip", "bk_target_cloud_id"], ...],      # 维度字段名字典
+        "d": [[0, ["127.0.0.1", "0"]], ...],                      # 每行维度: [字段名字典下标, 维度值]
+        "vk": [["load5", "time"], ...],                           # 指标字段名字典
+        "v": [[0, [1.38, 1569246480]], ...]                       # 每行指标: [字段名字典下标, 指标值]
+    }
+    """
+
+    name = "frame"
+
+    def __init__(self, frame_size: int = 1000):
+        self.records_per_entry = max(frame_size, 1)
+
+    def _iter_schema_chunks(self, records: List[Dict]) -> Iterable[Tuple[Tuple[str], List[Dict]]]:
+        """
+        按顶层字段集合切分连续记录，同一帧内的记录顶层字段必须一致
+        """
+        schema, chunk = None, []
+        for record in records:
+            record_schema = tuple(sorted(k for k in record if k not in ("dimensions", "values")))
+            if chunk and (record_schema != schema or len(chunk) >= self.records_per_entry):
+                yield schema, chunk
+                chunk = []
+            schema = record_schema
+            chunk.append(record)
+        if chunk:
+            yield schema, chunk
+
+    @staticmethod
+    def _intern(mapping, key_index: Dict[Tuple[str], int], keys: List[List[str]]):
+        if mapping is None:
+            return None
+        field_names = tuple(mapping.keys())
+        index = key_index.get(field_names)
+        if index is None:
+            index = key_index[field_names] = len(keys)
+            keys.append(list(field_names))
+        return [index, list(mapping.values())]
+
+    def encode(self, records: List[Dict]) -> List[str]:
+        entries = []
+        for fields, chunk in self._iter_schema_chunks(records):
+            dimension_key_index, dimension_keys = {}, []
+            value_key_index, value_keys = {}, []
+            columns = [[record[field] for record in chunk] for field in fields]
+            dimensions = [
+                self._intern(record.get("dimensions"), dimension_key_index, dimension_keys) for record in chunk
+            ]
+            values = [self._intern(record.get("values"), value_key_index, value_keys) for record in chunk]
+            frame = {"f": fields, "c": columns, "dk": dimension_keys, "d": dimensions, "vk": value_keys, "v": values}
+            entries.append(FRAME_PREFIX + json.dumps(frame, separators=(",", ":")))
+        return entries
+
+    @staticmethod
+    def decode(entry: str) -> List[Dict]:
+        frame = json.loads(entry[len(FRAME_PREFIX) :])
+        fields, dimension_keys, value_keys = frame["f"], frame["dk"], frame["vk"]
+        records = [dict(zip(fields, row)) for row in zip(*frame["c"])] if fields else [{} for _ in frame["d"]]
+        for record, dimensions, values in zip(records, frame["d"], frame["v"]):
+            if dimensions is not None:
+                record["dimensions"] = dict(zip(dimension_keys[dimensions[0]], dimensions[1]))
+            if values is not None:
+                record["values"] = dict(zip(value_keys[values[0]], values[1]))
+        return records
+
+
+CODECS = {
+    JsonRecordCodec.name: JsonRecordCodec,
+    ColumnarFrameCodec.name: ColumnarFrameCodec,
+}
+
+
+def get_queue_codec(cluster_name: str = None):
+    """
+    获取当前集群配置的队列编码方式
+    ACCESS_DATA_QUEUE_CODEC 格式: {"default": "json", "集群名称": "frame"}
+    """
+    if cluster_name is None:
+        cluster_name = settings.ALARM_BACKEND_CLUSTER_NAME
+    codec_config = getattr(settings, "ACCESS_DATA_QUEUE_CODEC", None) or {}
+    codec_name = codec_config.get(cluster_name, codec_config.get("default", JsonRecordCodec.name))
+    codec_cls = CODECS.get(codec_name)
+    if codec_cls is None:
+        logger.warning("unknown access data queue codec(%s), fallback to json", codec_name)
+        return JsonRecordCodec()
+    if codec_cls is ColumnarFrameCodec:
+        return ColumnarFrameCodec(getattr(settings, "ACCESS_DATA_QUEUE_FRAME_SIZE", 1000))
+    return codec_cls()
+
+
+def decode_entries(entries: Iterable[str]) -> Tuple[List[Dict], int, str]:
+    """
+    批量解析队列元素，兼容帧格式及历史 json 格式
+    :return: (记录列表, 解析失败的元素数量, 最后一个解析失败的元素)
+    """
+    records = []
+    unexpected_count = 0
+    last_unexpected = None
+    for entry in entries:
+        try:
+            if entry.startswith(FRAME_PREFIX):
+                records.extend(ColumnarFrameCodec.decode(entry))
+            else:
+                records.append(json.loads(entry))
+        except (ValueError, KeyError, IndexError, TypeError):
+            unexpected_count += 1
+            last_unexpected = entry
+    return records, unexpected_count, last_unexpected
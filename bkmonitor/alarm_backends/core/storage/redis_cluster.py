@@ -8,9 +8,32 @@ Unless required by applicable law or agreed to in writing, software distributed
 an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the
 specific language governing permissions and limitations under the License.
 """
+import bisect
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
 from alarm_backends.core.cluster import get_cluster
 from alarm_backends.core.storage.redis import CACHE_BACKEND_CONF_MAP, Cache
 from bkmonitor.models import CacheNode, CacheRouter
+from core.prometheus import metrics
+
+# 多节点 pipeline 并发执行线程池，按进程号区分
+_pipeline_executors = {}
+
+
+def get_pipeline_executor():
+    # fork 出的子进程不会继承父进程线程池中的线程，需要在子进程中重新创建
+    pid = os.getpid()
+    executor = _pipeline_executors.get(pid)
+    if executor is None:
+        _pipeline_executors.clear()
+        executor = _pipeline_executors[pid] = ThreadPoolExecutor(
+            max_workers=settings.REDIS_PIPELINE_EXECUTOR_WORKERS, thread_name_prefix="redis_pipeline"
+        )
+    return executor
 
 
 class RedisNode(object):
@@ -159,13 +182,34 @@ class PipelineProxy(KeyRouterMixin):
 
         return self._pipeline_pool[node.id]
 
+    def _execute_node(self, node_id, pipeline_instance):
+        command_count = len(pipeline_instance)
+        start = time.time()
+        try:
+            return getattr(pipeline_instance, "execute")()
+        finally:
+            labels = {"node": str(node_id), "backend": self.node_proxy.backend}
+            metrics.REDIS_PIPELINE_EXECUTE_TIME.labels(**labels).observe(time.time() - start)
+            metrics.REDIS_PIPELINE_COMMAND_COUNT.labels(**labels).inc(command_count)
+
     def execute(self):
         p_result = {}
         result = []
-        for node_id, pipeline_instance in self._pipeline_pool.items():
-            p_result[node_id] = list(reversed(getattr(pipeline_instance, "execute")()))
+        # 仅执行存在命令的节点，多个节点时并发执行，避免逐个节点串行等待
+        pending = [(node_id, p) for node_id, p in self._pipeline_pool.items() if len(p)]
+        if len(pending) == 1:
+            node_id, pipeline_instance = pending[0]
+            p_result[node_id] = list(reversed(self._execute_node(node_id, pipeline_instance)))
+        elif pending:
+            executor = get_pipeline_executor()
+            futures = {
+                node_id: executor.submit(self._execute_node, node_id, pipeline_instance)
+                for node_id, pipeline_instance in pending
+            }
+            for node_id, future in futures.items():
+                p_result[node_id] = list(reversed(future.result()))
         for cmd in self.command_stack:
-            resp = p_result[cmd].pop() if p_result[cmd] else None
+            resp = p_result[cmd].pop() if p_result.get(cmd) else None
             result.append(resp)
         self.command_stack = []
         return result
@@ -188,6 +232,8 @@ class PipelineProxy(KeyRouterMixin):
 
 
 STRATEGY_ROUTER_CACHE = None
+# 与 STRATEGY_ROUTER_CACHE 一一对应的 strategy_score 列表，用于二分查找
+STRATEGY_ROUTER_SCORES = []
 STRATEGY_NODE_MAP = {}
 DEFAULT_NODE = None
 
@@ -195,7 +241,7 @@ DEFAULT_NODE = None
 def get_node_by_strategy_id(strategy_id: int):
     from django.utils.translation import ugettext as _
 
-    global STRATEGY_ROUTER_CACHE, DEFAULT_NODE, STRATEGY_NODE_MAP
+    global STRATEGY_ROUTER_CACHE, STRATEGY_ROUTER_SCORES, DEFAULT_NODE, STRATEGY_NODE_MAP
 
     # 获取路由表
     if not STRATEGY_ROUTER_CACHE:
@@ -204,6 +250,7 @@ def get_node_by_strategy_id(strategy_id: int):
             .select_related("node")
             .order_by("strategy_score")
         )
+        STRATEGY_ROUTER_SCORES = [router.strategy_score for router in STRATEGY_ROUTER_CACHE]
 
     # 优先从缓存中获取
     if STRATEGY_NODE_MAP.get(strategy_id):
@@ -215,11 +262,12 @@ def get_node_by_strategy_id(strategy_id: int):
             DEFAULT_NODE = CacheNode.default_node()
         return DEFAULT_NODE
 
-    # 根据策略ID获取对应的节点
-    for router in STRATEGY_ROUTER_CACHE:
-        if router.strategy_score > strategy_id:
-            STRATEGY_NODE_MAP[strategy_id] = router.node
-            return router.node
+    # 根据策略ID获取对应的节点：第一个 strategy_score 大于策略ID的路由
+    index = bisect.bisect_right(STRATEGY_ROUTER_SCORES, strategy_id)
+    if index < len(STRATEGY_ROUTER_CACHE):
+        node = STRATEGY_ROUTER_CACHE[index].node
+        STRATEGY_NODE_MAP[strategy_id] = node
+        return node
 
     # 如果策略ID超过了设置的默认上限，则抛出异常
     raise Exception(_("策略ID超过设置的默认上限"))
@@ -82,6 +82,8 @@ class HostStatusFilter(base.Filter):
     主机状态过滤器
     """
 
+    HOST_FIELDS = ["bk_state", "display_name"]
+
     def filter(self, record):
         """
         如果主机运营状态为不监控的几种类型，则直接过滤
@@ -97,12 +99,15 @@ class HostStatusFilter(base.Filter):
             return True
 
         if record.dimensions.get("bk_host_id"):
-            host = HostManager.get_by_id(bk_host_id=record.dimensions["bk_host_id"], using_mem=True)
+            host = HostManager.get_by_id(
+                bk_host_id=record.dimensions["bk_host_id"], using_mem=True, fields=self.HOST_FIELDS
+            )
         elif "bk_target_ip" in record.dimensions and "bk_target_cloud_id" in record.dimensions:
             host = HostManager.get(
                 ip=record.dimensions["bk_target_ip"],
                 bk_cloud_id=record.dimensions["bk_target_cloud_id"],
                 using_mem=True,
+                fields=self.HOST_FIELDS,
             )
         else:
             return False
@@ -18,6 +18,9 @@ from constants.data_source import DataSourceLabel, DataTypeLabel
 
 
 class TopoNodeFuller(Fuller):
+    # 维度补全只需要主机的IP及拓扑信息，避免解析完整的主机对象
+    HOST_FIELDS = ["ip", "bk_cloud_id", "bk_host_id", "topo_link"]
+
     @classmethod
     def is_service_target(cls, scenario):
         """
@@ -55,7 +58,7 @@ class TopoNodeFuller(Fuller):
         # 按主机ID补全维度
         bk_host_id = dimensions.get("bk_host_id")
         if bk_host_id:
-            host = HostManager.get_by_id(bk_host_id)
+            host = HostManager.get_by_id(bk_host_id, fields=self.HOST_FIELDS)
             if host:
                 dimensions["bk_target_ip"] = host.ip
                 dimensions["bk_target_cloud_id"] = str(host.bk_cloud_id)
@@ -79,7 +82,7 @@ class TopoNodeFuller(Fuller):
             return
 
         bk_target_cloud_id = dimensions.get("bk_target_cloud_id", "0") or dimensions.get("bk_cloud_id", "0")
-        host = HostManager.get(bk_target_ip, bk_target_cloud_id, using_mem=True)
+        host = HostManager.get(bk_target_ip, bk_target_cloud_id, using_mem=True, fields=self.HOST_FIELDS)
         if not host:
             return
 
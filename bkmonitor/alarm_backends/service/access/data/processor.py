@@ -12,11 +12,14 @@ import base64
 import gzip
 import json
 import logging
+import multiprocessing
+import os
 import queue
 import signal
 import threading
 import time
-from collections import defaultdict
+import zlib
+from collections import defaultdict, namedtuple
 from datetime import datetime, timedelta
 from typing import Dict, List
 
@@ -24,6 +27,7 @@ import arrow
 import pytz
 import redis
 from django.conf import settings
+from django.db import connections
 from django.utils.functional import cached_property
 from kafka import KafkaConsumer
 from kafka.consumer.fetcher import ConsumerRecord
@@ -38,6 +42,7 @@ from alarm_backends.core.cluster import get_cluster
 from alarm_backends.core.control.checkpoint import Checkpoint
 from alarm_backends.core.control.item import Item
 from alarm_backends.core.control.strategy import Strategy
+from alarm_backends.core.storage.queue_codec import JsonRecordCodec, get_queue_codec
 from alarm_backends.core.storage.redis import Cache
 from alarm_backends.management.hashring import HashRing
 from alarm_backends.service.access import base
@@ -62,6 +67,9 @@ from core.prometheus import metrics
 IP = get_local_ip()
 logger = logging.getLogger("access.data")
 
+# 分发到实时数据 handler 子进程的记录，仅保留处理所需字段，减少进程间序列化开销
+RealTimeRecord = namedtuple("RealTimeRecord", ["topic", "partition", "timestamp", "value"])
+
 
 class BaseAccessDataProcess(base.BaseAccessProcess):
     def __init__(self, *args, sub_task_id: str = None, **kwargs):
@@ -140,7 +148,9 @@ class BaseAccessDataProcess(base.BaseAccessProcess):
         data_list_key = data_list_key or key.DATA_LIST_KEY
         client = output_client or data_list_key.client
         output_key = data_list_key.get_key(strategy_id=item.strategy.strategy_id, item_id=item.id)
-        queue_length = client.llen(output_key)
+        # 无数据队列会被 nodata 模块原样回写，仍使用单条 json 格式
+        codec = get_queue_codec() if data_list_key is key.DATA_LIST_KEY else JsonRecordCodec()
+        queue_length = client.llen(output_key) * codec.records_per_entry
         # 超过最大检测长度10倍(50w)说明detect模块处理能力不足,数据将被丢弃。
         if queue_length > settings.SQL_MAX_LIMIT * 10:
             msg = (
@@ -155,7 +165,7 @@ class BaseAccessDataProcess(base.BaseAccessProcess):
         _offset = 0
         while _offset < len(record_list):
             chunk_records = record_list[_offset : _offset + 10000]
-            pipeline.lpush(output_key, *[json.dumps(record.data) for record in chunk_records])
+            pipeline.lpush(output_key, *codec.encode([record.data for record in chunk_records]))
             _offset += 10000
         # 避免监控周期大于默认key过期时间，引起数据丢失
         agg_interval = min(query_config["agg_interval"] for query_config in item.query_configs)
@@ -253,6 +263,7 @@ class AccessDataProcess(BaseAccessDataProcess):
     def items(self) -> List[Item]:
         data = []
         records = StrategyCacheManager.get_strategy_group_detail(self.strategy_group_key)
+        Strategy.preload([strategy_id for strategy_id in records if strategy_id.isdigit()])
         for strategy_id, item_ids in list(records.items()):
             try:
                 strategy_id = int(strategy_id)
@@ -827,6 +838,12 @@ class AccessRealTimeDataProcess(BaseAccessDataProcess):
         self._stop_signal = False
         self.strategy_cache = {}
 
+        # handler 子进程数量，为 0 时在当前进程内使用单个 handler 线程处理
+        self.handler_process_count = settings.ACCESS_REAL_TIME_HANDLER_PROCESSES
+        # 各 handler 子进程及其数据队列，按 partition 分片
+        self.workers: List[multiprocessing.Process] = []
+        self.worker_queues = []
+
     def __str__(self):
         return super(AccessRealTimeDataProcess, self).__str__()
 
@@ -1054,9 +1071,9 @@ class AccessRealTimeDataProcess(BaseAccessDataProcess):
                     continue
 
                 has_record = True
-                for records in data.values():
+                for topic_partition, records in data.items():
                     logger.info(f"real_time poller poll {consumer.config['bootstrap_servers']}: {len(records)}")
-                    self.queue.put((consumer.config["bootstrap_servers"], records))
+                    self.dispatch(consumer.config["bootstrap_servers"], topic_partition, records)
             self.consumers_lock.release()
 
             if once or self._stop_signal:
@@ -1067,13 +1084,80 @@ class AccessRealTimeDataProcess(BaseAccessDataProcess):
             if not has_record:
                 time.sleep(1)
 
+    def get_worker_index(self, bootstrap_servers: str, topic_partition) -> int:
+        """
+        按 partition 计算所属的 handler 子进程，同一 partition 的数据固定由同一子进程处理
+        """
+        shard_key = f"{bootstrap_servers}|{topic_partition.topic}|{topic_partition.partition}"
+        return zlib.crc32(shard_key.encode()) % len(self.worker_queues)
+
+    def dispatch(self, bootstrap_servers: str, topic_partition, records: List[ConsumerRecord]):
+        """
+        分发拉取到的数据
+        多进程模式下按 partition 分片到 handler 子进程，子进程队列满时阻塞 poller，形成反压
+        topic 配置随数据一并下发，子进程与 poller 使用同一份 topic 信息，不再单独刷新
+        """
+        if not self.worker_queues:
+            self.queue.put((bootstrap_servers, records))
+            return
+
+        worker_index = self.get_worker_index(bootstrap_servers, topic_partition)
+        worker_queue = self.worker_queues[worker_index]
+        topic_key = f"{bootstrap_servers}|{topic_partition.topic}"
+        message = (
+            bootstrap_servers,
+            [RealTimeRecord(r.topic, r.partition, r.timestamp, r.value) for r in records],
+            {topic_key: self.topics[topic_key]} if topic_key in self.topics else {},
+        )
+        while True:
+            if not self.check_worker_alive(worker_index):
+                return
+
+            try:
+                worker_queue.put(message, timeout=5)
+                break
+            except queue.Full:
+                metrics.ACCESS_REAL_TIME_HANDLER_BLOCKED_COUNT.labels(worker=str(worker_index)).inc()
+                logger.warning(f"real_time handler worker({worker_index}) queue is full, poller blocked")
+
+            if self._stop_signal:
+                logger.warning(
+                    f"real_time handler worker({worker_index}) queue is full on stop, drop {len(records)} records"
+                )
+                return
+
+        try:
+            metrics.ACCESS_REAL_TIME_HANDLER_QUEUE_SIZE.labels(worker=str(worker_index)).set(worker_queue.qsize())
+        except NotImplementedError:
+            pass
+
+    def check_worker_alive(self, worker_index: int) -> bool:
+        """
+        检查 handler 子进程是否存活
+        多线程环境下无法安全地重新 fork 子进程，子进程异常退出时停止当前进程，由进程管理重新拉起
+        """
+        worker = self.workers[worker_index]
+        if worker.is_alive():
+            return True
+
+        if not self._stop_signal:
+            logger.error(f"real_time handler worker({worker_index}) exited with code {worker.exitcode}, stop process")
+            self._stop_signal = True
+        return False
+
+    def refresh_topics(self):
+        """
+        获取分配到本机的最新topic信息
+        """
+        self.topics = json.loads(self.cache.hget(self.topic_cache_key, self.ip) or "{}")
+
     def run_consumer_manager(self, once=False):
         """
         kafka消费者管理
         """
         while True:
             # 获取最新的topic信息
-            self.topics = json.loads(self.cache.hget(self.topic_cache_key, self.ip) or "{}")
+            self.refresh_topics()
 
             # kafka集群及所属topic分组
             bootstrap_servers_topics = defaultdict(set)
@@ -1150,44 +1234,128 @@ class AccessRealTimeDataProcess(BaseAccessDataProcess):
                 data = []
                 bootstrap_servers = ""
 
-            try:
-                records = []
-                for record in data:
-                    try:
-                        records.extend(self.flat(bootstrap_servers, record))
-                    except Exception as e:
-                        logger.warning("%s loads alarm(%s) failed", record.topic, record.value, e)
-
-                record_list = []
-                for r in records:
-                    # 补充维度：比如：业务、集群、模块等信息
-                    self.full(r)
-
-                    new_r_list = r.full()
-                    if not new_r_list:
-                        continue
+            self.handle(bootstrap_servers, data)
 
-                    record_list.extend(new_r_list)
+            if once:
+                break
 
-                output = []
-                for r in record_list:
-                    # 过滤数据
-                    if self.filter(r) or r.filter(r):
-                        continue
+    def handle(self, bootstrap_servers: str, data: List):
+        """
+        处理一批kafka数据: 扁平化 -> 补充维度 -> 过滤 -> 推送
+        """
+        try:
+            records = []
+            for record in data:
+                try:
+                    records.extend(self.flat(bootstrap_servers, record))
+                except Exception as e:
+                    logger.warning("%s loads alarm(%s) failed", record.topic, record.value, e)
+
+            record_list = []
+            for r in records:
+                # 补充维度：比如：业务、集群、模块等信息
+                self.full(r)
 
-                    # 格式化数据
-                    r.clean()
+                new_r_list = r.full()
+                if not new_r_list:
+                    continue
+
+                record_list.extend(new_r_list)
 
-                    output.append(r)
+            output = []
+            for r in record_list:
+                # 过滤数据
+                if self.filter(r) or r.filter(r):
+                    continue
 
-                self.push(output)
-            except Exception as e:
-                logger.exception(e)
-                logger.error(f"real_time handler exception: {e}")
+                # 格式化数据
+                r.clean()
 
-            if once:
+                output.append(r)
+
+            self.push(output)
+        except Exception as e:
+            logger.exception(e)
+            logger.error(f"real_time handler exception: {e}")
+
+    def run_worker(self, worker_index: int, worker_queue, parent_pid: int):
+        """
+        handler 子进程，处理分片到本进程的数据，使用独立的redis连接推送
+        停止时由主进程投递 None 通知退出，主进程异常退出时子进程自行退出
+        """
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+        worker = str(worker_index)
+        self.consumers = {}
+        self.strategy_cache = {}
+        self.topics = {}
+        while os.getppid() == parent_pid:
+            try:
+                message = worker_queue.get(block=True, timeout=5)
+            except queue.Empty:
+                continue
+
+            if message is None:
+                logger.info(f"real_time handler worker({worker}) get stop signal")
                 break
 
+            bootstrap_servers, data, topics = message
+            self.topics.update(topics)
+            self.handle(bootstrap_servers, data)
+
+            # 处理延迟: 当前时间 - 本批次最早的数据写入kafka时间
+            timestamps = [r.timestamp for r in data if r.timestamp and r.timestamp > 0]
+            if timestamps:
+                metrics.ACCESS_REAL_TIME_HANDLER_LAG.labels(worker=worker).set(time.time() - min(timestamps) / 1000)
+            metrics.ACCESS_REAL_TIME_HANDLER_RECORD_COUNT.labels(worker=worker).inc(len(data))
+            metrics.report_all()
+
+    def start_workers(self) -> List[multiprocessing.Process]:
+        """
+        启动 handler 子进程，需要在启动其他线程前调用，避免fork时复制线程持有的锁
+        """
+        if self.handler_process_count <= 0:
+            return []
+
+        # 数据库连接不能在父子进程间共享，fork前关闭，使用时各自重建
+        connections.close_all()
+
+        workers = []
+        parent_pid = os.getpid()
+        for worker_index in range(self.handler_process_count):
+            worker_queue = multiprocessing.Queue(maxsize=settings.ACCESS_REAL_TIME_HANDLER_QUEUE_SIZE)
+            worker = multiprocessing.Process(
+                target=self.run_worker,
+                args=(worker_index, worker_queue, parent_pid),
+                name=f"real_time_handler_{worker_index}",
+                daemon=True,
+            )
+            worker.start()
+            self.worker_queues.append(worker_queue)
+            workers.append(worker)
+        self.workers = workers
+        logger.info(f"real_time handler start {len(workers)} worker processes")
+        return workers
+
+    def stop_workers(self, workers: List[multiprocessing.Process]):
+        """
+        通知 handler 子进程处理完队列中的数据后退出
+        """
+        for worker, worker_queue in zip(workers, self.worker_queues):
+            if not worker.is_alive():
+                continue
+            try:
+                worker_queue.put(None, timeout=5)
+            except queue.Full:
+                logger.warning(f"real_time handler worker({worker.name}) queue is full, terminate it")
+        for worker in workers:
+            worker.join(timeout=60)
+            if worker.is_alive():
+                worker.terminate()
+        self.workers = []
+        self.worker_queues = []
+
     def _stop(self, *args, **kwargs):
         self._stop_signal = True
 
@@ -1200,6 +1368,8 @@ class AccessRealTimeDataProcess(BaseAccessDataProcess):
         else:
             signal.signal(signal.SIGTERM, self._stop)
             signal.signal(signal.SIGINT, self._stop)
+            # 多进程模式下由 handler 子进程处理数据，否则在当前进程内启动 handler 线程
+            workers = self.start_workers()
             leader = InheritParentThread(target=self.run_leader)
             consumer_manager = InheritParentThread(target=self.run_consumer_manager)
             poller = InheritParentThread(target=self.run_poller)
@@ -1207,16 +1377,27 @@ class AccessRealTimeDataProcess(BaseAccessDataProcess):
             leader.start()
             consumer_manager.start()
             poller.start()
-            handler.start()
+            if not workers:
+                handler.start()
 
             while True:
                 self.service.register()
 
+                if workers:
+                    # 子进程异常退出时停止当前进程
+                    for worker_index in range(len(workers)):
+                        self.check_worker_alive(worker_index)
+                    # poller 及其他线程共用指标注册表，统一在主循环中周期上报
+                    metrics.report_all()
+
                 if self._stop_signal:
                     leader.join()
                     consumer_manager.join()
                     poller.join()
-                    handler.join()
+                    if workers:
+                        self.stop_workers(workers)
+                    else:
+                        handler.join()
                     self.service.unregister()
                     return
 
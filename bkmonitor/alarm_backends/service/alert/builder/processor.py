@@ -10,7 +10,7 @@ specific language governing permissions and limitations under the License.
 """
 import logging
 import time
-from typing import List
+from typing import Dict, List
 
 from django.utils.translation import ugettext as _
 from elasticsearch.helpers import BulkIndexError
@@ -35,11 +35,13 @@ class AlertBuilder(BaseAlertProcessor):
         super(AlertBuilder, self).__init__()
         self.logger = logging.getLogger("alert.builder")
 
-    def get_unexpired_events(self, events: List[Event]):
+    def get_unexpired_events(self, events: List[Event], current_alerts: Dict[str, Alert] = None):
         """
         先判断关联事件是否已经过期
+        :param current_alerts: 已加载的告警快照，不传则从缓存读取
         """
-        current_alerts = self.get_current_alerts(events)
+        if current_alerts is None:
+            current_alerts = self.get_current_alerts(events)
         unexpired_events = []
         expired_events = []
         for event in events:
@@ -77,7 +79,8 @@ class AlertBuilder(BaseAlertProcessor):
         """
         from alarm_backends.service.alert.builder.tasks import dedupe_events_to_alerts
 
-        events = self.get_unexpired_events(events)
+        # 已丢弃的事件无需处理
+        events = [event for event in events if not event.is_dropped()]
         if not events:
             return []
         lock_keys = [ALERT_UPDATE_LOCK.get_key(dedupe_md5=event.dedupe_md5) for event in events]
@@ -92,6 +95,11 @@ class AlertBuilder(BaseAlertProcessor):
                 else:
                     fail_locked_events.append(event)
 
+            # 加锁成功后一次性加载告警快照，过期检查、QOS处理及告警构建共用，避免重复读取缓存
+            # 加锁失败的事件延后重试时再进行过期检查
+            current_alerts = self.get_current_alerts(success_locked_events)
+            success_locked_events = self.get_unexpired_events(success_locked_events, current_alerts)
+
             for event in success_locked_events:
                 latency = event.get_process_latency()
                 if not latency:
@@ -111,7 +119,7 @@ class AlertBuilder(BaseAlertProcessor):
                     ).observe(latency["access_latency"])
 
             # 对加锁成功的告警才能进行操作
-            alerts = self.build_alerts(success_locked_events)
+            alerts = self.build_alerts(success_locked_events, current_alerts)
             alerts = self.enrich_alerts(alerts)
             self.update_alert_cache(alerts)
             self.update_alert_snapshot(alerts)
@@ -172,6 +180,8 @@ class AlertBuilder(BaseAlertProcessor):
             for alert in alerts
             if alert.is_new() and alert.strategy_id
         ]
+        if not alerts:
+            return
         send_check_task.delay(alerts=alerts, run_immediately=False)
         self.logger.info("send periodic check task finished, total(%s)", len(alerts))
 
@@ -284,14 +294,16 @@ class AlertBuilder(BaseAlertProcessor):
             )
             return alert
 
-    def build_alerts(self, events: List[Event]) -> List[Alert]:
+    def build_alerts(self, events: List[Event], current_alerts: Dict[str, Alert] = None) -> List[Alert]:
         """
         根据事件生成告警
+        :param current_alerts: 已加载的告警快照，构建过程中会回写，不传则从缓存读取
         """
         if not events:
             return []
 
-        current_alerts = self.get_current_alerts(events)
+        if current_alerts is None:
+            current_alerts = self.get_current_alerts(events)
         new_alerts = {}
         # 对事件进行遍历，逐个更新告警内容
         for event in events:
@@ -25,6 +25,9 @@ logger = logging.getLogger("alert.enricher")
 
 
 class CMDBEnricher(BaseEventEnricher):
+    # 主机丰富需要的字段
+    HOST_FIELDS = ["bk_biz_id", "bk_host_id", "bk_host_innerip", "bk_host_innerip_v6", "bk_cloud_id", "topo_link"]
+
     def __init__(self, events: List[Event]):
         super(CMDBEnricher, self).__init__(events)
 
@@ -53,7 +56,7 @@ class CMDBEnricher(BaseEventEnricher):
 
         # 加上从 ip_cache 拿到的 IP 列表
         hosts |= {host for host in chain(*[ips for ips in self.ip_cache.values() if ips])}
-        self.hosts_cache = HostManager.multi_get_with_dict(hosts)
+        self.hosts_cache = HostManager.multi_get_with_dict(hosts, fields=self.HOST_FIELDS)
 
     def get_host_by_ip(self, ip):
         keys = self.ip_cache.get(HostIPManager.key_to_internal_value(ip)) or []
@@ -103,7 +106,7 @@ class CMDBEnricher(BaseEventEnricher):
             ip_with_cloud_id = event.target.split("|")
 
         if bk_host_id:
-            host = HostManager.get_by_id(bk_host_id)
+            host = HostManager.get_by_id(bk_host_id, fields=self.HOST_FIELDS)
             if not host:
                 ip = ""
                 bk_cloud_id = 0
@@ -36,7 +36,7 @@ class TopoNodeTranslator(BaseTranslator):
         if not bk_host_id:
             return data
 
-        host = HostManager.get_by_id(bk_host_id.value)
+        host = HostManager.get_by_id(bk_host_id.value, fields=["display_name"])
         if not host:
             return data
 
@@ -81,7 +81,11 @@ class BaseAlertProcessor:
             )
             dedupe_md5_list.extend(md5_list)
 
-        alert_data = [ALERT_DEDUPE_CONTENT_KEY.client.get(cache_key) for cache_key in cache_keys]
+        # 通过 pipeline 批量读取，避免逐个key请求
+        pipeline = ALERT_DEDUPE_CONTENT_KEY.client.pipeline(transaction=False)
+        for cache_key in cache_keys:
+            pipeline.get(cache_key)
+        alert_data = pipeline.execute()
 
         alerts = []
 
@@ -31,7 +31,7 @@ from alarm_backends.service.converge.converge_manger import ConvergeManager
 from alarm_backends.service.converge.shield import ShieldManager
 from alarm_backends.service.converge.shield.shielder import AlertShieldConfigShielder
 from alarm_backends.service.converge.utils import get_execute_related_ids
-from alarm_backends.service.fta_action import need_poll
+from alarm_backends.service.fta_action import PollActionIndex, need_poll
 from alarm_backends.service.fta_action.tasks import run_action, run_webhook_action
 from bkmonitor.models.fta.action import ActionInstance, ConvergeInstance
 from bkmonitor.utils import extended_json
@@ -423,6 +423,7 @@ class ConvergeProcessor(object):
             self.instance.save(
                 update_fields=["outputs", "status", "end_time", "update_time", "need_poll", "ex_data", "execute_times"]
             )
+            PollActionIndex.add_finished_action(self.instance)
             if self.instance.status in ActionStatus.END_STATUS:
                 return
 
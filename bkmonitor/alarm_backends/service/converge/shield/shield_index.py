@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Tencent is pleased to support the open source community by making 蓝鲸智云 - 监控平台 (BlueKing - Monitor) available.
+Copyright (C) 2017-2021 THL A29 Limited, a Tencent company. All rights reserved.
+Licensed under the MIT License (the "License"); you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://opensource.org/licenses/MIT
+Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on
+an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the
+specific language governing permissions and limitations under the License.
+
+屏蔽配置索引
+进程内按业务缓存解析后的屏蔽配置，并以每条配置维度检查中的一个顶层相等条件(策略ID、IP、服务实例、拓扑节点等)建立倒排索引。
+查询时只需对候选配置做完整匹配，无需逐条解析并匹配业务下的全部屏蔽配置。
+"""
+import logging
+import threading
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+import arrow
+
+from alarm_backends.core.cache.shield import ShieldCacheManager
+from alarm_backends.service.converge.shield.shield_obj import AlertShieldObj
+from bkmonitor.documents.alert import AlertDocument
+from bkmonitor.utils.range.conditions import EqualCondition
+
+logger = logging.getLogger("fta_action.shield")
+
+
+class ShieldIndex(object):
+    """
+    单个业务的屏蔽配置索引
+    """
+
+    def __init__(self, configs: List[Dict]):
+        self.configs = configs
+        self.shield_objs: List[AlertShieldObj] = []
+        # 索引探针 -> 字段实例，用于从告警维度中提取对应字段的取值
+        self.probe_fields = {}
+        # 索引探针 -> {字段取值: [屏蔽配置下标]}
+        self.index = defaultdict(lambda: defaultdict(list))
+        # 没有顶层相等条件的屏蔽配置，需要逐条匹配
+        self.unindexed = []
+
+        for config in configs:
+            try:
+                shield_obj = AlertShieldObj(config)
+            except Exception as e:
+                logger.exception("parse shield config(%s) error: %s", config.get("id"), e)
+                continue
+            self.add(shield_obj)
+
+    @staticmethod
+    def get_probe_key(field) -> Tuple:
+        """
+        字段从数据中取值的方式与字段类型、名称及配置值的格式(如IP配置为字符串或带云区域的字典)有关
+        """
+        first_value = field.value
+        if first_value and isinstance(first_value, (list, tuple)):
+            first_value = first_value[0]
+        value_format = tuple(sorted(first_value)) if isinstance(first_value, dict) else None
+        return field.__class__, field.name, value_format
+
+    @staticmethod
+    def get_index_condition(shield_obj: AlertShieldObj):
+        """
+        维度检查中顶层的相等条件均为匹配的必要条件，选择取值最少的条件建立索引
+        """
+        conditions = [
+            condition for condition in shield_obj.dimension_check.conditions if type(condition) is EqualCondition
+        ]
+        if not conditions:
+            return None
+        return min(conditions, key=lambda condition: len(condition.cond_field.to_str_list()))
+
+    def add(self, shield_obj: AlertShieldObj):
+        position = len(self.shield_objs)
+        self.shield_objs.append(shield_obj)
+
+        condition = self.get_index_condition(shield_obj)
+        if condition is None:
+            self.unindexed.append(position)
+            return
+
+        field = condition.cond_field
+        probe_key = self.get_probe_key(field)
+        self.probe_fields.setdefault(probe_key, field)
+        for value in set(field.to_str_list()):
+            self.index[probe_key][value].append(position)
+
+    def get_candidates(self, dimension: Dict) -> List[int]:
+        candidates = set(self.unindexed)
+        for probe_key, field in self.probe_fields.items():
+            is_exists, data_value = field.get_value_from_data(dimension)
+            if not is_exists:
+                continue
+            values = self.index[probe_key]
+            for value in field.__class__(field.name, data_value).to_str_list():
+                candidates.update(values.get(value, ()))
+        return sorted(candidates)
+
+    def match(self, alert: AlertDocument) -> List[AlertShieldObj]:
+        """
+        获取与告警匹配的屏蔽配置
+        """
+        if not self.shield_objs:
+            return []
+
+        dimension = self.shield_objs[0].get_dimension(alert)
+        source_time = arrow.now()
+        return [
+            self.shield_objs[position]
+            for position in self.get_candidates(dimension)
+            if self.shield_objs[position].is_match(alert, source_time=source_time, dimension=dimension)
+        ]
+
+
+class ShieldIndexManager(object):
+    """
+    进程内屏蔽配置索引缓存，业务的屏蔽配置缓存内容发生变化时重建索引
+    """
+
+    _lock = threading.Lock()
+    _indexes: Dict[int, Tuple[str, ShieldIndex]] = {}
+
+    @classmethod
+    def get_index(cls, bk_biz_id) -> ShieldIndex:
+        raw_data = ShieldCacheManager.get_raw_shields_by_biz_id(bk_biz_id)
+        cached = cls._indexes.get(bk_biz_id)
+        if cached and cached[0] == raw_data:
+            return cached[1]
+
+        shield_index = ShieldIndex(ShieldCacheManager.parse_shields(raw_data))
+        with cls._lock:
+            cls._indexes[bk_biz_id] = (raw_data, shield_index)
+        return shield_index
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._indexes = {}
@@ -425,6 +425,14 @@ class AlertShieldObj(ShieldObj):
                 new_dimensions[key[len(tag_prefix) :]] = value
         return new_dimensions
 
-    def is_match(self, alert: AlertDocument):
-        source_time = arrow.now()
-        return self.time_check.is_match(source_time) and self.dimension_check.is_match(self.get_dimension(alert))
+    def is_match(self, alert: AlertDocument, source_time=None, dimension=None):
+        """
+        :param source_time: 匹配时间，默认为当前时间
+        :param dimension: 已经计算好的告警维度，多个屏蔽配置匹配同一告警时可复用
+        """
+        source_time = source_time or arrow.now()
+        if not self.time_check.is_match(source_time):
+            return False
+        if dimension is None:
+            dimension = self.get_dimension(alert)
+        return self.dimension_check.is_match(dimension)
@@ -59,8 +59,39 @@ class AnomalyDataPoint(object):
     def __init__(self, data_point, detector):
         self.data_point = data_point
         self.detector = detector
-        self.anomaly_message = ""
+        self._anomaly_message = ""
+        # 异常描述渲染函数，首次读取 anomaly_message 时才执行渲染
+        self._message_renderer = None
         self.anomaly_time = arrow.utcnow().format("YYYY-MM-DD HH:mm:ss")
         self.strategy_snapshot_key = ""
         self.child_detector = []
         self.context = {}
+
+    @property
+    def anomaly_message(self):
+        if self._message_renderer is not None:
+            renderer, self._message_renderer = self._message_renderer, None
+            self._anomaly_message = renderer()
+        return self._anomaly_message
+
+    @anomaly_message.setter
+    def anomaly_message(self, message):
+        self._message_renderer = None
+        self._anomaly_message = message
+
+    def set_lazy_message(self, renderer):
+        """
+        设置延迟渲染的异常描述
+        :param renderer: 无参函数，返回异常描述
+        """
+        self._message_renderer = renderer
+
+    def wrap_message(self, prefix="", suffix=""):
+        """
+        为异常描述拼接前后缀，不触发渲染
+        """
+        renderer = self._message_renderer
+        if renderer is None:
+            self._anomaly_message = prefix + self._anomaly_message + suffix
+        else:
+            self._message_renderer = lambda: prefix + renderer() + suffix
@@ -9,7 +9,6 @@ an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express o
 specific language governing permissions and limitations under the License.
 """
 
-import json
 import logging
 import time
 
@@ -20,6 +19,7 @@ from alarm_backends.core.control.strategy import Strategy
 from alarm_backends.core.i18n import i18n
 from alarm_backends.core.lock.service_lock import service_lock
 from alarm_backends.core.processor.base import BaseAbnormalPushProcessor
+from alarm_backends.core.storage.queue_codec import decode_entries, get_queue_codec
 from alarm_backends.service.detect import DataPoint
 from core.prometheus import metrics
 
@@ -60,47 +60,44 @@ class DetectProcess(BaseAbnormalPushProcessor):
         data_channel = key.DATA_LIST_KEY.get_key(strategy_id=self.strategy_id, item_id=item.id)
         client = key.DATA_LIST_KEY.client
 
-        total_points = client.llen(data_channel)
+        codec = get_queue_codec()
+        total_entries = client.llen(data_channel)
         assert settings.SQL_MAX_LIMIT > 0, "SQL_MAX_LIMIT should bigger than zero"
-        offset = min([total_points, settings.SQL_MAX_LIMIT])
+        # 帧格式下每个队列元素包含多条记录，按元素数量折算拉取上限
+        max_entries = max(settings.SQL_MAX_LIMIT // codec.records_per_entry, 1)
+        offset = min([total_entries, max_entries])
         if offset == 0:
             logger.info("[detect] strategy({}) item({}) 暂无待检测数据".format(self.strategy_id, item.id))
             return
-        if offset == settings.SQL_MAX_LIMIT:
+        if offset == max_entries:
             self.is_busy = True
             logger.error(
                 "[detect] strategy({}) item({}) 待检测数据量达到配置值"
                 "(SQL_MAX_LIMIT){}，部分数据可能存在处理延时".format(self.strategy_id, item.id, settings.SQL_MAX_LIMIT)
             )
 
-        records = client.lrange(data_channel, -offset, -1)
+        entries = client.lrange(data_channel, -offset, -1)
+        if not entries:
+            return
+
+        client.ltrim(data_channel, 0, -offset - 1)
+        # 队列左进右出，lrange 取出时需要做一次倒序才能保证先进先出
+        records, unexpected_record_count, last_unexpected_record = decode_entries(reversed(entries))
 
         # 上报detect拉取数据量
         metrics.DETECT_PROCESS_DATA_COUNT.labels(strategy_id=metrics.TOTAL_TAG, type="pull").inc(len(records))
 
-        unexpected_record_count = 0
-        last_unexpected_record = None
-        if records:
-            client.ltrim(data_channel, 0, -offset - 1)
-            # 队列左进右出，lrange 取出时需要做一次倒序才能保证先进先出
-            for record in reversed(records):
-                try:
-                    data_point = DataPoint(json.loads(record), item)
-                    # fill data point into inputs list
-                    self.inputs[item.id].append(data_point)
-                except ValueError:
-                    unexpected_record_count += 1
-                    last_unexpected_record = record
-            if unexpected_record_count > 0:
-                logger.error(
-                    "[detect] strategy({}) item({}) 发现非期望格式的待检测数据{}条,"
-                    " 其中之一: {}".format(self.strategy_id, item.id, unexpected_record_count, last_unexpected_record)
-                )
-
-            logger.info(
-                "[detect] strategy({}) item({}) 拉取数据({})条".format(self.strategy_id, item.id, len(self.inputs[item.id]))
+        self.inputs[item.id].extend(DataPoint(record, item) for record in records)
+        if unexpected_record_count > 0:
+            logger.error(
+                "[detect] strategy({}) item({}) 发现非期望格式的待检测数据{}条,"
+                " 其中之一: {}".format(self.strategy_id, item.id, unexpected_record_count, last_unexpected_record)
             )
 
+        logger.info(
+            "[detect] strategy({}) item({}) 拉取数据({})条".format(self.strategy_id, item.id, len(self.inputs[item.id]))
+        )
+
     def handle_data(self, item):
         # detect data
         data_points = self.inputs[item.id]
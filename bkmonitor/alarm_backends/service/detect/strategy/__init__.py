@@ -14,6 +14,9 @@ import functools
 import inspect
 import json
 import logging
+import threading
+import time
+from collections import OrderedDict
 
 from django.conf import settings
 from django.template import Context, Template
@@ -24,6 +27,7 @@ from alarm_backends.core.cache import key
 from alarm_backends.service.access.data.records import DataRecord
 from alarm_backends.service.detect import AnomalyDataPoint, DataPoint
 from alarm_backends.templatetags.unit import unit_auto_convert, unit_convert_min
+from bkmonitor.utils.common_utils import count_md5
 from core.errors.alarm_backends.detect import (
     HistoryDataNotExists,
     InvalidAlgorithmsConfig,
@@ -34,11 +38,33 @@ from core.unit import load_unit
 logger = logging.getLogger("detect")
 
 
+@functools.lru_cache(maxsize=1024)
+def compile_desc_template(desc_tpl):
+    """
+    编译异常描述模板，相同模板只编译一次
+    """
+    return Template(desc_tpl)
+
+
 class DetectContext(dict):
     def __getattr__(self, item):
         return self.__getitem__(item)
 
 
+class UnitConverter(object):
+    """
+    批量检测时的单位转换，等价于 unit_convert_min，同一批数据复用已加载的单位
+    """
+
+    def __init__(self):
+        self._units = {}
+
+    def convert(self, value, unit, suffix=None):
+        if unit not in self._units:
+            self._units[unit] = load_unit(unit)
+        return self._units[unit].convert_to_max(value, suffix, decimal=settings.POINT_PRECISION)[0]
+
+
 class Algorithms(object):
     """
     检测算法基类，定义一个算法对象。
@@ -102,18 +128,38 @@ class Algorithms(object):
                 f"[detect result]: \t{ret}\n"
             )
 
+    @property
+    def supports_batch(self):
+        """
+        是否支持批量检测，支持批量检测的算法需要实现 batch_detect
+        """
+        return False
+
+    def batch_detect(self, data_points):
+        """
+        批量检测，返回与 data_points 一一对应的检测结果(与 detect 返回值一致)
+        """
+        raise NotImplementedError
+
     def detect(self, data_point):
         """
         返回异常数据点对象
         """
         if self._detect(data_point):
-            anomaly_point = AnomalyDataPoint(data_point=data_point, detector=self)
-            try:
-                anomaly_point.anomaly_message = self._format_message(data_point)
-            except Exception as e:
-                logger.error("format anomaly message error: {}".format(e))
-                anomaly_point.anomaly_message = ""
-            return [anomaly_point]
+            return [self._gen_detector_anomaly_point(data_point)]
+
+    def _gen_detector_anomaly_point(self, data_point):
+        anomaly_point = AnomalyDataPoint(data_point=data_point, detector=self)
+        # 异常描述在真正被读取时才渲染，突发大量异常时避免逐个渲染模板
+        anomaly_point.set_lazy_message(functools.partial(self._safe_format_message, data_point))
+        return anomaly_point
+
+    def _safe_format_message(self, data_point):
+        try:
+            return self._format_message(data_point)
+        except Exception as e:
+            logger.error("format anomaly message error: {}".format(e))
+            return ""
 
     def _format_message(self, data_point):
         """
@@ -122,7 +168,7 @@ class Algorithms(object):
         if not self.desc_tpl:
             return ""
         context = Context(self.get_context(data_point))
-        return Template(self.desc_tpl).render(context)
+        return compile_desc_template(str(self.desc_tpl)).render(context)
 
     def detect_records(self, data_points, level):
         """
@@ -130,23 +176,38 @@ class Algorithms(object):
         """
         if isinstance(data_points, DataPoint):
             data_points = [data_points]
+
+        # 调试数据需要打印单点检测上下文，不走批量检测
+        if self.supports_batch and not any(hasattr(data_point, "__debug__") for data_point in data_points):
+            # 缺少上下文字段的数据点在单点检测中会抛出 InvalidDataPoint 被忽略，这里提前过滤
+            data_points = [
+                data_point
+                for data_point in data_points
+                if all(hasattr(data_point, attr) for attr in DataPoint.context_field)
+            ]
+            check_results = self.batch_detect(data_points)
+        else:
+            check_results = [self._detect_ignore_error(data_point) for data_point in data_points]
+
         anomaly_points = []
-        for data_point in data_points:
-            try:
-                check_result = self.detect(data_point)
-            except Exception:
-                continue
+        for data_point, check_result in zip(data_points, check_results):
             if check_result:
                 ap = self.gen_anomaly_point(data_point, check_result, level)
                 logger.info(
                     "[detect] strategy({}) item({}) level[{}] 发现异常点: {}".format(
-                        ap.data_point.item.strategy.id, ap.data_point.item.id, level, ap.__dict__
+                        ap.data_point.item.strategy.id, ap.data_point.item.id, level, ap.anomaly_id
                     )
                 )
                 anomaly_points.append(ap)
 
         return anomaly_points
 
+    def _detect_ignore_error(self, data_point):
+        try:
+            return self.detect(data_point)
+        except Exception:
+            return None
+
     def anomaly_message_template_tuple(self, data_point):
         """
         异常描述模板，
@@ -172,19 +233,16 @@ class Algorithms(object):
         if len(detect_result) == 1:
             ap = detect_result[0]
             if auto_format:
-                ap.anomaly_message = anomaly_message_prefix + ap.anomaly_message + anomaly_message_suffix
+                ap.wrap_message(anomaly_message_prefix, anomaly_message_suffix)
         else:
             # 总结基于多算法检测出的异常点，生成新的异常点
             ap = AnomalyDataPoint(data_point, self)
-            desc_list = []
             for child_ap in detect_result:
                 ap.child_detector.append(child_ap.detector)
-                desc_list.append(child_ap.anomaly_message)
 
+            ap.set_lazy_message(lambda: _("且").join([child_ap.anomaly_message for child_ap in detect_result]))
             if auto_format:
-                ap.anomaly_message = anomaly_message_prefix + _("且").join(desc_list) + anomaly_message_suffix
-            else:
-                ap.anomaly_message = _("且").join(desc_list)
+                ap.wrap_message(anomaly_message_prefix, anomaly_message_suffix)
 
         ap.anomaly_id = self._gen_anomaly_id(data_point, level)
 
@@ -208,16 +266,28 @@ class Algorithms(object):
 class ExprDetectAlgorithms(Algorithms):
     """
     表达式算法, 算法检测的基础单元
+    batch_expr: 与 expr 等价的批量检测函数，接收数据点列表，返回与之一一对应的检测结果(bool)
     """
 
-    def __init__(self, expr, desc_tpl=""):
+    def __init__(self, expr, desc_tpl="", batch_expr=None):
         self.expr = expr
         self.desc_tpl = desc_tpl
+        self.batch_expr = batch_expr
         super().__init__()
 
     def gen_expr(self):
         return self.expr
 
+    @property
+    def supports_batch(self):
+        return self.batch_expr is not None
+
+    def batch_detect(self, data_points):
+        return [
+            [self._gen_detector_anomaly_point(data_point)] if is_anomaly else None
+            for data_point, is_anomaly in zip(data_points, self.batch_expr(data_points))
+        ]
+
 
 class BasicAlgorithmsCollection(Algorithms):
     """
@@ -282,6 +352,36 @@ class BasicAlgorithmsCollection(Algorithms):
 
         return anomaly
 
+    @property
+    def supports_batch(self):
+        return bool(self.detectors) and all(detector.supports_batch for detector in self.detectors)
+
+    def batch_detect(self, data_points):
+        """
+        批量检测，逻辑与 detect 一致：and 只对仍满足条件的数据点继续检测，or 只对尚未命中的数据点继续检测
+        """
+        results = [[] for _ in data_points]
+        pending = list(range(len(data_points)))
+        for detector in self.detectors:
+            if not pending:
+                break
+            detector_results = detector.batch_detect([data_points[index] for index in pending])
+            next_pending = []
+            for index, result in zip(pending, detector_results):
+                if not result:
+                    if self.expr_op == "and":
+                        results[index] = []
+                    else:
+                        next_pending.append(index)
+                elif self.expr_op == "or":
+                    results[index] = result
+                else:
+                    results[index].extend(result)
+                    next_pending.append(index)
+            pending = next_pending
+
+        return results
+
     def get_context(self, data_point):
         context = super(BasicAlgorithmsCollection, self).get_context(data_point)
         context.update(
@@ -290,15 +390,80 @@ class BasicAlgorithmsCollection(Algorithms):
         return context
 
 
+class HistoryPointCache(object):
+    """
+    进程内历史数据缓存
+    以查询配置(query_md5 + 监控目标)为维度共享，相同查询的策略/监控项无需重复查询历史数据
+    {(query_key, timestamp): {dimensions_md5: json_data}}
+    """
+
+    def __init__(self, max_records=100000, ttl=key.HISTORY_DATA_KEY.ttl):
+        self.max_records = max_records
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._records = 0
+        self._lock = threading.Lock()
+
+    def get(self, query_key, timestamp):
+        cache_key = (query_key, timestamp)
+        with self._lock:
+            value = self._data.get(cache_key)
+            if value is None:
+                return None
+            expire_at, points = value
+            if expire_at < time.time():
+                self._remove(cache_key)
+                return None
+            self._data.move_to_end(cache_key)
+            return points
+
+    def set(self, query_key, timestamp, points):
+        cache_key = (query_key, timestamp)
+        with self._lock:
+            if cache_key in self._data:
+                self._remove(cache_key)
+            # 无数据的时刻不缓存，避免延迟到达的历史数据在过期前一直不可见
+            if not points or len(points) > self.max_records:
+                return
+            self._data[cache_key] = (time.time() + self.ttl, points)
+            self._records += len(points)
+            while self._records > self.max_records:
+                self._remove(next(iter(self._data)))
+
+    def _remove(self, cache_key):
+        _, points = self._data.pop(cache_key)
+        self._records -= len(points)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._records = 0
+
+
+HISTORY_POINT_CACHE = HistoryPointCache(max_records=settings.DETECT_HISTORY_CACHE_MAX_RECORDS)
+
+
 class HistoryPointFetcher(object):
     def set_default(self, value: int):
         self._default = value
 
+    @staticmethod
+    def get_history_cache_key(item):
+        """
+        历史数据进程内缓存key，相同查询配置及监控目标的监控项共享历史数据
+        """
+        query_md5 = getattr(item, "item_config", {}).get("query_md5")
+        if not query_md5:
+            return None
+        return count_md5({"query_md5": query_md5, "target": item.target})
+
     def query_history_points(self, data_points):
         item = data_points[0].item
         # 按时间从小到大排序
         sorted_data_points = sorted(data_points, key=lambda x: x.timestamp)
         offsets = self.get_history_offsets(item)
+        interval = item.query_configs[0]["agg_interval"]
+        history_cache_key = self.get_history_cache_key(item)
         for offset in offsets:
             # offsets 支持区间（相邻offset之间差值等于interval的整数倍）批量查询
             if isinstance(offset, tuple):
@@ -313,27 +478,50 @@ class HistoryPointFetcher(object):
             records = []
             from_timestamp, until_timestamp = (
                 sorted_data_points[0].timestamp - end,
-                sorted_data_points[-1].timestamp - start + item.query_configs[0]["agg_interval"],
+                sorted_data_points[-1].timestamp - start + interval,
             )
+            history_timestamps = list(range(from_timestamp, until_timestamp, interval))
 
-            accessed = None
-            for history_timestamp in range(from_timestamp, until_timestamp, item.query_configs[0]["agg_interval"]):
-                if accessed is None:
-                    accessed = True
-                accessed = accessed and self._check_history_points(item, history_timestamp)
-
-            if accessed:
+            if history_timestamps and all(self._check_history_points_exist(item, history_timestamps)):
                 # 历史时刻的数据都已经查过
                 continue
 
+            # 相同查询的其他监控项已经查询过，直接复用
+            if history_cache_key:
+                cached_points_map = {
+                    timestamp: HISTORY_POINT_CACHE.get(history_cache_key, timestamp) for timestamp in history_timestamps
+                }
+                if history_timestamps and all(points is not None for points in cached_points_map.values()):
+                    self._publish_history_points_map(item, cached_points_map)
+                    continue
+
             item_records = item.query_record(from_timestamp, until_timestamp)
             for record in item_records:
                 point = DataRecord(item, record)
                 if point.value:
                     records.append(adapter_data_access_2_detect(point, item))
 
-            self._local_history_storage = {}
-            self._publish_history_points(item, records)
+            self._reset_local_history_storage()
+            history_points_map = self._publish_history_points(item, records)
+            if history_cache_key:
+                # 无数据的时刻不缓存，历史数据延迟到达时，下次检测仍会重新查询
+                for timestamp, points in history_points_map.items():
+                    HISTORY_POINT_CACHE.set(history_cache_key, timestamp, points)
+
+        self._prefetch_history_points(item, data_points, offsets)
+
+    def _reset_local_history_storage(self):
+        """
+        重置本地历史数据存储
+        _local_history_storage: {history_key: {dimensions_md5: json_data}}
+        _partial_history_keys: 通过 HMGET 预取的 key，只包含部分维度，缺失的维度需要单独获取
+        """
+        self._local_history_storage = {}
+        self._partial_history_keys = set()
+
+    def _ensure_local_history_storage(self):
+        if getattr(self, "_local_history_storage", None) is None:
+            self._reset_local_history_storage()
 
     def _check_history_points(self, item, history_timestamp):
         """
@@ -345,27 +533,95 @@ class HistoryPointFetcher(object):
         )
         return client.exists(history_key)
 
+    def _check_history_points_exist(self, item, history_timestamps):
+        """
+        批量检查历史时刻的数据是否已经拉取过
+        """
+        pipeline = key.HISTORY_DATA_KEY.client.pipeline(transaction=False)
+        for history_timestamp in history_timestamps:
+            pipeline.exists(
+                key.HISTORY_DATA_KEY.get_key(strategy_id=item.strategy.id, item_id=item.id, timestamp=history_timestamp)
+            )
+        return pipeline.execute()
+
     def _publish_history_points(self, item, history_points):
         """
         发布历史时刻的数据
+        :return: {timestamp: {dimensions_md5: json_data}}
         """
         if not history_points:
-            return
-        pipeline = key.HISTORY_DATA_KEY.client.pipeline(transaction=False)
-        history_key_maker = functools.partial(
-            key.HISTORY_DATA_KEY.get_key, strategy_id=item.strategy.id, item_id=item.id
-        )
+            return {}
         # bulk cache json data
         history_points_map = {}
         for point in history_points:
             points_with_timestamp_map = history_points_map.setdefault(point.timestamp, {})
             points_with_timestamp_map[point.record_id.split(".")[0]] = json.dumps(point.as_dict())
 
+        self._publish_history_points_map(item, history_points_map)
+        return history_points_map
+
+    def _publish_history_points_map(self, item, history_points_map):
+        pipeline = key.HISTORY_DATA_KEY.client.pipeline(transaction=False)
+        history_key_maker = functools.partial(
+            key.HISTORY_DATA_KEY.get_key, strategy_id=item.strategy.id, item_id=item.id
+        )
+        has_command = False
         for timestamp, _points_with_timestamp_map in history_points_map.items():
+            if not _points_with_timestamp_map:
+                continue
             history_key = history_key_maker(timestamp=timestamp)
             pipeline.hmset(history_key, _points_with_timestamp_map)
             pipeline.expire(history_key, key.HISTORY_DATA_KEY.ttl)
-        pipeline.execute()
+            has_command = True
+        if has_command:
+            pipeline.execute()
+
+    def _iter_history_timestamps(self, item, data_point, offsets):
+        interval = item.query_configs[0]["agg_interval"]
+        for offset in offsets:
+            if isinstance(offset, tuple):
+                start, end = offset
+            else:
+                start = end = offset
+            if end == 0:
+                continue
+            for history_offset in range(start, end + 1, interval):
+                yield data_point.timestamp - history_offset
+
+    def _prefetch_history_points(self, item, data_points, offsets, chunk_size=1000):
+        """
+        批量预取数据点对应的历史数据，只获取需要的维度(HMGET)，预取结果写入本地存储
+        """
+        self._ensure_local_history_storage()
+
+        history_cache_key = self.get_history_cache_key(item)
+        fields_by_key = {}
+        for data_point in data_points:
+            dimensions_md5 = data_point.record_id.split(".")[0]
+            for history_timestamp in self._iter_history_timestamps(item, data_point, offsets):
+                history_key = key.HISTORY_DATA_KEY.get_key(
+                    strategy_id=item.strategy.id, item_id=item.id, timestamp=history_timestamp
+                )
+                if history_key in self._local_history_storage:
+                    continue
+                if history_cache_key:
+                    cached_points = HISTORY_POINT_CACHE.get(history_cache_key, history_timestamp)
+                    if cached_points is not None:
+                        # 进程缓存中是完整查询结果，包含全部维度
+                        self._local_history_storage[history_key] = cached_points
+                        continue
+                fields_by_key.setdefault(history_key, set()).add(dimensions_md5)
+
+        history_keys = list(fields_by_key.keys())
+        client = key.HISTORY_DATA_KEY.client
+        for offset in range(0, len(history_keys), chunk_size):
+            chunk = history_keys[offset : offset + chunk_size]
+            pipeline = client.pipeline(transaction=False)
+            for history_key in chunk:
+                pipeline.hmget(history_key, list(fields_by_key[history_key]))
+            for history_key, values in zip(chunk, pipeline.execute()):
+                self._local_history_storage[history_key] = dict(zip(fields_by_key[history_key], values))
+                self._partial_history_keys.add(history_key)
 
     def fetch_history_point(self, item, point, history_timestamp):
         """
@@ -375,13 +631,20 @@ class HistoryPointFetcher(object):
         history_key = key.HISTORY_DATA_KEY.get_key(
             strategy_id=item.strategy.id, item_id=item.id, timestamp=history_timestamp
         )
-        if not getattr(self, "_local_history_storage", None):
-            self._local_history_storage = {}
+        self._ensure_local_history_storage()
 
+        dimensions_md5 = point.record_id.split(".")[0]
         if history_key not in self._local_history_storage:
             self._local_history_storage[history_key] = client.hgetall(history_key)
-
-        raw_data = self._local_history_storage[history_key].get(point.record_id.split(".")[0])
+            self._partial_history_keys.discard(history_key)
+        elif (
+            history_key in self._partial_history_keys
+            and dimensions_md5 not in self._local_history_storage[history_key]
+        ):
+            # 预取时未包含的维度，单独获取
+            self._local_history_storage[history_key][dimensions_md5] = client.hget(history_key, dimensions_md5)
+
+        raw_data = self._local_history_storage[history_key].get(dimensions_md5)
         if not raw_data:
             if getattr(self, "_default", None) is not None:
                 return DataPoint({"value": self._default, "time": history_timestamp}, item)
@@ -416,6 +679,9 @@ class RangeRatioAlgorithmsCollection(BasicAlgorithmsCollection, HistoryPointFetc
     ceil_desc_tpl = ""
 
     def gen_expr(self):
+        # 子类重写了上下文时，表达式含义可能变化，不提供批量检测
+        batch_enabled = type(self).extra_context is RangeRatioAlgorithmsCollection.extra_context
+
         if self.validated_config["floor"]:
             yield ExprDetectAlgorithms(
                 "(unit_convert_min(value, unit) or "
@@ -423,6 +689,7 @@ class RangeRatioAlgorithmsCollection(BasicAlgorithmsCollection, HistoryPointFetc
                 "and (unit_convert_min(value, unit) <= "
                 "(unit_convert_min(floor_history_value, unit) * (100 - floor) * 0.01))",
                 self.floor_desc_tpl,
+                batch_expr=self._batch_ratio_expr(is_floor=True) if batch_enabled else None,
             )
 
         if self.validated_config["ceil"]:
@@ -432,8 +699,37 @@ class RangeRatioAlgorithmsCollection(BasicAlgorithmsCollection, HistoryPointFetc
                 "and (unit_convert_min(value, unit) >= "
                 "(unit_convert_min(ceil_history_value, unit) * (100 + ceil) * 0.01))",
                 self.ceil_desc_tpl,
+                batch_expr=self._batch_ratio_expr(is_floor=False) if batch_enabled else None,
             )
 
+    def _batch_ratio_expr(self, is_floor):
+        """
+        生成与 gen_expr 表达式等价的批量检测函数
+        """
+
+        def batch_expr(data_points):
+            if is_floor:
+                ratio = 100 - self.validated_config["floor"]
+            else:
+                ratio = 100 + self.validated_config["ceil"]
+            converter = UnitConverter()
+            results = []
+            for data_point in data_points:
+                try:
+                    history_data_point = self.history_point_fetcher(data_point)
+                    if history_data_point is None:
+                        results.append(False)
+                        continue
+                    value = converter.convert(data_point.value, data_point.unit)
+                    bound = converter.convert(history_data_point.value, data_point.unit) * ratio * 0.01
+                    compared = value <= bound if is_floor else value >= bound
+                    results.append(bool((value or bound) and compared))
+                except Exception:
+                    results.append(False)
+            return results
+
+        return batch_expr
+
     def extra_context(self, context):
         env = dict()
         history_data_point = self.history_point_fetcher(context.data_point)
@@ -15,16 +15,30 @@ specific language governing permissions and limitations under the License.
 
 import ast
 import logging
+import operator
 
 from django.utils.safestring import mark_safe
 from six.moves import zip
 
-from alarm_backends.service.detect.strategy import BasicAlgorithmsCollection, ExprDetectAlgorithms
+from alarm_backends.service.detect.strategy import (
+    BasicAlgorithmsCollection,
+    ExprDetectAlgorithms,
+    UnitConverter,
+)
 from bkmonitor.strategy.serializers import ThresholdSerializer, allowed_threshold_method
 from core.errors.alarm_backends.detect import InvalidThresholdConfig
 
 logger = logging.getLogger("detect")
 
+threshold_operators = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "==": operator.eq,
+    "!=": operator.ne,
+}
+
 
 class AlgorithmsAST(ast.NodeTransformer):
     """
@@ -43,6 +57,7 @@ class AndThreshold(BasicAlgorithmsCollection):
     def gen_expr(self):
         expr_list = []
         tpl_list = []
+        batch_expr_list = []
         for t_config in self.validated_config:
             method = t_config["method"]
             threshold = t_config["threshold"]
@@ -53,13 +68,35 @@ class AndThreshold(BasicAlgorithmsCollection):
                 )
             )
             tpl_list.append(self.desc_tpl.format(method_desc=mark_safe(comp.replace("==", "=")), threshold=threshold))
+            batch_expr_list.append(self._batch_threshold_expr(threshold_operators[comp], threshold))
 
         # no more effect
         if not expr_list:
             raise InvalidThresholdConfig(dict(config=self.validated_config))
 
-        for args in zip(expr_list, tpl_list):
-            yield ExprDetectAlgorithms(*args)
+        for expr, tpl, batch_expr in zip(expr_list, tpl_list, batch_expr_list):
+            yield ExprDetectAlgorithms(expr, tpl, batch_expr=batch_expr)
+
+    def _batch_threshold_expr(self, compare, threshold):
+        """
+        生成与阈值表达式等价的批量检测函数，阈值按单位只转换一次
+        """
+
+        def batch_expr(data_points):
+            converter = UnitConverter()
+            thresholds = {}
+            results = []
+            for data_point in data_points:
+                unit = data_point.unit
+                try:
+                    if unit not in thresholds:
+                        thresholds[unit] = converter.convert(threshold, unit, self.unit)
+                    results.append(bool(compare(converter.convert(data_point.value, unit), thresholds[unit])))
+                except Exception:
+                    results.append(False)
+            return results
+
+        return batch_expr
 
 
 class Threshold(AndThreshold):
@@ -54,6 +54,7 @@ from constants.action import (
 
 from .utils import (
     AlertAssignee,
+    PollActionIndex,
     PushActionProcessor,
     get_notice_display_mapping,
     need_poll,
@@ -480,6 +481,8 @@ class BaseActionProcessor(object):
             need_poll=need_poll(self.action),
             ex_data={"message": message},
         )
+        # 需要周期通知的，加入周期通知待检测索引
+        PollActionIndex.add_finished_action(self.action)
         # 更新任务数据(插入日志)
         level = ActionLogLevel.ERROR if to_status == ActionStatus.FAILURE else ActionLogLevel.INFO
         self.insert_action_log(
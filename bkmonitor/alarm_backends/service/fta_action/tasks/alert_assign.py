@@ -62,14 +62,9 @@ class BackendAssignMatchManager(AlertAssignMatchManager):
             # 如果没有分派规则或者当前配置不需要分派的情况下，不做分派适配
             return matched_rules
         for priority_id in AssignCacheManager.get_assign_priority_by_biz_id(self.bk_biz_id):
-            groups = AssignCacheManager.get_assign_groups_by_priority(self.bk_biz_id, priority_id)
-            group_rules = []
-            for group_id in groups:
-                group_rules.extend(AssignCacheManager.get_assign_rules_by_group(self.bk_biz_id, group_id))
-            for rule in group_rules:
-                rule_match_obj = AssignRuleMatch(rule, self.rule_snaps.get(str(rule["id"])), self.alert)
-                if rule_match_obj.is_matched(dimensions=self.dimensions):
-                    matched_rules.append(rule_match_obj)
+            # 规则集合在缓存中只编译一次，只评估命中索引的候选规则
+            rule_set = AssignCacheManager.get_assign_rule_set_by_priority(self.bk_biz_id, priority_id)
+            matched_rules = rule_set.match(self.dimensions, self.rule_snaps, self.alert)
             if matched_rules:
                 # 当前优先级下适配到分派规则，停止低优先级的适配
                 break
@@ -23,7 +23,11 @@ from alarm_backends.service.fta_action.tasks.alert_assign import AlertAssigneeMa
 from alarm_backends.service.fta_action.tasks.noise_reduce import (
     NoiseReduceRecordProcessor,
 )
-from alarm_backends.service.fta_action.utils import PushActionProcessor, need_poll
+from alarm_backends.service.fta_action.utils import (
+    PollActionIndex,
+    PushActionProcessor,
+    need_poll,
+)
 from bkmonitor.action.serializers import ActionPluginSlz
 from bkmonitor.documents import AlertDocument, AlertLog
 from bkmonitor.documents.base import BulkActionType
@@ -195,12 +199,19 @@ class CreateIntervalActionProcessor:
         self.finished_actions = []
         self.polled_alerts = []
         self.need_polled_actions = {}
+        # 未到期或者暂不满足条件的记录，需要更新下一次检测时间 {action_id: 检测时间}
+        self.rescheduled_actions = {}
+        # 已经不需要继续检测的记录，需要从索引中删除
+        self.removed_actions = []
+        self.now = int(time.time())
 
     def process(self):
         # 检查需要创建周期任务的内容
         self.check_polled_actions()
         # 创建周期任务
         self.create_interval_action()
+        # 更新待检测索引
+        self.update_poll_index()
 
         logger.info(
             "check_create_poll_action need_polled_actions({}), polled_actions({}) finished_actions({})".format(
@@ -208,13 +219,39 @@ class CreateIntervalActionProcessor:
             )
         )
 
+    def sync_poll_index(self):
+        """
+        从DB全量同步集群内需要轮询的记录到待检测索引，仅补充索引中不存在的记录
+        """
+        if not PollActionIndex.need_sync():
+            return
+        action_instances = ActionInstance.objects.filter(
+            need_poll=True, is_polled=False, bk_biz_id__in=get_cluster_bk_biz_ids()
+        ).values_list("id", "end_time")
+        action_scores = {
+            action_id: int(end_time.timestamp()) if end_time else self.now for action_id, end_time in action_instances
+        }
+        PollActionIndex.add(action_scores, only_new=True)
+        logger.info("check_create_poll_action sync poll index, action count(%s)", len(action_scores))
+
     def check_polled_actions(self):
         """
-        检查所有需要轮询的任务
+        检查所有到期需要轮询的任务
         :return:
         """
+        self.sync_poll_index()
+        due_actions = dict(PollActionIndex.get_due(self.now, settings.ACTION_POLL_DUE_BATCH_SIZE))
+        metrics.ACTION_POLL_INDEX_BACKLOG.set(PollActionIndex.backlog())
+        metrics.ACTION_POLL_DUE_COUNT.set(len(due_actions))
+        if not due_actions:
+            return
+        for due_time in due_actions.values():
+            metrics.ACTION_POLL_LATENESS.observe(max(self.now - due_time, 0))
+
         bk_biz_ids = set(get_cluster_bk_biz_ids())
-        action_instances = ActionInstance.objects.filter(need_poll=True, is_polled=False).only(
+        action_instances = ActionInstance.objects.filter(
+            id__in=list(due_actions.keys()), need_poll=True, is_polled=False
+        ).only(
             "id",
             "need_poll",
             "is_polled",
@@ -230,11 +267,16 @@ class CreateIntervalActionProcessor:
             "strategy_relation_id",
             "end_time",
             "is_parent_action",
+            "bk_biz_id",
         )
+        # 已经轮询或者不再需要轮询的记录，直接从索引中删除
+        valid_action_ids = {action_instance.id for action_instance in action_instances}
+        self.removed_actions = [action_id for action_id in due_actions if action_id not in valid_action_ids]
         checked_alerts = []
         for action_instance in action_instances:
             # 仅处理集群内的业务
             if action_instance.bk_biz_id not in bk_biz_ids:
+                self.removed_actions.append(action_instance.id)
                 continue
             action_config = ActionConfigCacheManager.get_action_config_by_id(config_id=action_instance.action_config_id)
             action_instance.action_config = action_config
@@ -269,11 +311,21 @@ class CreateIntervalActionProcessor:
                     execute_times=action_instance.execute_times,
                 )
                 self.polled_actions.append(action_id)
+            else:
+                # 告警暂不满足条件的，稍后重新检测
+                self.rescheduled_actions[action_id] = self.now + settings.ACTION_POLL_RECHECK_INTERVAL
 
         # 更新DB的数据，已经轮询的，设置为已经轮询，不需要轮询的，直接取消
         ActionInstance.objects.filter(id__in=self.polled_actions).update(is_polled=True)
         ActionInstance.objects.filter(id__in=self.finished_actions).update(need_poll=False)
 
+    def update_poll_index(self):
+        """
+        更新待检测索引：已处理的记录删除，未到期的记录按照下一次检测时间重新排序
+        """
+        PollActionIndex.remove(self.polled_actions + self.finished_actions + self.removed_actions)
+        PollActionIndex.add(self.rescheduled_actions)
+
     def check_finished_actions(self, checked_alerts: list, action_instance):
         check_key = "{}_{}".format(action_instance.alerts[0], action_instance.action_config_id)
         if check_key in checked_alerts:
@@ -291,6 +343,8 @@ class CreateIntervalActionProcessor:
         """
         if action_instance.id in self.finished_actions:
             return
+        # 配置异常或者间隔无效时，稍后重新检测
+        self.rescheduled_actions[action_instance.id] = self.now + settings.ACTION_POLL_RECHECK_INTERVAL
         try:
             execute_config = action_config["execute_config"]["template_detail"]
         except KeyError as error:
@@ -300,10 +354,15 @@ class CreateIntervalActionProcessor:
             logger.error("type error execute_config params in action_config %s error %s", action_config, str(error))
             return
         notify_interval = self.calc_action_interval(execute_config, action_instance)
-        if notify_interval <= 0 or int(action_instance.end_time.timestamp()) + notify_interval > int(time.time()):
-            # 不满足创建周期任务条件的时候，直接返回
+        if notify_interval <= 0:
+            return
+        next_poll_time = int(action_instance.end_time.timestamp()) + notify_interval
+        if next_poll_time > self.now:
+            # 不满足创建周期任务条件的时候，按照下一次通知时间重新检测
+            self.rescheduled_actions[action_instance.id] = next_poll_time
             return
 
+        self.rescheduled_actions.pop(action_instance.id, None)
         self.need_polled_actions.update({action_instance.id: action_instance})
         self.polled_alerts.extend(action_instance.alerts)
 
@@ -20,7 +20,11 @@ from django.utils.translation import ugettext as _
 
 from alarm_backends.core.cache.cmdb.host import HostManager
 from alarm_backends.core.cache.cmdb.module import ModuleManager
-from alarm_backends.core.cache.key import ALERT_DETECT_RESULT
+from alarm_backends.core.cache.key import (
+    ACTION_POLL_DUE_INDEX_KEY,
+    ACTION_POLL_INDEX_SYNC_KEY,
+    ALERT_DETECT_RESULT,
+)
 from alarm_backends.core.context import ActionContext
 from alarm_backends.core.context.utils import (
     get_business_roles,
@@ -47,6 +51,74 @@ from constants.action import (
 logger = logging.getLogger("fta_action.run")
 
 
+class PollActionIndex:
+    """
+    周期通知待检测索引
+    member 为需要轮询的处理记录ID，score 为下一次需要检测的时间戳
+    每轮检测只处理已经到期的记录，不再全量扫描DB
+    """
+
+    key = ACTION_POLL_DUE_INDEX_KEY
+
+    @classmethod
+    def add(cls, action_scores: dict, only_new=False):
+        """
+        :param action_scores: {action_id: 下一次检测时间}
+        :param only_new: 仅添加索引中不存在的记录，已有记录保持原有检测时间
+        """
+        if not action_scores:
+            return
+        client = cls.key.client
+        key = cls.key.get_key()
+        pipeline = client.pipeline(transaction=False)
+        pipeline.zadd(key, action_scores, nx=only_new)
+        pipeline.expire(key, cls.key.ttl)
+        pipeline.execute()
+
+    @classmethod
+    def add_finished_action(cls, action_instance: ActionInstance):
+        """
+        处理记录结束且需要轮询时加入索引，以结束时间作为首次检测时间，到期后再按照通知间隔重新计算
+        """
+        if not action_instance.need_poll or not action_instance.end_time:
+            return
+        try:
+            cls.add({action_instance.id: int(action_instance.end_time.timestamp())})
+        except BaseException as error:  # NOCC:broad-except(设计如此:)
+            # 索引写入失败时，由周期全量同步兜底
+            logger.exception("add action(%s) to poll index failed: %s", action_instance.id, error)
+
+    @classmethod
+    def remove(cls, action_ids: List[int]):
+        if action_ids:
+            cls.key.client.zrem(cls.key.get_key(), *action_ids)
+
+    @classmethod
+    def get_due(cls, timestamp, count) -> List[tuple]:
+        """
+        获取已经到期的记录
+        :return: [(action_id, 检测时间)]
+        """
+        return [
+            (int(action_id), score)
+            for action_id, score in cls.key.client.zrangebyscore(
+                cls.key.get_key(), 0, timestamp, start=0, num=count, withscores=True
+            )
+        ]
+
+    @classmethod
+    def backlog(cls):
+        return cls.key.client.zcard(cls.key.get_key())
+
+    @classmethod
+    def need_sync(cls):
+        """
+        是否需要从DB全量同步，用于兜底新增记录写索引失败及存量数据的场景，同步间隔为标记的过期时间
+        """
+        sync_key = ACTION_POLL_INDEX_SYNC_KEY
+        return bool(sync_key.client.set(sync_key.get_key(), 1, ex=sync_key.ttl, nx=True))
+
+
 class PushActionProcessor:
     @classmethod
     def push_actions_to_queue(
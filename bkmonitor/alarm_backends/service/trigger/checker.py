@@ -54,6 +54,8 @@ class AnomalyChecker(object):
         # shortcut
         self.dimensions_md5 = self.record_parser.dimensions_md5
         self.source_time = self.record_parser.source_time
+        # 批量预取的检测窗口数据 {level: check_results}
+        self.prefetched_check_results = {}
 
     @staticmethod
     def is_no_data_point(point):
@@ -163,14 +165,12 @@ class AnomalyChecker(object):
                 anomaly_level = level
         return anomaly_level, anomaly_timestamps
 
-    def _check_anomaly_by_level(self, level):
+    def _get_trigger_config(self, level):
         """
-        检测某个级别的异常点是否满足触发条件
-        :param str level: 告警级别
-        :return: 二元组：是否被触发，异常次数
+        获取某个级别的触发配置，不存在时返回 None
         """
         try:
-            trigger_config = self.trigger_configs[level]
+            return self.trigger_configs[level]
         except KeyError:
             trigger_configs = self.trigger_configs.values()
             if not trigger_configs:
@@ -180,10 +180,18 @@ class AnomalyChecker(object):
                         self.strategy_id, self.item_id, level
                     )
                 )
-                return False, []
+                return None
 
             # 默认兜底，trigger 配置当前所有告警级别默认一致
-            trigger_config = list(trigger_configs)[0]
+            return list(trigger_configs)[0]
+
+    def get_check_window(self, level, trigger_config=None):
+        """
+        获取某个级别检测窗口对应的 (缓存key, 最小时间, 最大时间)
+        """
+        trigger_config = trigger_config or self._get_trigger_config(level)
+        if trigger_config is None:
+            return None
 
         check_cache_key = CHECK_RESULT_CACHE_KEY.get_key(
             strategy_id=self.strategy_id,
@@ -193,9 +201,47 @@ class AnomalyChecker(object):
         )
         # 在对应的打点队列中取出打点信息。时间范围为source_time前后的一个窗口偏移量
         check_window_offset = trigger_config["check_window_size"] * self.check_window_unit - 1
-        check_results = CHECK_RESULT_CACHE_KEY.client.zrangebyscore(
-            name=check_cache_key, min=self.source_time - check_window_offset, max=self.source_time, withscores=True
-        )
+        return check_cache_key, self.source_time - check_window_offset, self.source_time
+
+    @classmethod
+    def prefetch_check_results(cls, checkers, chunk_size=1000):
+        """
+        批量预取多个检测点所有级别的检测窗口数据，相同窗口只查询一次
+        """
+        windows = {}
+        for checker in checkers:
+            for level in checker.point["anomaly"]:
+                window = checker.get_check_window(str(level))
+                if window is not None:
+                    windows.setdefault(window, []).append((checker, str(level)))
+
+        window_list = list(windows.keys())
+        for offset in range(0, len(window_list), chunk_size):
+            chunk = window_list[offset : offset + chunk_size]
+            pipeline = CHECK_RESULT_CACHE_KEY.client.pipeline(transaction=False)
+            for check_cache_key, min_score, max_score in chunk:
+                pipeline.zrangebyscore(name=check_cache_key, min=min_score, max=max_score, withscores=True)
+            for window, check_results in zip(chunk, pipeline.execute()):
+                for checker, level in windows[window]:
+                    checker.prefetched_check_results[level] = check_results
+
+    def _check_anomaly_by_level(self, level):
+        """
+        检测某个级别的异常点是否满足触发条件
+        :param str level: 告警级别
+        :return: 二元组：是否被触发，异常次数
+        """
+        trigger_config = self._get_trigger_config(level)
+        if trigger_config is None:
+            return False, []
+
+        if level in self.prefetched_check_results:
+            check_results = self.prefetched_check_results[level]
+        else:
+            check_cache_key, min_score, max_score = self.get_check_window(level, trigger_config)
+            check_results = CHECK_RESULT_CACHE_KEY.client.zrangebyscore(
+                name=check_cache_key, min=min_score, max=max_score, withscores=True
+            )
         # 统计包含异常标记的key的数量，并与trigger_count进行比较
         anomaly_timestamps = []
         for label, score in check_results:
@@ -13,6 +13,7 @@ import json
 import logging
 import time
 
+import arrow
 import six.moves.cPickle
 
 from alarm_backends.core.alert.adapter import MonitorEventAdapter
@@ -23,12 +24,67 @@ from alarm_backends.core.cache.key import (
 )
 from alarm_backends.core.control.strategy import Strategy
 from alarm_backends.service.trigger.checker import AnomalyChecker
+from bkmonitor.models import AnomalyRecord
+from bkmonitor.utils import time_tools
 from core.errors.alarm_backends import StrategyNotFound
 from core.prometheus import metrics
 
 logger = logging.getLogger("trigger")
 
 
+class TriggerEventCodec(object):
+    """
+    trigger 事件队列编解码
+    编码为带版本号的 json 信封，异常记录只保留模型字段，不再 pickle 模型对象
+    注意：仅用于 push_event_to_redis 写入的 redis 事件队列，线上 push 走的是 kafka(MonitorEventAdapter)，不受影响
+    队列的消费方需使用 loads 解码，source_time 以秒级时间戳存储
+    {
+        "v": 1,
+        "event_record": {...},
+        "anomaly_records": [[anomaly_id, source_time, strategy_id, origin_alarm, event_id], ...]
+    }
+    """
+
+    VERSION = 1
+    PREFIX = "#E{}|".format(VERSION)
+
+    @classmethod
+    def dumps(cls, record):
+        anomaly_records = [
+            [
+                anomaly_record.anomaly_id,
+                arrow.get(time_tools.localtime(anomaly_record.source_time)).timestamp,
+                anomaly_record.strategy_id,
+                anomaly_record.origin_alarm,
+                anomaly_record.event_id,
+            ]
+            for anomaly_record in record["anomaly_records"]
+        ]
+        envelope = {"v": cls.VERSION, "event_record": record["event_record"], "anomaly_records": anomaly_records}
+        return cls.PREFIX + json.dumps(envelope, separators=(",", ":"))
+
+    @classmethod
+    def loads(cls, payload):
+        """
+        解析事件记录，兼容历史的 pickle 格式
+        """
+        if not payload.startswith(cls.PREFIX):
+            return six.moves.cPickle.loads(payload.encode("latin1"))
+
+        envelope = json.loads(payload[len(cls.PREFIX) :])
+        anomaly_records = [
+            AnomalyRecord(
+                anomaly_id=anomaly_id,
+                source_time=time_tools.mysql_time(arrow.get(source_time).datetime),
+                strategy_id=strategy_id,
+                origin_alarm=origin_alarm,
+                event_id=event_id,
+            )
+            for anomaly_id, source_time, strategy_id, origin_alarm, event_id in envelope["anomaly_records"]
+        ]
+        return {"anomaly_records": anomaly_records, "event_record": envelope["event_record"]}
+
+
 class TriggerProcessor(object):
     # 单次处理量(默认为全量处理)
     MAX_PROCESS_COUNT = 0
@@ -91,7 +147,7 @@ class TriggerProcessor(object):
         pipeline = TRIGGER_EVENT_LIST_KEY.client.pipeline(transaction=False)
         trigger_event_list_key = TRIGGER_EVENT_LIST_KEY.get_key()
         for record in event_records:
-            pipeline.lpush(trigger_event_list_key, six.moves.cPickle.dumps(record).decode("latin1"))
+            pipeline.lpush(trigger_event_list_key, TriggerEventCodec.dumps(record))
         pipeline.expire(trigger_event_list_key, TRIGGER_EVENT_LIST_KEY.ttl)
         pipeline.execute()
 
@@ -144,21 +200,44 @@ class TriggerProcessor(object):
         if not in_alarm_time:
             logger.info("[trigger] strategy(%s) not in alarm time: %s, skipped", self.strategy_id, message)
         else:
+            checkers = []
             for point in self.anomaly_points:
                 try:
-                    self.process_point(point)
+                    checkers.append(self.gen_checker(point))
                 except Exception as e:
-                    error_message = "[process error] strategy({}), item({}) reason: {} \norigin data: {}".format(
-                        self.strategy_id, self.item_id, e, point
-                    )
-                    logger.exception(error_message)
+                    self._log_process_error(point, e)
+
+            # 一次性批量拉取所有检测点的窗口数据，避免逐点逐级别访问 redis
+            try:
+                AnomalyChecker.prefetch_check_results(checkers)
+            except Exception as e:
+                logger.exception(
+                    "[prefetch error] strategy({}), item({}) reason: {}".format(self.strategy_id, self.item_id, e)
+                )
+
+            for checker in checkers:
+                try:
+                    self.process_checker(checker)
+                except Exception as e:
+                    self._log_process_error(checker.point, e)
 
         self.push()
 
-    def process_point(self, point):
+    def _log_process_error(self, point, error):
+        error_message = "[process error] strategy({}), item({}) reason: {} \norigin data: {}".format(
+            self.strategy_id, self.item_id, error, point
+        )
+        logger.exception(error_message)
+
+    def gen_checker(self, point):
         point = json.loads(point)
         strategy = self.get_strategy_snapshot(point["strategy_snapshot_key"])
-        checker = AnomalyChecker(point, strategy, self.item_id)
+        return AnomalyChecker(point, strategy, self.item_id)
+
+    def process_point(self, point):
+        self.process_checker(self.gen_checker(point))
+
+    def process_checker(self, checker):
         anomaly_records, event_record = checker.check()
 
         # 暂存结果，最后批量保存
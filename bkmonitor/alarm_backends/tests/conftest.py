@@ -29,6 +29,8 @@ def pytest_configure():
         "elasticsearch_dsl.connections.Connections.create_connection", return_value=FakeElasticsearchBucket()
     ).start()
     settings.PUSH_MONITOR_EVENT_TO_FTA = False
+    # 用例会直接修改redis中的策略缓存，关闭进程内策略缓存
+    settings.STRATEGY_LOCAL_CACHE_ENABLED = False
     TestCase.databases = {"default", "monitor_api"}
 
 
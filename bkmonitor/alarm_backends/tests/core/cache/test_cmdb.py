@@ -10,19 +10,23 @@ specific language governing permissions and limitations under the License.
 """
 
 
+import copy
 import json
 
 import mock
 from django.core.cache import caches
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
 from alarm_backends.core.cache.cmdb import (
     BusinessManager,
     HostManager,
     ModuleManager,
     ServiceInstanceManager,
+    SetManager,
     TopoManager,
 )
+from alarm_backends.core.cache.cmdb.host import HostIPManager
+from alarm_backends.core.cache.cmdb.watch import CMDBResourceWatcher, LocalEventSource
 from alarm_backends.tests.utils.cmdb_data import (
     ALL_HOSTS,
     ALL_MODULES,
@@ -165,6 +169,47 @@ class TestHostManager(TestCMDBBaseTestCase):
         new_host_obj = HostManager.deserialize(obj_bin)
         self.assertEqual(host_obj, new_host_obj)
 
+    def test_compact_serialize(self):
+        host_obj = Host(
+            bk_host_innerip="10.0.0.1", bk_cloud_id=0, bk_host_id=1, bk_biz_id=2, bk_module_ids=[5], bk_os_name="linux"
+        )
+        host_obj.topo_link = {"module|5": [TopoNode("module", 5, "模块", "m5"), TopoNode("biz", 2, "业务", "b2")]}
+        host_obj.bk_world_id = "world"
+        # 缓存属性不写入缓存
+        self.assertFalse(host_obj.ignore_monitoring)
+
+        obj_str = HostManager.serialize(host_obj)
+        self.assertTrue(obj_str.startswith("#C1|"))
+        self.assertNotIn("ignore_monitoring", obj_str)
+
+        new_host_obj = HostManager.deserialize(obj_str)
+        self.assertEqual(new_host_obj.get_attrs(), HostManager.deserialize(obj_str).get_attrs())
+        self.assertEqual(new_host_obj.bk_os_name, "linux")
+        self.assertEqual(new_host_obj.bk_world_id, "world")
+        self.assertEqual([node.id for node in new_host_obj.topo_link["module|5"]], ["module|5", "biz|2"])
+        self.assertEqual(new_host_obj.topo_link["module|5"][0].bk_inst_name, "m5")
+
+        # 按字段获取时只解析需要的分段
+        brief_host_obj = HostManager.deserialize(obj_str, fields=["bk_host_id", "topo_link"])
+        self.assertEqual(brief_host_obj.bk_host_id, 1)
+        self.assertEqual(brief_host_obj.display_name, "10.0.0.1")
+        self.assertEqual(len(brief_host_obj.topo_link["module|5"]), 2)
+        self.assertEqual(brief_host_obj.bk_os_name, "")
+        self.assertFalse(hasattr(HostManager.deserialize(obj_str, fields=["bk_state"]), "topo_link"))
+
+        # 展示字段不在基础属性分段时，按字段获取仍返回写入缓存时的展示名称
+        with override_settings(HOST_DISPLAY_FIELDS=["bk_world_id"]):
+            display_host_obj = Host(bk_host_innerip="10.0.0.1", bk_cloud_id=0, bk_host_id=1, bk_world_id="world")
+            self.assertEqual(display_host_obj.display_name, "world")
+            obj_str = HostManager.serialize(display_host_obj)
+            self.assertEqual(HostManager.deserialize(obj_str, fields=["bk_host_id"]).display_name, "world")
+
+        # 兼容历史pickle格式
+        with override_settings(CMDB_CACHE_COMPACT_SERIALIZE=False):
+            pickle_str = HostManager.serialize(host_obj)
+        self.assertFalse(pickle_str.startswith("#C1|"))
+        self.assertEqual(HostManager.deserialize(pickle_str, fields=["bk_host_id"]).bk_os_name, "linux")
+
     def test_key_convert(self):
         self.assertEqual("10.0.0.1|0", HostManager.key_to_internal_value(ip="10.0.0.1", bk_cloud_id=0))
         self.assertEqual("10.0.0.1|0", HostManager.key_to_representation("10.0.0.1|0"))
@@ -505,3 +550,72 @@ class TestTopoManager(TestCMDBBaseTestCase):
         TopoManager.clear()
         self.assertEqual(len(TopoManager.cache.hkeys(TopoManager.CACHE_KEY)), 0)
         self.assertEqual(len(TopoManager.cache.hkeys(TopoManager.get_biz_cache_key())), 0)
+
+
+@override_settings(CMDB_RESOURCE_WATCH_ENABLED=True)
+class TestCMDBResourceWatcher(TestCMDBBaseTestCase):
+    def setUp(self):
+        super().setUp()
+        caches["locmem"].clear()
+        local.host_cache = {}
+        self.clear()
+        self.event_source = LocalEventSource()
+        self.watcher = CMDBResourceWatcher(self.event_source)
+
+    def tearDown(self):
+        super().tearDown()
+        self.clear()
+
+    def clear(self):
+        for manager in [HostManager, HostIPManager, ModuleManager, SetManager, TopoManager]:
+            manager.clear()
+        CMDBResourceWatcher.cache.delete(
+            *[CMDBResourceWatcher.get_cursor_key(bk_resource) for bk_resource in CMDBResourceWatcher.RESOURCE_MANAGERS]
+        )
+
+    @mock.patch("alarm_backends.core.cache.cmdb.host.api.cmdb.get_host_by_topo_node")
+    def test_sync(self, get_host_by_topo_node):
+        hosts = copy.deepcopy(ALL_HOSTS)
+        get_host_by_topo_node.side_effect = lambda bk_biz_id, **kwargs: [
+            copy.deepcopy(host) for host in hosts if host.bk_biz_id == bk_biz_id
+        ]
+
+        # 首次同步没有游标，全量刷新
+        self.assertFalse(CMDBResourceWatcher.is_watching(HostManager))
+        self.watcher.sync()
+        self.assertTrue(CMDBResourceWatcher.is_watching(HostManager))
+        self.assertEqual(len(HostManager.all()), len(ALL_HOSTS) * 2)
+        self.assertEqual(HostIPManager.get("10.0.0.3"), ["10.0.0.3|3"])
+
+        # 主机从业务3转移到业务2，仅刷新事件涉及的业务
+        get_host_by_topo_node.reset_mock()
+        hosts[2].bk_biz_id = 2
+        self.event_source.push("host_relation", "delete", {"bk_biz_id": 3, "bk_host_id": 3})
+        self.event_source.push("host_relation", "create", {"bk_biz_id": 2, "bk_host_id": 3})
+        self.watcher.sync()
+        self.assertSetEqual(
+            {call[1]["bk_biz_id"] for call in get_host_by_topo_node.call_args_list},
+            {2, 3},
+        )
+        self.assertEqual(HostManager.get_by_id(3).bk_biz_id, 2)
+
+        # 主机删除事件通过主机缓存定位业务
+        hosts.pop(3)
+        self.event_source.push("host", "delete", {"bk_host_id": 4})
+        self.watcher.sync()
+        self.assertIsNone(HostManager.get_by_id(4))
+        self.assertIsNone(HostManager.cache.hget(HostManager.CACHE_KEY, "10.0.0.4|4"))
+        self.assertIsNone(HostIPManager.cache.hget(HostIPManager.CACHE_KEY, "10.0.0.4"))
+        self.assertEqual(HostIPManager.get("10.0.0.3"), ["10.0.0.3|3"])
+
+        # 没有新事件时不刷新缓存
+        get_host_by_topo_node.reset_mock()
+        self.watcher.sync()
+        get_host_by_topo_node.assert_not_called()
+
+        # 游标丢失时回退为全量刷新
+        CMDBResourceWatcher.cache.delete(CMDBResourceWatcher.get_cursor_key("host"))
+        self.assertFalse(CMDBResourceWatcher.is_watching(HostManager))
+        self.watcher.sync()
+        self.assertEqual(get_host_by_topo_node.call_count, len(BIZ_IDS) * 2)
+        self.assertTrue(CMDBResourceWatcher.is_watching(HostManager))
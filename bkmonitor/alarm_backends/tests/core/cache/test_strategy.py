@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Tencent is pleased to support the open source community by making 蓝鲸智云 - 监控平台 (BlueKing - Monitor) available.
+Copyright (C) 2017-2021 THL A29 Limited, a Tencent company. All rights reserved.
+Licensed under the MIT License (the "License"); you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://opensource.org/licenses/MIT
+Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on
+an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the
+specific language governing permissions and limitations under the License.
+"""
+import copy
+import json
+
+import pytest
+
+from alarm_backends.core.cache.strategy import StrategyCacheManager
+
+pytestmark = pytest.mark.django_db
+
+
+def make_strategy(strategy_id, query_md5, name="cpu"):
+    return {
+        "id": strategy_id,
+        "bk_biz_id": 2,
+        "name": name,
+        "version": "v2",
+        "items": [
+            {"id": strategy_id * 10, "query_md5": query_md5, "query_configs": [{"agg_interval": 60}]},
+        ],
+    }
+
+
+@pytest.fixture()
+def clear_strategy_cache():
+    cache = StrategyCacheManager.cache
+    cache.delete(
+        StrategyCacheManager.IDS_CACHE_KEY,
+        StrategyCacheManager.STRATEGY_GROUP_CACHE_KEY,
+        StrategyCacheManager.STRATEGY_HASH_CACHE_KEY,
+        StrategyCacheManager.VERSION_CACHE_KEY,
+        *[StrategyCacheManager.CACHE_KEY_TEMPLATE.format(strategy_id=strategy_id) for strategy_id in (1, 2, 3)],
+    )
+
+
+class TestStrategyCacheRefresh:
+    def test_refresh_strategy__only_changed(self, clear_strategy_cache):
+        cache = StrategyCacheManager.cache
+        strategies = [make_strategy(1, "md5_a"), make_strategy(2, "md5_a"), make_strategy(3, "md5_b")]
+
+        StrategyCacheManager.refresh_strategy(copy.deepcopy(strategies))
+        assert StrategyCacheManager.get_strategy_version() == 1
+        assert set(StrategyCacheManager.get_strategy_hashes([1, 2, 3, 4])) == {1, 2, 3}
+        assert json.loads(cache.hget(StrategyCacheManager.STRATEGY_GROUP_CACHE_KEY, "md5_a")) == {
+            "1": [10],
+            "2": [20],
+            "bk_biz_id": 2,
+            "interval_list": [60, 60],
+        }
+
+        # 内容未变化时不会重写策略缓存，也不会递增版本号
+        cache.set(StrategyCacheManager.CACHE_KEY_TEMPLATE.format(strategy_id=1), "dirty")
+        StrategyCacheManager.refresh_strategy(copy.deepcopy(strategies))
+        assert StrategyCacheManager.get_strategy_version() == 1
+        assert cache.get(StrategyCacheManager.CACHE_KEY_TEMPLATE.format(strategy_id=1)) == "dirty"
+
+        # 仅变更的策略及分组被重写
+        strategies[1] = make_strategy(2, "md5_b", name="mem")
+        StrategyCacheManager.refresh_strategy(copy.deepcopy(strategies))
+        assert StrategyCacheManager.get_strategy_version() == 2
+        assert StrategyCacheManager.get_strategy_by_id(2)["name"] == "mem"
+        assert cache.get(StrategyCacheManager.CACHE_KEY_TEMPLATE.format(strategy_id=1)) == "dirty"
+        assert set(json.loads(cache.hget(StrategyCacheManager.STRATEGY_GROUP_CACHE_KEY, "md5_b"))) == {
+            "2",
+            "3",
+            "bk_biz_id",
+            "interval_list",
+        }
+
+    def test_refresh_strategy__restore_missing(self, clear_strategy_cache):
+        cache = StrategyCacheManager.cache
+        strategies = [make_strategy(1, "md5_a"), make_strategy(2, "md5_a")]
+        StrategyCacheManager.refresh_strategy(copy.deepcopy(strategies))
+        assert StrategyCacheManager.get_strategy_version() == 1
+
+        # 内容未变化但策略缓存已丢失时，重新写入并递增版本号
+        cache.delete(StrategyCacheManager.CACHE_KEY_TEMPLATE.format(strategy_id=1))
+        StrategyCacheManager.refresh_strategy(copy.deepcopy(strategies))
+        assert StrategyCacheManager.get_strategy_by_id(1)["name"] == "cpu"
+        assert StrategyCacheManager.get_strategy_version() == 2
+
+        # 缓存完整时不再递增版本号
+        StrategyCacheManager.refresh_strategy(copy.deepcopy(strategies))
+        assert StrategyCacheManager.get_strategy_version() == 2
+
+    def test_refresh_strategy_ids__delete(self, clear_strategy_cache):
+        strategies = [make_strategy(1, "md5_a"), make_strategy(2, "md5_a")]
+        StrategyCacheManager.refresh_strategy_ids(strategies)
+        StrategyCacheManager.refresh_strategy(strategies)
+        assert StrategyCacheManager.get_strategy_version() == 1
+
+        StrategyCacheManager.refresh_strategy_ids(strategies[:1])
+        StrategyCacheManager.refresh_strategy(strategies[:1])
+        assert StrategyCacheManager.get_strategy_version() == 3
+        assert StrategyCacheManager.get_strategy_by_id(2) is None
+        assert set(StrategyCacheManager.get_strategy_hashes([1, 2])) == {1}
@@ -1,11 +1,14 @@
 # -*- coding: utf-8 -*-
 import copy
+import hashlib
+import json
 from datetime import datetime
 
 import mock
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
-from alarm_backends.core.control.strategy import Strategy
+from alarm_backends.core.cache import key
+from alarm_backends.core.control.strategy import Strategy, strategy_local_cache
 
 STRATEGY = {
     "bk_biz_id": 2,
@@ -103,3 +106,71 @@ class TestStrategy(TestCase):
             [],
         ]
         self.assertFalse(strategy.in_alarm_time(datetime.strptime("2022-01-01 01:00:00", "%Y-%m-%d %H:%M:%S"))[0])
+
+
+@override_settings(STRATEGY_LOCAL_CACHE_ENABLED=True, STRATEGY_LOCAL_CACHE_CHECK_INTERVAL=0)
+class TestStrategyLocalCache(TestCase):
+    def setUp(self):
+        strategy_local_cache.clear()
+        self.raw_strategies = {
+            strategy_id: json.dumps(dict(copy.deepcopy(STRATEGY), id=strategy_id, update_time=1))
+            for strategy_id in (1, 2)
+        }
+        self.strategy_hashes = {
+            strategy_id: hashlib.md5(content.encode("utf-8")).hexdigest()
+            for strategy_id, content in self.raw_strategies.items()
+        }
+        patcher = mock.patch("alarm_backends.core.control.strategy.StrategyCacheManager")
+        self.StrategyCacheManager = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(strategy_local_cache.clear)
+        self.StrategyCacheManager.get_strategy_version.return_value = 1
+        self.StrategyCacheManager.get_strategy_hashes.side_effect = lambda ids: {
+            strategy_id: self.strategy_hashes[strategy_id] for strategy_id in ids if strategy_id in self.strategy_hashes
+        }
+        self.StrategyCacheManager.get_raw_strategy_by_ids.side_effect = lambda ids: {
+            strategy_id: self.raw_strategies[strategy_id] for strategy_id in ids if strategy_id in self.raw_strategies
+        }
+
+    def test_config__load_once(self):
+        Strategy.preload([1, 2, 3])
+        self.assertEqual(self.StrategyCacheManager.get_raw_strategy_by_ids.call_count, 1)
+
+        strategy = Strategy(1)
+        self.assertEqual(strategy.config["id"], 1)
+        self.assertEqual(Strategy(2).bk_biz_id, 2)
+        self.assertEqual(self.StrategyCacheManager.get_raw_strategy_by_ids.call_count, 1)
+
+        # 每个实例拿到的配置相互独立
+        strategy.config["name"] = "changed"
+        self.assertEqual(Strategy(1).config["name"], "test")
+
+        # 不存在的策略不缓存
+        self.assertEqual(Strategy(3).config, {})
+        self.assertEqual(self.StrategyCacheManager.get_raw_strategy_by_ids.call_count, 2)
+
+    def test_config__version_changed(self):
+        Strategy.preload([1, 2])
+        self.raw_strategies[1] = json.dumps(dict(copy.deepcopy(STRATEGY), id=1, name="new", update_time=2))
+        self.strategy_hashes[1] = hashlib.md5(self.raw_strategies[1].encode("utf-8")).hexdigest()
+
+        # 版本号未变化时使用进程内缓存
+        self.assertEqual(Strategy(1).config["name"], "test")
+
+        self.StrategyCacheManager.get_strategy_version.return_value = 2
+        self.assertEqual(Strategy(1).config["name"], "new")
+        self.assertEqual(Strategy(2).config["name"], "test")
+        self.StrategyCacheManager.get_raw_strategy_by_ids.assert_called_with([1])
+
+    def test_gen_strategy_snapshot__skip_written(self):
+        client = mock.MagicMock()
+        with mock.patch.object(key.STRATEGY_SNAPSHOT_KEY, "_cache", client):
+            snapshot_key = Strategy(1).gen_strategy_snapshot()
+            self.assertEqual(Strategy(1).gen_strategy_snapshot(), snapshot_key)
+            self.assertEqual(client.set.call_count, 1)
+
+            self.raw_strategies[1] = json.dumps(dict(copy.deepcopy(STRATEGY), id=1, update_time=2))
+            self.strategy_hashes[1] = hashlib.md5(self.raw_strategies[1].encode("utf-8")).hexdigest()
+            self.StrategyCacheManager.get_strategy_version.return_value = 2
+            self.assertNotEqual(Strategy(1).gen_strategy_snapshot(), snapshot_key)
+            self.assertEqual(client.set.call_count, 2)
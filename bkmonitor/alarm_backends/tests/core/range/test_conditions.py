@@ -23,6 +23,7 @@ from bkmonitor.utils.range.conditions import (
     NotRegularCondition,
     OrCondition,
     RegularCondition,
+    compile_regex,
 )
 from bkmonitor.utils.range.fields import DimensionField
 
@@ -156,6 +157,19 @@ class TestCondition(object):
         assert condition.is_match({"key": ["1234235678", "234"]})
         assert not condition.is_match({"key": ["234", "1234235678"]})
 
+    def test_regular_compile_once(self):
+        compile_regex.cache_clear()
+        field = DimensionField("key", [r"1234\d+5678", "(", r"123\d+5678"])
+        condition = RegularCondition(field)
+        for _ in range(10):
+            assert condition.is_match({"key": "1234235678"})
+            # 非法的正则表达式直接返回不适配
+            assert not condition.is_match({"key": "12345678"})
+        assert compile_regex.cache_info().misses == 3
+
+        RegularCondition(DimensionField("key", r"1234\d+5678"))
+        assert compile_regex.cache_info().hits == 1
+
     def test_not_regular(self):
         field = DimensionField("key", r"1234\d+5678")
         condition = NotRegularCondition(field)
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Tencent is pleased to support the open source community by making 蓝鲸智云 - 监控平台 (BlueKing - Monitor) available.
+Copyright (C) 2017-2021 THL A29 Limited, a Tencent company. All rights reserved.
+Licensed under the MIT License (the "License"); you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://opensource.org/licenses/MIT
+Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on
+an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the
+specific language governing permissions and limitations under the License.
+"""
+import json
+
+from alarm_backends.core.storage.queue_codec import (
+    FRAME_PREFIX,
+    ColumnarFrameCodec,
+    JsonRecordCodec,
+    decode_entries,
+)
+
+
+def make_records(count):
+    return [
+        {
+            "record_id": "342a08e0f85f169a7e099c18db3708ed.{}".format(1569246480 + i),
+            "value": i * 1.5,
+            "values": {"timestamp": 1569246480 + i, "load5": i * 1.5},
+            "dimensions": {"ip": "127.0.0.{}".format(i), "bk_cloud_id": "0"},
+            "dimension_fields": ["ip", "bk_cloud_id"],
+            "time": 1569246480 + i,
+            "access_time": 1569246490.5,
+        }
+        for i in range(count)
+    ]
+
+
+class TestQueueCodec(object):
+    def test_json_codec(self):
+        records = make_records(3)
+        entries = JsonRecordCodec().encode(records)
+        assert len(entries) == 3
+        assert [json.loads(entry) for entry in entries] == records
+
+    def test_frame_codec_round_trip(self):
+        records = make_records(25)
+        entries = ColumnarFrameCodec(frame_size=10).encode(records)
+        assert len(entries) == 3
+        assert all(entry.startswith(FRAME_PREFIX) for entry in entries)
+
+        decoded, unexpected_count, _ = decode_entries(entries)
+        assert unexpected_count == 0
+        assert decoded == records
+
+    def test_frame_codec_schema_change(self):
+        records = make_records(4)
+        records[2]["__debug__"] = True
+        records[3]["dimensions"] = {"host": "a"}
+        entries = ColumnarFrameCodec().encode(records)
+        # 顶层字段变化时拆分帧
+        assert len(entries) == 3
+
+        decoded, unexpected_count, _ = decode_entries(entries)
+        assert unexpected_count == 0
+        assert decoded == records
+
+    def test_decode_mixed_entries(self):
+        records = make_records(4)
+        entries = JsonRecordCodec().encode(records[:2]) + ColumnarFrameCodec().encode(records[2:]) + ["bad"]
+        decoded, unexpected_count, last_unexpected = decode_entries(entries)
+        assert decoded == records
+        assert unexpected_count == 1
+        assert last_unexpected == "bad"
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Tencent is pleased to support the open source community by making 蓝鲸智云 - 监控平台 (BlueKing - Monitor) available.
+Copyright (C) 2017-2021 THL A29 Limited, a Tencent company. All rights reserved.
+Licensed under the MIT License (the "License"); you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://opensource.org/licenses/MIT
+Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on
+an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the
+specific language governing permissions and limitations under the License.
+"""
+import threading
+
+import mock
+import pytest
+
+from alarm_backends.core.storage import redis_cluster
+from alarm_backends.core.storage.redis_cluster import PipelineProxy
+
+
+class FakePipeline(object):
+    def __init__(self, node_id, barrier=None, error=None):
+        self.node_id = node_id
+        self.barrier = barrier
+        self.error = error
+        self.commands = []
+
+    def __len__(self):
+        return len(self.commands)
+
+    def get(self, key):
+        self.commands.append(key)
+
+    def execute(self):
+        if self.barrier:
+            # 只有多个节点并发执行时才能全部到达屏障
+            self.barrier.wait(timeout=5)
+        if self.error:
+            raise self.error
+        return ["{}:{}".format(self.node_id, key) for key in self.commands]
+
+
+def make_proxy(pipelines):
+    proxy = PipelineProxy(mock.MagicMock(backend="service"))
+    proxy._pipeline_pool = pipelines
+    return proxy
+
+
+def push(proxy, node_id, key):
+    proxy._pipeline_pool[node_id].get(key)
+    proxy.command_stack.append(node_id)
+
+
+class TestPipelineProxy(object):
+    def test_execute_keeps_command_order(self):
+        # 节点 1、2 必须并发执行，串行执行时屏障等待超时抛出异常
+        barrier = threading.Barrier(2)
+        proxy = make_proxy({1: FakePipeline(1, barrier), 2: FakePipeline(2, barrier), 3: FakePipeline(3)})
+        for i, node_id in enumerate([1, 2, 1, 3, 2]):
+            push(proxy, node_id, "k{}".format(i))
+
+        result = proxy.execute()
+
+        assert result == ["1:k0", "2:k1", "1:k2", "3:k3", "2:k4"]
+        assert proxy.command_stack == []
+
+    def test_execute_skip_empty_pipeline(self):
+        empty = FakePipeline(2)
+        empty.execute = mock.MagicMock(return_value=[])
+        proxy = make_proxy({1: FakePipeline(1), 2: empty})
+        push(proxy, 1, "a")
+
+        assert proxy.execute() == ["1:a"]
+        empty.execute.assert_not_called()
+
+    def test_execute_raise_node_error(self):
+        proxy = make_proxy({1: FakePipeline(1), 2: FakePipeline(2, error=ValueError("node down"))})
+        push(proxy, 1, "a")
+        push(proxy, 2, "b")
+
+        with pytest.raises(ValueError):
+            proxy.execute()
+
+
+def test_get_pipeline_executor_after_fork():
+    executor = redis_cluster.get_pipeline_executor()
+    assert redis_cluster.get_pipeline_executor() is executor
+
+    # 进程号变化时(fork 出的子进程)重新创建线程池
+    with mock.patch.object(redis_cluster.os, "getpid", return_value=redis_cluster.os.getpid() + 1):
+        child_executor = redis_cluster.get_pipeline_executor()
+        assert child_executor is not executor
+        assert child_executor.submit(lambda: "ok").result(timeout=5) == "ok"
+
+
+def test_get_node_by_strategy_id():
+    routers = [mock.MagicMock(strategy_score=score, node="node{}".format(score)) for score in (100, 200, 300)]
+    with mock.patch.object(redis_cluster, "STRATEGY_ROUTER_CACHE", routers), mock.patch.object(
+        redis_cluster, "STRATEGY_ROUTER_SCORES", [100, 200, 300]
+    ), mock.patch.object(redis_cluster, "STRATEGY_NODE_MAP", {}):
+        assert redis_cluster.get_node_by_strategy_id(1) == "node100"
+        assert redis_cluster.get_node_by_strategy_id(100) == "node200"
+        assert redis_cluster.get_node_by_strategy_id(299) == "node300"
+        with pytest.raises(Exception):
+            redis_cluster.get_node_by_strategy_id(300)
@@ -9,6 +9,8 @@ an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express o
 specific language governing permissions and limitations under the License.
 """
 import json
+import os
+import queue
 import time
 from collections import namedtuple
 
@@ -16,6 +18,7 @@ import mock
 import pytest
 
 from alarm_backends.service.access import AccessRealTimeDataProcess
+from alarm_backends.service.access.data.processor import RealTimeRecord
 
 pytestmark = pytest.mark.django_db
 
@@ -195,3 +198,91 @@ class TestAccessDataProcess(object):
             )
         )
         p.run_handler(once=True)
+
+    def test_dispatch_to_workers(self):
+        TopicPartition = namedtuple("TopicPartition", ["topic", "partition"])
+        ConsumerRecord = namedtuple("ConsumerRecord", ["topic", "partition", "timestamp", "value"])
+        service = mock.MagicMock()
+        p = AccessRealTimeDataProcess(service)
+        p.workers = [mock.MagicMock(is_alive=mock.MagicMock(return_value=True)) for _ in range(3)]
+        p.worker_queues = [queue.Queue(maxsize=10) for _ in range(3)]
+        topic_info = {"dimensions": ["bk_target_ip"], "strategy_ids": [1]}
+        p.topics = {"kafka1.service.consul:9092|topic1": topic_info}
+
+        for partition in range(6):
+            for _ in range(2):
+                p.dispatch(
+                    "kafka1.service.consul:9092",
+                    TopicPartition("topic1", partition),
+                    [ConsumerRecord("topic1", partition, int(time.time() * 1000), b"{}")],
+                )
+
+        assert p.queue.qsize() == 0
+        assert sum(q.qsize() for q in p.worker_queues) == 12
+
+        # 同一个 partition 的数据只会分发到同一个 handler 子进程
+        partition_workers = {}
+        for worker_index, worker_queue in enumerate(p.worker_queues):
+            while not worker_queue.empty():
+                bootstrap_servers, records, topics = worker_queue.get()
+                assert bootstrap_servers == "kafka1.service.consul:9092"
+                # topic 信息随数据一并下发
+                assert topics == {"kafka1.service.consul:9092|topic1": topic_info}
+                partition_workers.setdefault(records[0].partition, set()).add(worker_index)
+        assert all(len(workers) == 1 for workers in partition_workers.values())
+
+    def test_dispatch_worker_exited(self):
+        TopicPartition = namedtuple("TopicPartition", ["topic", "partition"])
+        ConsumerRecord = namedtuple("ConsumerRecord", ["topic", "partition", "timestamp", "value"])
+        service = mock.MagicMock()
+        p = AccessRealTimeDataProcess(service)
+        p.workers = [mock.MagicMock(is_alive=mock.MagicMock(return_value=False), exitcode=1)]
+        p.worker_queues = [queue.Queue(maxsize=1)]
+
+        p.dispatch(
+            "kafka1.service.consul:9092",
+            TopicPartition("topic1", 0),
+            [ConsumerRecord("topic1", 0, int(time.time() * 1000), b"{}")],
+        )
+
+        # 子进程退出后不再分发数据，并停止当前进程
+        assert p.worker_queues[0].empty()
+        assert p._stop_signal
+
+    def test_dispatch_queue_full_on_stop(self):
+        TopicPartition = namedtuple("TopicPartition", ["topic", "partition"])
+        ConsumerRecord = namedtuple("ConsumerRecord", ["topic", "partition", "timestamp", "value"])
+        service = mock.MagicMock()
+        p = AccessRealTimeDataProcess(service)
+        p.workers = [mock.MagicMock(is_alive=mock.MagicMock(return_value=True))]
+        worker_queue = mock.MagicMock()
+        worker_queue.put.side_effect = queue.Full
+        p.worker_queues = [worker_queue]
+        p._stop_signal = True
+
+        p.dispatch(
+            "kafka1.service.consul:9092",
+            TopicPartition("topic1", 0),
+            [ConsumerRecord("topic1", 0, int(time.time() * 1000), b"{}")],
+        )
+
+        # 停止过程中队列已满时放弃分发，而不是一直阻塞
+        assert worker_queue.put.call_count == 1
+
+    def test_worker(self):
+        service = mock.MagicMock()
+        p = AccessRealTimeDataProcess(service)
+        worker_queue = queue.Queue()
+        record = RealTimeRecord("topic1", 0, int(time.time() * 1000), b"{}")
+        topics = {"kafka1.service.consul:9092|topic1": {"dimensions": [], "strategy_ids": [1]}}
+        worker_queue.put(("kafka1.service.consul:9092", [record], topics))
+        worker_queue.put(None)
+
+        with mock.patch.object(p, "handle") as handle, mock.patch(
+            "alarm_backends.service.access.data.processor.signal"
+        ):
+            p.run_worker(0, worker_queue, os.getppid())
+
+        handle.assert_called_once_with("kafka1.service.consul:9092", [record])
+        assert p.topics == topics
+        assert worker_queue.empty()
@@ -250,6 +250,35 @@ class TestProcessor(TestCase):
         result = processor.dedupe_events_to_alerts([event])
         self.assertEqual(0, len(result))
 
+    @mock.patch("bkmonitor.documents.base.BaseDocument.bulk_create")
+    @mock.patch("alarm_backends.service.alert.builder.processor.send_check_task.delay")
+    def test_dedupe_events_to_alerts__load_snapshot_once(self, send_check_task, bulk_create):
+        processor = AlertBuilder()
+        events = [
+            Event(
+                {
+                    "event_id": str(index),
+                    "plugin_id": "fta-test",
+                    "alert_name": "CPU usage high",
+                    "time": int(time.time()) - index,
+                    "tags": [{"key": "device", "value": "cpu0"}],
+                    "severity": 1,
+                    "target": "10.0.0.{}".format(index % 2),
+                    "dedupe_keys": ["alert_name", "target"],
+                }
+            )
+            for index in range(4)
+        ]
+
+        with mock.patch.object(
+            processor, "list_alerts_content_from_cache", wraps=processor.list_alerts_content_from_cache
+        ) as list_alerts, mock.patch.object(processor, "enrich_alerts", side_effect=lambda alerts: alerts):
+            alerts = processor.dedupe_events_to_alerts(events)
+
+        # 过期检查与告警构建共用同一份告警快照
+        self.assertEqual(1, list_alerts.call_count)
+        self.assertEqual(2, len(alerts))
+
     @mock.patch("bkmonitor.documents.base.BaseDocument.bulk_create")
     def test_build_alerts__event_drop(self, bulk_create):
         documents = []
@@ -9,24 +9,34 @@ an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express o
 specific language governing permissions and limitations under the License.
 """
 import copy
+import datetime
 import time
+from types import SimpleNamespace
 from typing import Dict
 
 import mock
 import pytest
 from django.core.cache import caches
+from django.utils import timezone
 
 from alarm_backends.core.alert import Alert, Event
 from alarm_backends.core.cache.cmdb import HostIPManager, HostManager
 from alarm_backends.core.cache.cmdb.host import HostAgentIDManager
+from alarm_backends.core.cache.shield import ShieldCacheManager
 from alarm_backends.core.storage.redis_cluster import get_node_by_strategy_id
 from alarm_backends.service.alert.enricher import KubernetesCMDBEnricher
+from alarm_backends.service.converge.shield.shield_index import (
+    ShieldIndex,
+    ShieldIndexManager,
+)
 from alarm_backends.service.converge.shield.shielder.saas_config import HostShielder
 from alarm_backends.tests.utils.cmdb_data import ALL_HOSTS, TOPO_TREE
 from api.cmdb.define import Business, Host
 from bkmonitor.models import CacheNode
+from bkmonitor.utils import extended_json
 from bkmonitor.utils.local import local
 from constants.data_source import KubernetesResultTableLabel
+from constants.shield import ScopeType, ShieldCategory
 
 pytestmark = pytest.mark.django_db
 
@@ -326,3 +336,102 @@ class TestHostShielder:
 
         assert shielder.is_matched()
         mock_get_host_without_biz_v2.assert_not_called()
+
+
+class FakeDimension(object):
+    def __init__(self, key, value):
+        self.key = key
+        self.value = value
+
+    def to_dict(self):
+        return {"key": self.key, "value": self.value}
+
+
+def make_shield_config(shield_id, category, dimension_config, scope_type=""):
+    now = timezone.now()
+    return {
+        "id": shield_id,
+        "bk_biz_id": BK_BIZ_ID,
+        "category": category,
+        "scope_type": scope_type,
+        "begin_time": now - datetime.timedelta(hours=1),
+        "end_time": now + datetime.timedelta(hours=1),
+        "cycle_config": {"type": 1, "begin_time": "", "end_time": "", "day_list": [], "week_list": []},
+        "dimension_config": dimension_config,
+        "notice_config": {},
+        "description": "",
+    }
+
+
+def make_alert(strategy_id, ip):
+    return SimpleNamespace(
+        id="alert-{}-{}".format(strategy_id, ip),
+        strategy_id=strategy_id,
+        strategy={},
+        severity=1,
+        origin_alarm={"data": {"dimensions": {"bk_target_ip": ip, "bk_target_cloud_id": 0}}},
+        dimensions=[FakeDimension("bk_target_ip", ip), FakeDimension("bk_target_cloud_id", 0)],
+        event_document=SimpleNamespace(bk_topo_node=[]),
+    )
+
+
+class TestShieldIndex:
+    @mock.patch("alarm_backends.service.converge.shield.shield_obj.Strategy")
+    def test_match__10k_shields(self, strategy):
+        strategy.return_value.config = {"items": [{"query_configs": [{"metric_id": "bk_monitor.system.cpu.usage"}]}]}
+        configs = [
+            make_shield_config(shield_id, ShieldCategory.STRATEGY, {"strategy_id": [shield_id], "level": [1, 2, 3]})
+            for shield_id in range(1, 9001)
+        ]
+        configs.extend(
+            make_shield_config(
+                shield_id,
+                ShieldCategory.SCOPE,
+                {
+                    "bk_target_ip": [
+                        {
+                            "bk_target_ip": "10.0.{}.{}".format(shield_id // 256, shield_id % 256),
+                            "bk_target_cloud_id": 0,
+                        }
+                    ]
+                },
+                scope_type=ScopeType.IP,
+            )
+            for shield_id in range(9001, 10001)
+        )
+        # 无法建立索引的维度屏蔽
+        configs.append(
+            make_shield_config(
+                10001,
+                ShieldCategory.DIMENSION,
+                {"dimension_conditions": [{"key": "bk_target_ip", "method": "include", "value": ["10.0.35."]}]},
+            )
+        )
+        shield_index = ShieldIndex(configs)
+        assert len(shield_index.unindexed) == 1
+
+        alerts = [
+            make_alert(strategy_id, "10.0.35.{}".format(strategy_id % 256)) for strategy_id in range(1, 10001, 500)
+        ]
+
+        indexed_result = [[obj.id for obj in shield_index.match(alert)] for alert in alerts]
+        linear_result = [[obj.id for obj in shield_index.shield_objs if obj.is_match(alert)] for alert in alerts]
+
+        assert indexed_result == linear_result
+        assert indexed_result[0] == [1, 10001]
+        assert indexed_result[1] == [501, 9205, 10001]
+
+    def test_index_refresh(self):
+        configs = [make_shield_config(1, ShieldCategory.STRATEGY, {"strategy_id": [1], "level": [1, 2, 3]})]
+        ShieldIndexManager.clear()
+        with mock.patch.object(ShieldCacheManager, "get_raw_shields_by_biz_id") as get_raw:
+            get_raw.return_value = extended_json.dumps(configs)
+            shield_index = ShieldIndexManager.get_index(BK_BIZ_ID)
+            assert ShieldIndexManager.get_index(BK_BIZ_ID) is shield_index
+
+            configs.append(make_shield_config(2, ShieldCategory.STRATEGY, {"strategy_id": [2], "level": [1, 2, 3]}))
+            get_raw.return_value = extended_json.dumps(configs)
+            new_shield_index = ShieldIndexManager.get_index(BK_BIZ_ID)
+            assert new_shield_index is not shield_index
+            assert len(new_shield_index.shield_objs) == 2
+        ShieldIndexManager.clear()
@@ -118,3 +118,91 @@ class TestSimpleRingRatio(object):
         with pytest.raises(InvalidSimpleRingRatioConfig):
             detect_engine = SimpleRingRatio(config=algorithms_config)
             detect_engine.detect((99, 100000000))
+
+
+class TestHistoryPointCache(object):
+    def test_lru_eviction(self):
+        from alarm_backends.service.detect.strategy import HistoryPointCache
+
+        cache = HistoryPointCache(max_records=3)
+        cache.set("query", 60, {"a": "1", "b": "2"})
+        cache.set("query", 120, {"a": "3"})
+        assert cache.get("query", 60) == {"a": "1", "b": "2"}
+        assert cache.get("other", 60) is None
+
+        # 超出记录上限时淘汰最久未使用的时刻
+        cache.set("query", 180, {"a": "4"})
+        assert cache.get("query", 120) is None
+        assert cache.get("query", 60) == {"a": "1", "b": "2"}
+        assert cache.get("query", 180) == {"a": "4"}
+
+        # 空结果不缓存，历史数据延迟到达时需要重新查询
+        cache.set("query", 240, {})
+        assert cache.get("query", 240) is None
+
+    def test_expire(self):
+        from alarm_backends.service.detect.strategy import HistoryPointCache
+
+        cache = HistoryPointCache(max_records=10, ttl=-1)
+        cache.set("query", 60, {"a": "1"})
+        assert cache.get("query", 60) is None
+
+
+@pytest.mark.django_db
+class TestHistoryPointFetcher(object):
+    def test_late_arriving_history(self):
+        from alarm_backends.core.storage.redis_cluster import get_node_by_strategy_id
+        from alarm_backends.service.detect import DataPoint as DetectDataPoint
+        from alarm_backends.service.detect.strategy import HISTORY_POINT_CACHE
+        from alarm_backends.tests.service.detect.test_threshold import (
+            Item,
+            Strategy,
+            mocked_item,
+        )
+        from bkmonitor.models import CacheNode
+
+        get_node_by_strategy_id(0)
+        CacheNode.refresh_from_settings()
+        HISTORY_POINT_CACHE.clear()
+
+        item = Item(
+            101,
+            Strategy(101, "os"),
+            "%",
+            mocked_item.data_sources,
+            mocked_item.metric_ids,
+            mocked_item.query_configs,
+            mocked_item.query,
+        )
+        item.item_config = {"query_md5": "late_arriving_history"}
+        item.target = []
+        point = DetectDataPoint(
+            {
+                "record_id": "389518839de471c0baec4b6fb26c2538.1569246480",
+                "value": 100,
+                "values": {"timestamp": 1569246480, "mocked_metric": 100},
+                "dimensions": {"mocked": "mocked"},
+                "time": 1569246480,
+            },
+            item,
+        )
+        history = {"mocked": "mocked", "mocked_metric": 50, "_time_": 1569246420, "_result_": 50}
+
+        # 首次检测时历史数据尚未到达
+        item.query_record = mock.MagicMock(return_value=[])
+        detect_engine = SimpleRingRatio(config={"floor": None, "ceil": 50})
+        detect_engine.query_history_points([point])
+        assert detect_engine.fetch_history_point(item, point, 1569246420) is None
+
+        # 历史数据延迟到达，下次检测需要重新查询
+        item.query_record = mock.MagicMock(return_value=[history])
+        detect_engine = SimpleRingRatio(config={"floor": None, "ceil": 50})
+        detect_engine.query_history_points([point])
+        assert item.query_record.call_count == 1
+        assert detect_engine.fetch_history_point(item, point, 1569246420).value == 50
+
+        # 已查询到数据的时刻不再重复查询
+        detect_engine = SimpleRingRatio(config={"floor": None, "ceil": 50})
+        detect_engine.query_history_points([point])
+        assert item.query_record.call_count == 1
+        assert detect_engine.fetch_history_point(item, point, 1569246420).value == 50
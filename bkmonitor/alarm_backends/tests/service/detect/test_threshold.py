@@ -10,6 +10,7 @@ specific language governing permissions and limitations under the License.
 """
 
 
+import time
 from collections import namedtuple
 
 import mock
@@ -259,3 +260,58 @@ class TestThreshold(object):
 
         anomaly_records = detect_engine.detect_records([datapoint], 1)
         assert anomaly_records[0].anomaly_message == "avg(测试指标) >= 1.0KiB, 当前值1.000977KiB"
+
+    def test_batch_detect(self):
+        algorithms_config = [
+            [{"threshold": 6, "method": "gt"}, {"threshold": 99, "method": "lte"}, {"threshold": 50, "method": "neq"}],
+            [{"threshold": 6, "method": "eq"}],
+        ]
+        detect_engine = Threshold(config=algorithms_config)
+        assert detect_engine.supports_batch
+
+        data_points = [datapoint99, datapoint50, datapoint6, mock_datapoint_with_value(None)]
+        batch_results = detect_engine.batch_detect(data_points)
+        assert [len(result or []) for result in batch_results] == [3, 0, 1, 0]
+
+        anomaly_result = detect_engine.detect_records(data_points, 1)
+        assert [ap.data_point for ap in anomaly_result] == [datapoint99, datapoint6]
+        assert anomaly_result[0].anomaly_message == "avg(测试指标) > 6.0%且 <= 99.0%且 != 50.0%, 当前值99%"
+        assert anomaly_result[1].anomaly_message == "avg(测试指标) = 6.0%, 当前值6%"
+
+    def test_anomaly_burst(self):
+        from alarm_backends.service.detect import strategy
+
+        algorithms_config = [[{"threshold": 50, "method": "gte"}]]
+        detect_engine = Threshold(config=algorithms_config)
+        data_points = [mock_datapoint_with_value(value) for value in range(100, 10100)]
+
+        strategy.compile_desc_template.cache_clear()
+        with mock.patch.object(strategy, "Template", wraps=strategy.Template) as template_cls:
+            start = time.time()
+            anomaly_result = detect_engine.detect_records(data_points, 1)
+            detect_cost = time.time() - start
+            assert len(anomaly_result) == 10000
+            # 检测阶段不渲染异常描述
+            assert template_cls.call_count == 0
+
+            start = time.time()
+            messages = [ap.anomaly_message for ap in anomaly_result]
+            render_cost = time.time() - start
+            # 同一模板只编译一次
+            assert template_cls.call_count == 1
+
+        assert messages[0] == "avg(测试指标) >= 50.0%, 当前值100%"
+        assert messages[-1] == "avg(测试指标) >= 50.0%, 当前值10099%"
+        print("10k anomalies burst: detect {:.3f}s, render {:.3f}s".format(detect_cost, render_cost))
+
+    def test_lazy_anomaly_message(self):
+        detect_engine = Threshold(config=[[{"threshold": 50, "method": "gte"}]])
+        with mock.patch.object(Threshold, "_format_message", autospec=True, return_value="异常") as format_message:
+            anomaly_point = detect_engine.detect_records([mock_datapoint_with_value(100)], 1)[0]
+            # 读取异常描述前不渲染
+            assert format_message.call_count == 0
+
+            assert "异常" in anomaly_point.anomaly_message
+            assert "异常" in anomaly_point.anomaly_message
+            # 多次读取只渲染一次
+            assert format_message.call_count == 1
@@ -38,6 +38,7 @@ from alarm_backends.service.fta_action.tasks.alert_assign import (
     BackendAssignMatchManager,
 )
 from api.cmdb.define import Business, Host
+from bkmonitor.action.alert_assign import AlertAssignMatchManager, AssignRuleSet
 from bkmonitor.documents import AlertDocument, AlertLog, EventDocument
 from bkmonitor.models import (
     ActionConfig,
@@ -50,6 +51,7 @@ from bkmonitor.models import (
     DutyArrange,
     UserGroup,
 )
+from bkmonitor.utils.local import local
 
 _mock.patch("alarm_backends.service.fta_action.utils.run_converge.delay", return_value=11111).start()
 _mock.patch("alarm_backends.service.fta_action.tasks.run_action.apply_async", return_value=11111).start()
@@ -761,6 +763,81 @@ class TestAlertAssignRule:
         m = BackendAssignMatchManager(alert=alert, notice_users=["admin"])
         assert rule_obj.is_matched(m.get_match_dimensions()) is False
 
+    def test_assign_rule_set_match(self):
+        rules = []
+        for rule_id in range(1, 501):
+            conditions = [{"field": "alert.strategy_id", "value": [str(rule_id)], "method": "eq"}]
+            if rule_id % 2:
+                conditions.append({"field": "alert.name", "value": [r"cpu\d+"], "method": "reg"})
+            if rule_id % 5 == 0:
+                # or 分支同样可以命中索引
+                conditions.append({"field": "bk_cloud_id", "value": ["5"], "method": "eq", "condition": "or"})
+            rules.append({"id": rule_id, "conditions": conditions, "user_groups": []})
+        # 无法建立索引的规则
+        rules.append(
+            {
+                "id": 501,
+                "conditions": [{"field": "alert.name", "value": ["cpu"], "method": "include"}],
+                "user_groups": [],
+            }
+        )
+        rules.append(
+            {"id": 502, "conditions": [{"field": "ip", "value": ["127.0.0.1"], "method": "eq"}], "user_groups": []}
+        )
+
+        rule_set = AssignRuleSet(rules)
+        assert rule_set.unindexed == {500, 501}
+
+        def linear_match(dimensions, rule_snaps):
+            return [
+                rule["id"]
+                for rule in rules
+                if AssignRuleMatch(rule, rule_snaps.get(str(rule["id"]))).is_matched(dimensions=dimensions)
+            ]
+
+        snap_rule = copy.deepcopy(rules[99])
+        cases = [
+            ({"alert.strategy_id": "3", "alert.name": "cpu1", "ip": "127.0.0.1", "bk_cloud_id": "0"}, {}),
+            ({"alert.strategy_id": "3", "alert.name": "mem", "ip": "127.0.0.2", "bk_cloud_id": "5"}, {}),
+            ({"alert.strategy_id": "4", "alert.name": "disk"}, {"100": snap_rule}),
+            ({"alert.name": "cpu2"}, {}),
+        ]
+        for dimensions, rule_snaps in cases:
+            matched_rules = rule_set.match(dimensions, rule_snaps)
+            assert [rule_obj.rule_id for rule_obj in matched_rules] == linear_match(dimensions, rule_snaps)
+
+        assert [rule_obj.rule_id for rule_obj in rule_set.match(*cases[0])] == [3, 501, 502]
+        # 存在快照且规则未变化的，直接视为适配
+        assert [rule_obj.rule_id for rule_obj in rule_set.match(*cases[2])] == [4, 100]
+
+    def test_assign_rule_set_cache(self, alert):
+        rules = [
+            {
+                "id": 1,
+                "is_enabled": True,
+                "conditions": [{"field": "tags.target", "value": ["127.0.0.1"], "method": "eq"}],
+                "user_groups": [],
+            }
+        ]
+        local.assign_rule_set_cache = {}
+
+        def match(rules_version):
+            m = AlertAssignMatchManager(
+                alert, group_rules=[rules], assign_mode=[AssignMode.BY_RULE], rules_version=rules_version
+            )
+            return [rule_obj.rule_id for rule_obj in m.get_matched_rules()]
+
+        with _mock.patch("bkmonitor.action.alert_assign.AssignRuleSet", wraps=AssignRuleSet) as rule_set_cls:
+            # 相同业务及规则版本下，多个告警适配时规则只编译一次
+            assert match("v1") == [1] and match("v1") == [1]
+            assert rule_set_cls.call_count == 1
+            # 规则版本变化后重新编译
+            assert match("v2") == [1]
+            assert rule_set_cls.call_count == 2
+            # 未指定规则版本时不缓存
+            assert match(None) == [1] and match(None) == [1]
+            assert rule_set_cls.call_count == 4
+
 
 def get_strategy_dict():
     strategy_dict = copy.deepcopy(STRATEGY_CONFIG_V3)
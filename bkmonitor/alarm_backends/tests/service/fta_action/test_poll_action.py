@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Tencent is pleased to support the open source community by making 蓝鲸智云 - 监控平台 (BlueKing - Monitor) available.
+Copyright (C) 2017-2021 THL A29 Limited, a Tencent company. All rights reserved.
+Licensed under the MIT License (the "License"); you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://opensource.org/licenses/MIT
+Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on
+an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the
+specific language governing permissions and limitations under the License.
+"""
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from alarm_backends.core.cache.key import ACTION_POLL_INDEX_SYNC_KEY
+from alarm_backends.service.fta_action.tasks.create_action import (
+    CreateIntervalActionProcessor,
+)
+from alarm_backends.service.fta_action.utils import PollActionIndex
+from bkmonitor.models import ActionInstance
+from constants.action import ActionPluginType, ActionSignal
+from constants.alert import EventStatus
+
+pytestmark = pytest.mark.django_db
+
+NOTICE_ACTION_CONFIG = {
+    "execute_config": {
+        "template_detail": {
+            "interval_notify_mode": "standard",
+            "notify_interval": 7200,
+            "template": {},
+        }
+    },
+    "id": 55555,
+    "plugin_id": 1,
+    "plugin_type": "notice",
+    "is_enabled": True,
+    "bk_biz_id": 2,
+    "name": "test_notice",
+}
+
+
+@pytest.fixture()
+def poll_mocks(mocker):
+    PollActionIndex.key.client.delete(PollActionIndex.key.get_key())
+    ACTION_POLL_INDEX_SYNC_KEY.client.delete(ACTION_POLL_INDEX_SYNC_KEY.get_key())
+    mocker.patch(
+        "alarm_backends.core.cache.action_config.ActionConfigCacheManager.get_action_config_by_id",
+        return_value=NOTICE_ACTION_CONFIG,
+    )
+    mocker.patch("alarm_backends.service.fta_action.tasks.create_action.get_cluster_bk_biz_ids", return_value=["2"])
+    mocker.patch("alarm_backends.service.fta_action.tasks.create_action.need_poll", return_value=True)
+    mocker.patch(
+        "bkmonitor.documents.AlertDocument.mget",
+        side_effect=lambda ids: [
+            SimpleNamespace(id=alert_id, latest_time=int(time.time()), status_detail=EventStatus.ABNORMAL)
+            for alert_id in ids
+        ],
+    )
+    return mocker.patch("alarm_backends.service.fta_action.tasks.create_interval_actions.delay", return_value=1)
+
+
+def create_action(action_id, end_time, need_poll=True, bk_biz_id=2):
+    return ActionInstance.objects.create(
+        id=action_id,
+        signal=ActionSignal.ABNORMAL,
+        strategy_id=1,
+        alerts=["alert_{}".format(action_id)],
+        alert_level=1,
+        bk_biz_id=bk_biz_id,
+        inputs={"alert_latest_time": 12345},
+        action_config={},
+        execute_times=1,
+        action_config_id=NOTICE_ACTION_CONFIG["id"],
+        strategy_relation_id=1,
+        need_poll=need_poll,
+        is_polled=False,
+        action_plugin={"plugin_type": ActionPluginType.NOTICE, "name": "测试", "plugin_key": ActionPluginType.NOTICE},
+        end_time=end_time,
+    )
+
+
+class TestPollActionIndex:
+    def test_process__only_due_actions(self, poll_mocks):
+        now = datetime.now(tz=timezone.utc)
+        create_action(1, now - timedelta(hours=3))
+        not_due_action = create_action(2, now - timedelta(minutes=10))
+        create_action(3, now - timedelta(hours=3), need_poll=False)
+
+        # 首次执行时从DB同步存量记录
+        CreateIntervalActionProcessor().process()
+        assert poll_mocks.call_count == 1
+        assert ActionInstance.objects.get(id=1).is_polled is True
+
+        client, key = PollActionIndex.key.client, PollActionIndex.key.get_key()
+        assert client.zscore(key, 1) is None
+        assert client.zscore(key, 3) is None
+        # 未到期的记录按照下一次通知时间重新排序
+        assert int(client.zscore(key, 2)) == int(not_due_action.end_time.timestamp()) + 7200
+
+        # 同步标记未过期，新增记录依赖写入索引
+        new_action = create_action(4, now - timedelta(hours=3))
+        processor = CreateIntervalActionProcessor()
+        processor.process()
+        assert poll_mocks.call_count == 1
+        assert processor.need_polled_actions == {}
+
+        PollActionIndex.add_finished_action(new_action)
+        CreateIntervalActionProcessor().process()
+        assert poll_mocks.call_count == 2
+        assert ActionInstance.objects.get(id=4).is_polled is True
+        assert PollActionIndex.backlog() == 1
+
+    def test_process__remove_invalid_actions(self, poll_mocks):
+        action = create_action(1, datetime.now(tz=timezone.utc) - timedelta(hours=3))
+        PollActionIndex.add({action.id: int(time.time()) - 10, 100: int(time.time()) - 10})
+        ACTION_POLL_INDEX_SYNC_KEY.client.set(ACTION_POLL_INDEX_SYNC_KEY.get_key(), 1)
+
+        ActionInstance.objects.filter(id=action.id).update(is_polled=True)
+        CreateIntervalActionProcessor().process()
+        # 已经轮询及不存在的记录直接从索引删除
+        assert poll_mocks.call_count == 0
+        assert PollActionIndex.backlog() == 0
+
+    def test_sync_poll_index__cluster_bizs(self, poll_mocks):
+        now = datetime.now(tz=timezone.utc)
+        create_action(1, now - timedelta(hours=3))
+        create_action(2, now - timedelta(hours=3), bk_biz_id=3)
+
+        # 仅同步集群内业务的记录
+        CreateIntervalActionProcessor().sync_poll_index()
+        client, key = PollActionIndex.key.client, PollActionIndex.key.get_key()
+        assert client.zscore(key, 1) is not None
+        assert client.zscore(key, 2) is None
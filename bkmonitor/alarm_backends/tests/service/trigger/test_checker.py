@@ -255,6 +255,25 @@ class TestChecker(TestCase):
         self.assertTrue(is_triggered)
         self.assertListEqual(anomaly_timestamps, [1569246420])
 
+    def test_prefetch_check_results(self):
+        self.insert_check_result(1)
+        checkers = [AnomalyChecker(POINT, STRATEGY, 1), AnomalyChecker(POINT, STRATEGY, 1)]
+        AnomalyChecker.prefetch_check_results(checkers)
+
+        for checker in checkers:
+            self.assertEqual(set(checker.prefetched_check_results.keys()), set(POINT["anomaly"].keys()))
+
+        # 预取之后不再访问 redis
+        self.clear_check_result()
+        checker = checkers[0]
+        is_triggered, anomaly_timestamps = checker._check_anomaly_by_level("2")
+        self.assertFalse(is_triggered)
+        self.assertListEqual(anomaly_timestamps, [1569246420])
+
+        is_triggered, anomaly_timestamps = checker._check_anomaly_by_level("3")
+        self.assertTrue(is_triggered)
+        self.assertListEqual(anomaly_timestamps, [1569246420])
+
     def test_check_anomaly_by_multi_metrics(self):
         self.insert_check_result(4)
         multi_strategy = copy.deepcopy(STRATEGY)
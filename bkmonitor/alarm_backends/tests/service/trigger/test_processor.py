@@ -11,10 +11,12 @@ specific language governing permissions and limitations under the License.
 
 
 import json
+import time
 from datetime import datetime
 from uuid import uuid4
 
 import mock
+import six.moves.cPickle
 from django.test import TestCase
 from six.moves import range
 
@@ -24,7 +26,7 @@ from alarm_backends.core.cache.key import (
     TRIGGER_EVENT_LIST_KEY,
 )
 from alarm_backends.core.storage.redis_cluster import get_node_by_strategy_id
-from alarm_backends.service.trigger.processor import TriggerProcessor
+from alarm_backends.service.trigger.processor import TriggerEventCodec, TriggerProcessor
 from bkmonitor.models import AnomalyRecord, CacheNode, time_tools
 from core.errors.alarm_backends import StrategyNotFound
 
@@ -211,3 +213,60 @@ class TestProcessor(TestCase):
         ) as fake_push_to_kafka:
             processor.process()
             print(fake_push_to_kafka.call_args)
+
+    def test_push_event_to_redis(self):
+        processor = TriggerProcessor(1, 1)
+        anomaly_records, event_record = mocked_check()
+        processor.push_event_to_redis([{"anomaly_records": anomaly_records, "event_record": event_record}])
+
+        payload = TRIGGER_EVENT_LIST_KEY.client.rpop(TRIGGER_EVENT_LIST_KEY.get_key())
+        record = TriggerEventCodec.loads(payload)
+        self.assertDictEqual(record["event_record"], EVENT)
+        self.assertListEqual(
+            [r.anomaly_id for r in record["anomaly_records"]], [r.anomaly_id for r in anomaly_records]
+        )
+        self.assertListEqual(
+            [r.source_time for r in record["anomaly_records"]], [r.source_time for r in anomaly_records]
+        )
+
+    def test_event_codec_compatible_with_pickle(self):
+        anomaly_records, event_record = mocked_check()
+        record = {"anomaly_records": anomaly_records, "event_record": event_record}
+        legacy_payload = six.moves.cPickle.dumps(record).decode("latin1")
+        self.assertDictEqual(TriggerEventCodec.loads(legacy_payload)["event_record"], EVENT)
+
+    def test_event_codec_benchmark(self):
+        anomaly_records, event_record = mocked_check()
+        record = {"anomaly_records": anomaly_records, "event_record": event_record}
+
+        def measure(dumps, loads, count=1000):
+            start = time.time()
+            payloads = [dumps(record) for _ in range(count)]
+            dump_cost = time.time() - start
+            start = time.time()
+            for payload in payloads:
+                loads(payload)
+            return len(payloads[0].encode("utf-8")), dump_cost, time.time() - start
+
+        pickle_size, pickle_dump, pickle_load = measure(
+            lambda r: six.moves.cPickle.dumps(r).decode("latin1"),
+            lambda p: six.moves.cPickle.loads(p.encode("latin1")),
+        )
+        codec_size, codec_dump, codec_load = measure(TriggerEventCodec.dumps, TriggerEventCodec.loads)
+        print(
+            "trigger event payload: pickle {}B dump {:.3f}s load {:.3f}s, codec {}B dump {:.3f}s load {:.3f}s".format(
+                pickle_size, pickle_dump, pickle_load, codec_size, codec_dump, codec_load
+            )
+        )
+        self.assertLess(codec_size, pickle_size)
+
+    def test_event_codec_source_time(self):
+        anomaly_records, event_record = mocked_check()
+        payload = TriggerEventCodec.dumps({"anomaly_records": anomaly_records, "event_record": event_record})
+        # source_time 以时间戳存储，不依赖 datetime.fromisoformat
+        envelope = json.loads(payload[len(TriggerEventCodec.PREFIX) :])
+        self.assertIsInstance(envelope["anomaly_records"][0][1], int)
+        self.assertListEqual(
+            [r.source_time for r in TriggerEventCodec.loads(payload)["anomaly_records"]],
+            [r.source_time for r in anomaly_records],
+        )
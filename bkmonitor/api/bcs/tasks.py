@@ -25,15 +25,21 @@ from bkmonitor.models import (
     BCSBase,
     BCSCluster,
     BCSContainer,
+    BCSContainerLabels,
     BCSNode,
+    BCSNodeLabels,
     BCSPod,
+    BCSPodLabels,
     BCSPodMonitor,
     BCSService,
+    BCSServiceLabels,
     BCSServiceMonitor,
     BCSWorkload,
+    BCSWorkloadLabels,
 )
 from bkmonitor.utils.common_utils import chunks
 from bkmonitor.utils.ip import exploded_ip
+from bkmonitor.utils.kubernetes_inventory import KubernetesInventory
 from core.drf_resource import api
 from core.prometheus import metrics
 
@@ -748,6 +754,35 @@ def sync_bkmonitor_operator_info():
             logger.exception(exc_info)
 
 
+@share_lock(identify="sync_bcs_inventory_snapshot")
+def sync_bcs_inventory_snapshot():
+    """生成容器监控列表使用的集群资源快照 ."""
+    if not settings.ENABLE_KUBERNETES_INVENTORY_SNAPSHOT:
+        return
+    clusters = BCSCluster.objects.all().values("bk_biz_id", "bcs_cluster_id")
+    for cluster in clusters:
+        bcs_cluster_id = cluster["bcs_cluster_id"]
+        sync_bcs_inventory_snapshot_sub_task.apply_async(args=(bcs_cluster_id,))
+
+
+@task(ignore_result=True, queue="celery_cron")
+def sync_bcs_inventory_snapshot_sub_task(bcs_cluster_id):
+    task_name = "sync_bcs_inventory_snapshot_sub_task"
+    run_sub_task(task_name, sync_bcs_inventory_snapshot_by_cluster, bcs_cluster_id)
+
+
+def sync_bcs_inventory_snapshot_by_cluster(bcs_cluster_id):
+    """生成单个集群各类资源的快照 ."""
+    for model_class, label_model_class in [
+        (BCSPod, BCSPodLabels),
+        (BCSContainer, BCSContainerLabels),
+        (BCSWorkload, BCSWorkloadLabels),
+        (BCSService, BCSServiceLabels),
+        (BCSNode, BCSNodeLabels),
+    ]:
+        KubernetesInventory.refresh(model_class, label_model_class, bcs_cluster_id)
+
+
 def patch_exists_resource_id(resource_models):
     if not resource_models:
         return
@@ -35,6 +35,7 @@ __all__ = [
     "list_biz_hosts",
     "list_biz_hosts_topo",
     "find_host_topo_relation",
+    "resource_watch",
 ]
 
 
@@ -54,6 +55,9 @@ class CMDBBaseResource(six.with_metaclass(abc.ABCMeta, APIResource)):
 
     return_type = list
 
+    # cmdb 接口均为查询接口，POST 请求同样允许合并
+    COALESCE_METHODS = ("GET", "POST")
+
     def full_request_data(self, validated_request_data):
         setattr(self, "bk_username", get_backend_username())
         validated_request_data = super(CMDBBaseResource, self).full_request_data(validated_request_data)
@@ -286,6 +290,18 @@ class FindTopoNodePaths(CMDBBaseResource):
     method = "POST"
 
 
+class ResourceWatch(CMDBBaseResource):
+    """
+    监听资源变化事件
+    """
+
+    # 事件按游标实时获取，不能缓存
+    action = "resource_watch"
+    method = "POST"
+    # 接口返回字典
+    return_type = dict
+
+
 search_set = SearchSet()
 search_module = SearchModule()
 list_biz_hosts_topo = ListBizHostsTopo()
@@ -307,3 +323,4 @@ find_host_by_service_template = FindHostByServiceTemplate()
 list_hosts_without_biz = ListHostsWithoutBiz()
 find_host_biz_relation = FindHostBizRelation()
 find_topo_node_paths = FindTopoNodePaths()
+resource_watch = ResourceWatch()
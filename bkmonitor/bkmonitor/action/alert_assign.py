@@ -18,7 +18,10 @@ from django.utils.translation import ugettext as _
 
 from bkmonitor.documents import AlertDocument, AlertLog
 from bkmonitor.utils.common_utils import count_md5
+from bkmonitor.utils.local import local
 from bkmonitor.utils.range import load_condition_instance
+from bkmonitor.utils.range.conditions import EqualCondition
+from bkmonitor.utils.range.fields import DimensionField
 from constants.action import ActionPluginType, AssignMode, UserGroupType
 from constants.alert import EVENT_SEVERITY_DICT
 
@@ -73,33 +76,42 @@ class UpgradeRuleMatch:
 class AssignRuleMatch:
     """分派规则适配"""
 
-    def __init__(self, assign_rule, assign_rule_snap=None, alert: AlertDocument = None):
+    def __init__(self, assign_rule, assign_rule_snap=None, alert: AlertDocument = None, dimension_check=None):
         """
         :param assign_rule:  规则ID
         :param assign_rule_snap:
+        :param dimension_check: 预先编译好的条件对象，不传则根据规则配置生成
         :return:
         """
         self.assign_rule = assign_rule
         self.assign_rule_snap = assign_rule_snap or {}
-        self.dimension_check = None
-        self.parse_dimension_conditions()
+        self.dimension_check = dimension_check
+        if self.dimension_check is None:
+            self.parse_dimension_conditions()
         self.alert = alert
 
-    def parse_dimension_conditions(self):
+    @staticmethod
+    def load_dimension_check(conditions):
         """
-        根据配置的条件信息获取
-        :return:
+        根据配置的条件信息生成条件对象
         """
         or_cond = []
         and_cond = []
-        for condition in self.assign_rule["conditions"]:
+        for condition in conditions:
             if condition.get("condition") == "or" and and_cond:
                 or_cond.append(and_cond)
                 and_cond = []
             and_cond.append(condition)
         if and_cond:
             or_cond.append(and_cond)
-        self.dimension_check = load_condition_instance(or_cond, False)
+        return load_condition_instance(or_cond, False)
+
+    def parse_dimension_conditions(self):
+        """
+        根据配置的条件信息获取
+        :return:
+        """
+        self.dimension_check = self.load_dimension_check(self.assign_rule["conditions"])
 
     def assign_group(self):
         return {"group_id": self.assign_rule["assign_group_id"]}
@@ -250,6 +262,90 @@ class AssignRuleMatch:
         return self.assign_rule.get("user_type", UserGroupType.MAIN)
 
 
+class AssignRuleSet:
+    """
+    同一优先级下分派规则的编译结果
+    1. 每条规则的条件只解析一次，正则在条件初始化时编译
+    2. 每个 or 分支选取一个 eq 条件建立倒排索引，告警只需评估命中索引的候选规则
+    """
+
+    def __init__(self, rules: List[dict]):
+        self.rules = rules
+        self.dimension_checks = []
+        # 索引结构: {字段名: {字段值: {规则下标}}}
+        self.index = defaultdict(lambda: defaultdict(set))
+        # 无法建立索引的规则，每次都需要评估
+        self.unindexed = set()
+        # 规则ID与下标的对应关系，用于快速找出存在快照的规则
+        self.snap_positions = defaultdict(list)
+        for position, rule in enumerate(rules):
+            dimension_check = AssignRuleMatch.load_dimension_check(rule["conditions"])
+            self.dimension_checks.append(dimension_check)
+            self.snap_positions[str(rule.get("id", ""))].append(position)
+            self.add(position, dimension_check)
+
+    @staticmethod
+    def get_index_condition(and_condition):
+        """
+        选取 and 分支中取值个数最少的 eq 条件作为索引条件
+        只有普通维度字段的取值方式与条件值一致，特殊字段(如ip、拓扑节点)不参与索引
+        """
+        conditions = [
+            condition
+            for condition in and_condition.conditions
+            if type(condition) is EqualCondition and type(condition.cond_field) is DimensionField
+        ]
+        if not conditions:
+            return None
+        return min(conditions, key=lambda condition: len(condition.cond_value_set))
+
+    def add(self, position, dimension_check):
+        index_conditions = [self.get_index_condition(and_condition) for and_condition in dimension_check.conditions]
+        if not index_conditions or None in index_conditions:
+            # 没有条件(全部适配)或者存在无法索引的分支，需要每次评估
+            self.unindexed.add(position)
+            return
+        for condition in index_conditions:
+            field_index = self.index[condition.cond_field.name]
+            for value in condition.cond_value_set:
+                field_index[value].add(position)
+
+    def get_candidates(self, dimensions: dict) -> List[int]:
+        """
+        获取可能适配的规则下标
+        """
+        positions = set(self.unindexed)
+        for field_name, field_index in self.index.items():
+            if field_name not in dimensions:
+                # 分派条件在维度不存在时不适配
+                continue
+            for value in DimensionField(field_name, dimensions[field_name]).to_str_list():
+                positions.update(field_index.get(value, ()))
+        return sorted(positions)
+
+    def match(self, dimensions: dict, rule_snaps: dict = None, alert: AlertDocument = None) -> List[AssignRuleMatch]:
+        """
+        按规则顺序返回适配的规则
+        :param dimensions: 告警维度信息
+        :param rule_snaps: 告警上已经记录的规则快照，存在快照且未变化的规则直接视为适配
+        :param alert: 告警
+        """
+        rule_snaps = rule_snaps or {}
+        positions = set(self.get_candidates(dimensions))
+        for rule_id in rule_snaps:
+            positions.update(self.snap_positions.get(rule_id, ()))
+
+        matched_rules = []
+        for position in sorted(positions):
+            rule = self.rules[position]
+            rule_match_obj = AssignRuleMatch(
+                rule, rule_snaps.get(str(rule.get("id", ""))), alert, dimension_check=self.dimension_checks[position]
+            )
+            if rule_match_obj.is_matched(dimensions=dimensions):
+                matched_rules.append(rule_match_obj)
+        return matched_rules
+
+
 class AlertAssignMatchManager:
     """
     告警分派管理
@@ -263,11 +359,13 @@ class AlertAssignMatchManager:
         assign_mode=None,
         notice_type=None,
         cmdb_attrs=None,
+        rules_version=None,
     ):
         """
         :param alert: 告警
         :param notice_users: 通知人员
         :param group_rules: 指定的分派规则, 以优先级
+        :param rules_version: 分派规则版本，指定时按业务及规则版本缓存规则的编译结果
         """
         self.alert = alert
         self.origin_severity = alert.severity
@@ -283,6 +381,7 @@ class AlertAssignMatchManager:
         self.rule_snaps = extra_info.get("rule_snaps") or {}
         self.bk_biz_id = self.alert.event.bk_biz_id
         self.group_rules = group_rules or []
+        self.rules_version = rules_version
         self.matched_rules: List[AssignRuleMatch] = []
         self.matched_rule_info = {
             "notice_upgrade_user_groups": [],
@@ -367,19 +466,34 @@ class AlertAssignMatchManager:
         if AssignMode.BY_RULE not in self.assign_mode:
             # 如果不需要分派的，不要进行规则匹配
             return matched_rules
-        for rules in self.group_rules:
-            for rule in rules:
-                if not rule.get("is_enabled"):
-                    # 没有开启的直接返回
-                    continue
-                rule_match_obj = AssignRuleMatch(rule, self.rule_snaps.get(str(rule.get("id", ""))), self.alert)
-                if rule_match_obj.is_matched(dimensions=self.dimensions):
-                    matched_rules.append(rule_match_obj)
+        for index, rules in enumerate(self.group_rules):
+            rule_set = self.get_rule_set(index, rules)
+            matched_rules = rule_set.match(self.dimensions, self.rule_snaps, self.alert)
             if matched_rules:
                 # 当前优先级下适配到分派规则，停止低优先级的适配
                 break
         return matched_rules
 
+    def get_rule_set(self, index, rules) -> AssignRuleSet:
+        """
+        获取指定优先级下分派规则的编译结果
+        指定了规则版本时，按业务及规则版本缓存在请求本地缓存中，同一批规则对多个告警适配时只编译一次
+        """
+        if self.rules_version is None:
+            # 没有开启的直接忽略
+            return AssignRuleSet([rule for rule in rules if rule.get("is_enabled")])
+
+        cache = getattr(local, "assign_rule_set_cache", None)
+        if cache is None:
+            cache = local.assign_rule_set_cache = {}
+        cache_key = (self.bk_biz_id, self.rules_version, index)
+        cached_rules, rule_set = cache.get(cache_key, (None, None))
+        if cached_rules is not rules:
+            # 匹配结果会回写到规则中，仅复用同一批规则对象的编译结果
+            rule_set = AssignRuleSet([rule for rule in rules if rule.get("is_enabled")])
+            cache[cache_key] = (rules, rule_set)
+        return rule_set
+
     def get_itsm_actions(self):
         """
         获取流程的规则对应的通知组
@@ -231,6 +231,8 @@ ADVANCED_OPTIONS = OrderedDict(
         ("MAX_BUILD_EVENT_NUMBER", slz.IntegerField(label="单次告警生成任务处理的event数量", default=0)),
         ("HOST_DYNAMIC_FIELDS", slz.ListField(label="主机动态属性", default=[])),
         ("METRIC_CACHE_TASK_PERIOD", slz.IntegerField(label="指标缓存任务周期(min)", default=10)),
+        ("ENABLE_METRIC_CACHE_INCREMENTAL", slz.BooleanField(label="是否开启指标缓存增量更新", default=False)),
+        ("ENABLE_METRIC_SEARCH_INDEX", slz.BooleanField(label="是否开启指标选择器内存搜索索引", default=False)),
         ("LAST_MIGRATE_VERSION", slz.CharField(label="最后一次迁移版本", default="")),
         # ("EXTERNAL_APIGW_PUBLIC_KEY", slz.CharField(label="外部APIGW公钥", default="")),
         # ("APIGW_PUBLIC_KEY", slz.CharField(label="APIGW公钥", default="")),
@@ -282,6 +284,7 @@ ADVANCED_OPTIONS = OrderedDict(
         ("OUTER_COLLOCTOR_HOST", slz.CharField(label="collector外网域名", default="")),
         ("ENABLE_INFLUXDB_STORAGE", slz.BooleanField(label="启用 influxdb 存储", default=True)),
         ("ES_SERIAL_CLUSTER_LIST", slz.ListField(label="ES 串行集群列表", default=[])),
+        ("ENABLE_ES_LIFECYCLE_CLUSTER_PLAN", slz.BooleanField(label="是否按集群批量管理ES索引生命周期", default=False)),
         ("BKDATA_USE_UNIFY_QUERY_GRAY_BIZ_LIST", slz.ListField(label="UNIFY-QUERY支持bkdata查询灰度业务列表", default=[])),
         (
             "BCS_DATA_CONVERGENCE_CONFIG",
@@ -430,6 +433,7 @@ STANDARD_CONFIGS = OrderedDict(
         ("BCS_GRAY_CLUSTER_ID_LIST", slz.ListField(label=_("BCS集群灰度ID名单"), default=[])),
         ("BCS_API_DATA_SOURCE", slz.ChoiceField(label=_("BCS集群元数据获取方式"), default="db", choices=("db", "api"))),
         ("ENABLE_BCS_GRAY_CLUSTER", slz.BooleanField(label=_("是否启用BCS集群灰度模式"), default=False)),
+        ("ENABLE_KUBERNETES_INVENTORY_SNAPSHOT", slz.BooleanField(label=_("容器监控列表是否使用集群资源快照查询"), default=False)),
         ("NOTICE_TITLE", slz.CharField(label=_("告警通知标题"), default="蓝鲸监控")),
         ("DEFAULT_KAFKA_STORAGE_CLUSTER_ID", slz.CharField(label=_("默认 kafka 存储集群ID"), default=None, allow_null=True)),
         ("BCS_KAFKA_STORAGE_CLUSTER_ID", slz.CharField(label=_("BCS kafka 存储集群ID"), default=None, allow_null=True)),
@@ -441,6 +445,8 @@ STANDARD_CONFIGS = OrderedDict(
         ),
         ("FTA_ES_SLICE_SIZE", slz.IntegerField(label=_("自愈ES分裂索引的大小(G)"), default=50)),
         ("FTA_ES_RETENTION", slz.IntegerField(label=_("自愈ES数据保留时间"), default=365)),
+        ("ENABLE_ALERT_MSEARCH", slz.BooleanField(label=_("告警页面查询是否合并为一次请求"), default=False)),
+        ("ENABLE_ALERT_ROLLUP", slz.BooleanField(label=_("告警分布直方图是否使用分钟级预聚合数据"), default=False)),
         ("DOUBLE_CHECK_SUM_STRATEGY_IDS", slz.ListField(label=_("适用 SUM 聚合方法二次确认的策略ID列表"), default=[])),
         ("SMS_CONTENT_LENGTH", slz.IntegerField(label=_("发送短信内容最大长度（0表示不限制）"), default=0)),
         ("IS_ACCESS_BK_DATA", slz.BooleanField(label=_("是否开启与计算平台的功能对接"), default=False)),
@@ -11,6 +11,7 @@ specific language governing permissions and limitations under the License.
 from .event import EventDocument  # noqa
 from .action import ActionInstanceDocument  # noqa
 from .alert import AlertDocument  # noqa
+from .alert_rollup import AlertRollupDocument  # noqa
 from .incident import (  # noqa
     IncidentDocument,
     IncidentNoticeDocument,
@@ -22,6 +23,7 @@ from .log import AlertLog  # noqa
 ALL_DOCUMENTS = [
     EventDocument,
     AlertDocument,
+    AlertRollupDocument,
     AlertLog,
     ActionInstanceDocument,
     IncidentDocument,
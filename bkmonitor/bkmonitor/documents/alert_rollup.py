@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+"""
+Tencent is pleased to support the open source community by making 蓝鲸智云 - 监控平台 (BlueKing - Monitor) available.
+Copyright (C) 2017-2021 THL A29 Limited, a Tencent company. All rights reserved.
+Licensed under the MIT License (the "License"); you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://opensource.org/licenses/MIT
+Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on
+an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the
+specific language governing permissions and limitations under the License.
+"""
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from django.core.cache import cache
+from django_elasticsearch_dsl.registries import registry
+from elasticsearch_dsl import A, field
+
+from bkmonitor.documents.alert import AlertDocument
+from bkmonitor.documents.base import BaseDocument, BulkActionType, Date
+from constants.alert import EventStatus
+
+logger = logging.getLogger("bkmonitor.documents")
+
+
+@registry.register_document
+class AlertRollupDocument(BaseDocument):
+    """
+    告警分钟级预聚合数据
+
+    按分钟统计新产生的告警数量(kind=begin)，以及已恢复、已关闭的告警数量(kind=end)，
+    用于告警分布直方图在无过滤条件时的快速查询
+
+    告警的开始时间为数据时间，可能远早于告警的创建时间，因此新产生的告警按创建时间划分预聚合批次，
+    批次内再按开始时间统计，保证每个告警只被统计一次。rollup_time 记录预聚合批次的起始时间
+    """
+
+    class Kind:
+        BEGIN = "begin"
+        END = "end"
+
+    # 预聚合时间粒度
+    INTERVAL = 60
+    # 预聚合支持的维度
+    DIMENSIONS = ("bk_biz_id", "strategy_id", "severity")
+    # 已预聚合的时间范围
+    RANGE_CACHE_KEY = "alert_rollup.range"
+    # 单次预聚合的最大时间跨度
+    MAX_ROLLUP_RANGE = 60 * 60
+
+    id = field.Keyword(required=True)
+    time = Date(format=BaseDocument.DATE_FORMAT)
+    rollup_time = Date(format=BaseDocument.DATE_FORMAT)
+    kind = field.Keyword()
+    bk_biz_id = field.Keyword()
+    strategy_id = field.Keyword()
+    severity = field.Integer()
+    status = field.Keyword()
+    count = field.Long()
+
+    class Index:
+        name = "bkfta_alert_rollup"
+        settings = {"number_of_shards": 1, "number_of_replicas": 1, "refresh_interval": "10s"}
+
+    def get_index_time(self):
+        return self.time
+
+    @classmethod
+    def get_rollup_range(cls) -> Optional[Tuple[int, int]]:
+        """
+        获取已完成预聚合的时间范围 [start_time, end_time)
+        """
+        rollup_range = cache.get(cls.RANGE_CACHE_KEY)
+        if not rollup_range:
+            return None
+        return rollup_range["start_time"], rollup_range["end_time"]
+
+    @classmethod
+    def is_covered(cls, start_time: int, end_time: int) -> bool:
+        """
+        判断时间范围是否已被预聚合数据完整覆盖
+        """
+        rollup_range = cls.get_rollup_range()
+        if not rollup_range:
+            return False
+        return rollup_range[0] <= start_time and end_time <= rollup_range[1]
+
+    @classmethod
+    def aggregate(cls, kind: str, start_time: int, end_time: int) -> List["AlertRollupDocument"]:
+        """
+        统计时间范围内的告警数量
+        新产生的告警按创建时间筛选、按开始时间统计，已结束的告警按结束时间筛选及统计
+        """
+        time_field = "begin_time" if kind == cls.Kind.BEGIN else "end_time"
+        filter_field = "create_time" if kind == cls.Kind.BEGIN else "end_time"
+        if kind == cls.Kind.BEGIN:
+            search_object = AlertDocument.search(start_time=start_time, end_time=end_time)
+        else:
+            # 告警索引按创建时间划分，已结束的告警可能在统计范围之前创建，需查询全部索引
+            search_object = AlertDocument.search(all_indices=True).filter(
+                "terms", status=[EventStatus.RECOVERED, EventStatus.CLOSED]
+            )
+        search_object = search_object.filter("range", **{filter_field: {"gte": start_time, "lt": end_time}})
+
+        sources = [
+            {"time": A("date_histogram", field=time_field, fixed_interval=f"{cls.INTERVAL}s")},
+            {"bk_biz_id": A("terms", field="event.bk_biz_id", missing_bucket=True)},
+            {"strategy_id": A("terms", field="strategy_id", missing_bucket=True)},
+            {"severity": A("terms", field="severity", missing_bucket=True)},
+        ]
+        if kind == cls.Kind.END:
+            sources.append({"status": A("terms", field="status")})
+
+        documents = []
+        composite_params = {"sources": sources, "size": 10000}
+        while True:
+            rollup_search = search_object[:0]
+            rollup_search.aggs.bucket("rollup", "composite", **composite_params)
+            search_result = rollup_search.execute()
+            buckets = search_result.aggs.rollup.buckets
+            for bucket in buckets:
+                key = bucket.key.to_dict()
+                key["time"] = int(key["time"]) // 1000
+                # 新产生的告警均计为未恢复
+                key.setdefault("status", EventStatus.ABNORMAL)
+                documents.append(
+                    cls(
+                        id="{kind}-{rollup_time}-{time}-{bk_biz_id}-{strategy_id}-{severity}-{status}".format(
+                            kind=kind, rollup_time=start_time, **key
+                        ),
+                        kind=kind,
+                        rollup_time=start_time,
+                        count=bucket.doc_count,
+                        **key,
+                    )
+                )
+            after_key = getattr(search_result.aggs.rollup, "after_key", None)
+            if not buckets or not after_key:
+                break
+            composite_params["after"] = after_key.to_dict()
+        return documents
+
+    @classmethod
+    def rollup(cls, now: int, lag: int) -> Optional[Dict]:
+        """
+        对上次预聚合位置到 now - lag 之间的告警进行预聚合，并推进预聚合时间范围
+        """
+        end_time = (now - lag) // cls.INTERVAL * cls.INTERVAL
+        rollup_range = cls.get_rollup_range()
+        if not rollup_range:
+            # 预聚合范围丢失时，从当前位置重新开始，避免使用不完整的数据
+            cache.set(cls.RANGE_CACHE_KEY, {"start_time": end_time, "end_time": end_time}, None)
+            return None
+
+        first_time, start_time = rollup_range
+        end_time = min(end_time, start_time + cls.MAX_ROLLUP_RANGE)
+        if end_time <= start_time:
+            return None
+
+        documents = []
+        for kind in (cls.Kind.BEGIN, cls.Kind.END):
+            documents.extend(cls.aggregate(kind, start_time, end_time))
+        if documents:
+            cls.bulk_create(documents, action=BulkActionType.INDEX)
+
+        cache.set(cls.RANGE_CACHE_KEY, {"start_time": first_time, "end_time": end_time}, None)
+        return {"start_time": start_time, "end_time": end_time, "count": len(documents)}
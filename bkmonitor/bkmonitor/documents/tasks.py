@@ -9,8 +9,11 @@ an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express o
 specific language governing permissions and limitations under the License.
 """
 import logging
+import time
 
-from bkmonitor.documents import ALL_DOCUMENTS
+from django.conf import settings
+
+from bkmonitor.documents import ALL_DOCUMENTS, AlertRollupDocument
 
 logger = logging.getLogger("bkmonitor.documents")
 
@@ -46,3 +49,17 @@ def clear_expired_indices():
             logger.info("[ES ILM] index(%s) clear expired success: %s", index.Index.name, result)
         except Exception as e:
             logger.exception("[ES ILM] index(%s) clear expired failed: %s", index.Index.name, e)
+
+
+def rollup_alerts():
+    """
+    告警分钟级预聚合
+    """
+    if not settings.ENABLE_ALERT_ROLLUP:
+        return
+
+    try:
+        result = AlertRollupDocument.rollup(int(time.time()), settings.ALERT_ROLLUP_LAG)
+        logger.info("[alert rollup] rollup finished: %s", result)
+    except Exception as e:
+        logger.exception("[alert rollup] rollup failed: %s", e)
@@ -24,6 +24,8 @@ from django.utils.encoding import force_bytes
 from bkmonitor.utils.common_utils import count_md5
 from bkmonitor.utils.local import local
 from bkmonitor.utils.request import get_request
+from bkmonitor.utils.thread_backend import InheritParentThread
+from core.prometheus import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -38,6 +40,8 @@ class UsingCache(object):
     min_length = 15
     preset = 6
     key_prefix = "web_cache"
+    # 开启过期可用窗口时，缓存值中记录有效截止时间的字段
+    fresh_until_field = "__fresh_until__"
 
     def __init__(
         self,
@@ -158,40 +162,138 @@ class UsingCache(object):
             # 缓存出错不影响主流程
             logger.exception("存缓存[key:{}]时报错：{}\n value: {!r}\nurl: {}".format(key, e, value, request_path))
 
+    @staticmethod
+    def _lock_key(cache_key):
+        return "{}:lock".format(cache_key)
+
+    def _acquire_refresh_lock(self, cache_key):
+        """
+        获取缓存刷新锁，同一个缓存key同时只有一个进程执行刷新
+        """
+        try:
+            return cache.add(self._lock_key(cache_key), 1, settings.CACHE_REFRESH_LOCK_TIMEOUT)
+        except Exception as e:
+            # 锁不可用时不影响主流程，直接刷新
+            logger.warning("[Cache]获取缓存刷新锁[key:{}]失败：{}".format(cache_key, e))
+            return True
+
+    def _release_refresh_lock(self, cache_key):
+        try:
+            cache.delete(self._lock_key(cache_key))
+        except Exception as e:
+            logger.warning("[Cache]释放缓存刷新锁[key:{}]失败：{}".format(cache_key, e))
+
+    def _is_refreshing(self, cache_key):
+        try:
+            return cache.get(self._lock_key(cache_key)) is not None
+        except Exception:
+            return False
+
+    def _get_cached_value(self, cache_key):
+        """
+        获取缓存数据及其是否已过期(处于过期可用窗口内)
+        开启过期可用窗口时，有效截止时间与数据一同存放，无需额外查询缓存
+        """
+        value = self.get_value(cache_key, default=None)
+        if isinstance(value, dict) and self.fresh_until_field in value:
+            return value["value"], time.time() >= value[self.fresh_until_field]
+        return value, False
+
     def _cached(self, task_definition, args, kwargs):
         """
         【默认缓存模式】
         先检查是否缓存是否存在
-        若存在，则直接返回缓存内容
-        若不存在，则执行函数，并将结果回写到缓存中
+        若存在，则直接返回缓存内容，若缓存处于过期可用窗口内，则在后台刷新缓存
+        若不存在，则执行函数，并将结果回写到缓存中，同一个缓存key同时只有一个进程执行函数，其余进程等待缓存写入
         """
         if settings.ENVIRONMENT == "development":
             cache_key = None
         else:
             cache_key = self._cache_key(task_definition, args, kwargs)
         if cache_key:
-            return_value = self.get_value(cache_key, default=None)
+            return_value, is_stale = self._get_cached_value(cache_key)
 
             if return_value is None:
-                return_value = self._refresh(task_definition, args, kwargs)
+                metrics.USING_CACHE_ACCESS_COUNT.labels(cache_type=self.using_cache_type.key, status="miss").inc()
+                return_value = self._single_flight_refresh(task_definition, args, kwargs, cache_key)
+            elif is_stale:
+                metrics.USING_CACHE_ACCESS_COUNT.labels(cache_type=self.using_cache_type.key, status="stale").inc()
+                self._background_refresh(task_definition, args, kwargs, cache_key)
+            else:
+                metrics.USING_CACHE_ACCESS_COUNT.labels(cache_type=self.using_cache_type.key, status="hit").inc()
         else:
             return_value = self._cacheless(task_definition, args, kwargs)
         return return_value
 
-    def _refresh(self, task_definition, args, kwargs):
+    def _single_flight_refresh(self, task_definition, args, kwargs, cache_key):
+        """
+        缓存未命中时，抢到刷新锁的进程执行函数并回写缓存
+        其余进程等待缓存写入，等待超时或刷新进程未回写缓存时，自行执行函数
+        """
+        if self._acquire_refresh_lock(cache_key):
+            try:
+                return self._refresh(task_definition, args, kwargs, cache_key=cache_key)
+            finally:
+                self._release_refresh_lock(cache_key)
+
+        deadline = time.time() + settings.CACHE_SINGLE_FLIGHT_WAIT_TIMEOUT
+        while time.time() < deadline:
+            time.sleep(0.1)
+            return_value, _ = self._get_cached_value(cache_key)
+            if return_value is not None:
+                return return_value
+            if not self._is_refreshing(cache_key):
+                break
+
+        return self._refresh(task_definition, args, kwargs, cache_key=cache_key)
+
+    def _background_refresh(self, task_definition, args, kwargs, cache_key):
+        """
+        后台刷新过期缓存，当前请求直接使用过期数据
+        """
+        if not self._acquire_refresh_lock(cache_key):
+            return
+
+        def refresh():
+            try:
+                self._refresh(task_definition, args, kwargs, cache_key=cache_key)
+            finally:
+                self._release_refresh_lock(cache_key)
+
+        InheritParentThread(target=refresh).start()
+
+    def _refresh(self, task_definition, args, kwargs, cache_key=None):
         """
         【强制刷新模式】
         不使用缓存的数据，将函数执行返回结果回写缓存
         """
-        cache_key = self._cache_key(task_definition, args, kwargs)
+        if cache_key is None:
+            cache_key = self._cache_key(task_definition, args, kwargs)
 
-        return_value = self._cacheless(task_definition, args, kwargs)
+        start = time.time()
+        exc = None
+        try:
+            return_value = self._cacheless(task_definition, args, kwargs)
+        except Exception as e:
+            exc = e
+            raise
+        finally:
+            if self.using_cache_type:
+                metrics.USING_CACHE_REFRESH_TIME.labels(cache_type=self.using_cache_type.key, exception=exc).observe(
+                    time.time() - start
+                )
 
         # 设置了缓存空数据
         # 或者不缓存空数据且数据为空时
         # 需要进行缓存
         if self.is_cache_func(return_value):
-            self.set_value(cache_key, return_value, self.using_cache_type.timeout)
+            timeout = self.using_cache_type.timeout
+            stale_timeout = self.using_cache_type.stale_timeout
+            if stale_timeout:
+                value = {"value": return_value, self.fresh_until_field: time.time() + timeout}
+            else:
+                value = return_value
+            self.set_value(cache_key, value, timeout + stale_timeout)
 
         return return_value
 
@@ -236,20 +338,24 @@ class CacheTypeItem(object):
     缓存类型定义
     """
 
-    def __init__(self, key, timeout, user_related=None, label=""):
+    def __init__(self, key, timeout, user_related=None, label="", stale_timeout=0):
         """
         :param key: 缓存名称
         :param timeout: 缓存超时，单位：s
         :param user_related: 是否用户相关
         :param label: 详细说明
+        :param stale_timeout: 过期可用窗口，单位：s。缓存过期后的该时间内仍返回过期数据，同时在后台刷新缓存
         """
         self.key = key
         self.timeout = timeout
         self.label = label
         self.user_related = user_related
+        self.stale_timeout = stale_timeout
 
-    def __call__(self, timeout):
-        return CacheTypeItem(self.key, timeout, self.user_related, self.label)
+    def __call__(self, timeout, stale_timeout=None):
+        if stale_timeout is None:
+            stale_timeout = self.stale_timeout
+        return CacheTypeItem(self.key, timeout, self.user_related, self.label, stale_timeout=stale_timeout)
 
 
 class CacheType(object):
@@ -261,9 +367,21 @@ class CacheType(object):
 
     BIZ = CacheTypeItem(key="biz", timeout=settings.CACHE_BIZ_TIMEOUT, label="业务及人员相关", user_related=True)
 
-    HOST = CacheTypeItem(key="host", timeout=settings.CACHE_HOST_TIMEOUT, label="主机信息相关", user_related=False)
+    HOST = CacheTypeItem(
+        key="host",
+        timeout=settings.CACHE_HOST_TIMEOUT,
+        label="主机信息相关",
+        user_related=False,
+        stale_timeout=settings.CACHE_HOST_TIMEOUT,
+    )
 
-    CC = CacheTypeItem(key="cc", timeout=settings.CACHE_CC_TIMEOUT, label="CC模块和Set相关", user_related=True)
+    CC = CacheTypeItem(
+        key="cc",
+        timeout=settings.CACHE_CC_TIMEOUT,
+        label="CC模块和Set相关",
+        user_related=True,
+        stale_timeout=settings.CACHE_CC_TIMEOUT,
+    )
 
     DATA = CacheTypeItem(key="data", timeout=settings.CACHE_DATA_TIMEOUT, label="计算平台接口相关", user_related=False)
     OVERVIEW = CacheTypeItem(
@@ -276,7 +394,7 @@ class CacheType(object):
     APM = CacheTypeItem(key="apm", timeout=60 * 10, user_related=False)
     APM_EBPF = CacheTypeItem(key="apm_ebpf", timeout=60 * 10, user_related=False)
     APM_ENDPOINTS = CacheTypeItem(key="apm_endpoints", timeout=60 * 10, user_related=False)
-    CC_BACKEND = CacheTypeItem(key="cc_backend", timeout=60 * 10, user_related=False)
+    CC_BACKEND = CacheTypeItem(key="cc_backend", timeout=60 * 10, user_related=False, stale_timeout=60 * 10)
     LOG_SEARCH = CacheTypeItem(key="log_search", timeout=60 * 5, label="日志平台相关", user_related=False)
     NODE_MAN = CacheTypeItem(key="node_man", timeout=60 * 10, label="节点管理相关", user_related=False)
     # 重要： 此类型表示所有resource调用均大概率命中缓存，因为缓存失效时间较长。缓存刷新由后台周期任务进行
@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+"""
+Tencent is pleased to support the open source community by making 蓝鲸智云 - 监控平台 (BlueKing - Monitor) available.
+Copyright (C) 2017-2021 THL A29 Limited, a Tencent company. All rights reserved.
+Licensed under the MIT License (the "License"); you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://opensource.org/licenses/MIT
+Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on
+an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the
+specific language governing permissions and limitations under the License.
+
+容器监控集群资源快照
+
+按(资源类型, 集群)定期生成资源清单的紧凑快照，保存列表过滤、统计和排序所需的字段，以及标签、命名空间、状态的倒排索引。
+快照压缩后写入缓存，各进程按构建时间加载到内存，容器监控列表直接在快照上完成过滤、状态统计、排序和分页。
+"""
+import json
+import logging
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict, defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import models
+
+logger = logging.getLogger("kubernetes")
+
+
+class SnapshotUnsupported(Exception):
+    """
+    查询条件无法在快照上执行
+    """
+
+
+class InventorySnapshot:
+    """
+    单个集群中一种资源的快照
+    """
+
+    # 不进入快照的字段
+    EXCLUDE_FIELDS = {"deleted_at", "last_synced_at", "unique_hash"}
+    # 建立倒排索引的字段
+    INDEX_FIELDS = ("namespace", "status", "monitor_status")
+
+    def __init__(self, bcs_cluster_id: str, build_time: float, fields: List[str], rows: List[List], labels: Dict):
+        self.bcs_cluster_id = bcs_cluster_id
+        self.build_time = build_time
+        self.fields = fields
+        self.field_positions = {field: index for index, field in enumerate(fields)}
+        self.rows = rows
+        # {(标签名, 标签值): [行号]}
+        self.labels: Dict[Tuple[str, str], List[int]] = labels
+        # {字段名: {字段值: [行号]}}
+        self.indexes: Dict[str, Dict] = {}
+        for field in self.INDEX_FIELDS:
+            if field not in self.field_positions:
+                continue
+            column = self.field_positions[field]
+            index = defaultdict(list)
+            for position, row in enumerate(rows):
+                index[row[column]].append(position)
+            self.indexes[field] = dict(index)
+
+    @classmethod
+    def get_fields(cls, model_class) -> Dict[str, models.Field]:
+        """
+        快照中保存的字段，忽略大文本和同步相关的字段
+        """
+        return {
+            field.name: field
+            for field in model_class._meta.concrete_fields
+            if not isinstance(field, models.TextField) and field.name not in cls.EXCLUDE_FIELDS
+        }
+
+    @classmethod
+    def build(cls, model_class, label_model_class, bcs_cluster_id: str) -> "InventorySnapshot":
+        build_time = time.time()
+        fields = list(cls.get_fields(model_class))
+        id_column = fields.index("id")
+
+        rows = []
+        positions = {}
+        queryset = model_class.objects.filter(bcs_cluster_id=bcs_cluster_id).order_by("id").values_list(*fields)
+        for row in queryset.iterator():
+            row = [value.timestamp() if isinstance(value, datetime) else value for value in row]
+            positions[row[id_column]] = len(rows)
+            rows.append(row)
+
+        labels = defaultdict(list)
+        label_queryset = label_model_class.objects.filter(bcs_cluster_id=bcs_cluster_id).values_list(
+            "resource_id", "label__key", "label__value"
+        )
+        for resource_id, key, value in label_queryset.iterator():
+            position = positions.get(resource_id)
+            if position is not None:
+                labels[(key, value)].append(position)
+        labels = {label: sorted(set(label_positions)) for label, label_positions in labels.items()}
+
+        return cls(bcs_cluster_id, build_time, fields, rows, labels)
+
+    def dumps(self) -> bytes:
+        data = {
+            "bcs_cluster_id": self.bcs_cluster_id,
+            "build_time": self.build_time,
+            "fields": self.fields,
+            "rows": self.rows,
+            "labels": [[key, value, positions] for (key, value), positions in self.labels.items()],
+        }
+        return zlib.compress(json.dumps(data, separators=(",", ":")).encode("utf-8"))
+
+    @classmethod
+    def loads(cls, content: bytes) -> "InventorySnapshot":
+        data = json.loads(zlib.decompress(content).decode("utf-8"))
+        labels = {(key, value): positions for key, value, positions in data["labels"]}
+        return cls(data["bcs_cluster_id"], data["build_time"], data["fields"], data["rows"], labels)
+
+    def filter(self, query: "InventoryQuery", namespaces: Optional[List[str]] = None) -> List[int]:
+        """
+        返回满足查询条件的行号
+        :param namespaces: 共享集群中可见的命名空间，None 表示不限制
+        """
+        equals = dict(query.equals)
+        if namespaces is not None:
+            equals["namespace"] = equals.get("namespace", set(namespaces)) & set(namespaces)
+
+        # 标签和带索引的字段通过倒排索引求交集，其余条件逐行判断
+        posting_sets = []
+        for key, values in query.labels.items():
+            posting_sets.append({position for value in values for position in self.labels.get((key, value), [])})
+        scan_equals = []
+        for field, values in equals.items():
+            index = self.indexes.get(field)
+            if index is None:
+                scan_equals.append((self.field_positions[field], values))
+            else:
+                posting_sets.append({position for value in values for position in index.get(value, [])})
+        scan_contains = [(self.field_positions[field], substrings) for field, substrings in query.contains]
+
+        if posting_sets:
+            posting_sets.sort(key=len)
+            candidates = sorted(posting_sets[0].intersection(*posting_sets[1:]))
+        else:
+            candidates = range(len(self.rows))
+
+        if not scan_equals and not scan_contains:
+            return list(candidates)
+
+        result = []
+        for position in candidates:
+            row = self.rows[position]
+            if not all(row[column] in values for column, values in scan_equals):
+                continue
+            if not all(
+                row[column] is not None and any(substring in row[column] for substring in substrings)
+                for column, substrings in scan_contains
+            ):
+                continue
+            result.append(position)
+        return result
+
+
+class InventoryQuery:
+    """
+    快照查询条件，与容器监控列表的 ORM 查询条件等价
+    """
+
+    def __init__(self, model_class):
+        self.fields = InventorySnapshot.get_fields(model_class)
+        # {集群ID: 命名空间列表}，命名空间列表为 None 时不限制
+        self.scopes: Dict[str, Optional[List[str]]] = {}
+        # {标签名: [标签值]}，不同标签名之间为且，同一标签名的多个值之间为或
+        self.labels: Dict[str, List[str]] = {}
+        # {字段名: {字段值}}
+        self.equals: Dict[str, set] = {}
+        # [(字段名, [子串])]，字段包含任意一个子串即满足
+        self.contains: List[Tuple[str, List[str]]] = []
+
+    def get_field(self, field_name: str) -> models.Field:
+        field = self.fields.get(field_name)
+        # 时间字段在快照中保存为时间戳，不支持等值过滤
+        if field is None or isinstance(field, models.DateTimeField):
+            raise SnapshotUnsupported(field_name)
+        return field
+
+    def add_equals(self, field_name: str, value):
+        field = self.get_field(field_name)
+        if not isinstance(value, (list, tuple, set)):
+            value = [value]
+        try:
+            values = {field.to_python(item) for item in value}
+        except ValidationError:
+            raise SnapshotUnsupported(field_name)
+        if field_name in self.equals:
+            values &= self.equals[field_name]
+        self.equals[field_name] = values
+
+    def add_contains(self, field_name: str, substrings: List[str]):
+        field = self.get_field(field_name)
+        if not isinstance(field, models.CharField):
+            raise SnapshotUnsupported(field_name)
+        self.contains.append((field_name, [str(substring) for substring in substrings]))
+
+
+class KubernetesInventory:
+    """
+    集群资源快照的存储和进程内缓存
+    """
+
+    DATA_KEY_TEMPLATE = "kubernetes_inventory.data.{resource}.{bcs_cluster_id}"
+    VERSION_KEY_TEMPLATE = "kubernetes_inventory.version.{resource}.{bcs_cluster_id}"
+    TIMEOUT = 60 * 60
+    # 进程内最多缓存的快照数
+    MAX_SNAPSHOT_COUNT = 200
+
+    _snapshots: "OrderedDict[Tuple[str, str], InventorySnapshot]" = OrderedDict()
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_keys(cls, model_class, bcs_cluster_id: str) -> Tuple[str, str]:
+        params = {"resource": model_class._meta.model_name, "bcs_cluster_id": bcs_cluster_id}
+        return cls.DATA_KEY_TEMPLATE.format(**params), cls.VERSION_KEY_TEMPLATE.format(**params)
+
+    @classmethod
+    def refresh(cls, model_class, label_model_class, bcs_cluster_id: str) -> InventorySnapshot:
+        """
+        重新生成快照并写入缓存
+        """
+        snapshot = InventorySnapshot.build(model_class, label_model_class, bcs_cluster_id)
+        data_key, version_key = cls.get_keys(model_class, bcs_cluster_id)
+        content = snapshot.dumps()
+        # 先写数据再写版本号，保证读到新版本号时数据已就绪
+        cache.set(data_key, content, cls.TIMEOUT)
+        cache.set(version_key, snapshot.build_time, cls.TIMEOUT)
+        logger.info(
+            "[kubernetes inventory] refresh snapshot of %s(%s), rows: %s, size: %s, cost: %s",
+            model_class._meta.model_name,
+            bcs_cluster_id,
+            len(snapshot.rows),
+            len(content),
+            time.time() - snapshot.build_time,
+        )
+        return snapshot
+
+    @classmethod
+    def get_snapshots(cls, model_class, bcs_cluster_ids: List[str]) -> Optional[List[InventorySnapshot]]:
+        """
+        获取多个集群的快照，任意集群的快照不存在或已过期时返回 None
+        """
+        keys = {bcs_cluster_id: cls.get_keys(model_class, bcs_cluster_id) for bcs_cluster_id in bcs_cluster_ids}
+        versions = cache.get_many([version_key for _, version_key in keys.values()])
+
+        now = time.time()
+        snapshots = []
+        for bcs_cluster_id in bcs_cluster_ids:
+            data_key, version_key = keys[bcs_cluster_id]
+            version = versions.get(version_key)
+            if version is None or now - version > settings.KUBERNETES_INVENTORY_SNAPSHOT_MAX_AGE:
+                return None
+
+            snapshot_key = (model_class._meta.model_name, bcs_cluster_id)
+            with cls._lock:
+                snapshot = cls._snapshots.get(snapshot_key)
+                if snapshot is not None:
+                    cls._snapshots.move_to_end(snapshot_key)
+            if snapshot is None or snapshot.build_time != version:
+                content = cache.get(data_key)
+                if content is None:
+                    return None
+                snapshot = InventorySnapshot.loads(content)
+                with cls._lock:
+                    cls._snapshots[snapshot_key] = snapshot
+                    while len(cls._snapshots) > cls.MAX_SNAPSHOT_COUNT:
+                        cls._snapshots.popitem(last=False)
+            snapshots.append(snapshot)
+        return snapshots
+
+    @classmethod
+    def search(
+        cls,
+        snapshots: List[InventorySnapshot],
+        query: InventoryQuery,
+        monitor_status: str = None,
+        sort: str = "",
+        offset: int = 0,
+        limit: int = 10,
+    ) -> Dict:
+        """
+        在快照上过滤、统计数据状态、排序并分页
+        :return: {"status_summary": {数据状态: 数量}, "total": 总数, "ids": 当前页的资源ID}
+        """
+        sort_field = sort.lstrip("-")
+        reverse = sort.startswith("-")
+        status_summary = Counter()
+        entries = []
+        for snapshot in snapshots:
+            if sort_field and sort_field not in snapshot.field_positions:
+                raise SnapshotUnsupported(sort_field)
+            id_column = snapshot.field_positions["id"]
+            status_column = snapshot.field_positions["monitor_status"]
+            sort_column = snapshot.field_positions.get(sort_field)
+            for position in snapshot.filter(query, query.scopes.get(snapshot.bcs_cluster_id)):
+                row = snapshot.rows[position]
+                status_summary[row[status_column]] += 1
+                if monitor_status and monitor_status != "all" and row[status_column] != monitor_status:
+                    continue
+                if sort_column is None:
+                    entries.append(row[id_column])
+                else:
+                    # 与数据库排序一致，空值在升序时排在最前
+                    value = row[sort_column]
+                    entries.append(((value is not None, value), row[id_column]))
+
+        entries.sort(reverse=reverse)
+        page = entries[offset : offset + limit]
+        return {
+            "status_summary": dict(status_summary),
+            "total": len(entries),
+            "ids": [resource_id for _, resource_id in page] if sort_field else page,
+        }
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._snapshots.clear()
@@ -12,6 +12,19 @@ specific language governing permissions and limitations under the License.
 
 import re
 import sre_constants
+from functools import lru_cache
+
+
+@lru_cache(maxsize=4096)
+def compile_regex(pattern):
+    """
+    编译正则表达式，相同表达式只编译一次
+    :return: 编译后的正则对象，表达式不合法时返回None
+    """
+    try:
+        return re.compile(r"%s" % pattern)
+    except sre_constants.error:
+        return None
 
 
 class Condition(object):
@@ -82,10 +95,14 @@ class AndCondition(CompositeCondition):
 
 
 class EqualCondition(SimpleCondition):
+    def __init__(self, cond_field, default_value_if_not_exists=False):
+        super(EqualCondition, self).__init__(cond_field, default_value_if_not_exists)
+        # 条件值在初始化时转换为集合，匹配时直接做哈希查找
+        self.cond_value_set = set(self.cond_field.to_str_list())
+
     def _is_match(self, data_field):
         data_value = data_field.to_str_list()
-        cond_value = self.cond_field.to_str_list()
-        return bool(set(data_value) & set(cond_value))
+        return not self.cond_value_set.isdisjoint(data_value)
 
 
 class NotEqualCondition(EqualCondition):
@@ -136,19 +153,20 @@ class GreaterOrEqualCondition(LesserCondition):
 
 
 class RegularCondition(SimpleCondition):
+    def __init__(self, cond_field, default_value_if_not_exists=False):
+        super(RegularCondition, self).__init__(cond_field, default_value_if_not_exists)
+        # 正则表达式在初始化时编译，避免每次匹配重复编译
+        self.patterns = [compile_regex(v) for v in self.cond_field.to_str_list()]
+
     def _is_match(self, data_field):
         data_value = data_field.to_str_list()
         if not data_value:
             return False
         data_value = data_value[0]
-        cond_value = self.cond_field.to_str_list()
-        for v in cond_value:
-            try:
-                reg = re.compile(r"%s" % v)
-            except sre_constants.error:
+        for reg in self.patterns:
+            if reg is None:
                 return False
-
-            if reg.findall(data_value):
+            if reg.search(data_value):
                 return True
         return False
 
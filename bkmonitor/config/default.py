@@ -607,6 +607,11 @@ BCS_STORAGE_PAGE_SIZE = os.getenv("BKAPP_BCS_STORAGE_PAGE_SIZE", 5000)
 # BCS资源同步并发数
 BCS_SYNC_SYNC_CONCURRENCY = os.getenv("BKAPP_BCS_SYNC_SYNC_CONCURRENCY", 20)
 
+# 容器监控列表是否使用集群资源快照查询
+ENABLE_KUBERNETES_INVENTORY_SNAPSHOT = False
+# 集群资源快照最大可用时长(秒)，超过后回退为数据库查询
+KUBERNETES_INVENTORY_SNAPSHOT_MAX_AGE = 10 * 60
+
 # 所有bcs指标都将基于该信息进行label复制
 BCS_METRICS_LABEL_PREFIX = {"*": "kubernetes", "node_": "kubernetes", "container_": "kubernetes", "kube_": "kubernetes"}
 
@@ -623,6 +628,12 @@ TRANSFER_BUILTIN_CLUSTER_ID = ""
 # 是否开启数据平台指标缓存
 ENABLE_BKDATA_METRIC_CACHE = True
 
+# 是否开启指标缓存增量更新，仅重新生成内容变更的结果表指标
+ENABLE_METRIC_CACHE_INCREMENTAL = False
+
+# 是否开启指标选择器内存搜索索引，替代数据库模糊查询
+ENABLE_METRIC_SEARCH_INDEX = False
+
 # influxdb proxy使用的默认集群名
 INFLUXDB_DEFAULT_PROXY_CLUSTER_NAME = "default"
 INFLUXDB_DEFAULT_PROXY_CLUSTER_NAME_FOR_K8S = "default"
@@ -636,6 +647,14 @@ DISABLE_BIZ_ID = []
 # 是否开启聚合网关上报
 METRIC_AGG_GATEWAY_URL = os.getenv("BKAPP_METRIC_AGG_GATEWAY_URL", "")
 METRIC_AGG_GATEWAY_UDP_URL = os.getenv("BKAPP_METRIC_AGG_GATEWAY_UDP_URL", METRIC_AGG_GATEWAY_URL)
+# 是否开启指标后台上报，开启后请求及任务中不再同步推送指标，由进程内后台线程批量推送
+ENABLE_METRIC_BACKGROUND_PUSH = os.getenv("BKAPP_ENABLE_METRIC_BACKGROUND_PUSH", "false").lower() == "true"
+# 指标后台上报间隔(秒)
+METRIC_BACKGROUND_PUSH_INTERVAL = int(os.getenv("BKAPP_METRIC_BACKGROUND_PUSH_INTERVAL", 10))
+# 指标待上报标记次数达到阈值时提前推送
+METRIC_BACKGROUND_PUSH_THRESHOLD = 1000
+# 指标推送失败时单个 registry 最多保留的序列数，超过后丢弃
+METRIC_BACKGROUND_PUSH_MAX_SERIES = 100000
 
 # 网关API域名
 APIGW_BASE_URL = os.getenv("BKAPP_APIGW_BASE_URL", "")
@@ -680,6 +699,12 @@ WECOM_APP_ACCOUNT = {}
 
 FTA_ES_SLICE_SIZE = 50
 FTA_ES_RETENTION = 365
+# 告警页面查询是否合并为一次 msearch 请求
+ENABLE_ALERT_MSEARCH = False
+# 告警分布直方图是否使用分钟级预聚合数据
+ENABLE_ALERT_ROLLUP = False
+# 告警预聚合延迟(秒)，避免告警写入延迟导致预聚合数据缺失
+ALERT_ROLLUP_LAG = 5 * 60
 
 # 短信通知最大长度设置
 SMS_CONTENT_LENGTH = 0
@@ -913,6 +938,18 @@ CACHE_DATA_TIMEOUT = 60 * 2
 CACHE_OVERVIEW_TIMEOUT = 60 * 2
 CACHE_HOME_TIMEOUT = 60 * 10
 CACHE_USER_TIMEOUT = 60 * 10
+# API 请求进程内共享连接池，连接池数量(按host)及单个连接池最大连接数
+API_HTTP_POOL_CONNECTIONS = 20
+API_HTTP_POOL_MAXSIZE = 50
+# API 请求连接超时时间，为空时与读取超时保持一致
+API_HTTP_CONNECT_TIMEOUT = None
+# 是否合并进程内相同的 API 查询请求
+ENABLE_API_REQUEST_COALESCE = True
+
+# 缓存刷新锁超时时间，同一缓存key同时只有一个进程执行刷新
+CACHE_REFRESH_LOCK_TIMEOUT = 60
+# 缓存未命中且其他进程正在刷新时，等待缓存写入的最长时间
+CACHE_SINGLE_FLIGHT_WAIT_TIMEOUT = 10
 
 # SaaS访问读写权限
 ROLE_WRITE_PERMISSION = "w"
@@ -1321,6 +1358,9 @@ OUTER_COLLOCTOR_HOST = ""
 # ES 需要串行的集群的白名单
 ES_SERIAL_CLUSTER_LIST = []
 
+# 是否按集群批量管理 ES 索引生命周期(集群状态一次拉取，别名及分配配置合并提交)
+ENABLE_ES_LIFECYCLE_CLUSTER_PLAN = False
+
 # BCS 数据合流配置， 默认为 不启用
 BCS_DATA_CONVERGENCE_CONFIG = {}
 
@@ -1339,6 +1379,13 @@ BKCI_SPACE_ACCESS_PLUGIN_LIST = []
 # 禁用告警CMDB缓存刷新
 DISABLE_ALARM_CMDB_CACHE_REFRESH = []
 
+# 是否通过CMDB资源变更事件增量刷新主机及拓扑缓存
+CMDB_RESOURCE_WATCH_ENABLED = os.getenv("BKAPP_CMDB_RESOURCE_WATCH_ENABLED", "false").lower() == "true"
+# CMDB资源变更事件游标有效期(秒)，超过该时间未成功消费事件时回退为全量刷新
+CMDB_RESOURCE_WATCH_CURSOR_TIMEOUT = 30 * 60
+# CMDB主机缓存是否使用紧凑编码写入(读取时兼容pickle)，滚动升级期间可关闭以兼容旧版本读取
+CMDB_CACHE_COMPACT_SERIALIZE = True
+
 # 邮件订阅审批服务ID
 REPORT_APPROVAL_SERVICE_ID = int(os.getenv("BKAPP_REPORT_APPROVAL_SERVICE_ID", 0))
 
@@ -1364,6 +1411,37 @@ ENABLED_ACCESS_DATA_BATCH_PROCESS = False
 ACCESS_DATA_BATCH_PROCESS_SIZE = 50000
 ACCESS_DATA_BATCH_PROCESS_THRESHOLD = 0
 
+# 实时监控数据 handler 子进程数量，0 表示在 access 进程内使用单个线程处理
+ACCESS_REAL_TIME_HANDLER_PROCESSES = 0
+# 实时监控数据 handler 子进程队列长度(批次数)，队列满时阻塞拉取
+ACCESS_REAL_TIME_HANDLER_QUEUE_SIZE = 100
+
+# access -> detect 待检测数据队列编码方式，可选 json(单条记录) / frame(列式帧)
+# 格式: {default: "json", 集群名称: "frame"}，detect 端兼容读取两种格式
+ACCESS_DATA_QUEUE_CODEC = {}
+# 列式帧格式下单个队列元素包含的最大记录数
+ACCESS_DATA_QUEUE_FRAME_SIZE = 1000
+
+# 分片 redis pipeline 多节点并发执行的线程数
+REDIS_PIPELINE_EXECUTOR_WORKERS = 8
+
+# detect 进程内历史数据缓存的最大记录数，相同查询配置的监控项共享历史数据
+DETECT_HISTORY_CACHE_MAX_RECORDS = 100000
+
+# 是否启用进程内策略配置缓存
+STRATEGY_LOCAL_CACHE_ENABLED = True
+# 进程内策略缓存检查版本号的间隔(秒)
+STRATEGY_LOCAL_CACHE_CHECK_INTERVAL = 5
+# 进程内策略缓存的最长有效期(秒)，版本号检查之外的兜底
+STRATEGY_LOCAL_CACHE_TIMEOUT = 300
+# 进程内策略缓存的最大策略数
+STRATEGY_LOCAL_CACHE_MAX_SIZE = 20000
+
+# 周期通知每轮最多处理的到期记录数，未处理完的记录在下一轮继续处理
+ACTION_POLL_DUE_BATCH_SIZE = 5000
+# 周期通知未达到间隔或者告警状态不满足时，重新检测的间隔(秒)
+ACTION_POLL_RECHECK_INTERVAL = 60
+
 # metadta请求es超时配置, 单位为秒，默认10秒
 # 格式: {default: 10, 集群域名: 20}
 METADATA_REQUEST_ES_TIMEOUT = {}
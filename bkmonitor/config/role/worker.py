@@ -126,6 +126,8 @@ DEFAULT_CRONTAB = [
     ("alarm_backends.core.cache.cmdb.topo", "*/10 * * * *", "global"),
     ("alarm_backends.core.cache.cmdb.service_template", "*/10 * * * *", "global"),
     ("alarm_backends.core.cache.cmdb.set_template", "*/10 * * * *", "global"),
+    # cmdb 资源变更事件增量刷新
+    ("alarm_backends.core.cache.cmdb.watch", "* * * * *", "global"),
     # model cache
     # 策略全量更新频率降低
     ("alarm_backends.core.cache.strategy", "*/6 * * * *", "global"),
@@ -187,6 +189,8 @@ if BCS_API_GATEWAY_HOST:
         ("api.bcs.tasks.sync_bcs_pod_resource", "*/15 * * * *", "global"),
         ("api.bcs.tasks.sync_bcs_container_resource", "*/15 * * * *", "global"),
         ("api.bcs.tasks.sync_bcs_node_resource", "*/15 * * * *", "global"),
+        # 容器监控列表集群资源快照
+        ("api.bcs.tasks.sync_bcs_inventory_snapshot", "*/2 * * * *", "global"),
         # bcs集群安装operator信息，一天同步一次
         ("api.bcs.tasks.sync_bkmonitor_operator_info", "0 2 * * *", "global"),
     ]
@@ -210,6 +214,8 @@ ACTION_TASK_CRONTAB = [
     ("alarm_backends.service.fta_action.tasks.dispatch_demo_action_tasks", "* * * * *", "global"),
     # 定期进行告警索引轮转 隔天创建，时间稍微拉长一点，避免短时间任务堵塞的时候容易过期，导致创建不成功
     ("bkmonitor.documents.tasks.rollover_indices", "*/24 * * * *", "global"),
+    # 告警分钟级预聚合
+    ("bkmonitor.documents.tasks.rollup_alerts", "* * * * *", "global"),
     # 定期清理停用的ai 策略对应的flow任务(每天2点半)
     ("bkmonitor.management.commands.clean_aiflow.run_clean", "30 2 * * *", "global"),
 ]
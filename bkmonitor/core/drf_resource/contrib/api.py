@@ -12,6 +12,9 @@ specific language governing permissions and limitations under the License.
 import abc
 import json
 import logging
+import os
+import threading
+from http.cookiejar import DefaultCookiePolicy
 
 import requests
 import six
@@ -21,8 +24,10 @@ from django.conf import settings
 from django.utils import translation
 from django.utils.module_loading import import_string
 from django.utils.translation import ugettext as _
+from requests.adapters import HTTPAdapter
 from requests.exceptions import HTTPError, ReadTimeout
 
+from bkmonitor.utils.common_utils import count_md5
 from bkmonitor.utils.request import get_request
 from bkmonitor.utils.user import make_userinfo
 from core.drf_resource.contrib.cache import CacheResource
@@ -41,6 +46,86 @@ BK_USERNAME_FIELD = "bk_username"
 APIPermissionDeniedCodeList = ["9900403", "35999999"]
 
 
+_session_lock = threading.Lock()
+_session = None
+_session_pid = None
+
+
+def get_api_session() -> requests.Session:
+    """
+    获取进程内共享的http会话，按host复用连接池，fork后的子进程重新创建
+    共享会话不保存cookie，避免不同用户的请求相互影响
+    """
+    global _session, _session_pid
+
+    pid = os.getpid()
+    if _session is not None and _session_pid == pid:
+        return _session
+
+    with _session_lock:
+        if _session is None or _session_pid != pid:
+            session = requests.session()
+            session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+            adapter = HTTPAdapter(
+                pool_connections=settings.API_HTTP_POOL_CONNECTIONS, pool_maxsize=settings.API_HTTP_POOL_MAXSIZE
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session, _session_pid = session, pid
+    return _session
+
+
+class _InFlightRequest(object):
+    __slots__ = ("event", "result", "exception")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.exception = None
+
+
+class RequestCoalescer(object):
+    """
+    进程内请求合并：相同的请求正在执行时，后续请求等待并复用其响应
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests = {}
+
+    def do(self, key, func):
+        """
+        :param key: 请求标识
+        :param func: 实际发起请求的函数
+        :return: (响应, 是否复用了其他请求的响应)
+        """
+        with self._lock:
+            in_flight = self._requests.get(key)
+            is_leader = in_flight is None
+            if is_leader:
+                in_flight = self._requests[key] = _InFlightRequest()
+
+        if not is_leader:
+            in_flight.event.wait()
+            if in_flight.exception is not None:
+                raise in_flight.exception
+            return in_flight.result, True
+
+        try:
+            in_flight.result = func()
+        except Exception as e:
+            in_flight.exception = e
+            raise
+        finally:
+            with self._lock:
+                self._requests.pop(key, None)
+            in_flight.event.set()
+        return in_flight.result, False
+
+
+request_coalescer = RequestCoalescer()
+
+
 def get_bk_login_ticket(request):
     """
     从 request 中获取用户登录凭据
@@ -73,6 +158,8 @@ class APIResource(six.with_metaclass(abc.ABCMeta, CacheResource)):
     TIMEOUT = 60
     # 是否直接使用标准格式数据，兼容BCS非标准返回的情况
     IS_STANDARD_FORMAT = True
+    # 允许进程内合并相同请求的请求方法，仅适用于无副作用的查询接口
+    COALESCE_METHODS = ("GET",)
 
     @abc.abstractproperty
     def base_url(self):
@@ -121,7 +208,36 @@ class APIResource(six.with_metaclass(abc.ABCMeta, CacheResource)):
         super(APIResource, self).__init__(*args, **kwargs)
         assert self.method.upper() in ["GET", "POST", "PUT", "DELETE", "PATCH"], _("method仅支持GET或POST或PUT或DELETE或PATCH")
         self.method = self.method.upper()
-        self.session = requests.session()
+
+    @property
+    def session(self) -> requests.Session:
+        return get_api_session()
+
+    def get_timeout(self, validated_request_data):
+        """
+        请求超时时间，配置了连接超时时使用 (连接超时, 读取超时)
+        """
+        timeout = validated_request_data.get("timeout") or self.TIMEOUT
+        if settings.API_HTTP_CONNECT_TIMEOUT:
+            return settings.API_HTTP_CONNECT_TIMEOUT, timeout
+        return timeout
+
+    def send_request(self, method, request_func, **request_kwargs):
+        """
+        发送请求，相同的查询请求在进程内合并
+        """
+        if (
+            not settings.ENABLE_API_REQUEST_COALESCE
+            or method not in self.COALESCE_METHODS
+            or request_kwargs.get("files")
+        ):
+            return request_func(**request_kwargs)
+
+        key = count_md5([method, request_kwargs], list_sort=False)
+        result, coalesced = request_coalescer.do(key, lambda: request_func(**request_kwargs))
+        if coalesced:
+            metrics.API_REQUEST_COALESCED_COUNT.labels(module=self.module_name, action=self.action).inc()
+        return result
 
     def request(self, request_data=None, **kwargs):
         request_data = request_data or kwargs
@@ -183,7 +299,7 @@ class APIResource(six.with_metaclass(abc.ABCMeta, CacheResource)):
             kwargs = {
                 "method": self.method,
                 "url": request_url,
-                "timeout": validated_request_data.get("timeout") or self.TIMEOUT,
+                "timeout": self.get_timeout(validated_request_data),
                 "headers": headers,
                 "verify": False,
             }
@@ -193,12 +309,14 @@ class APIResource(six.with_metaclass(abc.ABCMeta, CacheResource)):
                 if "method" in kwargs:
                     del kwargs["method"]
 
-                result = self.session.get(
+                result = self.send_request(
+                    self.method,
+                    self.session.get,
                     url=request_url,
                     params=validated_request_data,
                     headers=headers,
                     verify=False,
-                    timeout=validated_request_data.get("timeout") or self.TIMEOUT,
+                    timeout=self.get_timeout(validated_request_data),
                 )
             else:
                 non_file_data, file_data = self.split_request_data(validated_request_data)
@@ -212,7 +330,7 @@ class APIResource(six.with_metaclass(abc.ABCMeta, CacheResource)):
                     kwargs["data"] = non_file_data
 
                 kwargs = self.before_request(kwargs)
-                result = self.session.request(**kwargs)
+                result = self.send_request(self.method, self.session.request, **kwargs)
         except ReadTimeout as error:
             # 上报API调用失败统计指标
             self.report_api_failure_metric(error_code=getattr(error, 'code', 0), exception_type=type(error).__name__)
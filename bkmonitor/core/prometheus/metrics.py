@@ -10,41 +10,212 @@ specific language governing permissions and limitations under the License.
 """
 
 # 数据源
+import atexit
 import logging
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
 
+from celery.signals import worker_process_shutdown, worker_shutdown
 from django.conf import settings
 from prometheus_client.exposition import push_to_gateway
 from prometheus_client.utils import INF
 
-from core.prometheus.base import REGISTRY, BkCollectorRegistry, Counter, Histogram
+from core.prometheus.base import REGISTRY, BkCollectorRegistry, Counter, Gauge, Histogram
 from core.prometheus.tools import get_metric_agg_gateway_url, udp_handler
 
 logger = logging.getLogger(__name__)
 
 
-def report_all(job: str = settings.DEFAULT_METRIC_PUSH_JOB, registry: BkCollectorRegistry = REGISTRY):
+def push_registry(job: str, registry: BkCollectorRegistry) -> bool:
     """
-    批量上报指标
+    推送 registry 中的指标，成功后清空指标数据
     """
-    if not get_metric_agg_gateway_url():
-        return
     try:
         # 发送消息
         push_to_gateway(gateway="", job=job, registry=registry, handler=udp_handler)
     except Exception:
         # 失败不处理，handler已经打了日志了，这里只是为了防止上报过程出现任何异常导致正常逻辑无法走下去
-        return
+        return False
 
     registry.clear_data()
+    return True
+
+
+def count_series(registry: BkCollectorRegistry) -> int:
+    """
+    统计 registry 中的时间序列数量(按维度组合计算)
+    """
+    with registry._lock:
+        collectors = list(registry._collector_to_names)
+    return sum(len(collector._metrics) if hasattr(collector, "_metrics") else 1 for collector in collectors)
+
+
+class MetricsFlusher:
+    """
+    指标后台上报器
+    请求及任务中只标记待上报的 registry，指标数据在 registry 内存中聚合，
+    由后台线程按时间间隔或标记次数阈值批量推送，进程退出时同步推送剩余数据
+    """
+
+    def __init__(self, interval: float, max_pending: int, max_series: int):
+        self.interval = interval
+        self.max_pending = max_pending
+        self.max_series = max_series
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+        self._pending: Dict[Tuple[str, int], Tuple[str, BkCollectorRegistry]] = {}
+        self._mark_count = 0
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._stopped = False
+        # 推送失败且超过序列数上限被丢弃的序列数
+        self.dropped_series = 0
+        self.failed_pushes = 0
+
+    def mark(self, job: str, registry: BkCollectorRegistry):
+        """
+        标记 registry 待上报，标记次数达到阈值时唤醒后台线程提前推送
+        """
+        self._reset_if_forked()
+        with self._lock:
+            self._pending[(job, id(registry))] = (job, registry)
+            self._mark_count += 1
+            if self._mark_count >= self.max_pending:
+                self._event.set()
+        self.ensure_started()
+
+    def ensure_started(self):
+        """
+        按进程启动后台线程，fork 出的子进程不会继承父进程的线程，需要重新启动
+        """
+        self._reset_if_forked()
+        pid = os.getpid()
+        if self._stopped or (self._pid == pid and self._thread and self._thread.is_alive()):
+            return
+        with self._lock:
+            if self._pid == pid and self._thread and self._thread.is_alive():
+                return
+            if self._pid != pid:
+                atexit.register(self.shutdown)
+            self._pid = pid
+            self._thread = threading.Thread(target=self._run, name="metrics-flusher", daemon=True)
+            self._thread.start()
+
+    def _reset_if_forked(self):
+        """
+        进程号变化说明处于 fork 出的子进程中，需在获取锁之前重建状态
+        """
+        if self._pid is not None and self._pid != os.getpid():
+            self.reset_after_fork()
+
+    def reset_after_fork(self):
+        """
+        fork 出的子进程中重建锁、待推送标记及后台线程状态
+        fork 时父进程的锁可能正被其他线程持有，子进程中该锁永远不会被释放
+        父进程的待推送标记由父进程负责推送，子进程中丢弃
+        """
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+        self._pending = {}
+        self._mark_count = 0
+        self._thread = None
+
+    def _run(self):
+        while not self._stopped:
+            self._event.wait(self.interval)
+            self._event.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("[metrics flusher] flush metrics failed")
+
+    def flush(self) -> List[str]:
+        """
+        推送全部待上报的 registry
+        :return: 推送成功的任务标志
+        """
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending = {}
+            self._mark_count = 0
+
+        pushed = []
+        for job, registry in pending:
+            if push_registry(job, registry):
+                pushed.append(job)
+                continue
+
+            self.failed_pushes += 1
+            series = count_series(registry)
+            if series <= self.max_series:
+                # 保留数据等待下次重试
+                with self._lock:
+                    self._pending.setdefault((job, id(registry)), (job, registry))
+                continue
+
+            # 持续推送失败时限制内存占用，丢弃已聚合的数据
+            registry.clear_data()
+            self.dropped_series += series
+            logger.warning(
+                "[metrics flusher] push job(%s) failed, drop %s series (max series: %s)", job, series, self.max_series
+            )
+            METRICS_FLUSHER_DROPPED_SERIES_COUNT.labels(job=job).inc(series)
+        return pushed
+
+    def shutdown(self):
+        """
+        停止后台线程并同步推送剩余数据
+        """
+        if self._pid != os.getpid():
+            return
+        self._stopped = True
+        self._event.set()
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("[metrics flusher] flush metrics on shutdown failed")
+
+
+METRICS_FLUSHER = MetricsFlusher(
+    interval=settings.METRIC_BACKGROUND_PUSH_INTERVAL,
+    max_pending=settings.METRIC_BACKGROUND_PUSH_THRESHOLD,
+    max_series=settings.METRIC_BACKGROUND_PUSH_MAX_SERIES,
+)
+
+
+@worker_shutdown.connect(weak=False)
+@worker_process_shutdown.connect(weak=False)
+def flush_metrics_on_shutdown(**kwargs):
+    # prefork 子进程退出时不会执行 atexit，需要通过 celery 信号推送剩余数据
+    METRICS_FLUSHER.shutdown()
+
+
+def report_all(
+    job: str = settings.DEFAULT_METRIC_PUSH_JOB, registry: BkCollectorRegistry = REGISTRY, immediately: bool = False
+):
+    """
+    批量上报指标
+    :param immediately: 是否立即推送，未开启后台上报时总是立即推送
+    """
+    if not get_metric_agg_gateway_url():
+        return
+
+    if settings.ENABLE_METRIC_BACKGROUND_PUSH and not immediately:
+        METRICS_FLUSHER.mark(job, registry)
+        return
+
+    push_registry(job, registry)
 
 
 def safe_push_to_gateway(job: str = settings.DEFAULT_METRIC_PUSH_JOB, registry: BkCollectorRegistry = REGISTRY):
     """安全批量上报指标"""
-    # Q: 为什么该函数会在请求中被直接调用，而不是定期后台上报？
+    # Q: 为什么该函数会在请求中被调用？
     # A: 当前我们的 prometheus client 是以单进程维度启动，数据存储放在进程内存中
     #    而如果我们改用多进程模式，push gateway 反而不合适了
     #    https://github.com/prometheus/client_python#multiprocess-mode-eg-gunicorn
     #    可以理解为 pushgateway 充当一个远端的分布式共享内存，所以这里可以直推
+    #    开启 ENABLE_METRIC_BACKGROUND_PUSH 后，请求中仅做标记，由进程内后台线程批量推送
     try:
         report_all(job, registry)
     except Exception:
@@ -156,6 +327,30 @@ ACCESS_INCIDENT_PROCESS_COUNT = Counter(
     labelnames=("status", "exception"),
 )
 
+ACCESS_REAL_TIME_HANDLER_LAG = Gauge(
+    name="bkmonitor_access_real_time_handler_lag",
+    documentation="access(real_time) handler 子进程处理延迟",
+    labelnames=("worker",),
+)
+
+ACCESS_REAL_TIME_HANDLER_QUEUE_SIZE = Gauge(
+    name="bkmonitor_access_real_time_handler_queue_size",
+    documentation="access(real_time) handler 子进程待处理队列长度",
+    labelnames=("worker",),
+)
+
+ACCESS_REAL_TIME_HANDLER_RECORD_COUNT = Counter(
+    name="bkmonitor_access_real_time_handler_record_count",
+    documentation="access(real_time) handler 子进程处理数据条数",
+    labelnames=("worker",),
+)
+
+ACCESS_REAL_TIME_HANDLER_BLOCKED_COUNT = Counter(
+    name="bkmonitor_access_real_time_handler_blocked_count",
+    documentation="access(real_time) handler 子进程队列已满导致 poller 阻塞次数",
+    labelnames=("worker",),
+)
+
 # detect
 DETECT_PROCESS_TIME = Histogram(
     name="bkmonitor_detect_process_time",
@@ -407,6 +602,25 @@ ACTION_CREATE_PUSH_COUNT = Counter(
     labelnames=("strategy_id", "signal", "run_type", "notice_type"),
 )
 
+ACTION_POLL_INDEX_BACKLOG = Gauge(
+    name="bkmonitor_action_poll_index_backlog",
+    documentation="周期通知待检测索引中的记录数",
+    labelnames=(),
+)
+
+ACTION_POLL_DUE_COUNT = Gauge(
+    name="bkmonitor_action_poll_due_count",
+    documentation="周期通知单轮检测到期的记录数",
+    labelnames=(),
+)
+
+ACTION_POLL_LATENESS = Histogram(
+    name="bkmonitor_action_poll_lateness",
+    documentation="周期通知记录从到期到被检测的延迟",
+    labelnames=(),
+    buckets=(1, 5, 10, 20, 30, 60, 120, 300, 600, 1800, INF),
+)
+
 ACTION_EXECUTE_TIME = Histogram(
     name="bkmonitor_action_execute_time",
     documentation="action 模块动作执行耗时",
@@ -446,6 +660,38 @@ ALARM_CACHE_TASK_TIME = Histogram(
     buckets=(1, 3, 5, 10, 30, 60, 300, INF),
 )
 
+REDIS_PIPELINE_EXECUTE_TIME = Histogram(
+    name="bkmonitor_redis_pipeline_execute_time",
+    documentation="分片 redis pipeline 单节点执行耗时",
+    labelnames=("node", "backend"),
+    buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 3, 5, INF),
+)
+
+REDIS_PIPELINE_COMMAND_COUNT = Counter(
+    name="bkmonitor_redis_pipeline_command_count",
+    documentation="分片 redis pipeline 单节点执行命令数",
+    labelnames=("node", "backend"),
+)
+
+USING_CACHE_ACCESS_COUNT = Counter(
+    name="bkmonitor_using_cache_access_count",
+    documentation="using_cache 缓存访问次数",
+    labelnames=("cache_type", "status"),
+)
+
+USING_CACHE_REFRESH_TIME = Histogram(
+    name="bkmonitor_using_cache_refresh_time",
+    documentation="using_cache 缓存刷新耗时",
+    labelnames=("cache_type", "exception"),
+    buckets=(0.05, 0.1, 0.5, 1, 3, 5, 10, 30, 60, INF),
+)
+
+API_REQUEST_COALESCED_COUNT = Counter(
+    name="bkmonitor_api_request_coalesced_count",
+    documentation="API 请求合并次数",
+    labelnames=("module", "action"),
+)
+
 # mail report
 MAIL_REPORT_SEND_LATENCY = Histogram(
     name="bkmonitor_mail_report_send_latency",
@@ -480,4 +726,10 @@ API_FAILED_REQUESTS_TOTAL = Counter(
     labelnames=("action", "module", "code", "role", "exception", "user_name"),
 )
 
+METRICS_FLUSHER_DROPPED_SERIES_COUNT = Counter(
+    name="bkmonitor_metrics_flusher_dropped_series_count",
+    documentation="指标后台上报失败丢弃的序列数",
+    labelnames=("job",),
+)
+
 TOTAL_TAG = "__total__"
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+Tencent is pleased to support the open source community by making 蓝鲸智云 - 监控平台 (BlueKing - Monitor) available.
+Copyright (C) 2017-2021 THL A29 Limited, a Tencent company. All rights reserved.
+Licensed under the MIT License (the "License"); you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://opensource.org/licenses/MIT
+Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on
+an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the
+specific language governing permissions and limitations under the License.
+"""
+import threading
+
+import pytest
+
+from core.drf_resource.contrib.api import RequestCoalescer, get_api_session
+
+
+class TestRequestCoalescer(object):
+    def test_coalesce_in_flight_requests(self):
+        coalescer = RequestCoalescer()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+        results = []
+
+        def request():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return "response"
+
+        leader = threading.Thread(target=lambda: results.append(coalescer.do("key", request)))
+        leader.start()
+        started.wait(5)
+        follower = threading.Thread(target=lambda: results.append(coalescer.do("key", request)))
+        follower.start()
+        release.set()
+        leader.join()
+        follower.join()
+
+        assert len(calls) == 1
+        assert sorted(results) == [("response", False), ("response", True)]
+
+        # 请求完成后不再复用
+        assert coalescer.do("key", lambda: "new") == ("new", False)
+
+    def test_coalesce_exception(self):
+        coalescer = RequestCoalescer()
+
+        def request():
+            raise ValueError("timeout")
+
+        with pytest.raises(ValueError):
+            coalescer.do("key", request)
+        assert coalescer.do("key", lambda: "ok") == ("ok", False)
+
+
+def test_shared_session():
+    session = get_api_session()
+    assert get_api_session() is session
+    assert session.get_adapter("https://example.com") is session.get_adapter("http://example.com")
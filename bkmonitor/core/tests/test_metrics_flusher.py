@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+Tencent is pleased to support the open source community by making 蓝鲸智云 - 监控平台 (BlueKing - Monitor) available.
+Copyright (C) 2017-2021 THL A29 Limited, a Tencent company. All rights reserved.
+Licensed under the MIT License (the "License"); you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://opensource.org/licenses/MIT
+Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on
+an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the
+specific language governing permissions and limitations under the License.
+"""
+import pytest
+
+from core.prometheus import metrics
+from core.prometheus.base import BkCollectorRegistry, Counter, Histogram
+
+
+@pytest.fixture()
+def registry():
+    return BkCollectorRegistry()
+
+
+@pytest.fixture()
+def pushed(mocker):
+    """
+    替换网关发送，保留 registry 序列化过程
+    """
+    payloads = []
+
+    def handler(url, method, timeout, headers, data):
+        def handle():
+            payloads.append(data)
+
+        return handle
+
+    mocker.patch.object(metrics, "get_metric_agg_gateway_url", return_value="127.0.0.1:10205")
+    mocker.patch.object(metrics, "udp_handler", handler)
+    return payloads
+
+
+class TestMetricsFlusher(object):
+    def test_flush(self, registry, pushed):
+        counter = Counter(name="test_flusher_count", documentation="test", labelnames=("key",), registry=registry)
+        flusher = metrics.MetricsFlusher(interval=3600, max_pending=10000, max_series=10)
+
+        for index in range(5):
+            counter.labels(key=str(index)).inc()
+            flusher.mark("test", registry)
+            flusher.mark("test", registry)
+
+        # 多次标记合并为一次推送，推送后清空数据
+        assert flusher.flush() == ["test"]
+        assert len(pushed) == 1
+        assert metrics.count_series(registry) == 0
+        assert flusher.flush() == []
+        flusher.shutdown()
+
+    def test_flush_failed(self, registry, pushed, mocker):
+        counter = Counter(name="test_flusher_count", documentation="test", labelnames=("key",), registry=registry)
+        flusher = metrics.MetricsFlusher(interval=3600, max_pending=10000, max_series=10)
+        mocker.patch.object(metrics, "push_registry", return_value=False)
+
+        # 推送失败时保留数据等待重试
+        counter.labels(key="0").inc()
+        flusher.mark("test", registry)
+        assert flusher.flush() == []
+        assert metrics.count_series(registry) == 1
+        assert flusher.dropped_series == 0
+
+        # 超过序列数上限后丢弃
+        for index in range(20):
+            counter.labels(key=str(index)).inc()
+        assert flusher.flush() == []
+        assert metrics.count_series(registry) == 0
+        assert flusher.dropped_series == 20
+        flusher.shutdown()
+
+    def test_reset_after_fork(self, registry, pushed):
+        flusher = metrics.MetricsFlusher(interval=3600, max_pending=10000, max_series=10)
+        flusher.mark("test", registry)
+
+        # 模拟 fork 时锁被其他线程持有，子进程中重建后可以继续标记
+        flusher._lock.acquire()
+        flusher.reset_after_fork()
+        flusher.mark("test", registry)
+        assert flusher.flush() == ["test"]
+        flusher.shutdown()
+
+    def test_pid_changed(self, registry, pushed, mocker):
+        flusher = metrics.MetricsFlusher(interval=3600, max_pending=10000, max_series=10)
+        flusher.mark("parent", registry)
+        parent_thread = flusher._thread
+
+        # 模拟 fork 时锁被其他线程持有，子进程中进程号变化后重建锁、待推送标记及后台线程
+        flusher._lock.acquire()
+        mocker.patch.object(metrics.os, "getpid", return_value=flusher._pid + 1)
+        mocker.patch.object(metrics.atexit, "register")
+        flusher.mark("child", registry)
+        assert flusher._thread is not parent_thread
+        assert flusher._pid == metrics.os.getpid()
+        assert flusher.flush() == ["child"]
+        flusher.shutdown()
+
+    def test_drop_without_extra_mark(self, registry, pushed, mocker):
+        # 推送失败丢弃数据时不会额外标记其他 registry
+        mocker.patch.object(metrics, "push_registry", return_value=False)
+        flusher = metrics.MetricsFlusher(interval=3600, max_pending=10000, max_series=0)
+        Counter(name="test_flusher_count", documentation="test", registry=registry).inc()
+        flusher.mark("test", registry)
+        assert flusher.flush() == []
+        assert flusher._pending == {}
+        flusher.shutdown()
+
+    def test_report_all_background(self, registry, pushed, settings):
+        histogram = Histogram(
+            name="test_flusher_request_time", documentation="test", labelnames=("api", "status"), registry=registry
+        )
+
+        def request(count=200):
+            for index in range(count):
+                histogram.labels(api=f"api_{index % 20}", status="success").observe(0.1)
+                metrics.report_all(job="test", registry=registry)
+
+        settings.ENABLE_METRIC_BACKGROUND_PUSH = False
+        request()
+        inline_pushed = len(pushed)
+
+        settings.ENABLE_METRIC_BACKGROUND_PUSH = True
+        flusher = metrics.MetricsFlusher(interval=3600, max_pending=100000, max_series=10000)
+        metrics.METRICS_FLUSHER, origin_flusher = flusher, metrics.METRICS_FLUSHER
+        try:
+            request()
+            flusher.shutdown()
+        finally:
+            metrics.METRICS_FLUSHER = origin_flusher
+
+        # 后台上报时多次请求的指标合并为一次推送
+        assert inline_pushed == 200
+        assert len(pushed) - inline_pushed == 1
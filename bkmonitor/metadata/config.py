@@ -93,6 +93,9 @@ ES_CLUSTER_VERSION_DEFAULT = 7
 ES_SHARDS_CONFIG = os.environ.get("ES_SHARDS_NUMBER", 1)
 ES_REPLICAS_CONFIG = os.environ.get("ES_REPLICAS_CONFIG", 1)
 
+# 按集群批量管理 ES 索引生命周期时，单个任务处理的结果表数量
+ES_LIFECYCLE_CLUSTER_PLAN_STEP = 1000
+
 BCS_TABLE_ID_PREFIX = "bkmonitor_bcs"
 
 # 容器配置相关内容
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+Tencent is pleased to support the open source community by making 蓝鲸智云 - 监控平台 (BlueKing - Monitor) available.
+Copyright (C) 2017-2021 THL A29 Limited, a Tencent company. All rights reserved.
+Licensed under the MIT License (the "License"); you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://opensource.org/licenses/MIT
+Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on
+an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the
+specific language governing permissions and limitations under the License.
+"""
+
+import json
+
+from django.core.management.base import BaseCommand
+
+from metadata import models
+from metadata.models.constants import EsSourceType
+from metadata.service.es_lifecycle import ESLifecyclePlanner
+
+
+class Command(BaseCommand):
+    help = "manage es index lifecycle by cluster, use --dry_run to only output the plan"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--cluster_id", type=int, required=True, help="ES 集群 ID")
+        parser.add_argument("--table_ids", help="结果表ID，多个以半角逗号分隔，默认为集群下所有日志内建的结果表")
+        parser.add_argument("--dry_run", action="store_true", help="仅计算需要执行的变更，不提交到集群")
+
+    def handle(self, *args, **options):
+        cluster_id, table_ids, dry_run = options["cluster_id"], options.get("table_ids"), options.get("dry_run")
+        es_storages = models.ESStorage.objects.filter(storage_cluster_id=cluster_id)
+        if table_ids:
+            es_storages = es_storages.filter(table_id__in=table_ids.split(","))
+        else:
+            table_id_list = models.ResultTable.objects.filter(
+                table_id__in=es_storages.values_list("table_id", flat=True), is_enable=True, is_deleted=False
+            ).values_list("table_id", flat=True)
+            es_storages = es_storages.filter(source_type=EsSourceType.LOG.value, table_id__in=table_id_list)
+
+        report = ESLifecyclePlanner(cluster_id, dry_run=dry_run).run(es_storages)
+        self.stdout.write(json.dumps(report, indent=2))
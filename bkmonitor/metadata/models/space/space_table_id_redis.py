@@ -12,7 +12,9 @@ specific language governing permissions and limitations under the License.
 import datetime
 import json
 import logging
-from typing import Dict, List, Optional, Set
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Set
 
 from django.conf import settings
 from django.db.models import Q
@@ -56,6 +58,14 @@ logger = logging.getLogger("metadata")
 class SpaceTableIDRedis:
     """空间路由结果表数据推送 redis 相关功能"""
 
+    # 批量读写空间路由时，单次操作的 field 数量
+    SPACE_BATCH_SIZE = 500
+
+    def __init__(self):
+        # 各空间共用的数据，开启后在首次使用时加载，之后的空间直接复用
+        self._shared_data: Optional[Dict] = None
+        self._shared_data_lock = threading.RLock()
+
     def push_space_table_ids(
         self, space_type: str, space_id: str, is_publish: Optional[bool] = False, can_push_data: Optional[bool] = True
     ):
@@ -77,6 +87,80 @@ class SpaceTableIDRedis:
             RedisTools.publish(SPACE_TO_RESULT_TABLE_CHANNEL, [f"{space_type}__{space_id}"])
         logger.info("push space table_id data successfully, space_type: %s, space_id: %s", space_type, space_id)
 
+    def enable_shared_data(self):
+        """开启公共数据复用，批量组装空间路由时，结果表存储、平台数据源等数据仅加载一次
+
+        NOTE: 公共数据在实例生命周期内不会刷新，仅适用于单次批量推送
+        """
+        self._shared_data = {}
+
+    def compose_space_table_ids(self, space_type: str, space_id: str) -> Dict:
+        """组装空间及对应的结果表和过滤条件，不推送"""
+        space_id = str(space_id)
+        if space_type == SpaceTypes.BKCC.value:
+            return self._push_bkcc_space_table_ids(space_type, space_id, can_push_data=False)
+        elif space_type == SpaceTypes.BKCI.value:
+            return self._push_bkci_space_table_ids(space_type, space_id, can_push_data=False)
+        elif space_type == SpaceTypes.BKSAAS.value:
+            return self._push_bksaas_space_table_ids(space_type, space_id, can_push_data=False)
+        return {}
+
+    def compose_multi_space_table_ids(self, space_list: List[Dict]) -> Dict[str, Dict]:
+        """批量组装空间路由，格式: {space_uid: {table_id: {"filters": []}}}"""
+        space_values = {}
+        for space in space_list:
+            space_type, space_id = space["space_type"], str(space["space_id"])
+            try:
+                _values = self.compose_space_table_ids(space_type, space_id)
+            except Exception as e:
+                logger.error("compose space table_id error, space_type: %s, space_id: %s, %s", space_type, space_id, e)
+                continue
+            if _values:
+                space_values[f"{space_type}__{space_id}"] = _values
+        return space_values
+
+    def push_changed_space_table_ids(self, space_values: Dict[str, Dict], is_publish: Optional[bool] = False) -> List:
+        """与 redis 中已有的空间路由比对，仅写入并通知有变化的空间
+
+        :param space_values: 空间路由，格式: {space_uid: {table_id: {"filters": []}}}
+        :return: 有变化的空间 UID 列表
+        """
+        space_uid_list = list(space_values.keys())
+        changed_values = {}
+        for start in range(0, len(space_uid_list), self.SPACE_BATCH_SIZE):
+            space_uids = space_uid_list[start : start + self.SPACE_BATCH_SIZE]
+            old_values = RedisTools.hmget(SPACE_TO_RESULT_TABLE_KEY, space_uids)
+            for space_uid, old_value in zip(space_uids, old_values):
+                value = json.dumps(space_values[space_uid])
+                # 按解析后的数据比对，避免结果表顺序不同导致误判
+                if old_value and json.loads(old_value) == json.loads(value):
+                    continue
+                changed_values[space_uid] = value
+
+        changed_space_uid_list = list(changed_values.keys())
+        for start in range(0, len(changed_space_uid_list), self.SPACE_BATCH_SIZE):
+            space_uids = changed_space_uid_list[start : start + self.SPACE_BATCH_SIZE]
+            RedisTools.hmset_to_redis(SPACE_TO_RESULT_TABLE_KEY, {uid: changed_values[uid] for uid in space_uids})
+
+        if is_publish and changed_space_uid_list:
+            RedisTools.publish(SPACE_TO_RESULT_TABLE_CHANNEL, changed_space_uid_list)
+        logger.info(
+            "push redis space_to_result_table by diff, total: %s, changed: %s",
+            len(space_uid_list),
+            len(changed_space_uid_list),
+        )
+        return changed_space_uid_list
+
+    def _get_shared_data(self, name: str, loader: Callable):
+        """获取公共数据，未开启复用时直接加载"""
+        if self._shared_data is None:
+            return loader()
+        # 加锁，避免并发组装时重复加载；加载过程中可能依赖其它公共数据，因此使用可重入锁
+        with self._shared_data_lock:
+            if name not in self._shared_data:
+                self._shared_data[name] = loader()
+            return self._shared_data[name]
+
     def push_data_label_table_ids(
         self,
         data_label_list: Optional[List] = None,
@@ -359,9 +443,15 @@ class SpaceTableIDRedis:
             return {}
         # 获取空间关联的业务，注意这里业务 ID 为字符串类型
         # 追加空间访问指定插件的 filter
-        tids = models.ResultTable.objects.filter(
-            Q(table_id__startswith=BKCI_SYSTEM_TABLE_ID_PREFIX) | Q(table_id__in=settings.BKCI_SPACE_ACCESS_PLUGIN_LIST)
-        ).values_list("table_id", flat=True)
+        tids = self._get_shared_data(
+            "bkci_system_table_ids",
+            lambda: list(
+                models.ResultTable.objects.filter(
+                    Q(table_id__startswith=BKCI_SYSTEM_TABLE_ID_PREFIX)
+                    | Q(table_id__in=settings.BKCI_SPACE_ACCESS_PLUGIN_LIST)
+                ).values_list("table_id", flat=True)
+            ),
+        )
         return {tid: {"filters": [{"bk_biz_id": str(obj.resource_id)}]} for tid in tids}
 
     def _compose_bcs_space_cluster_table_ids(
@@ -417,6 +507,18 @@ class SpaceTableIDRedis:
     def _compose_bkci_level_table_ids(self, space_type: str, space_id: str) -> Dict:
         """组装 bkci 全局下的结果表"""
         logger.info("start to push bkci level table_id, space_type: %s, space_id: %s", space_type, space_id)
+        table_ids = self._get_shared_data(
+            f"bkci_level_table_ids__{space_type}", lambda: self._get_platform_table_ids(space_type)
+        )
+        _values = {}
+        # 组装数据
+        for tid in table_ids:
+            _values[tid] = {"filters": [{"projectId": space_id}]}
+
+        return _values
+
+    def _get_platform_table_ids(self, space_type: str) -> Set:
+        """获取空间类型下平台级数据源对应的结果表，仅包含写入influxdb和vm的数据"""
         # 过滤空间级的数据源
         data_ids = get_platform_data_ids(space_type=space_type)
         # 一个空间下 data_id 不会太多
@@ -425,16 +527,10 @@ class SpaceTableIDRedis:
                 "table_id", flat=True
             )
         )
-        _values = {}
         if not table_is_list:
-            return _values
+            return set()
         # 过滤仅写入influxdb和vm的数据
-        table_ids = self._refine_table_ids(table_is_list)
-        # 组装数据
-        for tid in table_ids:
-            _values[tid] = {"filters": [{"projectId": space_id}]}
-
-        return _values
+        return self._refine_table_ids(table_is_list)
 
     def _compose_bkci_other_table_ids(self, space_type: str, space_id: str) -> Dict:
         logger.info("start to push bkci space other table_id, space_type: %s, space_id: %s", space_type, space_id)
@@ -466,12 +562,22 @@ class SpaceTableIDRedis:
         logger.info(
             "start to push bkci space cross space_type table_id, space_type: %s, space_id: %s", space_type, space_id
         )
-        tids = models.ResultTable.objects.filter(table_id__startswith=BKCI_1001_TABLE_ID_PREFIX).values_list(
-            "table_id", flat=True
+        tids = self._get_shared_data(
+            "bkci_1001_table_ids",
+            lambda: list(
+                models.ResultTable.objects.filter(table_id__startswith=BKCI_1001_TABLE_ID_PREFIX).values_list(
+                    "table_id", flat=True
+                )
+            ),
         )
         # bkci 访问 p4 主机数据对应的结果表
-        p4_tids = models.ResultTable.objects.filter(table_id__startswith=P4_1001_TABLE_ID_PREFIX).values_list(
-            "table_id", flat=True
+        p4_tids = self._get_shared_data(
+            "p4_1001_table_ids",
+            lambda: list(
+                models.ResultTable.objects.filter(table_id__startswith=P4_1001_TABLE_ID_PREFIX).values_list(
+                    "table_id", flat=True
+                )
+            ),
         )
         # 组装结果表对应的 filter
         tid_filters = {tid: {"filters": [{"projectId": space_id}]} for tid in tids}
@@ -482,9 +588,8 @@ class SpaceTableIDRedis:
         """组装非业务类型的全空间类型的结果表数据"""
         logger.info("start to push all space type table_id, space_type: %s, space_id: %s", space_type, space_id)
         # 转换空间对应的bk_biz_id
-        try:
-            _id = models.Space.objects.get(space_type_id=space_type, space_id=space_id).id
-        except models.Space.DoesNotExist:
+        _id = self._get_space_pk(space_type, space_id)
+        if _id is None:
             return {}
         return {tid: {"filters": [{"bk_biz_id": str(-_id)}]} for tid in ALL_SPACE_TYPE_TABLE_ID_LIST}
 
@@ -671,17 +776,59 @@ class SpaceTableIDRedis:
         """组装预计算的结果表"""
         from metadata.models.record_rule.rules import RecordRule
 
-        objs = RecordRule.objects.filter(space_type=space_type, space_id=space_id)
-        return {obj.table_id: {"filters": []} for obj in objs}
+        if self._shared_data is None:
+            objs = RecordRule.objects.filter(space_type=space_type, space_id=space_id)
+            return {obj.table_id: {"filters": []} for obj in objs}
+
+        def _load():
+            space_tids = defaultdict(list)
+            for obj in RecordRule.objects.values("space_type", "space_id", "table_id"):
+                space_tids[(obj["space_type"], obj["space_id"])].append(obj["table_id"])
+            return space_tids
+
+        tids = self._get_shared_data("record_rule_table_ids", _load).get((space_type, space_id), [])
+        return {tid: {"filters": []} for tid in tids}
 
     def _compose_es_table_ids(self, space_type: str, space_id: str):
         """组装es的结果表"""
-        biz_id = models.Space.objects.get_biz_id_by_space(space_type, space_id)
-        tids = models.ResultTable.objects.filter(
-            bk_biz_id=biz_id, default_storage=models.ClusterInfo.TYPE_ES, is_deleted=False, is_enable=True
-        ).values_list("table_id", flat=True)
+        if self._shared_data is None:
+            biz_id = models.Space.objects.get_biz_id_by_space(space_type, space_id)
+            tids = models.ResultTable.objects.filter(
+                bk_biz_id=biz_id, default_storage=models.ClusterInfo.TYPE_ES, is_deleted=False, is_enable=True
+            ).values_list("table_id", flat=True)
+            return {tid: {"filters": []} for tid in tids}
+
+        def _load():
+            biz_tids = defaultdict(list)
+            for rt in models.ResultTable.objects.filter(
+                default_storage=models.ClusterInfo.TYPE_ES, is_deleted=False, is_enable=True
+            ).values("bk_biz_id", "table_id"):
+                biz_tids[rt["bk_biz_id"]].append(rt["table_id"])
+            return biz_tids
+
+        # 与 get_biz_id_by_space 保持一致，非bkcc空间类型的业务ID为负值
+        _id = self._get_space_pk(space_type, space_id)
+        if _id is None:
+            return {}
+        biz_id = int(space_id) if space_type == SpaceTypes.BKCC.value else -_id
+        tids = self._get_shared_data("es_table_ids", _load).get(biz_id, [])
         return {tid: {"filters": []} for tid in tids}
 
+    def _get_space_pk(self, space_type: str, space_id: str) -> Optional[int]:
+        """获取空间的自增ID，空间不存在时返回 None"""
+        if self._shared_data is None:
+            obj = models.Space.objects.filter(space_type_id=space_type, space_id=space_id).only("id").first()
+            return obj.id if obj else None
+
+        space_pks = self._get_shared_data(
+            "space_pks",
+            lambda: {
+                (space["space_type_id"], space["space_id"]): space["id"]
+                for space in models.Space.objects.values("id", "space_type_id", "space_id")
+            },
+        )
+        return space_pks.get((space_type, space_id))
+
     def _is_need_filter_for_bkcc(
         self,
         measurement_type: str,
@@ -752,6 +899,13 @@ class SpaceTableIDRedis:
 
     def _refine_table_ids(self, table_id_list: Optional[List] = None) -> Set:
         """提取写入到influxdb或vm的结果表数据"""
+        if self._shared_data is not None:
+            # 一次加载全部写入 influxdb 和 vm 的结果表，在内存中过滤
+            table_ids = self._get_shared_data("refined_table_ids", self._query_refined_table_ids)
+            return table_ids & set(table_id_list) if table_id_list else set(table_ids)
+        return self._query_refined_table_ids(table_id_list)
+
+    def _query_refined_table_ids(self, table_id_list: Optional[List] = None) -> Set:
         # 过滤写入 influxdb 的结果表
         influxdb_table_ids = models.InfluxDBStorage.objects.values_list("table_id", flat=True)
         if table_id_list:
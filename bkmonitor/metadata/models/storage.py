@@ -2241,10 +2241,17 @@ class ESStorage(models.Model, StorageResultTable):
 
     def get_client(self):
         """获取该结果表的客户端句柄"""
+        if getattr(self, "_shared_client", None) is not None:
+            return self._shared_client
         return es_tools.get_client(self.storage_cluster_id)
 
     es_client = cached_property(get_client, name="es_client")
 
+    def use_client(self, es_client):
+        """指定结果表使用的客户端，按集群批量管理索引生命周期时，同一集群的结果表共享集群状态"""
+        self._shared_client = es_client
+        self.__dict__["es_client"] = es_client
+
     def add_field(self, field):
         """需要修改ES的mapping"""
         pass
@@ -0,0 +1,522 @@
+# -*- coding: utf-8 -*-
+"""
+Tencent is pleased to support the open source community by making 蓝鲸智云 - 监控平台 (BlueKing - Monitor) available.
+Copyright (C) 2017-2021 THL A29 Limited, a Tencent company. All rights reserved.
+Licensed under the MIT License (the "License"); you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://opensource.org/licenses/MIT
+Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on
+an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the
+specific language governing permissions and limitations under the License.
+
+ES 索引生命周期的集群维度批量管理
+
+按集群一次性拉取索引统计、别名、分配配置及快照，结果表的生命周期逻辑(ESStorage 中的方法)通过 ClusterStateClient
+读取内存中的集群状态，别名变更及冷热分配在集群维度合并后批量提交。
+"""
+
+import fnmatch
+import functools
+import logging
+import time
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import elasticsearch
+import elasticsearch5
+import elasticsearch6
+
+from metadata import models
+from metadata.utils import es_tools
+
+logger = logging.getLogger("metadata")
+
+NOT_FOUND_ERRORS = (elasticsearch5.NotFoundError, elasticsearch.NotFoundError, elasticsearch6.NotFoundError)
+
+
+class ESClusterState:
+    """ES 集群的索引状态，集群维度一次拉取，后续读取均在内存中完成"""
+
+    ALLOCATION_SETTING_PREFIX = "index.routing.allocation."
+
+    def __init__(self, es_client):
+        self.es_client = es_client
+        # 格式: {index_name: {"size": 主分片大小(byte), "count": 主分片文档数}}
+        self.indices: Dict[str, Dict] = {}
+        # 格式: {index_name: {alias_name, ...}}
+        self.aliases: Dict[str, Set[str]] = {}
+        # 索引的分配配置，按需加载，格式: {index_name: {"index.routing.allocation.include.box_type": "warm"}}
+        self.allocation_settings: Optional[Dict[str, Dict]] = None
+        # 快照按仓库加载，格式: {repository: [snapshot, ...]}，仓库不存在时为 None
+        self.snapshots: Dict[str, Optional[List[Dict]]] = {}
+        # 实际发送到集群的请求计数
+        self.requests = Counter()
+
+    def load(self):
+        """拉取集群的索引统计及别名"""
+        self.requests["indices.stats"] += 1
+        stats = self.es_client.indices.stats(
+            metric="store,docs",
+            filter_path="indices.*.primaries.store.size_in_bytes,indices.*.primaries.docs.count",
+        )
+        for index_name, stat in (stats.get("indices") or {}).items():
+            primaries = stat.get("primaries") or {}
+            self.indices[index_name] = {
+                "size": (primaries.get("store") or {}).get("size_in_bytes", 0),
+                "count": (primaries.get("docs") or {}).get("count", 0),
+            }
+
+        self.requests["indices.get_alias"] += 1
+        alias_info = self.es_client.indices.get_alias()
+        self.aliases = {
+            index_name: set((info.get("aliases") or {}).keys())
+            for index_name, info in alias_info.items()
+            if index_name in self.indices
+        }
+        for index_name in self.indices:
+            self.aliases.setdefault(index_name, set())
+
+    def match_indices(self, pattern: str) -> List[str]:
+        return [index_name for index_name in self.indices if fnmatch.fnmatchcase(index_name, pattern)]
+
+    def get_allocation_settings(self, index_name: str) -> Dict:
+        if self.allocation_settings is None:
+            self.requests["indices.get_settings"] += 1
+            settings = self.es_client.indices.get_settings(
+                name=f"{self.ALLOCATION_SETTING_PREFIX}*", flat_settings=True
+            )
+            self.allocation_settings = {name: info.get("settings") or {} for name, info in settings.items()}
+        return self.allocation_settings.get(index_name) or {}
+
+    def get_snapshots(self, repository: str) -> Optional[List[Dict]]:
+        if repository not in self.snapshots:
+            self.requests["snapshot.get"] += 1
+            try:
+                self.snapshots[repository] = self.es_client.snapshot.get(repository, "*").get("snapshots", [])
+            except NOT_FOUND_ERRORS:
+                self.snapshots[repository] = None
+        return self.snapshots[repository]
+
+    def add_index(self, index_name: str):
+        self.indices[index_name] = {"size": 0, "count": 0}
+        self.aliases[index_name] = set()
+
+    def remove_index(self, index_name: str):
+        self.indices.pop(index_name, None)
+        self.aliases.pop(index_name, None)
+        if self.allocation_settings is not None:
+            self.allocation_settings.pop(index_name, None)
+
+
+class _IndicesClient:
+    """索引相关接口，读取走集群状态，别名变更暂存待批量提交"""
+
+    # 可直接透传到集群的只读接口
+    READ_ONLY_APIS = {"exists", "exists_alias", "get", "get_mapping", "get_settings", "get_template"}
+
+    def __init__(self, client: "ClusterStateClient"):
+        self._client = client
+        self._state = client.state
+
+    def __getattr__(self, item):
+        return self._client.passthrough(self._state.es_client.indices, "indices.", item, self.READ_ONLY_APIS)
+
+    def stats(self, index=None, metric=None, **kwargs):
+        # 指定统计项时需要实时数据，如快照时记录的索引大小
+        if metric:
+            self._state.requests["indices.stats"] += 1
+            return self._state.es_client.indices.stats(index=index, metric=metric, **kwargs)
+        index_names = self._state.match_indices(index or "*")
+        return {
+            "indices": {
+                index_name: {"primaries": {"store": {"size_in_bytes": self._state.indices[index_name]["size"]}}}
+                for index_name in index_names
+            }
+        }
+
+    def get_alias(self, index=None, name=None, **kwargs):
+        if name:
+            data = {
+                index_name: {"aliases": {name: {}}}
+                for index_name, aliases in self._state.aliases.items()
+                if name in aliases and (not index or fnmatch.fnmatchcase(index_name, index))
+            }
+            if not data:
+                raise elasticsearch.NotFoundError(404, "alias [{}] missing".format(name))
+            return data
+        return {
+            index_name: {"aliases": {alias: {} for alias in self._state.aliases[index_name]}}
+            for index_name in self._state.match_indices(index or "*")
+        }
+
+    def update_aliases(self, body, **kwargs):
+        self._client.add_alias_actions(body["actions"])
+        return {"acknowledged": True}
+
+    def put_alias(self, index, name, **kwargs):
+        self._client.add_alias_actions([{"add": {"index": index, "alias": name}}])
+        return {"acknowledged": True}
+
+    def delete_alias(self, index, name, **kwargs):
+        self._client.add_alias_actions([{"remove": {"index": index, "alias": alias}} for alias in name.split(",")])
+        return {"acknowledged": True}
+
+    def create(self, index, body=None, **kwargs):
+        result = self._client.execute(
+            "indices.create", self._state.es_client.indices.create, index=index, body=body, **kwargs
+        )
+        self._state.add_index(index)
+        return result
+
+    def delete(self, index, **kwargs):
+        # 删除索引时，先提交涉及该索引的别名变更，避免批量提交时索引已不存在
+        self._client.flush_aliases(index_name=index)
+        result = self._client.execute("indices.delete", self._state.es_client.indices.delete, index=index, **kwargs)
+        self._state.remove_index(index)
+        return result
+
+
+class _SnapshotClient:
+    """快照相关接口，快照列表按仓库一次拉取"""
+
+    READ_ONLY_APIS = {"get_repository", "status"}
+
+    def __init__(self, client: "ClusterStateClient"):
+        self._client = client
+        self._state = client.state
+
+    def __getattr__(self, item):
+        return self._client.passthrough(self._state.es_client.snapshot, "snapshot.", item, self.READ_ONLY_APIS)
+
+    def get(self, repository, snapshot, **kwargs):
+        snapshots = self._state.get_snapshots(repository)
+        if snapshots is None:
+            raise elasticsearch.NotFoundError(404, "repository [{}] missing".format(repository))
+        return {"snapshots": [s for s in snapshots if fnmatch.fnmatchcase(s.get("snapshot", ""), snapshot)]}
+
+    def create(self, repository, snapshot, body=None, **kwargs):
+        result = self._client.execute(
+            "snapshot.create", self._state.es_client.snapshot.create, repository, snapshot, body, **kwargs
+        )
+        snapshots = self._state.get_snapshots(repository)
+        if snapshots is not None:
+            snapshots.append({"snapshot": snapshot, "state": "IN_PROGRESS"})
+        return result
+
+    def delete(self, repository, snapshot, **kwargs):
+        result = self._client.execute(
+            "snapshot.delete", self._state.es_client.snapshot.delete, repository, snapshot, **kwargs
+        )
+        snapshots = self._state.get_snapshots(repository)
+        if snapshots is not None:
+            self._state.snapshots[repository] = [s for s in snapshots if s.get("snapshot") != snapshot]
+        return result
+
+
+class ClusterStateClient:
+    """
+    基于集群状态的 ES 客户端，提供 ESStorage 生命周期管理用到的接口
+    - 索引统计、别名、快照列表从集群状态中读取
+    - 别名变更先应用到集群状态，过滤掉无效的操作后暂存，由调用方批量提交
+    - dry_run 时所有变更仅应用到集群状态，不提交到集群
+    - 未声明为只读的透传接口均视为变更操作，dry_run 时不提交到集群
+    """
+
+    READ_ONLY_APIS = {"info", "ping", "get", "mget", "search", "msearch"}
+
+    def __init__(self, state: ESClusterState, dry_run: bool = False):
+        self.state = state
+        self.dry_run = dry_run
+        self.indices = _IndicesClient(self)
+        self.snapshot = _SnapshotClient(self)
+        # 暂存的别名变更，按结果表分组，批量提交失败时可按结果表重试
+        self.pending_alias_actions: Dict[str, List[Dict]] = defaultdict(list)
+        self.current_table_id = ""
+        # 计划执行的变更计数，dry_run 时即为将要执行的变更
+        self.actions = Counter()
+
+    def __getattr__(self, item):
+        return self.passthrough(self.state.es_client, "", item, self.READ_ONLY_APIS)
+
+    def passthrough(self, es_client, prefix: str, item: str, read_only_apis: Set[str]):
+        """透传未实现的接口，只读接口直接请求集群，其余接口按变更操作执行"""
+        func = getattr(es_client, item)
+        if item in read_only_apis:
+            self.state.requests[f"{prefix}{item}"] += 1
+            return func
+        return functools.partial(self.execute, f"{prefix}{item}", func)
+
+    def count(self, index, **kwargs):
+        if index in self.state.indices:
+            return {"count": self.state.indices[index]["count"]}
+        self.state.requests["count"] += 1
+        return self.state.es_client.count(index=index, **kwargs)
+
+    def execute(self, action: str, func, *args, **kwargs):
+        """执行变更操作"""
+        self.actions[action] += 1
+        if self.dry_run:
+            logger.info(
+                "[es lifecycle] dry run, table_id->[%s] skip %s: %s", self.current_table_id, action, args or kwargs
+            )
+            return {"acknowledged": True}
+        self.state.requests[action] += 1
+        return func(*args, **kwargs)
+
+    def add_alias_actions(self, actions: List[Dict]):
+        """应用别名变更到集群状态，已生效的变更不再提交"""
+        for action in actions:
+            op, params = next(iter(action.items()))
+            index_name, alias = params["index"], params["alias"]
+            aliases = self.state.aliases.get(index_name)
+            if aliases is None:
+                continue
+            if op == "add":
+                if alias in aliases:
+                    continue
+                aliases.add(alias)
+            elif op == "remove":
+                if alias not in aliases:
+                    continue
+                aliases.discard(alias)
+            self.pending_alias_actions[self.current_table_id].append(action)
+
+    def flush_aliases(
+        self, batch_size: int = 500, index_name: Optional[str] = None, table_ids: Optional[Iterable[str]] = None
+    ):
+        """
+        批量提交暂存的别名变更
+        :param index_name: 仅提交涉及该索引的结果表的变更
+        :param table_ids: 仅提交指定结果表的变更
+        """
+        if table_ids is None:
+            table_ids = list(self.pending_alias_actions.keys())
+        table_ids = [table_id for table_id in table_ids if table_id in self.pending_alias_actions]
+        if index_name:
+            table_ids = [
+                table_id
+                for table_id in table_ids
+                if any(
+                    next(iter(action.values()))["index"] == index_name
+                    for action in self.pending_alias_actions[table_id]
+                )
+            ]
+
+        groups, action_count = [], 0
+        for table_id in table_ids:
+            actions = self.pending_alias_actions.pop(table_id)
+            groups.append((table_id, actions))
+            action_count += len(actions)
+            if action_count >= batch_size:
+                self._submit_alias_actions(groups)
+                groups, action_count = [], 0
+        if groups:
+            self._submit_alias_actions(groups)
+
+    def _submit_alias_actions(self, groups: List[Tuple[str, List[Dict]]]):
+        actions = [action for __, table_actions in groups for action in table_actions]
+        try:
+            self.execute(
+                "indices.update_aliases", self.state.es_client.indices.update_aliases, body={"actions": actions}
+            )
+        except Exception as e:
+            # 别名变更是原子的，批量失败时按结果表逐个提交，避免单个结果表影响整批
+            if len(groups) <= 1:
+                logger.error("[es lifecycle] table_id->[%s] update aliases failed: %s", groups[0][0], e)
+                return
+            logger.warning("[es lifecycle] batch update aliases failed, retry by table_id, error: %s", e)
+            for group in groups:
+                self._submit_alias_actions([group])
+
+
+class ESLifecyclePlanner:
+    """
+    ES 集群维度的索引生命周期管理
+
+    生命周期逻辑与逐个结果表执行时一致，区别在于
+    1. 集群状态(索引统计、别名、分配配置、快照)一次拉取，结果表之间共享
+    2. 已生效的别名不再重复提交，其余别名变更按集群合并批量提交
+    3. 冷热分配按配置合并，批量更新索引配置
+    """
+
+    # 单次批量更新别名的操作数
+    ALIAS_BATCH_SIZE = 500
+    # 单次更新分配配置的索引数，避免请求地址过长
+    ALLOCATION_BATCH_SIZE = 100
+
+    def __init__(self, cluster_id: int, dry_run: bool = False):
+        self.cluster_id = cluster_id
+        self.dry_run = dry_run
+        self.state = ESClusterState(es_tools.get_client(cluster_id))
+        self.client = ClusterStateClient(self.state, dry_run=dry_run)
+        # 待分配的索引，格式: {(配置项, 配置值): [index_name, ...]}
+        self.reallocations: Dict[Tuple[str, str], List[str]] = defaultdict(list)
+
+    def run(self, es_storages: Iterable["models.ESStorage"]) -> Dict:
+        """
+        执行集群下结果表的生命周期管理
+        :return: 执行报告
+        """
+        timings = {}
+        start_time = time.time()
+        self.state.load()
+        timings["load_state"] = time.time() - start_time
+
+        plan_start_time = time.time()
+        succeed, failed = [], []
+        for es_storage in es_storages:
+            if es_storage.storage_cluster_id != self.cluster_id:
+                logger.warning(
+                    "[es lifecycle] table_id->[%s] not belong to cluster->[%s], skip",
+                    es_storage.table_id,
+                    self.cluster_id,
+                )
+                continue
+            if self.manage(es_storage):
+                succeed.append(es_storage.table_id)
+            else:
+                failed.append(es_storage.table_id)
+        timings["plan"] = time.time() - plan_start_time
+
+        apply_start_time = time.time()
+        self.client.flush_aliases(batch_size=self.ALIAS_BATCH_SIZE)
+        self.apply_reallocations()
+        timings["apply"] = time.time() - apply_start_time
+        timings["total"] = time.time() - start_time
+
+        report = {
+            "cluster_id": self.cluster_id,
+            "dry_run": self.dry_run,
+            "index_count": len(self.state.indices),
+            "succeed_count": len(succeed),
+            "failed_table_ids": failed,
+            "timings": {key: round(value, 3) for key, value in timings.items()},
+            "requests": dict(self.state.requests),
+            "actions": dict(self.client.actions),
+        }
+        logger.info("[es lifecycle] cluster->[%s] lifecycle finished, report: %s", self.cluster_id, report)
+        return report
+
+    def manage(self, es_storage: "models.ESStorage") -> bool:
+        """管理单个结果表的索引生命周期，与 _manage_es_storage 的流程保持一致"""
+        self.client.current_table_id = es_storage.table_id
+        es_storage.use_client(self.client)
+        created_count = self.client.actions["indices.create"]
+        try:
+            if not es_storage.index_exist():
+                logger.info("table_id->[%s] found no index in es,will create new one", es_storage.table_id)
+                es_storage.create_index_and_aliases(es_storage.slice_gap)
+            else:
+                es_storage.update_index_and_aliases(ahead_time=es_storage.slice_gap)
+
+            # 新建索引后，写入别名需要尽快指向新索引，不等待批量提交
+            if self.client.actions["indices.create"] != created_count:
+                self.client.flush_aliases(table_ids=[es_storage.table_id])
+
+            # 快照的创建及清理会同步写入快照索引记录，dry_run 时仅计算需要执行的快照变更
+            if self.dry_run:
+                self.plan_create_snapshot(es_storage)
+            else:
+                es_storage.create_snapshot()
+            es_storage.clean_index_v2()
+            if self.dry_run:
+                self.plan_clean_snapshot(es_storage)
+            else:
+                es_storage.clean_snapshot()
+            self.plan_reallocation(es_storage)
+        except Exception as e:
+            logger.error(
+                "es_storage: %s index lifecycle failed, cluster_id: %s, error: %s",
+                es_storage.table_id,
+                self.cluster_id,
+                e,
+            )
+            return False
+        return True
+
+    def plan_create_snapshot(self, es_storage: "models.ESStorage"):
+        """计算需要创建的快照，与 ESStorage.create_snapshot 的判断逻辑一致，不写入快照索引记录"""
+        if not es_storage.can_snapshot or es_storage.is_snapshot_stopped:
+            return
+
+        now = es_storage.now
+        current_snapshot_info = es_storage.current_snapshot_info()
+        if current_snapshot_info["datetime"]:
+            if current_snapshot_info["datetime"].day == now.day or not current_snapshot_info["is_success"]:
+                return
+
+        expired_index = es_storage.expired_index()
+        if not expired_index:
+            return
+        self.client.snapshot.create(
+            es_storage.snapshot_obj.target_snapshot_repository_name,
+            es_storage.make_snapshot_name(now, es_storage.index_name),
+            {"indices": ",".join(expired_index), "include_global_state": False},
+        )
+
+    def plan_clean_snapshot(self, es_storage: "models.ESStorage"):
+        """计算需要清理的过期快照，与 ESStorage.clean_snapshot 的判断逻辑一致，不删除快照索引记录"""
+        if not es_storage.can_delete_snapshot:
+            return
+
+        snapshot_obj = es_storage.snapshot_obj
+        for expired_snapshot in es_storage.get_expired_snapshot(snapshot_obj.snapshot_days):
+            self.client.snapshot.delete(snapshot_obj.target_snapshot_repository_name, expired_snapshot.get("snapshot"))
+
+    def plan_reallocation(self, es_storage: "models.ESStorage"):
+        """计算需要切换到暖数据节点的索引，与 ESStorage.reallocate_index 的筛选逻辑一致"""
+        if es_storage.warm_phase_days <= 0:
+            return
+
+        warm_phase_settings = es_storage.warm_phase_settings
+        setting_name = "{}{}.{}".format(
+            ESClusterState.ALLOCATION_SETTING_PREFIX,
+            warm_phase_settings["allocation_type"],
+            warm_phase_settings["allocation_attr_name"],
+        )
+        setting_value = warm_phase_settings["allocation_attr_value"]
+
+        alias_list = self.client.indices.get_alias(index=f"*{es_storage.index_name}_*_*")
+        filter_result = es_storage.group_expired_alias(
+            alias_list, es_storage.warm_phase_days, need_delay_delete_alias=False
+        )
+        # 如果存在未过期的别名，那说明这个索引仍在被写入，不能把它切换到冷节点；已经分配过的索引同样跳过
+        index_list = [
+            index_name
+            for index_name, alias in filter_result.items()
+            if not alias["not_expired_alias"]
+            and self.state.get_allocation_settings(index_name).get(setting_name) != setting_value
+        ]
+        if index_list:
+            logger.info("table_id->[%s] ready to reallocate index_list: %s", es_storage.table_id, index_list)
+            self.reallocations[(setting_name, setting_value)].extend(index_list)
+
+    def apply_reallocations(self):
+        """按分配配置合并，批量更新索引配置"""
+        for (setting_name, setting_value), index_list in self.reallocations.items():
+            for start in range(0, len(index_list), self.ALLOCATION_BATCH_SIZE):
+                index_names = index_list[start : start + self.ALLOCATION_BATCH_SIZE]
+                try:
+                    self.client.execute(
+                        "indices.put_settings",
+                        self.state.es_client.indices.put_settings,
+                        index=",".join(index_names),
+                        body={setting_name: setting_value},
+                    )
+                except Exception as e:
+                    logger.exception("[es lifecycle] reallocate index->[%s] failed: %s", index_names, e)
+        self.reallocations.clear()
+
+
+def manage_es_storage_by_cluster(es_storages: Iterable["models.ESStorage"], dry_run: bool = False) -> List[Dict]:
+    """按集群批量管理结果表的索引生命周期"""
+    cluster_storages = defaultdict(list)
+    for es_storage in es_storages:
+        cluster_storages[es_storage.storage_cluster_id].append(es_storage)
+
+    reports = []
+    for cluster_id, storages in cluster_storages.items():
+        try:
+            reports.append(ESLifecyclePlanner(cluster_id, dry_run=dry_run).run(storages))
+        except Exception as e:
+            logger.exception("[es lifecycle] cluster->[%s] lifecycle failed: %s", cluster_id, e)
+    return reports
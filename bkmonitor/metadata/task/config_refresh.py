@@ -21,6 +21,7 @@ from django.utils.translation import ugettext as _
 from alarm_backends.core.lock.service_lock import share_lock
 from metadata import models
 from metadata.config import (
+    ES_LIFECYCLE_CLUSTER_PLAN_STEP,
     KAFKA_SASL_MECHANISM,
     KAFKA_SASL_PROTOCOL,
     PERIODIC_TASK_DEFAULT_TTL,
@@ -270,6 +271,11 @@ def refresh_es_storage():
     ).values_list("table_id", flat=True)
     es_storages = es_storages.filter(table_id__in=table_id_list)
 
+    # 按集群批量管理时，同一集群的结果表尽量放在同一个任务中，减少集群状态的拉取次数
+    if settings.ENABLE_ES_LIFECYCLE_CLUSTER_PLAN:
+        es_storages = es_storages.order_by("storage_cluster_id", "table_id")
+        step = ES_LIFECYCLE_CLUSTER_PLAN_STEP
+
     count = es_storages.count()
     for s in range(start, count, step):
         manage_es_storage.delay(es_storages[s : s + step])
@@ -47,7 +47,6 @@ from metadata.models.vm.constants import (
     QUERY_VM_SPACE_UID_CHANNEL_KEY,
     QUERY_VM_SPACE_UID_LIST_KEY,
 )
-from metadata.task.utils import bulk_handle
 from metadata.utils.redis_tools import RedisTools
 
 logger = logging.getLogger("metadata")
@@ -486,7 +485,6 @@ def push_and_publish_space_router(
     is_publish: Optional[bool] = True,
 ):
     """推送数据和通知"""
-    from metadata.models.space.constants import SPACE_TO_RESULT_TABLE_CHANNEL
     from metadata.models.space.ds_rt import get_space_table_id_data_id
     from metadata.task.tasks import multi_push_space_table_ids
 
@@ -503,13 +501,8 @@ def push_and_publish_space_router(
     # 拼装数据
     space_list = [{"space_type": space["space_type_id"], "space_id": space["space_id"]} for space in spaces]
 
-    # 批量处理
-    bulk_handle(multi_push_space_table_ids, space_list)
-
-    # 通知到使用方
-    if is_publish:
-        space_uid_list = [f"{space['space_type_id']}__{space['space_id']}" for space in spaces]
-        RedisTools.publish(SPACE_TO_RESULT_TABLE_CHANNEL, space_uid_list)
+    # 批量处理，仅推送并通知有变化的空间
+    multi_push_space_table_ids(space_list, is_publish=is_publish)
 
     # 更新数据
     from metadata.models.space.space_table_id_redis import SpaceTableIDRedis
@@ -719,6 +712,6 @@ def refresh_bksaas_space_resouce():
 
     space_ids = [{"space_type": space_type, "space_id": space["app_code"]} for space in space_id_list]
     # NOTE: 此时集群或者公共插件相关的信息已经存在了，不需要再进行指标或 data_label 的映射
-    bulk_handle(multi_push_space_table_ids, space_ids)
+    multi_push_space_table_ids(space_ids)
 
     logger.info("refresh bksaas space resource successfully")
@@ -21,7 +21,6 @@ from django.utils.translation import ugettext as _
 from alarm_backends.service.scheduler.app import app
 from metadata import models
 from metadata.task.utils import bulk_handle
-from metadata.utils.redis_tools import RedisTools
 
 logger = logging.getLogger("metadata")
 
@@ -158,6 +157,13 @@ def update_time_series_metrics(time_series_metrics):
 @app.task(ignore_result=True, queue="celery_report_cron")
 def manage_es_storage(es_storages):
     """并发管理 ES 存储。"""
+    # 按集群批量管理，集群状态一次拉取，别名及分配配置的变更合并提交
+    if settings.ENABLE_ES_LIFECYCLE_CLUSTER_PLAN:
+        from metadata.service.es_lifecycle import manage_es_storage_by_cluster
+
+        manage_es_storage_by_cluster(es_storages)
+        return
+
     with ThreadPoolExecutor(max_workers=10) as executor:
         executor.map(_manage_es_storage, es_storages)
 
@@ -225,10 +231,7 @@ def push_and_publish_space_router(
         space_id,
         json.dumps(table_id_list),
     )
-    from metadata.models.space.constants import (
-        SPACE_TO_RESULT_TABLE_CHANNEL,
-        SpaceTypes,
-    )
+    from metadata.models.space.constants import SpaceTypes
     from metadata.models.space.ds_rt import get_space_table_id_data_id
     from metadata.models.space.space_table_id_redis import SpaceTableIDRedis
 
@@ -247,12 +250,8 @@ def push_and_publish_space_router(
         space_ids = models.Space.objects.filter(space_type_id=space_type).values_list("space_id", flat=True)
         # 拼装数据
         space_list = [{"space_type": space_type, "space_id": space_id} for space_id in space_ids]
-        # 使用线程处理
-        bulk_handle(multi_push_space_table_ids, space_list)
-
-        # 通知到使用方
-        push_redis_keys = [f"{space_type}__{space_id}" for space_id in space_ids]
-        RedisTools.publish(SPACE_TO_RESULT_TABLE_CHANNEL, push_redis_keys)
+        # 推送并通知有变化的空间
+        multi_push_space_table_ids(space_list, is_publish=True)
 
     # 更新数据
     space_client.push_data_label_table_ids(table_id_list=table_id_list, is_publish=True)
@@ -261,19 +260,30 @@ def push_and_publish_space_router(
     logger.info("push and publish space_type: %s, space_id: %s router successfully", space_type, space_id)
 
 
-def multi_push_space_table_ids(space_list: List[Dict]):
-    """批量推送数据"""
+def multi_push_space_table_ids(space_list: List[Dict], is_publish: Optional[bool] = False) -> List[str]:
+    """批量推送数据
+
+    公共数据仅加载一次，多线程组装空间路由后与 redis 中的数据比对，仅写入并通知有变化的空间
+    :return: 有变化的空间 UID 列表
+    """
     logger.info("start to multi push space table ids")
     from metadata.models.space.space_table_id_redis import SpaceTableIDRedis
 
+    if not space_list:
+        return []
+
     space_client = SpaceTableIDRedis()
-    for space in space_list:
-        try:
-            space_client.push_space_table_ids(space_type=space["space_type"], space_id=space["space_id"])
-        except Exception as e:
-            logger.error("push space to redis error, %s", e)
+    space_client.enable_shared_data()
+    space_values = {}
+
+    def _compose(spaces: List[Dict]):
+        space_values.update(space_client.compose_multi_space_table_ids(spaces))
+
+    bulk_handle(_compose, space_list)
+    changed_space_uid_list = space_client.push_changed_space_table_ids(space_values, is_publish=is_publish)
 
-    logger.info("multi push space table ids successfully")
+    logger.info("multi push space table ids successfully, changed: %s", len(changed_space_uid_list))
+    return changed_space_uid_list
 
 
 def _access_bkdata_vm(bk_biz_id: int, table_id: str, data_id: int):
@@ -14,12 +14,15 @@ import json
 import pytest
 
 from metadata.models.space import ds_rt
+from metadata.models.space.constants import SPACE_TO_RESULT_TABLE_CHANNEL
 from metadata.models.space.space_table_id_redis import SpaceTableIDRedis
 
 from .conftest import (
     DEFAULT_DATA_ID,
     DEFAULT_EVENT_ES_TABLE_ID,
     DEFAULT_LOG_ES_TABLE_ID,
+    DEFAULT_SPACE_ID,
+    DEFAULT_SPACE_TYPE,
     DEFAULT_TABLE_ID,
 )
 
@@ -69,3 +72,36 @@ def test_compose_es_table_id_detail(create_and_delete_record):
     for key in ["db", "measurement", "storage_id"]:
         assert key in data[DEFAULT_LOG_ES_TABLE_ID]
         assert key in data[f"{DEFAULT_EVENT_ES_TABLE_ID}.__default__"]
+
+
+def test_push_changed_space_table_ids(create_and_delete_record, mocker):
+    space_list = [{"space_type": DEFAULT_SPACE_TYPE, "space_id": DEFAULT_SPACE_ID}]
+    space_uid = f"{DEFAULT_SPACE_TYPE}__{DEFAULT_SPACE_ID}"
+    expected_values = SpaceTableIDRedis().compose_multi_space_table_ids(space_list)
+    assert DEFAULT_TABLE_ID in expected_values[space_uid]
+
+    # 复用公共数据时，组装结果与逐空间查询一致
+    client = SpaceTableIDRedis()
+    client.enable_shared_data()
+    space_values = client.compose_multi_space_table_ids(space_list)
+    assert space_values == expected_values
+
+    redis_data = {}
+    mocker.patch(
+        "metadata.utils.redis_tools.RedisTools.hmget",
+        side_effect=lambda key, fields: [redis_data.get(field) for field in fields],
+    )
+    mocked_hmset = mocker.patch(
+        "metadata.utils.redis_tools.RedisTools.hmset_to_redis",
+        side_effect=lambda key, field_value: redis_data.update(field_value),
+    )
+    mocked_publish = mocker.patch("metadata.utils.redis_tools.RedisTools.publish")
+
+    assert client.push_changed_space_table_ids(space_values, is_publish=True) == [space_uid]
+    assert json.loads(redis_data[space_uid]) == space_values[space_uid]
+    mocked_publish.assert_called_once_with(SPACE_TO_RESULT_TABLE_CHANNEL, [space_uid])
+
+    # 数据未变化时，不写入也不通知
+    assert client.push_changed_space_table_ids(space_values, is_publish=True) == []
+    assert mocked_hmset.call_count == 1
+    assert mocked_publish.call_count == 1
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Tencent is pleased to support the open source community by making 蓝鲸智云 - 监控平台 (BlueKing - Monitor) available.
+Copyright (C) 2017-2021 THL A29 Limited, a Tencent company. All rights reserved.
+Licensed under the MIT License (the "License"); you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://opensource.org/licenses/MIT
+Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on
+an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the
+specific language governing permissions and limitations under the License.
+"""
+from unittest import mock
+
+import elasticsearch
+import pytest
+
+from metadata.service.es_lifecycle import ClusterStateClient, ESClusterState, ESLifecyclePlanner
+
+INDEX_NAME = "v2_2_bklog_test_20240101_0"
+NEW_INDEX_NAME = "v2_2_bklog_test_20240102_0"
+WRITE_ALIAS = "write_20240101_2_bklog_test"
+READ_ALIAS = "2_bklog_test_20240101_read"
+
+
+@pytest.fixture
+def es_client():
+    client = mock.MagicMock()
+    client.indices.stats.return_value = {
+        "indices": {
+            INDEX_NAME: {"primaries": {"store": {"size_in_bytes": 1024}, "docs": {"count": 10}}},
+            "other_index": {"primaries": {"store": {"size_in_bytes": 1}, "docs": {"count": 0}}},
+        }
+    }
+    client.indices.get_alias.return_value = {
+        INDEX_NAME: {"aliases": {WRITE_ALIAS: {}, READ_ALIAS: {}}},
+        "other_index": {"aliases": {}},
+    }
+    return client
+
+
+def test_cluster_state_client__read_from_state(es_client):
+    state = ESClusterState(es_client)
+    state.load()
+    client = ClusterStateClient(state)
+
+    assert client.indices.stats("v2_2_bklog_test_*") == {
+        "indices": {INDEX_NAME: {"primaries": {"store": {"size_in_bytes": 1024}}}}
+    }
+    assert set(client.indices.get_alias(index="*2_bklog_test_*_*")[INDEX_NAME]["aliases"]) == {WRITE_ALIAS, READ_ALIAS}
+    assert list(client.indices.get_alias(name=WRITE_ALIAS)) == [INDEX_NAME]
+    with pytest.raises(elasticsearch.NotFoundError):
+        client.indices.get_alias(name="write_20240102_2_bklog_test")
+    assert client.count(index=INDEX_NAME) == {"count": 10}
+
+    # 集群状态仅拉取一次
+    assert es_client.indices.stats.call_count == 1
+    assert es_client.indices.get_alias.call_count == 1
+
+
+def test_cluster_state_client__batch_aliases(es_client):
+    state = ESClusterState(es_client)
+    state.load()
+    client = ClusterStateClient(state)
+
+    client.current_table_id = "2_bklog.test"
+    client.indices.create(index=NEW_INDEX_NAME, body={})
+    client.indices.update_aliases(
+        body={
+            "actions": [
+                # 已生效的别名不再提交
+                {"add": {"index": INDEX_NAME, "alias": READ_ALIAS}},
+                {"add": {"index": NEW_INDEX_NAME, "alias": "write_20240102_2_bklog_test"}},
+            ]
+        }
+    )
+    client.indices.delete_alias(index=INDEX_NAME, name=WRITE_ALIAS)
+    assert state.aliases[INDEX_NAME] == {READ_ALIAS}
+    es_client.indices.update_aliases.assert_not_called()
+
+    client.flush_aliases()
+    es_client.indices.update_aliases.assert_called_once_with(
+        body={
+            "actions": [
+                {"add": {"index": NEW_INDEX_NAME, "alias": "write_20240102_2_bklog_test"}},
+                {"remove": {"index": INDEX_NAME, "alias": WRITE_ALIAS}},
+            ]
+        }
+    )
+    assert client.actions == {"indices.create": 1, "indices.update_aliases": 1}
+
+
+def test_cluster_state_client__dry_run(es_client):
+    state = ESClusterState(es_client)
+    state.load()
+    client = ClusterStateClient(state, dry_run=True)
+
+    client.indices.create(index=NEW_INDEX_NAME, body={})
+    client.indices.delete(index=INDEX_NAME)
+    client.flush_aliases()
+
+    es_client.indices.create.assert_not_called()
+    es_client.indices.delete.assert_not_called()
+    # 变更仍然应用到集群状态，后续的计划基于变更后的状态
+    assert NEW_INDEX_NAME in state.indices
+    assert INDEX_NAME not in state.indices
+    assert client.actions == {"indices.create": 1, "indices.delete": 1}
+
+
+def test_cluster_state_client__dry_run_passthrough(es_client):
+    state = ESClusterState(es_client)
+    state.load()
+    client = ClusterStateClient(state, dry_run=True)
+
+    # 只读接口直接透传
+    client.indices.get_mapping(index=INDEX_NAME)
+    es_client.indices.get_mapping.assert_called_once_with(index=INDEX_NAME)
+
+    # 未声明为只读的接口视为变更操作，dry_run 时不提交到集群
+    client.indices.put_settings(index=INDEX_NAME, body={})
+    client.snapshot.delete_repository("repo")
+    client.delete_by_query(index=INDEX_NAME, body={})
+    es_client.indices.put_settings.assert_not_called()
+    es_client.snapshot.delete_repository.assert_not_called()
+    es_client.delete_by_query.assert_not_called()
+
+    client.indices.put_alias(index=INDEX_NAME, name="write_20240102_2_bklog_test")
+    es_client.indices.put_alias.assert_not_called()
+    assert "write_20240102_2_bklog_test" in state.aliases[INDEX_NAME]
+    assert client.actions == {"indices.put_settings": 1, "snapshot.delete_repository": 1, "delete_by_query": 1}
+
+
+def test_lifecycle_planner__dry_run_snapshot(es_client):
+    with mock.patch("metadata.service.es_lifecycle.es_tools.get_client", return_value=es_client):
+        planner = ESLifecyclePlanner(cluster_id=1, dry_run=True)
+    planner.state.load()
+    es_client.snapshot.get.return_value = {"snapshots": []}
+
+    es_storage = mock.MagicMock(
+        table_id="2_bklog.test", storage_cluster_id=1, index_name="2_bklog_test", warm_phase_days=0
+    )
+    es_storage.can_snapshot = True
+    es_storage.is_snapshot_stopped = False
+    es_storage.current_snapshot_info.return_value = {"datetime": None, "snapshot": None, "is_success": False}
+    es_storage.expired_index.return_value = [INDEX_NAME]
+    es_storage.make_snapshot_name.return_value = "2_bklog_test_snapshot_20240102"
+    es_storage.snapshot_obj.target_snapshot_repository_name = "repo"
+    es_storage.get_expired_snapshot.return_value = [{"snapshot": "2_bklog_test_snapshot_20231201"}]
+
+    assert planner.manage(es_storage)
+
+    # dry_run 时不调用会写入快照索引记录的方法，也不提交到集群
+    es_storage.create_snapshot.assert_not_called()
+    es_storage.clean_snapshot.assert_not_called()
+    es_client.snapshot.create.assert_not_called()
+    es_client.snapshot.delete.assert_not_called()
+    assert planner.client.actions["snapshot.create"] == 1
+    assert planner.client.actions["snapshot.delete"] == 1
@@ -16,13 +16,20 @@ from functools import reduce
 from itertools import chain
 from typing import Dict, List, Tuple
 
+from django.conf import settings
 from django.utils.translation import ugettext as _
 from django.utils.translation import ugettext_lazy as _lazy
-from elasticsearch_dsl import Q
+from elasticsearch_dsl import Q, Search
+from elasticsearch_dsl.response import Response
 from elasticsearch_dsl.response.aggs import BucketData
 from luqum.tree import FieldGroup, OrOperation, Phrase, SearchField, Word
 
-from bkmonitor.documents import ActionInstanceDocument, AlertDocument, AlertLog
+from bkmonitor.documents import (
+    ActionInstanceDocument,
+    AlertDocument,
+    AlertLog,
+    AlertRollupDocument,
+)
 from bkmonitor.models import ActionInstance, ConvergeRelation, MetricListCache, Shield
 from bkmonitor.strategy.new_strategy import get_metric_id
 from bkmonitor.utils.ip import exploded_ip
@@ -305,10 +312,11 @@ class AlertQueryHandler(BaseBizQueryHandler):
 
         return search_object
 
-    def search_raw(self, show_overview=False, show_aggs=False, show_dsl=False):
-        search_object = self.get_search_object()
-        search_object = self.add_conditions(search_object)
-        search_object = self.add_query_string(search_object)
+    def get_search_raw_object(self, show_overview=False, show_aggs=False) -> Search:
+        """
+        构造告警列表查询对象
+        """
+        search_object = self.get_filtered_search_object()
         search_object = self.add_ordering(search_object)
         search_object = self.add_pagination(search_object)
 
@@ -318,7 +326,11 @@ class AlertQueryHandler(BaseBizQueryHandler):
         if show_aggs:
             search_object = self.add_aggs(search_object)
 
-        search_result = search_object.params(track_total_hits=True).execute()
+        return search_object.params(track_total_hits=True)
+
+    def search_raw(self, show_overview=False, show_aggs=False, show_dsl=False):
+        search_object = self.get_search_raw_object(show_overview, show_aggs)
+        search_result = search_object.execute()
 
         if show_dsl:
             return search_result, search_object.to_dict()
@@ -335,6 +347,21 @@ class AlertQueryHandler(BaseBizQueryHandler):
             dsl = None
             exc = e
 
+        result = self.handle_search_result(search_result, show_overview, show_aggs)
+
+        if dsl:
+            result["dsl"] = dsl
+
+        if exc:
+            exc.data = result
+            raise exc
+
+        return result
+
+    def handle_search_result(self, search_result: Response, show_overview=False, show_aggs=False) -> Dict:
+        """
+        处理告警列表查询结果
+        """
         alerts = self.handle_hit_list(search_result)
         self.handle_operator(alerts)
 
@@ -358,13 +385,6 @@ class AlertQueryHandler(BaseBizQueryHandler):
         if show_aggs:
             result["aggs"] = self.handle_aggs(search_result)
 
-        if dsl:
-            result["dsl"] = dsl
-
-        if exc:
-            exc.data = result
-            raise exc
-
         return result
 
     def _get_buckets(
@@ -391,6 +411,37 @@ class AlertQueryHandler(BaseBizQueryHandler):
             result[dimension_tuple] = aggregation
 
     def date_histogram(self, interval: str = "auto", group_by: List[str] = None):
+        search_objects, context = self.get_date_histogram_search_objects(interval, group_by)
+        search_results = [search_object.execute() for search_object in search_objects]
+        return self.handle_date_histogram_result(search_results, context)
+
+    def can_use_rollup(self, start_time: int, end_time: int, interval: int, group_by: List[str]) -> bool:
+        """
+        判断告警分布直方图是否可以使用分钟级预聚合数据
+        预聚合数据只记录了业务、策略、级别维度，因此仅支持无额外过滤条件的查询
+        """
+        if not settings.ENABLE_ALERT_ROLLUP or interval % AlertRollupDocument.INTERVAL:
+            return False
+
+        if self.conditions or self.query_string or self.username or self.status or self.must_exists_fields:
+            return False
+
+        # 非授权业务需要按用户过滤
+        if not self.bk_biz_ids or self.unauthorized_bizs:
+            return False
+
+        if not set(group_by).issubset(AlertRollupDocument.DIMENSIONS):
+            return False
+
+        return AlertRollupDocument.is_covered(start_time, end_time)
+
+    def get_date_histogram_search_objects(
+        self, interval: str = "auto", group_by: List[str] = None
+    ) -> Tuple[List[Search], Dict]:
+        """
+        构造告警分布直方图的查询对象
+        :return: 查询对象列表，以及处理查询结果所需的上下文
+        """
         interval = self.calculate_agg_interval(self.start_time, self.end_time, interval)
 
         # 默认按status聚合
@@ -419,46 +470,102 @@ class AlertQueryHandler(BaseBizQueryHandler):
         end_time = self.end_time // interval * interval + interval
         now_time = int(time.time()) // interval * interval + interval
 
-        search_object = self.get_search_object(start_time=start_time, end_time=end_time)
-        search_object = self.add_conditions(search_object)
-        search_object = self.add_query_string(search_object)
+        rollup_range = None
+        if self.can_use_rollup(start_time, end_time, interval, group_by):
+            rollup_range = AlertRollupDocument.get_rollup_range()
+
+        context = {
+            "interval": interval,
+            "group_by": group_by,
+            "status_group": status_group,
+            "start_time": start_time,
+            "end_time": end_time,
+            "now_time": now_time,
+            "use_rollup": rollup_range is not None,
+        }
+
+        search_object = self.get_filtered_search_object(start_time=start_time, end_time=end_time)[:0]
 
-        # 已经恢复或关闭的告警，按end_time聚合
-        ended_object = search_object.aggs.bucket(
-            "end_time", "filter", {"range": {"end_time": {"lte": end_time}}}
-        ).bucket("end_alert", "filter", {"terms": {"status": [EventStatus.RECOVERED, EventStatus.CLOSED]}})
-        # 查询时间范围内产生的告警，按begin_time聚合
-        new_anomaly_object = search_object.aggs.bucket(
-            "begin_time", "filter", {"range": {"begin_time": {"gte": start_time, "lte": end_time}}}
-        )
         # 开始时间在查询时间范围之前的告警总数
         old_anomaly_object = search_object.aggs.bucket(
             "init_alert", "filter", {"range": {"begin_time": {"lt": start_time}}}
         )
 
-        # 时间聚合
-        ended_object = ended_object.bucket(
-            "time", "date_histogram", field="end_time", fixed_interval=f"{interval}s"
-        ).bucket("status", "terms", field="status")
-        new_anomaly_object = new_anomaly_object.bucket(
-            "time", "date_histogram", field="begin_time", fixed_interval=f"{interval}s"
-        )
+        # 查询时间范围内产生的告警，按begin_time聚合
+        new_anomaly_filter = [{"range": {"begin_time": {"gte": start_time, "lte": end_time}}}]
+        if rollup_range:
+            # 预聚合数据按告警创建时间划分批次，尚未预聚合的告警仍从原始数据中统计
+            new_anomaly_filter.append({"range": {"create_time": {"gte": rollup_range[1]}}})
+        new_anomaly_object = search_object.aggs.bucket(
+            "begin_time", "filter", {"bool": {"filter": new_anomaly_filter}}
+        ).bucket("time", "date_histogram", field="begin_time", fixed_interval=f"{interval}s")
 
-        # 维度聚合
         for field in group_by:
-            ended_object = self.add_agg_bucket(ended_object, field)
             new_anomaly_object = self.add_agg_bucket(new_anomaly_object, field)
             old_anomaly_object = self.add_agg_bucket(old_anomaly_object, field)
 
-        # 查询
-        search_result = search_object[:0].execute()
+        if rollup_range:
+            rollup_search_object = self.get_rollup_search_object(
+                start_time, end_time, interval, group_by, rollup_range[1]
+            )
+            return [search_object, rollup_search_object], context
+
+        # 已经恢复或关闭的告警，按end_time聚合
+        ended_object = (
+            search_object.aggs.bucket("end_time", "filter", {"range": {"end_time": {"lte": end_time}}})
+            .bucket("end_alert", "filter", {"terms": {"status": [EventStatus.RECOVERED, EventStatus.CLOSED]}})
+            .bucket("time", "date_histogram", field="end_time", fixed_interval=f"{interval}s")
+            .bucket("status", "terms", field="status")
+        )
+        for field in group_by:
+            ended_object = self.add_agg_bucket(ended_object, field)
+
+        return [search_object], context
+
+    def get_rollup_search_object(
+        self, start_time: int, end_time: int, interval: int, group_by: List[str], rollup_end_time: int
+    ) -> Search:
+        """
+        构造告警预聚合数据的查询对象
+        :param rollup_end_time: 已完成预聚合的截止时间，仅查询该时间之前完成的预聚合批次，避免与原始数据重复统计
+        """
+        search_object = AlertRollupDocument.search(start_time=start_time, end_time=end_time)
+        search_object = search_object.filter("range", time={"gte": start_time, "lt": end_time})
+        search_object = search_object.filter("range", rollup_time={"lt": rollup_end_time})
+        if self.authorized_bizs is not None:
+            search_object = search_object.filter("terms", bk_biz_id=self.authorized_bizs)
+        search_object = search_object[:0]
+
+        bucket = (
+            search_object.aggs.bucket("time", "date_histogram", field="time", fixed_interval=f"{interval}s")
+            .bucket("kind", "terms", field="kind")
+            .bucket("status", "terms", field="status")
+        )
+        for field in group_by:
+            bucket = bucket.bucket(field, "terms", field=field)
+        bucket.metric("count", "sum", field="count")
+        return search_object
+
+    def handle_date_histogram_result(self, search_results: List[Response], context: Dict):
+        """
+        处理告警分布直方图的查询结果
+        """
+        interval = context["interval"]
+        group_by = context["group_by"]
+        start_time = context["start_time"]
+        end_time = context["end_time"]
 
         result = defaultdict(
             lambda: {
-                status: {ts * 1000: 0 for ts in range(start_time, min(now_time, end_time), interval)}
+                status: {ts * 1000: 0 for ts in range(start_time, min(context["now_time"], end_time), interval)}
                 for status in EVENT_STATUS_DICT
             }
         )
+        search_result = search_results[0]
+
+        if context["use_rollup"]:
+            self.handle_rollup_result(result, search_results[1], group_by)
+
         if hasattr(search_result.aggs, 'begin_time'):
             for time_bucket in search_result.aggs.begin_time.time.buckets:
                 begin_time_result = {}
@@ -466,8 +573,9 @@ class AlertQueryHandler(BaseBizQueryHandler):
 
                 key = int(time_bucket.key_as_string) * 1000
                 for dimension_tuple, bucket in begin_time_result.items():
+                    # 使用预聚合数据时，这里仅包含尚未预聚合的告警，需要与预聚合数据累加
                     if key in result[dimension_tuple][EventStatus.ABNORMAL]:
-                        result[dimension_tuple][EventStatus.ABNORMAL][key] = bucket.doc_count
+                        result[dimension_tuple][EventStatus.ABNORMAL][key] += bucket.doc_count
 
         if hasattr(search_result.aggs, 'end_time') and hasattr(search_result.aggs.end_time, 'end_alert'):
             for time_bucket in search_result.aggs.end_time.end_alert.time.buckets:
@@ -508,7 +616,7 @@ class AlertQueryHandler(BaseBizQueryHandler):
                 current_abnormal_count = all_series[EventStatus.ABNORMAL][ts]
 
             # 如果不按status聚合，需要将status聚合的结果合并到一起
-            if not status_group:
+            if not context["status_group"]:
                 for ts in all_series[EventStatus.ABNORMAL]:
                     all_series[EventStatus.ABNORMAL][ts] += (
                         all_series[EventStatus.CLOSED][ts] + all_series[EventStatus.RECOVERED][ts]
@@ -517,6 +625,28 @@ class AlertQueryHandler(BaseBizQueryHandler):
                 all_series.pop(EventStatus.RECOVERED, None)
         return result
 
+    def handle_rollup_result(self, result: Dict, rollup_result: Response, group_by: List[str]):
+        """
+        将预聚合数据填充到直方图中，新产生的告警计为未恢复，已结束的告警按状态统计
+        """
+        if not hasattr(rollup_result.aggs, "time"):
+            return
+
+        for time_bucket in rollup_result.aggs.time.buckets:
+            key = int(time_bucket.key_as_string) * 1000
+            for kind_bucket in time_bucket.kind.buckets:
+                for status_bucket in kind_bucket.status.buckets:
+                    if kind_bucket.key == AlertRollupDocument.Kind.BEGIN:
+                        status = EventStatus.ABNORMAL
+                    else:
+                        status = status_bucket.key
+
+                    rollup_buckets = {}
+                    self._get_buckets(rollup_buckets, {}, status_bucket, group_by)
+                    for dimension_tuple, bucket in rollup_buckets.items():
+                        if key in result[dimension_tuple][status]:
+                            result[dimension_tuple][status][key] += int(bucket.count.value)
+
     def parse_condition_item(self, condition: dict) -> Q:
         if condition["key"] == "stage":
             conditions = []
@@ -885,6 +1015,12 @@ class AlertQueryHandler(BaseBizQueryHandler):
         return event
 
     def top_n(self, fields: List, size=10, translators: dict = None, char_add_quotes=True):
+        search_object = self.get_top_n_search_object(fields, size)
+        return self.handle_top_n_result(search_object.execute(), fields, size, translators, char_add_quotes)
+
+    def handle_top_n_result(
+        self, search_result: Response, fields: List, size=10, translators: dict = None, char_add_quotes=True
+    ) -> Dict:
         translators = {
             "metric": MetricTranslator(name_format="{name} ({id})", bk_biz_ids=self.bk_biz_ids),
             "bk_biz_id": BizTranslator(),
@@ -892,7 +1028,9 @@ class AlertQueryHandler(BaseBizQueryHandler):
             "category": CategoryTranslator(),
             'plugin_id': PluginTranslator(),
         }
-        return super(AlertQueryHandler, self).top_n(fields, size, translators, char_add_quotes)
+        return super(AlertQueryHandler, self).handle_top_n_result(
+            search_result, fields, size, translators, char_add_quotes
+        )
 
     def list_tags(self):
         """
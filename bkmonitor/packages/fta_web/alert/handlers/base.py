@@ -8,12 +8,13 @@ Unless required by applicable law or agreed to in writing, software distributed
 an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the
 specific language governing permissions and limitations under the License.
 """
+import logging
 import time
 from abc import ABC
 from typing import Callable, Dict, List, Optional
 
 from django.utils.translation import ugettext as _
-from elasticsearch_dsl import AttrDict, Q, Search
+from elasticsearch_dsl import AttrDict, MultiSearch, Q, Search
 from elasticsearch_dsl.aggs import Bucket
 from elasticsearch_dsl.response import Response
 from luqum.auto_head_tail import auto_head_tail
@@ -30,6 +31,8 @@ from constants.alert import EventTargetType
 from core.errors.alert import QueryStringParseError
 from fta_web.alert.handlers.translator import AbstractTranslator
 
+logger = logging.getLogger(__name__)
+
 
 class QueryField:
     def __init__(
@@ -170,9 +173,36 @@ class BaseQueryTransformer(BaseTreeTransformer):
         return field
 
 
+def multi_execute(search_objects: List[Search]) -> List[Optional[Response]]:
+    """
+    通过一次 msearch 请求执行多个查询
+    :return: 与查询对象一一对应的查询结果，单个查询失败时为 None
+    """
+    if not search_objects:
+        return []
+
+    multi_search = MultiSearch(using=search_objects[0]._using)
+    for search_object in search_objects:
+        # msearch 的请求头不支持 track_total_hits，需要放到请求体中
+        params = dict(search_object._params)
+        track_total_hits = params.pop("track_total_hits", None)
+        search_object = search_object._clone()
+        search_object._params = params
+        if track_total_hits is not None:
+            search_object = search_object.extra(track_total_hits=track_total_hits)
+        multi_search = multi_search.add(search_object)
+
+    responses = multi_search.execute(raise_on_error=False)
+    if None in responses:
+        logger.warning("multi search partially failed: %s/%s", responses.count(None), len(responses))
+    return responses
+
+
 class BaseQueryHandler:
     # query_string 语法树自定义解析类
     query_transformer = None
+    # TOP N 统计中桶数量聚合的后缀
+    TOP_N_BUCKET_COUNT_SUFFIX = ".bucket_count"
 
     class DurationOption:
         # 关于时间差的选项
@@ -222,6 +252,8 @@ class BaseQueryHandler:
         self.ordering = self.query_transformer.transform_ordering_fields(ordering)
         # 转换 condition 的字段
         self.conditions = self.query_transformer.transform_condition_fields(conditions)
+        # 带有过滤条件的查询对象缓存，同一次页面加载的多个查询共用
+        self._filtered_search_objects = {}
 
     def scan(self):
         """
@@ -255,6 +287,19 @@ class BaseQueryHandler:
         """
         raise NotImplementedError
 
+    def get_filtered_search_object(self, **kwargs) -> Search:
+        """
+        获取带有过滤条件(conditions 及 query_string)的查询对象，相同参数只解析一次
+        """
+        key = tuple(sorted(kwargs.items()))
+        if key not in self._filtered_search_objects:
+            search_object = self.get_search_object(**kwargs)
+            search_object = self.add_conditions(search_object)
+            search_object = self.add_query_string(search_object)
+            self._filtered_search_objects[key] = search_object
+        # 聚合会原地修改查询对象，因此返回副本
+        return self._filtered_search_objects[key]._clone()
+
     def add_pagination(self, search_object: Search, page: int = None, page_size: int = None):
         """
         分页
@@ -468,22 +513,40 @@ class BaseQueryHandler:
             ]
         }
         """
-        translators = translators or {}
+        search_object = self.get_top_n_search_object(fields, size)
+        search_result = search_object.execute()
+        return self.handle_top_n_result(search_result, fields, size, translators, char_add_quotes)
 
-        search_object = self.get_search_object()
-        search_object = self.add_conditions(search_object)
-        search_object = self.add_query_string(search_object)
+    def get_top_n_search_object(self, fields: List, size=10) -> Search:
+        """
+        构造字段值 TOP N 统计的查询对象
+        """
+        search_object = self.get_filtered_search_object()
         search_object = search_object.params(track_total_hits=True).extra(size=0)
 
         # 最多不能超过10000个桶
         size = min(size, 10000)
 
-        bucket_count_suffix = ".bucket_count"
-
         for field in fields:
-            self.add_agg_bucket(search_object.aggs, field, size=size, bucket_count_suffix=bucket_count_suffix)
+            self.add_agg_bucket(
+                search_object.aggs, field, size=size, bucket_count_suffix=self.TOP_N_BUCKET_COUNT_SUFFIX
+            )
+        return search_object
 
-        search_result = search_object.execute()
+    def handle_top_n_result(
+        self,
+        search_result: Response,
+        fields: List,
+        size=10,
+        translators: Dict[str, AbstractTranslator] = None,
+        char_add_quotes=True,
+    ) -> Dict:
+        """
+        处理字段值 TOP N 统计的查询结果
+        """
+        translators = translators or {}
+        size = min(size, 10000)
+        bucket_count_suffix = self.TOP_N_BUCKET_COUNT_SUFFIX
 
         result = {
             "doc_count": search_result.hits.total.value,
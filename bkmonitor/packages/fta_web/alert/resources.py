@@ -83,7 +83,7 @@ from core.unit import load_unit
 from fta_web.alert.handlers.action import ActionQueryHandler
 from fta_web.alert.handlers.alert import AlertQueryHandler
 from fta_web.alert.handlers.alert_log import AlertLogHandler
-from fta_web.alert.handlers.base import BaseQueryHandler
+from fta_web.alert.handlers.base import BaseQueryHandler, multi_execute
 from fta_web.alert.handlers.event import EventQueryHandler
 from fta_web.alert.handlers.translator import BizTranslator, PluginTranslator
 from fta_web.alert.serializers import (
@@ -324,7 +324,13 @@ class AlertDateHistogramResource(Resource):
                 for sliced_start_time, sliced_end_time in slice_time_interval(start_time, end_time)
             ]
         )
+        return self.merge_results(results)
 
+    @classmethod
+    def merge_results(cls, results: List[Dict]) -> Dict:
+        """
+        合并各个时间分片的直方图
+        """
         data = {status: {} for status in EVENT_STATUS_DICT}
         for result in results:
             for status, series in result.items():
@@ -353,7 +359,11 @@ class AlertDateHistogramResultResource(Resource):
         start_time = validated_request_data.get("start_time")
         end_time = validated_request_data.get("end_time")
         handler = AlertQueryHandler(**validated_request_data)
-        datas = list(handler.date_histogram(interval=interval).values())
+        return self.format_result(handler.date_histogram(interval=interval), start_time, end_time, interval)
+
+    @classmethod
+    def format_result(cls, result: Dict, start_time: int, end_time: int, interval: int) -> Dict:
+        datas = list(result.values())
         if not datas:
             data = {"default_time_series": {"start_time": start_time, "end_time": end_time, "interval": interval}}
             return data
@@ -1167,6 +1177,118 @@ class SearchAlertResource(Resource):
         return result
 
 
+class SearchAlertPageResource(Resource):
+    """
+    告警页面查询，一次返回告警列表、字段 TOP N 统计及告警分布直方图
+    开启 ENABLE_ALERT_MSEARCH 后，全部分片查询通过一次 msearch 请求完成
+    """
+
+    class RequestSerializer(SearchAlertResource.RequestSerializer):
+        interval = serializers.CharField(label="聚合周期", default="auto")
+        fields = serializers.ListField(label="TOP N 查询字段列表", child=serializers.CharField(), default=[])
+        size = serializers.IntegerField(label="获取的桶数量", default=10)
+
+    def perform_request(self, validated_request_data):
+        interval = validated_request_data.pop("interval")
+        fields = validated_request_data.pop("fields")
+        size = validated_request_data.pop("size")
+        filter_params = {
+            key: validated_request_data[key] for key in AlertSearchSerializer().fields if key in validated_request_data
+        }
+
+        if not settings.ENABLE_ALERT_MSEARCH:
+            return {
+                "search": resource.alert.search_alert(validated_request_data),
+                "top_n": resource.alert.alert_top_n(fields=fields, size=size, **filter_params) if fields else None,
+                "date_histogram": resource.alert.alert_date_histogram(interval=interval, **filter_params),
+            }
+
+        show_overview = validated_request_data.pop("show_overview")
+        show_aggs = validated_request_data.pop("show_aggs")
+        show_dsl = validated_request_data.pop("show_dsl")
+        record_history = validated_request_data.pop("record_history")
+
+        start_time = filter_params.pop("start_time")
+        end_time = filter_params.pop("end_time")
+        if filter_params["bk_biz_ids"] is not None:
+            authorized_bizs, unauthorized_bizs = AlertQueryHandler.parse_biz_item(filter_params["bk_biz_ids"])
+            filter_params["authorized_bizs"] = authorized_bizs
+            filter_params["unauthorized_bizs"] = unauthorized_bizs
+        slice_times = slice_time_interval(start_time, end_time)
+        interval = BaseQueryHandler.calculate_agg_interval(start_time, end_time, interval)
+
+        # 告警列表
+        handler = AlertQueryHandler(**validated_request_data)
+        search_objects = [handler.get_search_raw_object(show_overview, show_aggs)]
+
+        # 各个时间分片的 TOP N 统计
+        top_n_handlers = []
+        if fields:
+            for index, (sliced_start_time, sliced_end_time) in enumerate(slice_times):
+                top_n_handler = AlertQueryHandler(
+                    start_time=sliced_start_time,
+                    end_time=sliced_end_time,
+                    is_time_partitioned=True,
+                    is_finaly_partition=index == len(slice_times) - 1,
+                    **filter_params,
+                )
+                top_n_handlers.append(top_n_handler)
+                search_objects.append(top_n_handler.get_top_n_search_object(fields, size))
+
+        # 各个时间分片的告警分布直方图
+        histogram_queries = []
+        for sliced_start_time, sliced_end_time in slice_times:
+            histogram_handler = AlertQueryHandler(
+                start_time=sliced_start_time, end_time=sliced_end_time, **filter_params
+            )
+            histogram_search_objects, context = histogram_handler.get_date_histogram_search_objects(interval)
+            offset = len(search_objects)
+            histogram_queries.append((histogram_handler, context, offset, offset + len(histogram_search_objects)))
+            search_objects.extend(histogram_search_objects)
+
+        with SearchHistory.record(
+            SearchType.ALERT,
+            validated_request_data,
+            enabled=record_history and validated_request_data.get("query_string"),
+        ):
+            search_results = multi_execute(search_objects)
+            # 失败的查询单独重试，以便抛出原始异常
+            search_results = [
+                search_object.execute() if search_result is None else search_result
+                for search_object, search_result in zip(search_objects, search_results)
+            ]
+
+        result = handler.handle_search_result(search_results[0], show_overview, show_aggs)
+        if show_dsl:
+            result["dsl"] = search_objects[0].to_dict()
+
+        top_n = None
+        if fields:
+            top_n = AlertTopNResource.merge_results(
+                [
+                    top_n_handler.handle_top_n_result(search_result, fields, size)
+                    for top_n_handler, search_result in zip(top_n_handlers, search_results[1:])
+                ]
+            )
+
+        histogram_results = []
+        for histogram_handler, context, start, end in histogram_queries:
+            histogram_results.append(
+                AlertDateHistogramResultResource.format_result(
+                    histogram_handler.handle_date_histogram_result(search_results[start:end], context),
+                    histogram_handler.start_time,
+                    histogram_handler.end_time,
+                    interval,
+                )
+            )
+
+        return {
+            "search": result,
+            "top_n": top_n,
+            "date_histogram": AlertDateHistogramResource.merge_results(histogram_results),
+        }
+
+
 class ExportAlertResource(Resource):
     """
     导出告警数据
@@ -1640,7 +1762,13 @@ class AlertTopNResource(Resource):
                 for index, (sliced_start_time, sliced_end_time) in enumerate(slice_times)
             ]
         )
+        return self.merge_results(results)
 
+    @classmethod
+    def merge_results(cls, results: List[Dict]) -> Dict:
+        """
+        合并各个时间分片的 TOP N 统计
+        """
         result = {
             "doc_count": 0,
             "fields": [],
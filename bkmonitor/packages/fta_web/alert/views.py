@@ -132,7 +132,7 @@ class AlertViewSet(ResourceViewSet):
     def check_permissions(self, request):
         if self.action in ["search_history", "list_index_by_host", "validate_query_string", "allowed_biz"]:
             return
-        elif self.action == "alert/search":
+        elif self.action in ["alert/search", "alert/page"]:
             permission = BusinessActionPermission([ActionEnum.VIEW_EVENT, ActionEnum.VIEW_BUSINESS])
         else:
             permission = BusinessActionPermission([ActionEnum.VIEW_EVENT])
@@ -150,6 +150,7 @@ class AlertViewSet(ResourceViewSet):
                 self.action
                 in [
                     "alert/search",
+                    "alert/page",
                     "alert/top_n",
                     "alert/export",
                     "alert/date_histogram",
@@ -169,6 +170,7 @@ class AlertViewSet(ResourceViewSet):
         ResourceRoute("GET", resource.alert.list_allowed_biz, endpoint="allowed_biz"),
         ResourceRoute("GET", resource.alert.list_search_history, endpoint="search_history"),
         ResourceRoute("POST", resource.alert.search_alert, endpoint="alert/search"),
+        ResourceRoute("POST", resource.alert.search_alert_page, endpoint="alert/page"),
         ResourceRoute("POST", resource.alert.export_alert, endpoint="alert/export"),
         ResourceRoute("POST", resource.alert.alert_date_histogram, endpoint="alert/date_histogram"),
         ResourceRoute("POST", resource.alert.list_alert_tags, endpoint="alert/tags"),
@@ -204,6 +204,7 @@ class MatchDebugResource(Resource, metaclass=abc.ABCMeta):
             rule["alerts"] = []
         sorted_priorities = sorted(priority_rules.keys(), reverse=True)
         sorted_priority_rules = [priority_rules[sorted_priority] for sorted_priority in sorted_priorities]
+        rules_version = count_md5(sorted_priority_rules, list_sort=False)
 
         # step3 对告警进行规则适配 ?? 是否需要后台任务支持
         matched_alerts = []
@@ -216,6 +217,7 @@ class MatchDebugResource(Resource, metaclass=abc.ABCMeta):
                 group_rules=sorted_priority_rules,
                 assign_mode=[AssignMode.BY_RULE],
                 cmdb_attrs=self.get_alert_cmdb_attributes(alert),
+                rules_version=rules_version,
             )
             alert_manager.run_match()
             if not alert_manager.matched_rules:
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Tencent is pleased to support the open source community by making 蓝鲸智云 - 监控平台 (BlueKing - Monitor) available.
+Copyright (C) 2017-2021 THL A29 Limited, a Tencent company. All rights reserved.
+Licensed under the MIT License (the "License"); you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://opensource.org/licenses/MIT
+Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on
+an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the
+specific language governing permissions and limitations under the License.
+"""
+import random
+import time
+
+from django.core.management import BaseCommand
+
+from bkmonitor.models.metric_list_cache import MetricListCache
+from constants.data_source import DataSourceLabel, DataTypeLabel
+from monitor_web.strategies.metric_search_index import (
+    BizMetricIndex,
+    MetricSearchIndex,
+)
+from monitor_web.strategies.resources.v2 import GetMetricListV2Resource
+
+WORDS = ["cpu", "mem", "disk", "net", "io", "usage", "total", "request", "latency", "error", "count", "bytes", "pod"]
+
+
+def make_metric(bk_biz_id: int, index: int) -> MetricListCache:
+    rand = random.Random(index)
+    db = f"{rand.choice(WORDS)}_{index // 1000}"
+    metric_field = "_".join(rand.sample(WORDS, 3)) + f"_{index}"
+    return MetricListCache(
+        bk_biz_id=bk_biz_id,
+        result_table_id=f"{db}.__default__",
+        result_table_name=db,
+        metric_field=metric_field,
+        metric_field_name=metric_field.replace("_", " "),
+        data_label=db,
+        related_id=str(index // 1000),
+        related_name=db,
+        result_table_label="other_rt",
+        data_source_label=DataSourceLabel.CUSTOM,
+        data_type_label=DataTypeLabel.TIME_SERIES,
+        data_target="none_target",
+        collect_config_ids=[],
+        default_dimensions=[],
+        default_condition=[],
+    )
+
+
+class Command(BaseCommand):
+    """
+    对比指标选择器模糊搜索的数据库查询与内存索引耗时
+    在指定业务下写入合成指标数据，执行完成后默认清理
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bk_biz_id", type=int, default=-999999, help="合成数据写入的业务ID")
+        parser.add_argument("--count", type=int, default=1000000, help="合成指标数量")
+        parser.add_argument("--queries", nargs="*", default=["cpu", "usage_total", "latency_12345", "pod.error"])
+        parser.add_argument("--skip_create", action="store_true", help="复用已写入的合成数据")
+        parser.add_argument("--keep", action="store_true", help="执行完成后保留合成数据")
+
+    def handle(self, *args, **options):
+        bk_biz_id = options["bk_biz_id"]
+        queryset = MetricListCache.objects.filter(bk_biz_id=bk_biz_id)
+
+        if not options["skip_create"]:
+            queryset.delete()
+            start_time = time.time()
+            batch = []
+            for index in range(options["count"]):
+                batch.append(make_metric(bk_biz_id, index))
+                if len(batch) >= 5000:
+                    MetricListCache.objects.bulk_create(batch)
+                    batch = []
+            if batch:
+                MetricListCache.objects.bulk_create(batch)
+            self.stdout.write(f"create {options['count']} metrics cost {time.time() - start_time:.2f}s")
+
+        start_time = time.time()
+        index = BizMetricIndex.build(bk_biz_id)
+        self.stdout.write(f"build index of {len(index.ids)} metrics cost {time.time() - start_time:.2f}s")
+
+        MetricSearchIndex.clear()
+        MetricSearchIndex.get_indexes([bk_biz_id])
+        for query in options["queries"]:
+            params = {"bk_biz_id": bk_biz_id, "conditions": [{"key": "query", "value": query}]}
+
+            start_time = time.time()
+            orm_metrics = GetMetricListV2Resource.filter_by_conditions(queryset, params).order_by("-use_frequency")
+            orm_count = orm_metrics.count()
+            orm_page = list(orm_metrics.values_list("id", flat=True)[:20])
+            orm_cost = time.time() - start_time
+
+            start_time = time.time()
+            search_result = MetricSearchIndex.search([bk_biz_id], [query])
+            if search_result is None:
+                self.stdout.write(f"query({query}): too many matches, index falls back to orm")
+                continue
+            index_metrics = GetMetricListV2Resource.filter_by_conditions(queryset, params, search_result).order_by(
+                search_result.rank_expression(), "-use_frequency"
+            )
+            index_count = index_metrics.count()
+            index_page = list(index_metrics.values_list("id", flat=True)[:20])
+            index_cost = time.time() - start_time
+
+            self.stdout.write(
+                f"query({query}): orm {orm_count} metrics {orm_cost * 1000:.1f}ms, "
+                f"index {index_count} metrics {index_cost * 1000:.1f}ms, "
+                f"page size: {len(orm_page)}/{len(index_page)}"
+            )
+
+        if not options["keep"]:
+            queryset.delete()
@@ -19,6 +19,7 @@ from datetime import datetime
 from functools import reduce
 from typing import Dict, List, Optional, Tuple, Union
 
+from django.conf import settings
 from django.core.exceptions import EmptyResultSet
 from django.db.models import Count, Q
 from django.db.models.aggregates import Sum
@@ -56,6 +57,11 @@ from bkmonitor.utils.kubernetes import (
     KubernetesServiceJsonParser,
     get_progress_value,
 )
+from bkmonitor.utils.kubernetes_inventory import (
+    InventoryQuery,
+    KubernetesInventory,
+    SnapshotUnsupported,
+)
 from bkmonitor.utils.thread_backend import ThreadPool
 from constants.data_source import DataSourceLabel, DataTypeLabel
 from constants.event import EventTypeNormal, EventTypeWarning
@@ -150,19 +156,25 @@ class KubernetesResource(ApiAuthResource, abc.ABC):
         # 参数预处理
         self.preset(view_options)
 
-        # 构造数据表搜索条件
-        self.add_condition_filter(view_options)
-        # 添加列搜索
-        self.add_column_filter(view_options)
-
-        # 计算每种状态的资源数量
-        status_filter_data = self.get_status_filter_data(view_options)
-        # 添加根据数据状态过滤的条件
-        self.add_monitor_status_filter(view_options)
-        # 计算资源总数
-        total = self.get_total()
-        # 根据分页获取一页的数据
-        self.pagination_data(view_options)
+        # 优先在集群资源快照上完成过滤、统计和分页
+        snapshot_result = self.query_snapshot(view_options)
+        if snapshot_result:
+            status_filter_data = snapshot_result["filter"]
+            total = snapshot_result["total"]
+        else:
+            # 构造数据表搜索条件
+            self.add_condition_filter(view_options)
+            # 添加列搜索
+            self.add_column_filter(view_options)
+
+            # 计算每种状态的资源数量
+            status_filter_data = self.get_status_filter_data(view_options)
+            # 添加根据数据状态过滤的条件
+            self.add_monitor_status_filter(view_options)
+            # 计算资源总数
+            total = self.get_total()
+            # 根据分页获取一页的数据
+            self.pagination_data(view_options)
 
         # 搜索条件
         label_condition_list = self.data_to_labels_condition_list(view_options)
@@ -195,6 +207,9 @@ class KubernetesResource(ApiAuthResource, abc.ABC):
         }
         if overview_data_rendered:
             results["overview_data"] = overview_data_rendered
+        if snapshot_result:
+            # 快照距今的时长(秒)
+            results["snapshot_age"] = snapshot_result["snapshot_age"]
 
         return results
 
@@ -488,16 +503,24 @@ class KubernetesResource(ApiAuthResource, abc.ABC):
         if not cluster_ids:
             return condition_list
 
-        label_ids = [
-            item["label_id"]
-            for item in self.model_label_class.objects.filter(bcs_cluster_id__in=cluster_ids)
-            .values("label_id")
-            .distinct()
-        ]
-        labels = BCSLabel.objects.filter(hash_id__in=label_ids)
+        snapshots = None
+        if settings.ENABLE_KUBERNETES_INVENTORY_SNAPSHOT:
+            snapshots = KubernetesInventory.get_snapshots(self.model_class, cluster_ids)
         label_key_map_values = {}
-        for label in labels:
-            label_key_map_values.setdefault(label.key, []).append(label.value)
+        if snapshots is not None:
+            for snapshot in snapshots:
+                for key, value in snapshot.labels:
+                    label_key_map_values.setdefault(key, []).append(value)
+        else:
+            label_ids = [
+                item["label_id"]
+                for item in self.model_label_class.objects.filter(bcs_cluster_id__in=cluster_ids)
+                .values("label_id")
+                .distinct()
+            ]
+            labels = BCSLabel.objects.filter(hash_id__in=label_ids)
+            for label in labels:
+                label_key_map_values.setdefault(label.key, []).append(label.value)
 
         for key, values in label_key_map_values.items():
             values = sorted(list(set(values)))
@@ -544,8 +567,14 @@ class KubernetesResource(ApiAuthResource, abc.ABC):
                 q_list.append(filter_q)
         self.query_set_list = q_list
 
+    def get_label_conditions(self, params: Dict) -> Optional[Dict]:
+        """获得标签搜索条件，返回 None 时表示搜索不到数据 ."""
+        return {k.replace("__label_", ""): v for k, v in params.items() if k.find("__label_") == 0}
+
     def filtered_label(self, params: Dict) -> Optional[Q]:
-        label_conditions = {k.replace("__label_", ""): v for k, v in params.items() if k.find("__label_") == 0}
+        label_conditions = self.get_label_conditions(params)
+        if label_conditions is None:
+            return None
         if not label_conditions:
             return Q()
         filter_q = self.model_class.label_query_set_parser(label_conditions)
@@ -638,6 +667,95 @@ class KubernetesResource(ApiAuthResource, abc.ABC):
             for key, value in filter_dict.items():
                 self.query_set_list.append(Q(**{f"{key}__in": value}))
 
+    def get_snapshot_scopes(self, params: Dict) -> Optional[Dict[str, Optional[List[str]]]]:
+        """获得与业务、容器空间过滤等价的集群范围 {集群ID: 命名空间列表}，命名空间列表为 None 时不限制 ."""
+        bk_biz_id = params["bk_biz_id"]
+        space_associated_clusters = self.get_cluster_by_space_uid(params.get("space_uid"))
+        if bk_biz_id >= 0:
+            cluster_ids = BCSCluster.objects.filter(bk_biz_id=bk_biz_id).values_list("bcs_cluster_id", flat=True)
+            return {cluster_id: None for cluster_id in cluster_ids}
+        if not space_associated_clusters:
+            return None
+
+        scopes = {}
+        for cluster_id, value in space_associated_clusters.items():
+            cluster_type = value.get("cluster_type")
+            namespace_list = value["namespace_list"]
+            if cluster_type == BcsClusterType.SHARED and namespace_list and self.model_class.has_namespace_field():
+                scopes[cluster_id] = namespace_list
+            else:
+                scopes[cluster_id] = None
+        return scopes
+
+    def get_snapshot_query(self, params: Dict) -> InventoryQuery:
+        """获得与字段、关键字、列过滤等价的快照查询条件 ."""
+        query = InventoryQuery(self.model_class)
+        if params["bk_biz_id"] >= 0:
+            query.add_equals("bk_biz_id", params["bk_biz_id"])
+        for k, v in params.items():
+            if hasattr(self.model_class, k) and k not in {
+                "keyword",
+                "bk_biz_id",
+                "bcs_cluster_id",
+                "space_uid",
+                "monitor_status",
+            }:
+                query.add_equals(k, v)
+        name_value = params.get("keyword")
+        if name_value and hasattr(self.model_class, "name"):
+            for value in name_value:
+                query.add_contains("name", [value])
+        for key, value in (params.get("filter_dict") or {}).items():
+            query.add_equals(key, value)
+        return query
+
+    def query_snapshot(self, params: Dict) -> Optional[Dict]:
+        """在集群资源快照上过滤、统计和分页，快照不可用或条件不支持时返回 None，回退为数据库查询 ."""
+        if not settings.ENABLE_KUBERNETES_INVENTORY_SNAPSHOT:
+            return None
+        scopes = self.get_snapshot_scopes(params)
+        if scopes is None:
+            return None
+        bcs_cluster_id = params.get("bcs_cluster_id")
+        if bcs_cluster_id:
+            cluster_ids = bcs_cluster_id if isinstance(bcs_cluster_id, list) else [bcs_cluster_id]
+            scopes = {cluster_id: value for cluster_id, value in scopes.items() if cluster_id in cluster_ids}
+        snapshots = KubernetesInventory.get_snapshots(self.model_class, list(scopes))
+        if snapshots is None:
+            return None
+
+        page = params.get("page", 1)
+        page_size = params.get("page_size", 10)
+        label_conditions = self.get_label_conditions(params)
+        if label_conditions is None:
+            # 标签搜索不到，直接返回空数据
+            result = {"status_summary": {}, "total": 0, "ids": []}
+        else:
+            try:
+                query = self.get_snapshot_query(params)
+                query.scopes = scopes
+                query.labels = {key: values for key, values in label_conditions.items() if values}
+                result = KubernetesInventory.search(
+                    snapshots,
+                    query,
+                    monitor_status=params.get("monitor_status"),
+                    sort=self.get_sort(params),
+                    offset=(page - 1) * page_size,
+                    limit=page_size,
+                )
+            except SnapshotUnsupported as e:
+                logger.info("[kubernetes inventory] query %s by db, unsupported field: %s", self.model_class, e)
+                return None
+
+        items = self.model_class.objects.in_bulk(result["ids"])
+        self.data = [items[resource_id] for resource_id in result["ids"] if resource_id in items]
+        build_time = min((snapshot.build_time for snapshot in snapshots), default=time.time())
+        return {
+            "filter": self.patch_status_filter_data_wrap(result["status_summary"]),
+            "total": result["total"],
+            "snapshot_age": int(time.time() - build_time),
+        }
+
     def aggregate_by_biz_id(self, bk_biz_id, params: Dict) -> Dict:
         """按业务ID聚合 ."""
         filter_q = Q(bk_biz_id=bk_biz_id)
@@ -902,7 +1020,7 @@ class GetKubernetesPodList(KubernetesResource):
 
         return selector
 
-    def filtered_label(self, params: Dict) -> Optional[Q]:
+    def get_label_conditions(self, params: Dict) -> Optional[Dict]:
         if "service_name" in params:
             # 获取服务的pod选择器
             selector = self.read_namespaced_service(params)
@@ -911,7 +1029,7 @@ class GetKubernetesPodList(KubernetesResource):
                 return None
             else:
                 params.update({f"__label_{key}": [value] for key, value in selector.items()})
-        return super().filtered_label(params)
+        return super().get_label_conditions(params)
 
     def get_overview_data(self, params, data):
         bk_biz_id = params["bk_biz_id"]
@@ -1357,6 +1475,39 @@ class GetKubernetesNodeList(KubernetesResource):
             filter_q &= control_plane_q
         return filter_q
 
+    def get_snapshot_scopes(self, params: Dict) -> Optional[Dict[str, Optional[List[str]]]]:
+        """容器空间下仅查询独立集群的节点 ."""
+        if params["bk_biz_id"] >= 0:
+            return super().get_snapshot_scopes(params)
+        space_associated_clusters = self.get_cluster_by_space_uid(params.get("space_uid"))
+        scopes = {
+            cluster_id: None
+            for cluster_id, value in space_associated_clusters.items()
+            if value["cluster_type"] == BcsClusterType.SINGLE
+        }
+        return scopes or None
+
+    def get_snapshot_query(self, params: Dict) -> InventoryQuery:
+        """添加节点角色过滤 ."""
+        query = super().get_snapshot_query({k: v for k, v in params.items() if k != "roles"})
+        roles_value = params.get("roles")
+        if isinstance(roles_value, list):
+            roles_value = roles_value[0] if roles_value else None
+        if isinstance(roles_value, str):
+            # 过滤控制平面节点
+            if "master" in roles_value or "control-plane" in roles_value:
+                query.add_contains("roles", ["control-plane", "master"])
+            else:
+                query.add_equals("roles", roles_value)
+        return query
+
+    def query_snapshot(self, params: Dict) -> Optional[Dict]:
+        sort = params.get("sort")
+        if sort and sort.lstrip("-") in self.client_sort_fields:
+            # 按资源使用率排序时需要全部数据，使用数据库查询
+            return None
+        return super().query_snapshot(params)
+
     def pagination_data(self, params: Dict):
         """获得分页后的数据 ."""
         if not self.query_set_list:
@@ -10,16 +10,19 @@ specific language governing permissions and limitations under the License.
 """
 
 import copy
+import hashlib
+import json
 import logging
 import re
 import time
 from collections import defaultdict
 from datetime import datetime
 from functools import reduce
-from typing import Dict, Generator, List
+from typing import Dict, Generator, Iterable, List, Optional, Set, Tuple
 
 import requests
 from django.conf import settings
+from django.core.cache import cache
 from django.db.models import Count, Max, Q
 from django.utils.translation import ugettext as _
 from django.utils.translation import ugettext_lazy as _lazy
@@ -70,6 +73,7 @@ from monitor_web.plugin.manager.process import (
     BuildInProcessDimension,
     BuildInProcessMetric,
 )
+from monitor_web.strategies.metric_search_index import MetricSearchIndex
 from monitor_web.tasks import run_metric_manager_async
 
 FILTER_DIMENSION_LIST = ["time", "bk_supplier_id", "bk_cmdb_level", "timestamp"]
@@ -196,6 +200,14 @@ class BaseMetricCacheManager:
 
     data_sources = (("", ""),)
 
+    # 是否支持按表的变更游标增量更新
+    incremental = False
+    # 指标与表的关联字段，需与 get_table_key 的取值一致
+    table_key_field = "result_table_id"
+    # 变更游标有效期，过期后回退为全量更新
+    CURSOR_TIMEOUT = 24 * 60 * 60
+    CURSOR_CACHE_KEY_TEMPLATE = "metric_list_cache.table_cursor.{source}.{bk_biz_id}"
+
     def __init__(self, bk_biz_id=None):
         self.bk_biz_id = bk_biz_id
         self.new_metric_ids = []
@@ -209,6 +221,97 @@ class BaseMetricCacheManager:
         """
         raise NotImplementedError
 
+    def get_table_key(self, table: Dict) -> str:
+        """
+        表标识，同一标识的多个表作为整体计算变更游标
+        """
+        return table.get("table_id", "")
+
+    @staticmethod
+    def get_table_cursor(tables: List[Dict]) -> str:
+        """
+        表的变更游标，表内容(包括指标及维度信息)变化时游标随之变化
+        """
+        content = json.dumps(tables, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.md5(content.encode("utf-8")).hexdigest()
+
+    def is_incremental(self) -> bool:
+        return self.incremental and self.bk_biz_id is not None and settings.ENABLE_METRIC_CACHE_INCREMENTAL
+
+    @property
+    def cursor_cache_key(self) -> str:
+        return self.CURSOR_CACHE_KEY_TEMPLATE.format(source=self.__class__.__name__, bk_biz_id=self.bk_biz_id)
+
+    def get_cursor_state(self) -> Optional[Dict]:
+        """
+        获取上次更新的变更游标
+        :return: {"full_update_time": 上次全量更新时间, "cursors": {表标识: 游标}}
+        """
+        state = cache.get(self.cursor_cache_key)
+        if not state or time.time() - state["full_update_time"] > self.CURSOR_TIMEOUT:
+            return None
+        return state
+
+    def save_cursor_state(self, cursors: Dict[str, str], full_update_time: float):
+        cache.set(
+            self.cursor_cache_key, {"full_update_time": full_update_time, "cursors": cursors}, self.CURSOR_TIMEOUT
+        )
+
+    def clear_cursor_state(self):
+        """
+        清理变更游标，下次执行全量更新
+        """
+        cache.delete(self.cursor_cache_key)
+
+    def get_changed_tables(
+        self, tables: List[Dict], cursors: Dict[str, str], old_cursors: Dict[str, str]
+    ) -> Tuple[List[Dict], Set[str]]:
+        """
+        对比变更游标
+        :return: (变更的表, 变更及已删除的表标识)
+        """
+        changed_table_keys = {key for key, cursor in cursors.items() if old_cursors.get(key) != cursor}
+        changed_table_keys.update(set(old_cursors) - set(cursors))
+        return [table for table in tables if self.get_table_key(table) in changed_table_keys], changed_table_keys
+
+    def iter_metrics(self, tables: Iterable[Dict], failed_table_keys: Set[str]) -> Generator[Dict, None, None]:
+        """
+        生成表的指标并补全字段，生成过程中出现异常的表记录到 failed_table_keys
+        """
+        for table in tables:
+            has_exception, self.has_exception = self.has_exception, False
+            metrics = list(self.get_metrics_by_table(table))
+            if self.has_exception:
+                failed_table_keys.add(self.get_table_key(table))
+            self.has_exception = self.has_exception or has_exception
+
+            for metric in metrics:
+                # 处理result_table_id长度
+                if len(metric.get("result_table_id", "")) > 256:
+                    metric["result_table_id"] = metric["result_table_id"][:256]
+
+                if metric.get("result_table_id", "") in ["bkunifylogbeat_task.base", "bkunifylogbeat_common.base"]:
+                    continue
+
+                # 补全维度字段
+                dimensions = metric.get("dimensions", [])
+                for dimension in dimensions:
+                    if "is_dimension" not in dimension:
+                        dimension["is_dimension"] = True
+                    if "type" not in dimension:
+                        dimension["type"] = DimensionFieldType.String
+
+                metric.update(
+                    dict(
+                        use_frequency=self.metric_use_frequency.get(
+                            f"{metric.get('data_source_label', '')}."
+                            f"{metric.get('result_table_id', '')}.{metric['metric_field']}",
+                            0,
+                        )
+                    )
+                )
+                yield metric
+
     def get_metrics_by_table(self, table) -> Generator[Dict, None, None]:
         """
         根据表查询指标数据
@@ -252,73 +355,76 @@ class BaseMetricCacheManager:
         to_be_delete = []
         self.refresh_metric_use_frequency()
 
+        tables = self.get_tables()
+        failed_table_keys = set()
+        table_cursors = {}
+        # 变更及已删除的表标识，为None时全量更新
+        changed_table_keys = None
+        cursor_state = None
+        if self.is_incremental():
+            tables = list(tables)
+            table_groups = defaultdict(list)
+            for table in tables:
+                table_groups[self.get_table_key(table)].append(table)
+            table_cursors = {key: self.get_table_cursor(group) for key, group in table_groups.items()}
+            cursor_state = self.get_cursor_state()
+            if cursor_state:
+                tables, changed_table_keys = self.get_changed_tables(tables, table_cursors, cursor_state["cursors"])
+        metrics = self.iter_metrics(tables, failed_table_keys)
+
         metric_pool = self.get_metric_pool()
         if self.bk_biz_id is not None:
             metric_pool = metric_pool.filter(bk_biz_id=self.bk_biz_id)
+        if changed_table_keys is not None:
+            # 增量更新时指标池限定为变更表的指标，指标关联的表可能与生成指标的表不一致，因此一并查询
+            metrics = list(metrics)
+            pool_table_keys = changed_table_keys | {str(metric.get(self.table_key_field, "")) for metric in metrics}
+            metric_pool = metric_pool.filter(**{f"{self.table_key_field}__in": pool_table_keys})
         metric_pool_values = metric_pool.only(*METRIC_POOL_KEYS)
 
+        # 有指标变更的业务，用于使搜索索引失效
+        changed_biz_ids = set()
+
         # metric_hash_dict
         metric_hash_dict = {}
         for m in list(metric_pool_values):
             metric_id = "{}.{}.{}.{}".format(m.bk_biz_id, m.result_table_id, m.metric_field, m.related_id)
             if metric_id in metric_hash_dict:
                 to_be_delete.append(m.id)
+                changed_biz_ids.add(m.bk_biz_id)
             else:
                 metric_hash_dict[metric_id] = m
 
-        for table in self.get_tables():
-            for metric in self.get_metrics_by_table(table):
-                # 处理result_table_id长度
-                if len(metric.get("result_table_id", "")) > 256:
-                    metric["result_table_id"] = metric["result_table_id"][:256]
-
-                if metric.get("result_table_id", "") in ["bkunifylogbeat_task.base", "bkunifylogbeat_common.base"]:
-                    continue
-
-                # 补全维度字段
-                dimensions = metric.get("dimensions", [])
-                for dimension in dimensions:
-                    if "is_dimension" not in dimension:
-                        dimension["is_dimension"] = True
-                    if "type" not in dimension:
-                        dimension["type"] = DimensionFieldType.String
-
-                metric.update(
-                    dict(
-                        use_frequency=self.metric_use_frequency.get(
-                            f"{metric.get('data_source_label', '')}."
-                            f"{metric.get('result_table_id', '')}.{metric['metric_field']}",
-                            0,
-                        )
-                    )
-                )
-                metric_id = "{}.{}.{}.{}".format(
-                    metric["bk_biz_id"],
-                    metric.get("result_table_id", ""),
-                    metric["metric_field"],
-                    metric.get("related_id", ""),
-                )
-                metric_instance = metric_hash_dict.pop(metric_id, None)
-                if metric_instance is None:
-                    _metric = MetricListCache(**metric)
-                    metric["readable_name"] = _metric.get_human_readable_name()
-                    _metric.readable_name = metric["readable_name"]
-                    _metric.metric_md5 = count_md5(metric)
-
-                    logger.info("Going to add %s to cache creating list", metric_id)
-                    to_be_create.append(_metric)
-                    continue
+        for metric in metrics:
+            metric_id = "{}.{}.{}.{}".format(
+                metric["bk_biz_id"],
+                metric.get("result_table_id", ""),
+                metric["metric_field"],
+                metric.get("related_id", ""),
+            )
+            metric_instance = metric_hash_dict.pop(metric_id, None)
+            if metric_instance is None:
+                _metric = MetricListCache(**metric)
+                metric["readable_name"] = _metric.get_human_readable_name()
+                _metric.readable_name = metric["readable_name"]
+                _metric.metric_md5 = count_md5(metric)
+
+                logger.info("Going to add %s to cache creating list", metric_id)
+                to_be_create.append(_metric)
+                changed_biz_ids.add(metric["bk_biz_id"])
+                continue
 
-                # readable_name 可能会因用户修改data_label而变更，因此跟随周期任务自动更新
-                metric["readable_name"] = metric_instance.get_human_readable_name()
+            # readable_name 可能会因用户修改data_label而变更，因此跟随周期任务自动更新
+            metric["readable_name"] = metric_instance.get_human_readable_name()
 
-                metric["metric_md5"] = count_md5(metric)
-                if not metric_instance.metric_md5 or metric_instance.metric_md5 != metric["metric_md5"]:
-                    metric["last_update"] = datetime.now()
-                    logger.info(f"Going to adding {metric_id} to cache updating list")
-                    metric["id"] = metric_instance.id
-                    to_be_update.append(metric)
-                    metric_instance.metric_md5 = metric["metric_md5"]
+            metric["metric_md5"] = count_md5(metric)
+            if not metric_instance.metric_md5 or metric_instance.metric_md5 != metric["metric_md5"]:
+                metric["last_update"] = datetime.now()
+                logger.info(f"Going to adding {metric_id} to cache updating list")
+                metric["id"] = metric_instance.id
+                to_be_update.append(metric)
+                changed_biz_ids.add(metric["bk_biz_id"])
+                metric_instance.metric_md5 = metric["metric_md5"]
 
         # create
         if to_be_create:
@@ -341,14 +447,33 @@ class BaseMetricCacheManager:
                 MetricListCache.objects.bulk_update(init_md5_metrics, fields, batch_size=500)
 
         # clean (手动添加的自定义指标标记md5为0，不做删除处理）
-        to_be_delete.extend([m.id for m in list(metric_hash_dict.values()) if m.metric_md5 != "0"])
+        # 生成异常的表保留原有指标；增量更新时仅清理变更及已删除表的指标
+        for m in metric_hash_dict.values():
+            table_key = str(getattr(m, self.table_key_field))
+            if m.metric_md5 == "0" or table_key in failed_table_keys:
+                continue
+            if changed_table_keys is not None and table_key not in changed_table_keys:
+                continue
+            to_be_delete.append(m.id)
+            changed_biz_ids.add(m.bk_biz_id)
         if to_be_delete:
             logger.info("Going to delete metric caches %s", list(metric_hash_dict.keys()))
             MetricListCache.objects.filter(id__in=to_be_delete).delete()
 
+        if changed_biz_ids:
+            MetricSearchIndex.invalidate(changed_biz_ids)
+
+        # 记录变更游标，生成异常的表不记录，下次重新生成
+        if self.is_incremental():
+            for table_key in failed_table_keys:
+                table_cursors.pop(table_key, None)
+            full_update_time = cursor_state["full_update_time"] if changed_table_keys is not None else start_time
+            self.save_cursor_state(table_cursors, full_update_time)
+
         logger.info(
             f"[end] update metric {self.__class__.__name__}({self.bk_biz_id}) "
             f"create {len(to_be_create)} metric,update {len(to_be_update)} metric, delete {len(to_be_delete)} metric."
+            f"changed tables: {'all' if changed_table_keys is None else len(changed_table_keys)}, "
             f"timestamp: {int(start_time)}, cost {time.time() - start_time}s"
         )
 
@@ -428,9 +553,16 @@ class CustomMetricCacheManager(BaseMetricCacheManager):
 
     data_sources = ((DataSourceLabel.CUSTOM, DataTypeLabel.TIME_SERIES),)
 
+    incremental = True
+    table_key_field = "related_id"
+
     def __init__(self, bk_biz_id=None):
         super(CustomMetricCacheManager, self).__init__(bk_biz_id)
 
+    def get_table_key(self, table: Dict) -> str:
+        # 分表模式下同一分组会拆分为多个表，按分组计算变更游标
+        return str(table["time_series_group_id"])
+
     def get_metric_pool(self):
         # 自定义指标，补上进程采集相关(映射到了，bkmonitor + timeseries[业务id为0])
         # 这里不filter 业务id 是因为基类 _run 方法已有兜底过滤
@@ -700,6 +832,9 @@ class BkLogSearchCacheManager(BaseMetricCacheManager):
         (DataSourceLabel.BK_LOG_SEARCH, DataTypeLabel.LOG),
     )
 
+    incremental = True
+    table_key_field = "related_id"
+
     def __init__(self, bk_biz_id):
         super(BkLogSearchCacheManager, self).__init__(bk_biz_id)
 
@@ -720,6 +855,9 @@ class BkLogSearchCacheManager(BaseMetricCacheManager):
                 index_set_msg["time_field"] = "dtEventTimeStamp"
         yield from index_list
 
+    def get_table_key(self, table: Dict) -> str:
+        return str(table["index_set_id"])
+
     def get_log_metric(self, table: Dict, related_map: Dict[str, List[str]]) -> Dict:
         """
         日志关键字指标
@@ -846,6 +984,8 @@ class CustomEventCacheManager(BaseMetricCacheManager):
 
     data_sources = ((DataSourceLabel.CUSTOM, DataTypeLabel.EVENT),)
 
+    incremental = True
+
     SYSTEM_EVENTS = [
         {
             "event_group_id": 0,
@@ -1561,6 +1701,8 @@ class BkmonitorK8sMetricCacheManager(BkmonitorMetricCacheManager):
     _build_in_metrics = None
     IGNORE_DIMENSIONS = ["bk_instance", "bk_job"]
 
+    incremental = True
+
     @property
     def build_in_metrics(self):
         if self._build_in_metrics is None:
@@ -1580,20 +1722,18 @@ class BkmonitorK8sMetricCacheManager(BkmonitorMetricCacheManager):
         )
 
     def get_tables(self):
-        # k8s 相关指标，table_id 设置为空dict
-        yield {}
-
-    def get_metrics_by_table(self, table):
         # 按业务获取指标
         # 业务id为Node时，抛出异常（k8s指标仅支持按业务缓存）
         # 业务id为0时，获取全局内置k8s指标
         # 业务id非0时，按业务缓存对应custom_data_id下的指标
         if self.bk_biz_id is None:
             logger.exception("get k8s metrics error, bk_biz_id is None.")
-        else:
-            yield from self.get_k8s_metric(
-                api.metadata.query_bcs_metrics(bk_biz_ids=[self.bk_biz_id]), bk_biz_id=self.bk_biz_id
-            )
+            return
+        # k8s 相关指标，table_id 设置为空，指标列表作为表内容用于计算变更游标
+        yield {"table_id": "", "metrics": api.metadata.query_bcs_metrics(bk_biz_ids=[self.bk_biz_id])}
+
+    def get_metrics_by_table(self, table):
+        yield from self.get_k8s_metric(table["metrics"], bk_biz_id=self.bk_biz_id)
 
     def get_k8s_metric(self, metrics, bk_biz_id):
         def get_base_table_by_metric(k8s_metric):
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+Tencent is pleased to support the open source community by making 蓝鲸智云 - 监控平台 (BlueKing - Monitor) available.
+Copyright (C) 2017-2021 THL A29 Limited, a Tencent company. All rights reserved.
+Licensed under the MIT License (the "License"); you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://opensource.org/licenses/MIT
+Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on
+an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the
+specific language governing permissions and limitations under the License.
+
+指标选择器模糊搜索索引
+
+按业务在进程内存中维护指标的三元组(trigram)倒排索引，替代 MetricListCache 上多列 icontains 导致的全表扫描。
+指标缓存写入后递增业务的索引版本号，各进程查询时比对版本号，不一致时重建该业务的索引。
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from django.core.cache import cache
+from django.db.models import Case, IntegerField, Value, When
+
+from bkmonitor.models.metric_list_cache import MetricListCache
+
+logger = logging.getLogger(__name__)
+
+
+class MatchRank:
+    """
+    搜索匹配等级，数值越小越靠前
+    """
+
+    EXACT = 0
+    PREFIX = 1
+    SUBSTRING = 2
+
+
+class MetricSearchResult:
+    """
+    搜索结果
+    """
+
+    def __init__(self, ranks: Dict[int, int]):
+        # {指标ID: 匹配等级}
+        self.ranks = ranks
+
+    @property
+    def ids(self) -> List[int]:
+        return list(self.ranks)
+
+    def rank_expression(self) -> Case:
+        """
+        匹配等级排序表达式
+        """
+        rank_ids = defaultdict(list)
+        for metric_id, rank in self.ranks.items():
+            rank_ids[rank].append(metric_id)
+        return Case(
+            *(When(id__in=ids, then=Value(rank)) for rank, ids in sorted(rank_ids.items())),
+            default=Value(MatchRank.SUBSTRING),
+            output_field=IntegerField(),
+        )
+
+
+class BizMetricIndex:
+    """
+    单个业务的指标索引
+    """
+
+    GRAM_SIZE = 3
+    # 模糊搜索字段
+    SEARCH_FIELDS = ("result_table_id", "metric_field", "metric_field_name")
+    # 建索引的字段，data_label 仅用于指标ID格式的查询
+    INDEX_FIELDS = SEARCH_FIELDS + ("data_label",)
+
+    def __init__(self, bk_biz_id: int, version=None):
+        self.bk_biz_id = bk_biz_id
+        self.version = version
+        self.build_time = time.time()
+        self.ids: List[int] = []
+        # 每个指标的小写字段值，顺序与 INDEX_FIELDS 一致
+        self.docs: List[Tuple[str, ...]] = []
+        self.grams: Dict[str, List[int]] = defaultdict(list)
+
+    def add(self, metric_id: int, values: Iterable[str]):
+        doc = tuple((value or "").lower() for value in values)
+        position = len(self.ids)
+        self.ids.append(metric_id)
+        self.docs.append(doc)
+        for gram in self.split_grams(*doc):
+            self.grams[gram].append(position)
+
+    @classmethod
+    def split_grams(cls, *texts: str) -> Set[str]:
+        return {text[i : i + cls.GRAM_SIZE] for text in texts for i in range(len(text) - cls.GRAM_SIZE + 1)}
+
+    @classmethod
+    def build(cls, bk_biz_id: int, version=None) -> "BizMetricIndex":
+        index = cls(bk_biz_id, version)
+        queryset = MetricListCache.objects.filter(bk_biz_id=bk_biz_id).values_list("id", *cls.INDEX_FIELDS)
+        for metric_id, *values in queryset.iterator():
+            index.add(metric_id, values)
+        # 构建完成后不再追加，转换为普通字典避免查询时产生空列表
+        index.grams = dict(index.grams)
+        return index
+
+    def candidates(self, texts: Iterable[str]) -> Iterable[int]:
+        """
+        同时包含所有文本的三元组的候选指标，文本过短无法使用索引时返回全部指标
+        """
+        grams = self.split_grams(*texts)
+        if not grams:
+            return range(len(self.ids))
+
+        postings = sorted((self.grams.get(gram, []) for gram in grams), key=len)
+        positions = set(postings[0])
+        for posting in postings[1:]:
+            if not positions:
+                break
+            positions.intersection_update(posting)
+        return sorted(positions)
+
+    def search(self, query: str) -> Dict[int, int]:
+        """
+        与 icontains 语义一致的模糊搜索
+        :return: {指标ID: 匹配等级}
+        """
+        query = query.lower()
+        result = {}
+
+        # 结果表、指标名、指标别名中包含查询字符串
+        for position in self.candidates([query]):
+            doc = self.docs[position]
+            rank = None
+            for value in doc[: len(self.SEARCH_FIELDS)]:
+                if value == query:
+                    rank = MatchRank.EXACT
+                    break
+                if value.startswith(query):
+                    rank = MatchRank.PREFIX
+                elif rank is None and query in value:
+                    rank = MatchRank.SUBSTRING
+            if rank is not None:
+                result[self.ids[position]] = rank
+
+        # 指标ID格式，如 system.cpu_summary.usage、data_label.usage
+        fields = query.split(".")
+        patterns = []
+        if len(fields) == 2:
+            patterns = [(0, fields[0], fields[1]), (3, fields[0], fields[1])]
+        elif len(fields) >= 3:
+            patterns = [(0, ".".join(fields[:2]), ".".join(fields[2:]))]
+        for table_field_index, table, metric_field in patterns:
+            for position in self.candidates([table, metric_field]):
+                doc = self.docs[position]
+                if table not in doc[table_field_index] or metric_field not in doc[1]:
+                    continue
+                if doc[table_field_index] == table and doc[1] == metric_field:
+                    rank = MatchRank.EXACT
+                else:
+                    rank = MatchRank.SUBSTRING
+                metric_id = self.ids[position]
+                result[metric_id] = min(result.get(metric_id, rank), rank)
+        return result
+
+
+class MetricSearchIndex:
+    """
+    进程内指标搜索索引，按业务缓存并通过版本号失效
+    """
+
+    VERSION_KEY_TEMPLATE = "metric_search_index.version.{bk_biz_id}"
+    VERSION_TIMEOUT = 24 * 60 * 60
+    # 未通过版本号感知的写入(如其他模块直接修改缓存表)，依靠索引过期兜底
+    INDEX_TIMEOUT = 10 * 60
+    # 进程内最多缓存的业务数
+    MAX_BIZ_COUNT = 50
+    # 匹配数量超过阈值时 id__in 查询代价过高，回退为数据库查询
+    MAX_MATCH_COUNT = 10000
+
+    _indexes: "OrderedDict[int, BizMetricIndex]" = OrderedDict()
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_version_key(cls, bk_biz_id: int) -> str:
+        return cls.VERSION_KEY_TEMPLATE.format(bk_biz_id=bk_biz_id)
+
+    @classmethod
+    def invalidate(cls, bk_biz_ids: Iterable[int]):
+        """
+        指标缓存写入后调用，使各进程中业务的索引失效
+        """
+        version = time.time()
+        cache.set_many({cls.get_version_key(bk_biz_id): version for bk_biz_id in set(bk_biz_ids)}, cls.VERSION_TIMEOUT)
+
+    @classmethod
+    def get_indexes(cls, bk_biz_ids: List[int]) -> List[BizMetricIndex]:
+        version_keys = {cls.get_version_key(bk_biz_id): bk_biz_id for bk_biz_id in bk_biz_ids}
+        versions = {version_keys[key]: version for key, version in cache.get_many(list(version_keys)).items()}
+
+        indexes = []
+        for bk_biz_id in bk_biz_ids:
+            version = versions.get(bk_biz_id)
+            with cls._lock:
+                index = cls._indexes.get(bk_biz_id)
+                if index is not None:
+                    cls._indexes.move_to_end(bk_biz_id)
+            if index is None or index.version != version or time.time() - index.build_time > cls.INDEX_TIMEOUT:
+                start_time = time.time()
+                index = BizMetricIndex.build(bk_biz_id, version)
+                logger.info(
+                    "[metric search index] build index of biz(%s), metrics: %s, cost: %s",
+                    bk_biz_id,
+                    len(index.ids),
+                    time.time() - start_time,
+                )
+                with cls._lock:
+                    cls._indexes[bk_biz_id] = index
+                    while len(cls._indexes) > cls.MAX_BIZ_COUNT:
+                        cls._indexes.popitem(last=False)
+            indexes.append(index)
+        return indexes
+
+    @classmethod
+    def search(cls, bk_biz_ids: List[int], queries: List[str]) -> Optional[MetricSearchResult]:
+        """
+        在多个业务的索引中搜索，匹配数量过多时返回 None
+        """
+        ranks = {}
+        for index in cls.get_indexes(bk_biz_ids):
+            for query in queries:
+                for metric_id, rank in index.search(query).items():
+                    ranks[metric_id] = min(ranks.get(metric_id, rank), rank)
+            if len(ranks) > cls.MAX_MATCH_COUNT:
+                return None
+        return MetricSearchResult(ranks)
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._indexes.clear()
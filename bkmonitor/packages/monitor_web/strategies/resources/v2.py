@@ -74,6 +74,10 @@ from monitor_web.strategies.constant import (
     DEFAULT_TRIGGER_CONFIG_MAP,
     GLOBAL_TRIGGER_CONFIG,
 )
+from monitor_web.strategies.metric_search_index import (
+    MetricSearchIndex,
+    MetricSearchResult,
+)
 from monitor_web.strategies.serializers import handle_target
 from monitor_web.tasks import update_metric_list_by_biz
 
@@ -1216,11 +1220,8 @@ class GetMetricListV2Resource(Resource):
         page = serializers.IntegerField(required=False, label="页码")
         page_size = serializers.IntegerField(required=False, label="每页数目")
 
-    @classmethod
-    def filter_by_conditions(cls, metrics: QuerySet, params: Dict) -> QuerySet:
-        """
-        按查询条件过滤指标
-        """
+    @staticmethod
+    def get_filter_dict(params: Dict) -> Dict[str, List]:
         filter_dict = defaultdict(list)
         for condition in params.get("conditions", []):
             if "key" not in condition or "value" not in condition:
@@ -1230,6 +1231,35 @@ class GetMetricListV2Resource(Resource):
             if not isinstance(value, list):
                 value = [value]
             filter_dict[key].extend(value)
+        return filter_dict
+
+    @classmethod
+    def search_by_index(cls, params: Dict) -> Optional[MetricSearchResult]:
+        """
+        使用内存索引进行模糊搜索，未开启或匹配数量过多时返回 None
+        """
+        if not settings.ENABLE_METRIC_SEARCH_INDEX:
+            return None
+
+        queries = [str(query) for query in cls.get_filter_dict(params)["query"]]
+        if not queries:
+            return None
+
+        try:
+            return MetricSearchIndex.search([0, params["bk_biz_id"]], queries)
+        except Exception as e:
+            logger.exception("search metric by index failed: %s", e)
+            return None
+
+    @classmethod
+    def filter_by_conditions(
+        cls, metrics: QuerySet, params: Dict, search_result: Optional[MetricSearchResult] = None
+    ) -> QuerySet:
+        """
+        按查询条件过滤指标
+        :param search_result: 内存索引的模糊搜索结果，存在时替代数据库模糊查询
+        """
+        filter_dict = cls.get_filter_dict(params)
 
         search_fields = [
             "result_table_id",
@@ -1287,7 +1317,9 @@ class GetMetricListV2Resource(Resource):
                 metrics = metrics.filter(id__in=[])
 
         # 模糊搜索
-        if filter_dict["query"]:
+        if filter_dict["query"] and search_result is not None:
+            metrics = metrics.filter(id__in=search_result.ids)
+        elif filter_dict["query"]:
             # 尝试解析指标ID格式的query字符串
             exact_query = []
             for query in filter_dict["query"]:
@@ -1723,7 +1755,8 @@ class GetMetricListV2Resource(Resource):
             )
 
         # 按查询条件过滤指标
-        metrics = self.filter_by_conditions(metrics, params)
+        search_result = self.search_by_index(params)
+        metrics = self.filter_by_conditions(metrics, params, search_result)
 
         # 区分指标/事件/日志关键字选择器或Grafana选择器
         metrics = self.data_type_filter(metrics, params)
@@ -1736,6 +1769,9 @@ class GetMetricListV2Resource(Resource):
 
         metrics = self.scenario_filter(metrics, params)
         metrics = self.data_source_filter(metrics, params)
+        # 按匹配程度排序：完全匹配 > 前缀匹配 > 包含
+        if search_result is not None:
+            metrics = metrics.order_by(search_result.rank_expression(), "-use_frequency")
 
         # 按标签统计并过滤标签
         tag_list = self.get_tag_list(metrics, params)
@@ -313,7 +313,10 @@ def update_metric_list_by_biz(bk_biz_id):
                     continue
                 start = time.time()
                 logger.info("update metric list({}) by biz({})".format(source_type, bk_biz_id))
-                source(bk_biz_id).run(delay=False)
+                manager = source(bk_biz_id)
+                # 手动刷新时执行全量更新
+                manager.clear_cursor_state()
+                manager.run(delay=False)
                 logger.info("update metric list({}) succeed in {}".format(source_type, time.time() - start))
 
         except BaseException as e:
@@ -346,9 +349,11 @@ def append_metric_list_cache(result_table_id_list):
     """
     from bkmonitor.models.metric_list_cache import MetricListCache
     from monitor_web.strategies.metric_list_cache import BkmonitorMetricCacheManager
+    from monitor_web.strategies.metric_search_index import MetricSearchIndex
 
     def update_or_create_metric_list_cache(metric_list):
         # 这里可以考虑 删除 + 创建逻辑
+        bk_biz_ids = set()
         for metric in metric_list:
             metric["metric_md5"] = count_md5(metric)
             MetricListCache.objects.update_or_create(
@@ -359,6 +364,8 @@ def append_metric_list_cache(result_table_id_list):
                 data_source_label=metric.get("data_source_label"),
                 defaults=metric,
             )
+            bk_biz_ids.add(metric["bk_biz_id"])
+        MetricSearchIndex.invalidate(bk_biz_ids)
 
     if settings.ROLE == "api":
         # api 调用不做指标实时更新。
@@ -466,6 +473,7 @@ def append_event_metric_list_cache(bk_event_group_id):
         BkMonitorLogCacheManager,
         CustomEventCacheManager,
     )
+    from monitor_web.strategies.metric_search_index import MetricSearchIndex
 
     set_local_username(settings.COMMON_USERNAME)
     event_group_id = int(bk_event_group_id)
@@ -482,6 +490,7 @@ def append_event_metric_list_cache(bk_event_group_id):
                 data_source_label=metric_msg.get("data_source_label"),
                 defaults=metric_msg,
             )
+        MetricSearchIndex.invalidate([result_table_msg["bk_biz_id"]])
     else:
         BkMonitorLogCacheManager().run()
 
@@ -511,6 +520,7 @@ def update_task_running_status(task_id):
 def append_custom_ts_metric_list_cache(time_series_group_id):
     from bkmonitor.models.metric_list_cache import MetricListCache
     from monitor_web.strategies.metric_list_cache import CustomMetricCacheManager
+    from monitor_web.strategies.metric_search_index import MetricSearchIndex
 
     try:
         params = {
@@ -529,6 +539,7 @@ def append_custom_ts_metric_list_cache(time_series_group_id):
                     data_source_label=metric_msg.get("data_source_label"),
                     defaults=metric_msg,
                 )
+            MetricSearchIndex.invalidate([result["bk_biz_id"]])
     except BaseException as err:
         logger.error("[update_custom_ts_metric] failed, msg is {}".format(err))
 
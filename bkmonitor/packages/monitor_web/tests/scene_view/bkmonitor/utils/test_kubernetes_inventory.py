@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Tencent is pleased to support the open source community by making 蓝鲸智云 - 监控平台 (BlueKing - Monitor) available.
+Copyright (C) 2017-2021 THL A29 Limited, a Tencent company. All rights reserved.
+Licensed under the MIT License (the "License"); you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://opensource.org/licenses/MIT
+Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on
+an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the
+specific language governing permissions and limitations under the License.
+"""
+import pytest
+
+from bkmonitor.models import BCSPod, BCSPodLabels
+from bkmonitor.utils.kubernetes_inventory import (
+    InventoryQuery,
+    InventorySnapshot,
+    KubernetesInventory,
+    SnapshotUnsupported,
+)
+from core.drf_resource import resource
+
+pytestmark = pytest.mark.django_db
+
+
+def search(snapshot, **kwargs):
+    query = InventoryQuery(BCSPod)
+    for field, value in kwargs.pop("equals", {}).items():
+        query.add_equals(field, value)
+    for field, substrings in kwargs.pop("contains", {}).items():
+        query.add_contains(field, substrings)
+    query.labels = kwargs.pop("labels", {})
+    query.scopes = kwargs.pop("scopes", {})
+    result = KubernetesInventory.search([snapshot], query, **kwargs)
+    names = dict(BCSPod.objects.filter(id__in=result["ids"]).values_list("id", "name"))
+    return result["status_summary"], result["total"], [names[resource_id] for resource_id in result["ids"]]
+
+
+class TestInventorySnapshot:
+    def test_search(self, add_bcs_pods):
+        snapshot = InventorySnapshot.build(BCSPod, BCSPodLabels, "BCS-K8S-00000")
+        snapshot = InventorySnapshot.loads(snapshot.dumps())
+        assert len(snapshot.rows) == 2
+        assert set(snapshot.indexes["monitor_status"]) == {"success", "failed"}
+
+        assert search(snapshot, sort="-name") == (
+            {"success": 1, "failed": 1},
+            2,
+            ["api-gateway-1", "api-gateway-0"],
+        )
+        # 数据状态在统计之后过滤
+        assert search(snapshot, monitor_status="failed") == ({"success": 1, "failed": 1}, 1, ["api-gateway-1"])
+        # 标签、字段、关键字过滤
+        assert search(snapshot, labels={"key_1": ["value_1", "value_x"]}) == ({"success": 1}, 1, ["api-gateway-0"])
+        assert search(snapshot, labels={"key_1": ["value_1"], "key_2": ["value_x"]}) == ({}, 0, [])
+        assert search(snapshot, equals={"node_ip": ["1.1.1.1"]})[2] == ["api-gateway-1"]
+        assert search(snapshot, contains={"name": ["-1"]})[2] == ["api-gateway-1"]
+        # 共享集群按命名空间过滤
+        assert search(snapshot, scopes={"BCS-K8S-00000": ["namespace_a"]})[1] == 0
+        # 分页
+        assert search(snapshot, sort="name", offset=1, limit=1)[2] == ["api-gateway-1"]
+
+        with pytest.raises(SnapshotUnsupported):
+            InventoryQuery(BCSPod).add_equals("images", "host/namespace/apisix:latest")
+        with pytest.raises(SnapshotUnsupported):
+            search(snapshot, sort="images")
+
+    def test_get_kubernetes_pod_list(self, settings, add_bcs_cluster_item_for_update_and_delete, add_bcs_pods):
+        params = {
+            "page": 1,
+            "page_size": 10,
+            "condition_list": [{"bcs_cluster_id": "BCS-K8S-00002"}],
+            "bk_biz_id": 100,
+            "sort": "-restarts",
+        }
+        settings.ENABLE_KUBERNETES_INVENTORY_SNAPSHOT = False
+        expect = resource.scene_view.get_kubernetes_pod_list(params)
+
+        settings.ENABLE_KUBERNETES_INVENTORY_SNAPSHOT = True
+        KubernetesInventory.clear()
+        for bcs_cluster_id in ["BCS-K8S-00000", "BCS-K8S-00002"]:
+            KubernetesInventory.refresh(BCSPod, BCSPodLabels, bcs_cluster_id)
+        actual = resource.scene_view.get_kubernetes_pod_list(params)
+
+        assert actual.pop("snapshot_age") >= 0
+        assert actual == expect
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""
+Tencent is pleased to support the open source community by making 蓝鲸智云 - 监控平台 (BlueKing - Monitor) available.
+Copyright (C) 2017-2021 THL A29 Limited, a Tencent company. All rights reserved.
+Licensed under the MIT License (the "License"); you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://opensource.org/licenses/MIT
+Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on
+an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the
+specific language governing permissions and limitations under the License.
+"""
+import pytest
+
+from bkmonitor.models.metric_list_cache import MetricListCache
+from constants.data_source import DataSourceLabel, DataTypeLabel
+from monitor_web.strategies.metric_list_cache import BaseMetricCacheManager
+
+pytestmark = pytest.mark.django_db
+
+
+class FakeEventCacheManager(BaseMetricCacheManager):
+    data_sources = ((DataSourceLabel.CUSTOM, DataTypeLabel.EVENT),)
+    incremental = True
+
+    def __init__(self, bk_biz_id, tables):
+        super(FakeEventCacheManager, self).__init__(bk_biz_id)
+        self.tables = tables
+        self.generated_tables = []
+
+    def get_tables(self):
+        yield from self.tables
+
+    def get_metrics_by_table(self, table):
+        self.generated_tables.append(table["table_id"])
+        for event_name in table["events"]:
+            yield {
+                "bk_biz_id": self.bk_biz_id,
+                "result_table_id": table["table_id"],
+                "result_table_label": "os",
+                "metric_field": event_name,
+                "metric_field_name": event_name,
+                "data_source_label": DataSourceLabel.CUSTOM,
+                "data_type_label": DataTypeLabel.EVENT,
+                "data_target": "none_target",
+                "dimensions": [],
+            }
+
+
+def run_manager(tables):
+    manager = FakeEventCacheManager(2, tables)
+    manager.run()
+    metrics = MetricListCache.objects.filter(bk_biz_id=2, data_type_label=DataTypeLabel.EVENT)
+    return manager.generated_tables, sorted(f"{m.result_table_id}.{m.metric_field}" for m in metrics)
+
+
+def test_incremental_update(settings):
+    settings.ENABLE_METRIC_CACHE_INCREMENTAL = True
+    MetricListCache.objects.filter(bk_biz_id=2).delete()
+    FakeEventCacheManager(2, []).clear_cursor_state()
+
+    tables = [{"table_id": "event_a", "events": ["a1", "a2"]}, {"table_id": "event_b", "events": ["b1"]}]
+    # 首次执行全量更新
+    assert run_manager(tables) == (["event_a", "event_b"], ["event_a.a1", "event_a.a2", "event_b.b1"])
+
+    # 无变更时不重新生成指标
+    assert run_manager(tables) == ([], ["event_a.a1", "event_a.a2", "event_b.b1"])
+
+    # 仅重新生成变更的表
+    tables[1] = {"table_id": "event_b", "events": ["b1", "b2"]}
+    assert run_manager(tables) == (["event_b"], ["event_a.a1", "event_a.a2", "event_b.b1", "event_b.b2"])
+
+    # 已删除表的指标被清理
+    assert run_manager(tables[1:]) == ([], ["event_b.b1", "event_b.b2"])
+
+    # 清理游标后回退为全量更新
+    FakeEventCacheManager(2, []).clear_cursor_state()
+    assert run_manager(tables[1:]) == (["event_b"], ["event_b.b1", "event_b.b2"])
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Tencent is pleased to support the open source community by making 蓝鲸智云 - 监控平台 (BlueKing - Monitor) available.
+Copyright (C) 2017-2021 THL A29 Limited, a Tencent company. All rights reserved.
+Licensed under the MIT License (the "License"); you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://opensource.org/licenses/MIT
+Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on
+an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the
+specific language governing permissions and limitations under the License.
+"""
+import random
+
+from monitor_web.strategies.metric_search_index import BizMetricIndex, MatchRank
+
+WORDS = ["cpu", "mem", "disk", "net", "io", "usage", "total", "request", "latency", "error", "count", "bytes", "pod"]
+
+
+def make_docs(count):
+    docs = []
+    for index in range(count):
+        rand = random.Random(index)
+        db = f"{rand.choice(WORDS)}_{index // 100}"
+        metric_field = "_".join(rand.sample(WORDS, 3)) + f"_{index}"
+        docs.append((index, (f"{db}.__default__", metric_field, metric_field.replace("_", " ").upper(), db)))
+    return docs
+
+
+def icontains_search(docs, query):
+    """
+    与 GetMetricListV2Resource.filter_by_conditions 中 icontains 查询等价的实现
+    """
+    query = query.lower()
+    fields = query.split(".")
+    patterns = []
+    if len(fields) == 2:
+        patterns = [(0, fields[0], fields[1]), (3, fields[0], fields[1])]
+    elif len(fields) >= 3:
+        patterns = [(0, ".".join(fields[:2]), ".".join(fields[2:]))]
+
+    result = set()
+    for metric_id, values in docs:
+        values = [value.lower() for value in values]
+        if any(query in value for value in values[:3]) or any(
+            table in values[index] and metric_field in values[1] for index, table, metric_field in patterns
+        ):
+            result.add(metric_id)
+    return result
+
+
+class TestBizMetricIndex:
+    def test_search(self):
+        docs = make_docs(2000)
+        index = BizMetricIndex(2)
+        for metric_id, values in docs:
+            index.add(metric_id, values)
+
+        for query in ["cpu", "io", "x", "USAGE_total", "usage total", "cpu_3.__default__", "pod.error", "mem_1.bytes"]:
+            assert set(index.search(query)) == icontains_search(docs, query), query
+
+        ranks = index.search("cpu_usage_total_7")
+        assert set(ranks.values()) <= {MatchRank.EXACT, MatchRank.PREFIX, MatchRank.SUBSTRING}
+        ranks = index.search(docs[5][1][1])
+        assert ranks[5] == MatchRank.EXACT
+
+    def test_search_large(self):
+        docs = make_docs(20000)
+        index = BizMetricIndex(2)
+        for metric_id, values in docs:
+            index.add(metric_id, values)
+
+        for query in ["latency_12345", "request_error", "pod.error", "disk_99"]:
+            assert set(index.search(query)) == icontains_search(docs, query), query
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+"""
+Tencent is pleased to support the open source community by making 蓝鲸智云 - 监控平台 (BlueKing - Monitor) available.
+Copyright (C) 2017-2021 THL A29 Limited, a Tencent company. All rights reserved.
+Licensed under the MIT License (the "License"); you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://opensource.org/licenses/MIT
+Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on
+an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the
+specific language governing permissions and limitations under the License.
+"""
+import time
+from fnmatch import fnmatch
+from unittest import mock
+
+import pytest
+from elasticsearch_dsl import Search
+from elasticsearch_dsl.response import Response
+
+from bkmonitor.documents import AlertDocument, AlertRollupDocument
+from constants.alert import EventStatus
+from fta_web.alert.handlers.alert import AlertQueryHandler
+from fta_web.alert.resources import SearchAlertPageResource
+
+pytestmark = pytest.mark.django_db
+
+END_TIME = int(time.time()) // 3600 * 3600
+START_TIME = END_TIME - 3600
+# 直方图中的两个时间点
+BEGIN_TIME = START_TIME + 600
+CLOSE_TIME = START_TIME + 1200
+# 已完成预聚合的时间范围
+ROLLUP_RANGE = (START_TIME - 86400, END_TIME + 120)
+
+
+def fake_aggregations(aggs):
+    """
+    按查询中的聚合结构构造聚合结果，每个桶的文档数均为2
+    """
+    result = {}
+    for name, agg in aggs.items():
+        sub_result = fake_aggregations(agg.get("aggs", {}))
+        agg_type = next(key for key in agg if key not in ("aggs", "meta"))
+        if agg_type in ("filter", "nested"):
+            result[name] = {"doc_count": 2, **sub_result}
+        elif agg_type == "date_histogram":
+            bucket = {"key": BEGIN_TIME * 1000, "key_as_string": str(BEGIN_TIME), "doc_count": 2, **sub_result}
+            result[name] = {"buckets": [bucket]}
+        elif agg_type == "terms":
+            key = EventStatus.CLOSED if agg["terms"].get("field") == "status" else "1"
+            result[name] = {"buckets": [{"key": key, "doc_count": 2, **sub_result}]}
+        else:
+            result[name] = {"value": 2}
+    return result
+
+
+def fake_execute(search_object):
+    data = {
+        "hits": {"total": {"value": 0, "relation": "eq"}, "hits": []},
+        "aggregations": fake_aggregations(search_object.to_dict().get("aggs", {})),
+    }
+    return Response(search_object, data)
+
+
+def make_handler(**kwargs):
+    params = {
+        "bk_biz_ids": [2],
+        "authorized_bizs": [2],
+        "unauthorized_bizs": [],
+        "start_time": START_TIME,
+        "end_time": END_TIME,
+    }
+    params.update(kwargs)
+    return AlertQueryHandler(**params)
+
+
+@pytest.fixture()
+def rollup_range(settings):
+    settings.ENABLE_ALERT_ROLLUP = True
+    with mock.patch.object(AlertRollupDocument, "get_rollup_range", return_value=ROLLUP_RANGE) as get_rollup_range:
+        yield get_rollup_range
+
+
+class TestAlertPage:
+    def request_page(self, settings, enable_msearch):
+        settings.ENABLE_ALERT_MSEARCH = enable_msearch
+        with mock.patch.object(Search, "execute", autospec=True, side_effect=fake_execute), mock.patch(
+            "fta_web.alert.resources.multi_execute", side_effect=lambda objs: [fake_execute(obj) for obj in objs]
+        ):
+            return SearchAlertPageResource().request(
+                bk_biz_ids=[2], start_time=START_TIME, end_time=END_TIME, fields=["severity"]
+            )
+
+    def test_msearch_equals_resources(self, settings):
+        assert self.request_page(settings, True) == self.request_page(settings, False)
+
+    def test_msearch_retry_failed(self, settings):
+        settings.ENABLE_ALERT_MSEARCH = True
+
+        def multi_execute(search_objects):
+            # 告警列表查询在 msearch 中失败
+            return [None] + [fake_execute(search_object) for search_object in search_objects[1:]]
+
+        with mock.patch.object(Search, "execute", autospec=True, side_effect=fake_execute) as execute, mock.patch(
+            "fta_web.alert.resources.multi_execute", side_effect=multi_execute
+        ):
+            result = SearchAlertPageResource().request(bk_biz_ids=[2], start_time=START_TIME, end_time=END_TIME)
+
+        # 失败的查询单独重试
+        assert execute.call_count == 1
+        assert result["search"]["total"] == 0
+        assert result["date_histogram"]["series"]
+
+    def test_msearch_retry_raise(self, settings):
+        settings.ENABLE_ALERT_MSEARCH = True
+        with mock.patch.object(Search, "execute", autospec=True, side_effect=ValueError("search error")), mock.patch(
+            "fta_web.alert.resources.multi_execute", side_effect=lambda objs: [None] * len(objs)
+        ):
+            # 重试时抛出原始异常
+            with pytest.raises(ValueError, match="search error"):
+                SearchAlertPageResource().request(bk_biz_ids=[2], start_time=START_TIME, end_time=END_TIME)
+
+
+class TestAlertRollup:
+    def test_can_use_rollup(self, settings, rollup_range):
+        start_time, end_time = START_TIME, END_TIME + 60
+        assert make_handler().can_use_rollup(start_time, end_time, 60, ["bk_biz_id"])
+
+        # 聚合周期不是分钟的整数倍
+        assert not make_handler().can_use_rollup(start_time, end_time, 30, [])
+        # 存在额外的过滤条件
+        assert not make_handler(query_string="alert_name: cpu").can_use_rollup(start_time, end_time, 60, [])
+        assert not make_handler(status=[EventStatus.ABNORMAL]).can_use_rollup(start_time, end_time, 60, [])
+        assert not make_handler(username="admin").can_use_rollup(start_time, end_time, 60, [])
+        # 存在未授权的业务
+        handler = make_handler(bk_biz_ids=[2, 3], unauthorized_bizs=[3])
+        assert not handler.can_use_rollup(start_time, end_time, 60, [])
+        # 不支持的聚合维度
+        assert not make_handler().can_use_rollup(start_time, end_time, 60, ["tags.device"])
+        # 超出已预聚合的时间范围
+        assert not make_handler().can_use_rollup(start_time, ROLLUP_RANGE[1] + 60, 60, [])
+
+        settings.ENABLE_ALERT_ROLLUP = False
+        assert not make_handler().can_use_rollup(start_time, end_time, 60, [])
+
+    def test_rollup_equals_raw(self, rollup_range):
+        handler = make_handler()
+
+        # 原始数据: 查询范围前开始的告警5个，范围内新产生3个，关闭1个
+        with mock.patch.object(AlertQueryHandler, "can_use_rollup", return_value=False):
+            search_objects, context = handler.get_date_histogram_search_objects(interval="60")
+        assert not context["use_rollup"]
+        raw_result = handler.handle_date_histogram_result(
+            [
+                Response(
+                    search_objects[0],
+                    {
+                        "aggregations": {
+                            "init_alert": {"doc_count": 5},
+                            "begin_time": {
+                                "doc_count": 3,
+                                "time": {
+                                    "buckets": [
+                                        {"key": BEGIN_TIME * 1000, "key_as_string": str(BEGIN_TIME), "doc_count": 3}
+                                    ]
+                                },
+                            },
+                            "end_time": {
+                                "doc_count": 1,
+                                "end_alert": {
+                                    "doc_count": 1,
+                                    "time": {
+                                        "buckets": [
+                                            {
+                                                "key": CLOSE_TIME * 1000,
+                                                "key_as_string": str(CLOSE_TIME),
+                                                "doc_count": 1,
+                                                "status": {"buckets": [{"key": EventStatus.CLOSED, "doc_count": 1}]},
+                                            }
+                                        ]
+                                    },
+                                },
+                            },
+                        }
+                    },
+                )
+            ],
+            context,
+        )
+
+        # 预聚合数据: 新产生的告警中2个已预聚合，1个在预聚合完成后才创建，仍从原始数据中统计
+        search_objects, context = handler.get_date_histogram_search_objects(interval="60")
+        assert context["use_rollup"]
+        raw_aggs = search_objects[0].to_dict()["aggs"]
+        begin_time_filters = raw_aggs["begin_time"]["filter"]["bool"]["filter"]
+        assert {"range": {"create_time": {"gte": ROLLUP_RANGE[1]}}} in begin_time_filters
+        assert "end_time" not in raw_aggs
+        rollup_filters = search_objects[1].to_dict()["query"]["bool"]["filter"]
+        assert {"range": {"rollup_time": {"lt": ROLLUP_RANGE[1]}}} in rollup_filters
+
+        def rollup_bucket(ts, kind, status, count):
+            return {
+                "key": ts * 1000,
+                "key_as_string": str(ts),
+                "doc_count": 1,
+                "kind": {
+                    "buckets": [
+                        {
+                            "key": kind,
+                            "doc_count": 1,
+                            "status": {"buckets": [{"key": status, "doc_count": 1, "count": {"value": float(count)}}]},
+                        }
+                    ]
+                },
+            }
+
+        rollup_result = handler.handle_date_histogram_result(
+            [
+                Response(
+                    search_objects[0],
+                    {
+                        "aggregations": {
+                            "init_alert": {"doc_count": 5},
+                            "begin_time": {
+                                "doc_count": 1,
+                                "time": {
+                                    "buckets": [
+                                        {"key": BEGIN_TIME * 1000, "key_as_string": str(BEGIN_TIME), "doc_count": 1}
+                                    ]
+                                },
+                            },
+                        }
+                    },
+                ),
+                Response(
+                    search_objects[1],
+                    {
+                        "aggregations": {
+                            "time": {
+                                "buckets": [
+                                    rollup_bucket(BEGIN_TIME, AlertRollupDocument.Kind.BEGIN, EventStatus.ABNORMAL, 2),
+                                    rollup_bucket(CLOSE_TIME, AlertRollupDocument.Kind.END, EventStatus.CLOSED, 1),
+                                ]
+                            }
+                        }
+                    },
+                ),
+            ],
+            context,
+        )
+
+        assert dict(rollup_result) == dict(raw_result)
+        abnormal_series = raw_result[()][EventStatus.ABNORMAL]
+        assert abnormal_series[BEGIN_TIME * 1000] == 8
+        assert abnormal_series[CLOSE_TIME * 1000] == 7
+
+    def test_aggregate_end_alert_created_before(self):
+        # 告警在统计范围的前一天创建，在统计范围内关闭
+        create_time = START_TIME - 86400
+        alert_indices = AlertDocument.build_index_name_by_time(create_time, create_time)
+        searches = []
+
+        def execute(search_object):
+            searches.append(search_object)
+            key = {"time": CLOSE_TIME * 1000, "bk_biz_id": 2, "strategy_id": 1, "severity": 1}
+            bucket = {"key": dict(key, status=EventStatus.CLOSED), "doc_count": 1}
+            return Response(search_object, {"aggregations": {"rollup": {"buckets": [bucket]}}})
+
+        with mock.patch.object(Search, "execute", autospec=True, side_effect=execute):
+            documents = AlertRollupDocument.aggregate(AlertRollupDocument.Kind.END, START_TIME, END_TIME)
+
+        search_indices = searches[0]._index
+        assert all(any(fnmatch(index, pattern) for pattern in search_indices) for index in alert_indices)
+        assert [(document.time, document.status, document.count) for document in documents] == [
+            (CLOSE_TIME, EventStatus.CLOSED, 1)
+        ]
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+Tencent is pleased to support the open source community by making 蓝鲸智云 - 监控平台 (BlueKing - Monitor) available.
+Copyright (C) 2017-2021 THL A29 Limited, a Tencent company. All rights reserved.
+Licensed under the MIT License (the "License"); you may not use this file except in compliance with the License.
+You may obtain a copy of the License at http://opensource.org/licenses/MIT
+Unless required by applicable law or agreed to in writing, software distributed under the License is distributed on
+an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the License for the
+specific language governing permissions and limitations under the License.
+"""
+import threading
+
+import mock
+import pytest
+from django.core.cache.backends.locmem import LocMemCache
+
+from bkmonitor.utils.cache import CacheTypeItem, using_cache
+
+CACHE_TYPE = CacheTypeItem(key="test", timeout=60, user_related=False, stale_timeout=60)
+
+
+class SyncThread(object):
+    def __init__(self, target):
+        self.target = target
+
+    def start(self):
+        self.target()
+
+
+@pytest.fixture()
+def fake_cache(mocker, settings):
+    settings.ENVIRONMENT = "testing"
+    settings.ROLE = "api"
+    backend = LocMemCache("using_cache_test", {})
+    mocker.patch("bkmonitor.utils.cache.cache", backend)
+    mocker.patch("bkmonitor.utils.cache.mem_cache", backend)
+    mocker.patch("bkmonitor.utils.cache.InheritParentThread", SyncThread)
+    return backend
+
+
+class TestUsingCache(object):
+    def test_stale_while_revalidate(self, fake_cache, mocker):
+        now = [1000]
+        mocker.patch("bkmonitor.utils.cache.time", mock.MagicMock(time=lambda: now[0]))
+        call_count = {"count": 0}
+
+        @using_cache(CACHE_TYPE)
+        def get_data():
+            call_count["count"] += 1
+            return call_count["count"]
+
+        assert get_data() == 1
+        # 命中缓存时只查询一次缓存
+        with mock.patch.object(fake_cache, "get", wraps=fake_cache.get) as cache_get:
+            assert get_data() == 1
+        assert cache_get.call_count == 1
+
+        # 超过有效期后，返回过期数据并在后台刷新
+        now[0] += CACHE_TYPE.timeout
+        assert get_data() == 1
+        assert call_count["count"] == 2
+        assert get_data() == 2
+
+    def test_cache_type_call(self):
+        assert CACHE_TYPE(120).stale_timeout == CACHE_TYPE.stale_timeout
+        cache_type = CACHE_TYPE(120, stale_timeout=30)
+        assert (cache_type.timeout, cache_type.stale_timeout) == (120, 30)
+
+    def test_single_flight(self, fake_cache):
+        calls = []
+        started = threading.Event()
+        release = threading.Event()
+
+        @using_cache(CACHE_TYPE)
+        def get_data():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return "data"
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(get_data()))
+        leader.start()
+        started.wait(5)
+
+        follower = threading.Thread(target=lambda: results.append(get_data()))
+        follower.start()
+        release.set()
+        leader.join()
+        follower.join()
+
+        assert results == ["data", "data"]
+        assert len(calls) == 1